@@ -12,6 +12,7 @@ class Settings(BaseSettings):
     
     # Ключ для шифрования приватных ключей VPN (Fernet)
     # Можно сгенерировать через: cryptography.fernet.Fernet.generate_key()
+    # Ротация: новый ключ первым, старые через запятую — см. bot/services/key_rotation.py
     encryption_key: SecretStr | None = Field(default=None)
 
     # Настройки AmneziaWG
@@ -22,6 +23,8 @@ class Settings(BaseSettings):
     server_endpoint: str = ""
     dns_servers: str = "1.1.1.1, 8.8.8.8"
     vpn_ip_range: str = "10.8.0.0/24"
+    # IPv6-префикс клиентов (dual-stack, например fd42:8::/64); пусто — только IPv4
+    vpn_ipv6_range: str = ""
     max_profiles_per_user: int = 3
 
     # Параметры обфускации AmneziaWG
@@ -46,10 +49,88 @@ class Settings(BaseSettings):
     log_level: str = "INFO"   # DEBUG | INFO | WARNING | ERROR
     log_path: str = "logs"    # директория для файлов логов
 
-    # FSM Storage (опционально — Redis для production)
-    # Если не задан, используется MemoryStorage (данные теряются при рестарте)
+    # FSM Storage и разделяемое состояние (опционально — Redis для production)
+    # Если не задан, используется MemoryStorage (данные теряются при рестарте),
+    # а антифлуд и дедупликация запросов работают в памяти процесса
     redis_url: str | None = None  # пример: redis://localhost:6379/0
 
+    # Конкурентная обработка апдейтов
+    # Апдейты разных пользователей обрабатываются параллельно пулом воркеров,
+    # апдейты одного пользователя — строго по порядку. 0 = режим aiogram по умолчанию.
+    update_workers: int = 8
+    update_queue_size: int = 1000  # максимум ожидающих апдейтов (backpressure для polling)
+
+    # Антифлуд (token bucket): ёмкость ведра и скорость пополнения (токенов/с).
+    # Стоимость действий — DEFAULT_ACTION_COSTS в throttling_middleware.
+    throttle_burst: float = 5.0
+    throttle_rate: float = 1.5
+    throttle_notify: bool = True  # сообщать пользователю об ограничении
+
+    # Вызовы wg/awg/docker: таймаут (с), число повторов по таймауту и порог
+    # «медленной» команды для лога (мс)
+    wg_command_timeout: float = 30.0
+    wg_command_retries: int = 1
+    wg_slow_command_ms: int = 1000
+    # Не больше wg_max_concurrent процессов одновременно; после wg_breaker_threshold
+    # отказов подряд (таймауты, контейнер остановлен) вызовы отклоняются wg_breaker_reset секунд
+    wg_max_concurrent: int = 4
+    wg_breaker_threshold: int = 3
+    wg_breaker_reset: float = 30.0
+
+    # Пир «онлайн», если рукопожатие было не раньше wg_online_window секунд назад;
+    # снимок дампа для «последний раз в сети» и счётчиков переиспользуется wg_snapshot_ttl секунд
+    wg_online_window: int = 180
+    wg_snapshot_ttl: float = 30.0
+
+    # Сборщик неактивных пиров: снимать с интерфейса пиры без рукопожатия дольше
+    # wg_idle_detach_days дней (0 — выкл.); проверка раз в wg_idle_check_interval секунд
+    wg_idle_detach_days: int = 0
+    wg_idle_check_interval: float = 3600.0
+
+    # Размещение профилей по узлам VPN (bot/services/nodes.py): вес доли трафика
+    # узла против доли занятых адресов (0 — только по числу профилей)
+    node_traffic_weight: float = 0.3
+
+    # Дополнительные форматы конфига для скачивания (bot/services/config_template.py):
+    # wg — стандартный WireGuard, amnezia — JSON AmneziaVPN; через запятую, пусто — только .conf AWG
+    config_formats: str = ""
+
+    # Выгрузка конфигов администратором (/export, bot/services/config_export.py):
+    # потоки расшифровки и рендера, размер части ZIP в МБ (лимит Bot API на документ — 50 МБ)
+    export_workers: int = 4
+    export_part_mb: int = 45
+
+    # Фоновое перешифрование приватных ключей после смены ENCRYPTION_KEY
+    # (bot/services/key_rotation.py): профилей в пачке и пауза между пачками (с)
+    key_rotation_batch: int = 200
+    key_rotation_pause: float = 0.5
+
+    # Сверка пиров интерфейса с БД (bot/services/reconciler.py): период (с, 0 — только
+    # при старте и по /reconcile) и доля пиров интерфейса, которую можно удалить за раз
+    wg_reconcile_interval: float = 600.0
+    wg_reconcile_max_remove: float = 0.5
+
+    # SQL-запросы: порог «медленного» запроса для лога и /slowq (мс),
+    # прикладывать ли к медленным запросам EXPLAIN QUERY PLAN
+    db_slow_query_ms: int = 100
+    db_explain_slow: bool = True
+
+    # Трассировка апдейтов (bot/core/tracing.py): доля трасс для экспорта,
+    # порог (мс), после которого трасса экспортируется всегда (0 — выкл.), файл
+    trace_sample_rate: float = 0.0
+    trace_slow_ms: int = 0
+    trace_path: str = "logs/traces.jsonl"
+
+    # Монитор лага event loop: период пробы (с), порог алерта администратору (мс,
+    # 0 — без алертов) и минимальный интервал между алертами (с)
+    loop_lag_interval: float = 0.5
+    loop_lag_threshold_ms: int = 250
+    loop_lag_alert_cooldown: float = 300.0
+
+    # Метрики Prometheus: GET http://<metrics_host>:<metrics_port>/metrics
+    metrics_port: int = 0  # 0 = эндпоинт выключен
+    metrics_host: str = "127.0.0.1"
+
     # Настройка загрузки из .env файла
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,181 @@
+"""
+Пул воркеров для конкурентной обработки апдейтов с сохранением порядка.
+
+Апдейты разных пользователей обрабатываются параллельно (не более ``workers``
+одновременно), апдейты одного пользователя/чата — строго последовательно,
+в порядке поступления.
+
+Устройство:
+  _pending  — ключ → очередь задач этого ключа (deque)
+  _ready    — очередь ключей, у которых есть задачи и нет активного воркера
+  _slots    — семафор на общее число ожидающих задач (backpressure для polling)
+
+Воркер берёт ключ из _ready, выполняет одну задачу и, если у ключа остались
+задачи, возвращает ключ в конец _ready — так один «шумный» пользователь
+не монополизирует воркер.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from loguru import logger
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class LatencyTracker:
+    """Агрегирует длительность выполнения по имени (count / total / max)."""
+
+    def __init__(self) -> None:
+        self._stats: dict[str, list[float]] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        entry = self._stats.get(name)
+        if entry is None:
+            self._stats[name] = [1, seconds, seconds]
+            return
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """Статистика по всем именам, отсортированная по суммарному времени."""
+        rows = [
+            {
+                "name": name,
+                "count": int(count),
+                "avg_ms": total / count * 1000,
+                "max_ms": peak * 1000,
+                "total_ms": total * 1000,
+            }
+            for name, (count, total, peak) in sorted(
+                self._stats.items(), key=lambda item: item[1][1], reverse=True,
+            )
+        ]
+        return rows
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+
+class OrderedUpdateExecutor:
+    """Ограниченный пул воркеров с per-key упорядочиванием задач."""
+
+    def __init__(self, workers: int = 8, max_pending: int = 1000) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if max_pending < 1:
+            raise ValueError("max_pending must be >= 1")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.handler_latency = LatencyTracker()
+        self._pending: dict[Hashable, deque[tuple[Job, float]]] = {}
+        self._ready: asyncio.Queue[Hashable] = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._queued = 0
+        self._busy = 0
+        self._processed = 0
+        self._failed = 0
+        self._max_wait = 0.0
+        self._tasks: list[asyncio.Task[None]] = []
+
+    # ── Жизненный цикл ───────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(
+            "[EXECUTOR] Запущен пул | workers={} max_pending={}",
+            self.workers, self.max_pending,
+        )
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается обработки очереди (не дольше timeout) и останавливает воркеры."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[EXECUTOR] Очередь не разобрана за {}с | pending={}", timeout, self._queued)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self) -> None:
+        """Ждёт, пока все поставленные задачи будут выполнены."""
+        while self._queued or self._busy:
+            await asyncio.sleep(0.01)
+
+    # ── Постановка задач ─────────────────────────────────────────────────────
+
+    async def submit(self, key: Hashable, job: Job) -> None:
+        """
+        Ставит задачу в очередь ключа. Блокируется, если очередь заполнена
+        (max_pending) — polling естественно притормаживает.
+        """
+        await self._slots.acquire()
+        self._queued += 1
+        queue = self._pending.get(key)
+        if queue is not None:
+            # У ключа уже есть активный воркер или он ждёт в _ready
+            queue.append((job, time.monotonic()))
+            return
+        self._pending[key] = deque([(job, time.monotonic())])
+        self._ready.put_nowait(key)
+
+    # ── Воркер ───────────────────────────────────────────────────────────────
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            job, enqueued_at = queue.popleft()
+            self._queued -= 1
+            self._busy += 1
+            wait = time.monotonic() - enqueued_at
+            if wait > self._max_wait:
+                self._max_wait = wait
+            try:
+                await job()
+                self._processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self._failed += 1
+                logger.opt(exception=exc).error("[EXECUTOR] Ошибка обработки апдейта | key={}", key)
+            finally:
+                self._busy -= 1
+                self._slots.release()
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+    # ── Метрики ──────────────────────────────────────────────────────────────
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество задач, ожидающих воркера."""
+        return self._queued
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "queue_depth": self._queued,
+            "max_pending": self.max_pending,
+            "active_keys": len(self._pending),
+            "processed": self._processed,
+            "failed": self._failed,
+            "max_wait_ms": self._max_wait * 1000,
+        }
@@ -15,11 +15,22 @@ Sink-и:
   CRITICAL — бот не может работать: нет .env, невалидный ключ
   AUDIT    — кастомный (25): журнал безопасности — кто что сделал с чьим доступом
 
+Файловые sink-и фоновые (LogWriter): в потоке event loop сообщение только
+форматируется и кладётся в очередь, а запись, ротация и gzip-сжатие выполняются
+в отдельном потоке. Перед остановкой бота вызывайте ``await complete_logging()``,
+чтобы дописать очередь.
+
 Приватные ключи WireGuard НИКОГДА не попадают в логи.
 """
 
+import asyncio
+import atexit
+import copy
+import queue
 import sys
+import threading
 from pathlib import Path
+from typing import Any, Callable
 
 from loguru import logger
 
@@ -35,14 +46,94 @@ except TypeError:
     pass  # уже зарегистрирован
 
 
-def setup_logging(log_level: str = "INFO", log_path: str = "logs") -> None:
+class LogWriter:
+    """
+    Фоновый поток записи файловых логов.
+
+    Основной logger получает лёгкий callable-sink, который кладёт уже
+    отформатированную строку в ``queue.Queue``. Поток-писатель передаёт её
+    в независимую копию logger-а (``copy.deepcopy``) с настоящими файловыми
+    sink-ами — там и происходят запись, ротация и сжатие.
+
+    В отличие от ``enqueue=True`` в loguru, записи не сериализуются через
+    pickle и multiprocessing-очередь: боту не нужна межпроцессная запись.
+    """
+
+    def __init__(self) -> None:
+        # Копия делается до добавления sink-ов: у неё свои хендлеры
+        self._logger = copy.deepcopy(logger)
+        self._logger.remove()
+        self._queue: queue.Queue[tuple[str, str] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    def add_file(self, name: str, path: Path, **file_kwargs: Any) -> Callable[[Any], None]:
+        """Добавляет файловый sink и возвращает callable-sink для основного logger-а."""
+        self._logger.add(
+            path,
+            level=0,
+            format="{message}",
+            filter=lambda record: record["extra"].get("sink") == name,
+            **file_kwargs,
+        )
+
+        def sink(message: Any) -> None:
+            self._queue.put((name, str(message)))
+
+        return sink
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                name, text = item
+                self._logger.bind(sink=name).opt(raw=True).log("INFO", text)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Блокирует до записи всех сообщений из очереди."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._logger.remove()
+
+
+_writer: LogWriter | None = None
+
+
+def _stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+atexit.register(_stop_writer)
+
+
+def setup_logging(log_level: str = "INFO", log_path: str = "logs", background: bool = True) -> None:
     """
     Инициализирует все sink-и. Вызывается один раз при старте бота.
 
     :param log_level: уровень для stderr и bot.log (INFO | DEBUG | WARNING | ERROR)
     :param log_path:  директория для файлов логов
+    :param background: писать файловые логи в фоновом потоке (не блокируя event loop)
     """
+    global _writer
     logger.remove()
+    _stop_writer()
+    if background:
+        _writer = LogWriter()
 
     logs_dir = Path(log_path)
     logs_dir.mkdir(parents=True, exist_ok=True)
@@ -64,7 +155,8 @@ def setup_logging(log_level: str = "INFO", log_path: str = "logs") -> None:
 
     # ── bot.log ─────────────────────────────────────────────────────────────
     # Полная история INFO+: регистрации, одобрения, VPN-операции, ошибки.
-    logger.add(
+    _add_file_sink(
+        "bot",
         logs_dir / "bot.log",
         level=log_level.upper(),
         format=(
@@ -79,7 +171,8 @@ def setup_logging(log_level: str = "INFO", log_path: str = "logs") -> None:
 
     # ── errors.log ──────────────────────────────────────────────────────────
     # Только ERROR и CRITICAL — для быстрой диагностики проблем.
-    logger.add(
+    _add_file_sink(
+        "errors",
         logs_dir / "errors.log",
         level="ERROR",
         format=(
@@ -97,7 +190,8 @@ def setup_logging(log_level: str = "INFO", log_path: str = "logs") -> None:
     # ── audit.log ───────────────────────────────────────────────────────────
     # Только кастомный уровень AUDIT: журнал безопасности без ротации по дням,
     # чтобы история не терялась. Ротация только по размеру.
-    logger.add(
+    _add_file_sink(
+        "audit",
         logs_dir / "audit.log",
         level=AUDIT_LEVEL_NAME,
         format="{time:YYYY-MM-DD HH:mm:ss} | AUDIT | {message}",
@@ -108,6 +202,26 @@ def setup_logging(log_level: str = "INFO", log_path: str = "logs") -> None:
         filter=_audit_only,
     )
 
+    if _writer is not None:
+        _writer.start()
+
+
+_FILE_OPTIONS = ("rotation", "retention", "compression", "encoding")
+
+
+def _add_file_sink(name: str, path: Path, **kwargs: Any) -> None:
+    """
+    Добавляет файловый sink: напрямую или через фоновый LogWriter.
+
+    Уровень, формат и фильтр применяются в основном logger-е (в потоке
+    вызова), параметры файла — rotation/retention/compression — у писателя.
+    """
+    if _writer is None:
+        logger.add(path, **kwargs)
+        return
+    file_kwargs = {key: kwargs.pop(key) for key in _FILE_OPTIONS if key in kwargs}
+    logger.add(_writer.add_file(name, path, **file_kwargs), **kwargs)
+
 
 # ── фильтры ──────────────────────────────────────────────────────────────────
 
@@ -140,14 +254,22 @@ def audit(event: str, **kwargs: object) -> None:
 
 
 def log_wg_command(args: list[str]) -> None:
-    """DEBUG: команда передаваемая в wg/awg."""
-    safe_args = " ".join(str(a) for a in args)
-    logger.debug(f"[WG] Команда: {safe_args}")
+    """DEBUG: команда передаваемая в wg/awg (строка собирается только при включённом DEBUG)."""
+    logger.opt(lazy=True).debug("[WG] Команда: {}", lambda: " ".join(str(a) for a in args))
 
 
 def log_wg_result(returncode: int, stderr: str = "") -> None:
     """DEBUG: результат выполнения wg/awg команды."""
     if returncode == 0:
-        logger.debug(f"[WG] Успешно (returncode=0)")
+        logger.debug("[WG] Успешно (returncode=0)")
     else:
-        logger.debug(f"[WG] Ошибка (returncode={returncode}): {stderr.strip()}")
+        logger.opt(lazy=True).debug(
+            "[WG] Ошибка (returncode={}): {}", lambda: returncode, lambda: stderr.strip(),
+        )
+
+
+async def complete_logging() -> None:
+    """Дожидается записи всех сообщений из очереди фоновых файловых sink-ов."""
+    await logger.complete()
+    if _writer is not None:
+        await asyncio.to_thread(_writer.flush)
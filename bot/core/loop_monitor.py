@@ -0,0 +1,125 @@
+"""
+Монитор лага event loop.
+
+Фоновая задача раз в ``interval`` засыпает через asyncio.sleep и меряет,
+насколько позже запланированного проснулась. Задержка — это время, пока
+цикл был занят синхронной работой (рендер QR, массовая расшифровка Fernet,
+блокирующий ввод-вывод). Значения идут в гистограмму
+andreyvpn_event_loop_lag_seconds и скользящее окно для /perf.
+
+Если лаг превысил ``threshold``, в лог пишется предупреждение с именами
+выполняющихся хендлеров, а вызывающий получает alert() — не чаще раза
+в ``cooldown`` секунд (пропущенные превышения считаются и передаются со
+следующим алертом).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from loguru import logger
+
+from bot.core import metrics
+
+Alert = Callable[[float, list[str], int], Awaitable[None]]
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+class LoopLagMonitor:
+    """Проба задержки планирования event loop с алертами при превышении порога."""
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        threshold: float = 0.25,
+        cooldown: float = 300.0,
+        alert: Alert | None = None,
+        running: Callable[[], list[str]] | None = None,
+        window: int = 600,
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._alert = alert
+        self._running = running
+        self._recent: deque[float] = deque(maxlen=window)
+        self._stalls = 0
+        self._suppressed = 0
+        self._last_alert: float | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._alert_task: asyncio.Task[None] | None = None
+
+    # ── Жизненный цикл ───────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._alert_task):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        self._alert_task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, loop.time() - expected))
+
+    # ── Обработка замеров ────────────────────────────────────────────────────
+
+    def observe(self, lag: float) -> None:
+        metrics.EVENT_LOOP_LAG_SECONDS.observe(lag)
+        self._recent.append(lag)
+        if not self.threshold or lag < self.threshold:
+            return
+
+        self._stalls += 1
+        handlers = self._running() if self._running is not None else []
+        logger.warning(
+            "[LOOP] Лаг event loop | lag_ms={:.0f} handlers={}",
+            lag * 1000, ", ".join(handlers) or "-",
+        )
+        if self._alert is None:
+            return
+        now = time.monotonic()
+        if self._last_alert is not None and now - self._last_alert < self.cooldown:
+            self._suppressed += 1
+            return
+        if self._alert_task is not None and not self._alert_task.done():
+            self._suppressed += 1
+            return
+        self._last_alert = now
+        suppressed, self._suppressed = self._suppressed, 0
+        self._alert_task = asyncio.create_task(self._send(lag, handlers, suppressed), name="loop-lag-alert")
+
+    async def _send(self, lag: float, handlers: list[str], suppressed: int) -> None:
+        assert self._alert is not None
+        try:
+            await self._alert(lag, handlers, suppressed)
+        except Exception as e:
+            logger.warning("[LOOP] Не удалось отправить алерт | error={}", e)
+
+    def stats(self) -> dict[str, Any]:
+        ordered = sorted(self._recent)
+        return {
+            "p50_ms": _percentile(ordered, 0.50) * 1000,
+            "p95_ms": _percentile(ordered, 0.95) * 1000,
+            "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+            "stalls": self._stalls,
+            "threshold_ms": self.threshold * 1000,
+        }
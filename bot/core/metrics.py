@@ -0,0 +1,374 @@
+"""
+Метрики бота в формате Prometheus (text exposition format 0.0.4).
+
+Небольшой собственный реестр без внешних зависимостей: Counter, Gauge и
+Histogram с метками, плюс HTTP-эндпоинт ``/metrics`` на asyncio.start_server.
+Эндпоинт включается настройкой METRICS_PORT (0 — выключен).
+
+Использование:
+    from bot.core import metrics
+
+    metrics.WG_COMMAND_SECONDS.labels(command="awg set").observe(0.012)
+    with metrics.HANDLER_SECONDS.labels(router="user.profiles").time():
+        ...
+"""
+from __future__ import annotations
+
+import asyncio
+import asyncio.base_events
+import bisect
+import math
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any, TypeVar
+
+from loguru import logger
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values, strict=True))
+    return "{" + pairs + "}"
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+
+    def labels(self, **labels: str) -> Any:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self) -> Any:
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels, use .labels(...)")
+        return self.labels()
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """Значение одной комбинации меток."""
+
+    def clear(self) -> None:
+        self._children.clear()
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, child in sorted(self._children.items()):
+            yield from self._render_child(key, child)
+
+    def _render_child(self, key: tuple[str, ...], child: Any) -> Iterator[str]:
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class _ValueChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+
+class _CounterChild(_ValueChild):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        self.value += amount
+
+
+class _GaugeChild(_ValueChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(b for b in buckets if b != math.inf))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def _render_child(self, key: tuple[str, ...], child: _HistogramChild) -> Iterator[str]:
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts, strict=True):
+            cumulative += count
+            labels = _format_labels(names, key + (_format_value(bound),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {child.count}"
+
+
+Collector = Callable[[], Awaitable[None]]
+_M = TypeVar("_M", bound=_Metric)
+
+
+class Registry:
+    """
+    Набор метрик и асинхронных коллекторов.
+
+    Коллекторы вызываются перед отдачей /metrics и обновляют gauge-и,
+    которые дорого поддерживать на каждом событии (число пиров, заявок).
+    Ошибка коллектора не ломает эндпоинт — остальные метрики отдаются.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Collector] = []
+
+    def register(self, metric: _M) -> _M:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def clear_collectors(self) -> None:
+        self._collectors.clear()
+
+    async def collect(self) -> None:
+        for collector in list(self._collectors):
+            try:
+                await collector()
+            except Exception as e:
+                logger.warning("[METRICS] Коллектор завершился с ошибкой | error={}", e)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Сбрасывает значения всех метрик (для тестов)."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+def _register(metric: _M) -> _M:
+    REGISTRY.register(metric)
+    return metric
+
+
+# ── Метрики бота ─────────────────────────────────────────────────────────────
+
+HANDLER_SECONDS = _register(Histogram(
+    "andreyvpn_handler_duration_seconds",
+    "Handler latency by router (bot.handlers.<router>)",
+    ["router"],
+))
+WG_COMMAND_SECONDS = _register(Histogram(
+    "andreyvpn_wg_command_duration_seconds",
+    "Duration of wg/awg/docker subprocess calls by command",
+    ["command"],
+))
+DB_QUERY_SECONDS = _register(Histogram(
+    "andreyvpn_db_query_duration_seconds",
+    "SQL statement latency by statement type (SELECT, INSERT, COMMIT, ...)",
+    ["query"],
+))
+MIDDLEWARE_REJECTIONS = _register(Counter(
+    "andreyvpn_middleware_rejections_total",
+    "Updates dropped by middlewares",
+    ["middleware", "reason"],
+))
+ACTIVE_PEERS = _register(Gauge(
+    "andreyvpn_active_peers",
+    "Peers configured on the WireGuard interface",
+))
+ONLINE_PEERS = _register(Gauge(
+    "andreyvpn_online_peers",
+    "Peers with a handshake within WG_ONLINE_WINDOW",
+))
+PEERS_DETACHED = _register(Counter(
+    "andreyvpn_peers_detached_total",
+    "Idle peers detached from the interface by the idle-peer collector",
+))
+DETACHED_PEERS = _register(Gauge(
+    "andreyvpn_detached_peers",
+    "Profiles currently detached from the interface as idle",
+))
+ADDRESS_POOL_USAGE = _register(Gauge(
+    "andreyvpn_address_pool_usage_ratio",
+    "Share of VPN_IP_RANGE host addresses assigned to profiles",
+))
+NODE_PROFILES = _register(Gauge(
+    "andreyvpn_node_profiles",
+    "Profiles assigned to each VPN node",
+    ["node"],
+))
+IP_POOL_USAGE = _register(Gauge(
+    "andreyvpn_ip_pool_usage_ratio",
+    "Share of each address pool's host addresses assigned to profiles",
+    ["node", "pool"],
+))
+PENDING_APPROVALS = _register(Gauge(
+    "andreyvpn_pending_approvals",
+    "Users waiting for admin approval",
+))
+PEER_RECONCILE_CHANGES = _register(Counter(
+    "andreyvpn_peer_reconcile_changes_total",
+    "Peer changes applied by DB/interface reconciliation",
+    ["action"],
+))
+EVENT_LOOP_LAG_SECONDS = _register(Histogram(
+    "andreyvpn_event_loop_lag_seconds",
+    "Event loop scheduling delay measured by the lag probe",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+))
+
+
+# ── HTTP-эндпоинт ────────────────────────────────────────────────────────────
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """Минимальный HTTP/1.0 сервер: GET /metrics → текст реестра, остальное — 404."""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY) -> None:
+        self.host = host
+        self.port = port
+        self._registry = registry
+        self._server: asyncio.base_events.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        sockets = self._server.sockets or ()
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info("[METRICS] Эндпоинт запущен | url=http://{}:{}/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны — дочитываем до пустой строки
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+            if len(parts) >= 2 and parts[0] == "GET" and path == "/metrics":
+                await self._registry.collect()
+                await self._respond(writer, "200 OK", self._registry.render(), CONTENT_TYPE)
+            else:
+                await self._respond(writer, "404 Not Found", "not found\n", "text/plain")
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, body: str, content_type: str) -> None:
+        payload = body.encode("utf-8")
+        head = (
+            f"HTTP/1.0 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
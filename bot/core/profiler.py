@@ -0,0 +1,201 @@
+"""
+Сэмплирующий профайлер работающего бота (команда администратора /profile).
+
+За ограниченное время собирает три картины:
+  CPU-стеки   — фоновый поток раз в ``interval`` читает стек потока event loop
+                (sys._current_frames); ожидание в selector считается простоем
+  корутины    — в event loop на каждом тике берётся самая глубокая корутина
+                каждой задачи вне asyncio (цепочка cr_await): сколько тиков
+                задача провела в каждом await — приближение wall time
+  лаг цикла   — насколько позже запланированного просыпается asyncio.sleep
+
+Результат пишется в logs/: ``profile-<время>.folded`` (CPU-стеки в формате
+flamegraph.pl) и ``profile-<время>.txt`` (сводка). Одновременно работает не
+больше одного профиля.
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+MAX_DURATION = 300.0
+IDLE = "<idle>"
+# Листовые функции, в которых поток event loop ждёт событий
+_IDLE_FUNCTIONS = frozenset({"select", "poll", "epoll", "kqueue", "control", "_poll"})
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{Path(code.co_filename).stem}:{name}"
+
+
+def _stack(frame: FrameType | None) -> tuple[str, ...]:
+    labels: list[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+_ASYNCIO_DIR = str(Path(asyncio.__file__).parent)
+
+
+def _innermost_coroutine(task: asyncio.Task[Any]) -> str | None:
+    """Самая глубокая корутина задачи вне asyncio (asyncio.sleep и т. п. не интересны)."""
+    coro: Any = task.get_coro()
+    label = None
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        if not frame.f_code.co_filename.startswith(_ASYNCIO_DIR) or label is None:
+            label = _frame_label(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return label
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(q * (len(ordered) - 1)))]
+
+
+@dataclass
+class ProfileResult:
+    duration: float
+    interval: float
+    stacks: Counter[tuple[str, ...]] = field(default_factory=Counter)
+    coroutines: Counter[str] = field(default_factory=Counter)
+    lag: list[float] = field(default_factory=list)
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    @property
+    def busy_samples(self) -> int:
+        return self.samples - self.stacks.get((IDLE,), 0)
+
+    def top_frames(self, limit: int = 10) -> list[tuple[str, int, int]]:
+        """Функции по собственным сэмплам: (функция, собственные, включая вызванные)."""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            if stack == (IDLE,):
+                continue
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [(label, n, total[label]) for label, n in own.most_common(limit)]
+
+    def top_coroutines(self, limit: int = 10) -> list[tuple[str, float]]:
+        """Корутины по времени ожидания/выполнения, с."""
+        return [(label, n * self.interval) for label, n in self.coroutines.most_common(limit)]
+
+    def lag_stats(self) -> dict[str, float]:
+        ordered = sorted(self.lag)
+        return {
+            "p50_ms": _percentile(ordered, 0.50) * 1000,
+            "p95_ms": _percentile(ordered, 0.95) * 1000,
+            "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, limit: int = 15) -> str:
+        samples = self.samples or 1
+        lag = self.lag_stats()
+        lines = [
+            f"duration={self.duration:.1f}s interval={self.interval * 1000:.0f}ms "
+            f"samples={self.samples} busy={self.busy_samples / samples:.1%}",
+            f"loop lag: p50={lag['p50_ms']:.1f}ms p95={lag['p95_ms']:.1f}ms max={lag['max_ms']:.1f}ms",
+            "",
+            "CPU (own / total samples):",
+        ]
+        lines += [f"  {own:>6} {total:>6}  {label}" for label, own, total in self.top_frames(limit)]
+        lines += ["", "Coroutines (wall s):"]
+        lines += [f"  {seconds:>8.2f}  {label}" for label, seconds in self.top_coroutines(limit)]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str | Path) -> tuple[Path, Path]:
+        """Пишет .folded и .txt в directory; вызывать через asyncio.to_thread."""
+        base = Path(directory)
+        base.mkdir(parents=True, exist_ok=True)
+        stem = f"profile-{datetime.now():%Y%m%d-%H%M%S}"
+        folded, summary = base / f"{stem}.folded", base / f"{stem}.txt"
+        folded.write_text(self.folded(), encoding="utf-8")
+        summary.write_text(self.summary(), encoding="utf-8")
+        return folded, summary
+
+
+class SamplingProfiler:
+    """Один запуск профиля: ``await SamplingProfiler(interval).run(duration)``."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+
+    def _sample_cpu(self, thread_id: int, stop: threading.Event, result: ProfileResult) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            if frame.f_code.co_name in _IDLE_FUNCTIONS:
+                result.stacks[(IDLE,)] += 1
+            else:
+                result.stacks[_stack(frame)] += 1
+
+    async def run(self, duration: float) -> ProfileResult:
+        duration = min(max(duration, self.interval), MAX_DURATION)
+        result = ProfileResult(duration=duration, interval=self.interval)
+        loop = asyncio.get_running_loop()
+        current = asyncio.current_task()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample_cpu,
+            args=(threading.get_ident(), stop, result),
+            name="profiler-sampler",
+            daemon=True,
+        )
+        sampler.start()
+        try:
+            deadline = loop.time() + duration
+            while loop.time() < deadline:
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                result.lag.append(max(0.0, loop.time() - expected))
+                for task in asyncio.all_tasks(loop):
+                    if task is current:
+                        continue
+                    label = _innermost_coroutine(task)
+                    if label is not None:
+                        result.coroutines[label] += 1
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+        return result
+
+
+_active: asyncio.Task[ProfileResult] | None = None
+
+
+def is_running() -> bool:
+    return _active is not None and not _active.done()
+
+
+def start(duration: float, interval: float = 0.01) -> asyncio.Task[ProfileResult]:
+    """Запускает профиль в фоне. RuntimeError, если профиль уже идёт."""
+    global _active
+    if is_running():
+        raise RuntimeError("profile is already running")
+    _active = asyncio.create_task(SamplingProfiler(interval).run(duration), name="profiler")
+    return _active
@@ -0,0 +1,187 @@
+"""
+Поэтапный старт бота и отчёт о нём.
+
+Блокирующие фазы (инициализация БД, регистрация middleware) выполняются в
+on_startup через ``with report.phase(...)`` — без них бот не может принимать
+апдейты. Всё, что можно доделать позже (восстановление пиров, проверка
+SERVER_PUB_KEY), запускается ``report.background(...)``: polling стартует
+сразу, фоновые фазы идут параллельно.
+
+Когда все фоновые фазы завершились, отчёт с длительностями пишется в лог и
+передаётся колбэкам on_ready (уведомление администратора). Текущее состояние
+показывает команда /startup.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+
+from loguru import logger
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+_ICONS = {PENDING: "⏸", RUNNING: "⏳", DONE: "✅", FAILED: "❌"}
+
+
+class StartupPhase:
+    __slots__ = ("name", "background", "status", "started", "duration", "detail")
+
+    def __init__(self, name: str, background: bool) -> None:
+        self.name = name
+        self.background = background
+        self.status = PENDING
+        self.started: float | None = None
+        self.duration: float | None = None
+        self.detail = ""
+
+    def elapsed(self) -> float:
+        if self.duration is not None:
+            return self.duration
+        if self.started is None:
+            return 0.0
+        return time.perf_counter() - self.started
+
+
+class StartupReport:
+    """Фазы старта: статус, длительность, готовность."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, StartupPhase] = {}
+        self.accepting_updates: float | None = None  # с от начала старта
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._on_ready: list[Callable[[StartupReport], Awaitable[None]]] = []
+        self._reported = False
+
+    # ── Фазы ─────────────────────────────────────────────────────────────────
+
+    def _begin(self, name: str, background: bool) -> StartupPhase:
+        phase = self.phases[name] = StartupPhase(name, background)
+        phase.status = RUNNING
+        phase.started = time.perf_counter()
+        return phase
+
+    @staticmethod
+    def _end(phase: StartupPhase, error: BaseException | None = None) -> float:
+        duration = phase.duration = time.perf_counter() - (phase.started or 0.0)
+        if error is None:
+            phase.status = DONE
+        else:
+            phase.status = FAILED
+            phase.detail = phase.detail or str(error) or type(error).__name__
+        return duration
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[StartupPhase]:
+        """Блокирующая фаза: ошибка фиксируется и пробрасывается дальше."""
+        phase = self._begin(name, background=False)
+        try:
+            yield phase
+        except BaseException as e:
+            self._end(phase, e)
+            raise
+        duration = self._end(phase)
+        logger.info("[STARTUP] Фаза {} | {:.0f} мс", name, duration * 1000)
+
+    def record(self, name: str, duration: float) -> StartupPhase:
+        """Фаза, измеренная снаружи (например, импорт модулей до создания отчёта)."""
+        phase = self.phases[name] = StartupPhase(name, background=False)
+        phase.status = DONE
+        phase.duration = duration
+        logger.info("[STARTUP] Фаза {} | {:.0f} мс", name, duration * 1000)
+        return phase
+
+    def mark_accepting(self) -> None:
+        """Бот готов принимать апдейты (блокирующие фазы позади)."""
+        self.accepting_updates = time.perf_counter() - self.started
+        logger.info("[STARTUP] Приём апдейтов через {:.0f} мс после старта", self.accepting_updates * 1000)
+
+    def background(self, name: str, job: Callable[[StartupPhase], Awaitable[None]]) -> asyncio.Task[None]:
+        """
+        Фоновая фаза. job получает StartupPhase и может записать итог в
+        ``phase.detail``; исключения логируются и помечают фазу как failed.
+        """
+        phase = self._begin(name, background=True)
+
+        async def run() -> None:
+            try:
+                await job(phase)
+            except asyncio.CancelledError:
+                self._end(phase, asyncio.CancelledError())
+                phase.detail = "cancelled"
+                raise
+            except Exception as e:
+                self._end(phase, e)
+                logger.warning("[STARTUP] Фоновая фаза {} не удалась: {}", name, e)
+            else:
+                duration = self._end(phase)
+                logger.info(
+                    "[STARTUP] Фоновая фаза {} | {:.0f} мс{}",
+                    name, duration * 1000, f" | {phase.detail}" if phase.detail else "",
+                )
+            await self._maybe_ready()
+
+        task = asyncio.create_task(run(), name=f"startup-{name}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # ── Готовность ───────────────────────────────────────────────────────────
+
+    @property
+    def ready(self) -> bool:
+        return self.accepting_updates is not None and all(
+            p.status in (DONE, FAILED) for p in self.phases.values()
+        )
+
+    def on_ready(self, callback: Callable[[StartupReport], Awaitable[None]]) -> None:
+        self._on_ready.append(callback)
+
+    async def _maybe_ready(self) -> None:
+        if self._reported or not self.ready:
+            return
+        self._reported = True
+        logger.info("[STARTUP] Старт завершён\n{}", self.render(html=False))
+        for callback in self._on_ready:
+            try:
+                await callback(self)
+            except Exception as e:
+                logger.warning("[STARTUP] Не удалось отправить отчёт о старте: {}", e)
+
+    async def finish(self) -> None:
+        """Вызывается после блокирующих фаз: если фоновых нет, отчёт уходит сразу."""
+        await self._maybe_ready()
+
+    async def wait(self) -> None:
+        """Ждёт завершения фоновых фаз (для тестов и shutdown)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def cancel(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.wait()
+
+    # ── Отображение ──────────────────────────────────────────────────────────
+
+    def render(self, html: bool = True) -> str:
+        import html as html_module
+
+        def b(text: str) -> str:
+            return f"<b>{text}</b>" if html else text
+
+        state = "готов" if self.ready else "фоновые фазы выполняются"
+        lines = [f"🚀 {b('Старт бота')}: {state}"]
+        if self.accepting_updates is not None:
+            lines.append(f"Приём апдейтов: через {self.accepting_updates * 1000:.0f} мс")
+        for phase in self.phases.values():
+            kind = "фон" if phase.background else "блок."
+            detail = f" — {phase.detail}" if phase.detail else ""
+            if html:
+                detail = html_module.escape(detail)
+            lines.append(
+                f"{_ICONS[phase.status]} {phase.name} ({kind}): {phase.elapsed() * 1000:.0f} мс{detail}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,297 @@
+"""
+Разделяемое состояние бота: TTL-ключи и token bucket'ы.
+
+Две реализации с одинаковым интерфейсом:
+  MemoryStateStore — в памяти процесса, размер ограничен (по умолчанию)
+  RedisStateStore  — в Redis (REDIS_URL), общее для нескольких реплик бота
+
+Используется для антифлуда (ThrottlingMiddleware), дедупликации запросов
+на VPN-профиль и кэша статуса одобрения (AccessControlMiddleware). Все
+операции атомарны: в памяти — за счёт однопоточного event loop, в Redis —
+SET NX PX и Lua-скрипт.
+
+Использование:
+    store = get_state_store()
+    if await store.try_lock("vpn_request:123", ttl=86400):
+        ...  # первый запрос
+    await store.unlock("vpn_request:123")
+"""
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Hashable
+from typing import Any
+
+from loguru import logger
+
+
+class TokenBuckets:
+    """
+    Компактное хранилище token bucket'ов.
+
+    Состояние хранится в двух массивах ``array('d')`` (токены и момент
+    последнего пересчёта); dict отображает ключ → номер слота. Пополнение
+    ленивое: токены пересчитываются только при обращении к слоту.
+
+    При заполнении (maxsize) освобождаются слоты, чьи вёдра уже полностью
+    восполнились — они неотличимы от новых.
+    """
+
+    def __init__(self, rate: float, burst: float, maxsize: int = 10_000) -> None:
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self._maxsize = maxsize
+        self._slots: dict[Hashable, int] = {}
+        self._keys: list[Hashable] = []
+        self._tokens = array("d")
+        self._stamp = array("d")
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def consume(self, key: Hashable, cost: float, now: float) -> bool:
+        """Списывает cost токенов. False — токенов недостаточно (ничего не списано)."""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key)
+            tokens = self.burst
+        else:
+            tokens = self._tokens[slot] + (now - self._stamp[slot]) * self.rate
+            if tokens > self.burst:
+                tokens = self.burst
+        self._stamp[slot] = now
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            return True
+        self._tokens[slot] = tokens
+        return False
+
+    def tokens(self, key: Hashable, now: float) -> float:
+        """Текущее число токенов пользователя (без списания)."""
+        slot = self._slots.get(key)
+        if slot is None:
+            return self.burst
+        return min(self.burst, self._tokens[slot] + (now - self._stamp[slot]) * self.rate)
+
+    def _allocate(self, key: Hashable) -> int:
+        if len(self._slots) >= self._maxsize and not self._free:
+            self._sweep(time.monotonic())
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._tokens.append(0.0)
+            self._stamp.append(0.0)
+        self._slots[key] = slot
+        return slot
+
+    def _sweep(self, now: float) -> None:
+        """Освобождает полностью восполненные вёдра; если таких нет — самое старое."""
+        oldest_slot, oldest_stamp = -1, now
+        for key, slot in list(self._slots.items()):
+            stamp = self._stamp[slot]
+            if self._tokens[slot] + (now - stamp) * self.rate >= self.burst:
+                del self._slots[key]
+                self._free.append(slot)
+            elif stamp <= oldest_stamp:
+                oldest_slot, oldest_stamp = slot, stamp
+        if not self._free and oldest_slot >= 0:
+            del self._slots[self._keys[oldest_slot]]
+            self._free.append(oldest_slot)
+
+
+class StateStore(ABC):
+    """Интерфейс хранилища разделяемого состояния."""
+
+    @abstractmethod
+    async def try_lock(self, key: str, ttl: float) -> bool:
+        """Атомарно создаёт ключ на ttl секунд. False — ключ уже существует."""
+
+    @abstractmethod
+    async def unlock(self, key: str) -> None:
+        """Удаляет ключ (если есть)."""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Есть ли живой (не истёкший) ключ."""
+
+    @abstractmethod
+    async def get_value(self, key: str) -> str | None:
+        """Значение живого ключа; None — ключа нет или истёк TTL."""
+
+    @abstractmethod
+    async def set_value(self, key: str, value: str, ttl: float) -> None:
+        """Записывает значение на ttl секунд (перезаписывает существующее)."""
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        """Списывает cost токенов из ведра key. False — токенов недостаточно."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        """Освобождает ресурсы (соединения)."""
+
+
+class MemoryStateStore(StateStore):
+    """
+    Хранилище в памяти процесса.
+
+    TTL-ключи лежат в dict key → (момент истечения, значение); при превышении maxsize
+    сначала вычищаются истёкшие, затем самые старые ключи — память ограничена.
+    """
+
+    def __init__(self, maxsize: int = 100_000) -> None:
+        self._maxsize = maxsize
+        self._keys: dict[str, tuple[float, str]] = {}
+        self._buckets: dict[tuple[float, float], TokenBuckets] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    async def try_lock(self, key: str, ttl: float) -> bool:
+        if self._live(key) is not None:
+            return False
+        self._put(key, "1", ttl)
+        return True
+
+    async def unlock(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    async def exists(self, key: str) -> bool:
+        return self._live(key) is not None
+
+    async def get_value(self, key: str) -> str | None:
+        return self._live(key)
+
+    async def set_value(self, key: str, value: str, ttl: float) -> None:
+        self._put(key, value, ttl)
+
+    async def consume(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        buckets = self._buckets.get((rate, burst))
+        if buckets is None:
+            buckets = self._buckets[(rate, burst)] = TokenBuckets(rate=rate, burst=burst)
+        return buckets.consume(key, cost, time.monotonic())
+
+    async def close(self) -> None:
+        """Соединений нет — закрывать нечего."""
+
+    def _live(self, key: str) -> str | None:
+        entry = self._keys.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._keys[key]
+            return None
+        return entry[1]
+
+    def _put(self, key: str, value: str, ttl: float) -> None:
+        now = time.monotonic()
+        self._keys.pop(key, None)  # переставляем в конец порядка вставки
+        self._keys[key] = (now + ttl, value)
+        if len(self._keys) > self._maxsize:
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        for key in [k for k, (exp, _) in self._keys.items() if exp <= now]:
+            del self._keys[key]
+        while len(self._keys) > self._maxsize:
+            del self._keys[next(iter(self._keys))]
+
+
+# Token bucket целиком на стороне Redis: время берётся из TIME сервера,
+# поэтому у всех реплик одни часы. Ключ живёт, пока ведро не восполнится.
+_CONSUME_LUA = """
+local cost = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 's')
+local tokens = tonumber(state[1])
+local stamp = tonumber(state[2])
+if tokens == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + (now - stamp) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 's', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return allowed
+"""
+
+
+class RedisStateStore(StateStore):
+    """Хранилище в Redis — общее для всех реплик бота."""
+
+    def __init__(self, redis: Any, prefix: str = "andreyvpn:") -> None:
+        self._redis = redis
+        self._prefix = prefix
+        self._consume_script = redis.register_script(_CONSUME_LUA)
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "andreyvpn:") -> RedisStateStore:
+        from redis.asyncio import Redis
+
+        return cls(Redis.from_url(url), prefix=prefix)
+
+    async def try_lock(self, key: str, ttl: float) -> bool:
+        ms = max(int(ttl * 1000), 1)
+        return bool(await self._redis.set(self._prefix + key, b"1", nx=True, px=ms))
+
+    async def unlock(self, key: str) -> None:
+        await self._redis.delete(self._prefix + key)
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self._redis.exists(self._prefix + key))
+
+    async def get_value(self, key: str) -> str | None:
+        value = await self._redis.get(self._prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set_value(self, key: str, value: str, ttl: float) -> None:
+        await self._redis.set(self._prefix + key, value.encode(), px=max(int(ttl * 1000), 1))
+
+    async def consume(self, key: str, cost: float, rate: float, burst: float) -> bool:
+        allowed = await self._consume_script(
+            keys=[f"{self._prefix}tb:{key}"], args=[cost, rate, burst],
+        )
+        return bool(allowed)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_state_store(redis_url: str | None) -> StateStore:
+    """RedisStateStore при заданном REDIS_URL, иначе MemoryStateStore."""
+    if redis_url:
+        try:
+            store = RedisStateStore.from_url(redis_url)
+            logger.info("[STARTUP] State store: Redis | url={}...", redis_url[:30])
+            return store
+        except ImportError:
+            logger.warning("[STARTUP] Пакет redis не установлен, state store в памяти процесса")
+    return MemoryStateStore()
+
+
+_store: StateStore = MemoryStateStore()
+
+
+def get_state_store() -> StateStore:
+    return _store
+
+
+def set_state_store(store: StateStore) -> None:
+    global _store
+    _store = store
@@ -0,0 +1,322 @@
+"""
+Трассировка апдейтов: дерево span-ов на каждый апдейт.
+
+TracingMiddleware открывает корневой span ``update`` (start_trace), дальше
+span-ы создаются вложенно через ``with span(...)`` / ``@traced``:
+  handler <имя>  — HandlerTimingMiddleware
+  db <SQL>       — InstrumentedConnection
+  wg <команда>   — VPNService._run
+  executor.wait  — ожидание в очереди OrderedUpdateExecutor (handoff)
+
+Текущий span живёт в contextvars, поэтому параллельные апдейты не
+смешиваются. Идентификатор трассы привязывается к loguru как ``extra[ctx]``
+— все строки лога одного апдейта можно найти по нему.
+
+Завершённая трасса экспортируется, если попала в выборку (TRACE_SAMPLE_RATE)
+или длилась дольше TRACE_SLOW_MS, — одной JSON-строкой в TRACE_PATH.
+scripts/trace_to_folded.py превращает файл в folded stacks для flame graph.
+
+Без активной трассы span() ничего не делает и почти ничего не стоит.
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Protocol, TypeVar
+
+from loguru import logger
+
+MAX_SPANS = 512  # на трассу: длинные циклы не раздувают память
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "duration", "attrs", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: int | None, attrs: dict[str, Any]) -> None:
+        self.trace = trace
+        self.span_id = len(trace.spans)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration: float | None = None
+        self.attrs = attrs
+        self.error: str | None = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: float) -> dict[str, Any]:
+        return {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Span-ы одного апдейта. Экспортируется, когда отпущены все удержания (hold)."""
+
+    __slots__ = ("trace_id", "started_at", "spans", "dropped", "sampled", "_holds")
+
+    def __init__(self, sampled: bool) -> None:
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.spans: list[Span] = []
+        self.dropped = 0
+        self.sampled = sampled
+        self._holds = 0
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def new_span(self, name: str, parent: Span | None, attrs: dict[str, Any]) -> Span | None:
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = Span(self, name, None if parent is None else parent.span_id, attrs)
+        self.spans.append(span)
+        return span
+
+    def hold(self) -> None:
+        self._holds += 1
+
+    def release(self) -> None:
+        self._holds -= 1
+        if self._holds == 0:
+            # Корень охватывает и работу, переданную в другие задачи (handoff)
+            self.root.duration = self.elapsed()
+            _tracer.finish(self)
+
+    def elapsed(self) -> float:
+        """От начала корневого span-а до конца последнего (с учётом переданной работы)."""
+        end = max(s.start + (s.duration or 0.0) for s in self.spans)
+        return end - self.root.start
+
+    def to_dict(self) -> dict[str, Any]:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "timestamp": self.started_at,
+            "duration_ms": round(self.elapsed() * 1000, 3),
+            "attrs": root.attrs,
+            "dropped_spans": self.dropped,
+            "spans": [s.to_dict(root.start) for s in self.spans],
+        }
+
+
+class TraceExporter(Protocol):
+    def export(self, trace: dict[str, Any]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class JsonlTraceExporter:
+    """
+    Пишет трассы JSON-строками в файл из фонового потока (event loop не
+    блокируется). При превышении max_bytes файл переименовывается в ``.1``.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 50 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: dict[str, Any]) -> None:
+        self._queue.put(trace)
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+            except Exception as exc:
+                logger.warning("[TRACE] Не удалось записать трассу | error={}", exc)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, line: str) -> None:
+        if self.path.exists() and self.path.stat().st_size >= self.max_bytes:
+            os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+    def flush(self) -> None:
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class _Tracer:
+    def __init__(self) -> None:
+        self.exporter: TraceExporter | None = None
+        self.sample_rate = 0.0
+        self.slow = 0.0  # с; 0 — без хвостовой выборки
+
+    def sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def finish(self, trace: Trace) -> None:
+        if self.exporter is None:
+            return
+        if trace.sampled or (self.slow and trace.elapsed() >= self.slow):
+            self.exporter.export(trace.to_dict())
+
+
+_tracer = _Tracer()
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("trace_span", default=None)
+
+
+def configure(exporter: TraceExporter | None, sample_rate: float = 0.0, slow_ms: float = 0.0) -> None:
+    """Включает экспорт трасс. exporter=None — span-ы строятся, но никуда не пишутся."""
+    _tracer.exporter = exporter
+    _tracer.sample_rate = sample_rate
+    _tracer.slow = slow_ms / 1000
+
+
+def shutdown() -> None:
+    exporter, _tracer.exporter = _tracer.exporter, None
+    if exporter is not None:
+        exporter.close()
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+def current_trace_id() -> str | None:
+    span = _current.get()
+    return None if span is None else span.trace.trace_id
+
+
+@contextmanager
+def _activate(span: Span) -> Iterator[Span]:
+    token = _current.set(span)
+    try:
+        with logger.contextualize(ctx=span.trace.trace_id):
+            yield span
+    finally:
+        _current.reset(token)
+
+
+def _close(span: Span, exc: BaseException | None) -> None:
+    span.duration = time.perf_counter() - span.start
+    if exc is not None:
+        span.error = type(exc).__name__
+
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Span]:
+    """Корневой span новой трассы (один на апдейт)."""
+    trace = Trace(_tracer.sample())
+    root = trace.new_span(name, None, attrs)
+    assert root is not None
+    trace.hold()
+    exc: BaseException | None = None
+    try:
+        with _activate(root):
+            yield root
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        _close(root, exc)
+        trace.release()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | None]:
+    """Вложенный span текущей трассы; вне трассы — no-op (yield None)."""
+    parent = _current.get()
+    child = None if parent is None else parent.trace.new_span(name, parent, attrs)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    exc: BaseException | None = None
+    try:
+        yield child
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        _current.reset(token)
+        _close(child, exc)
+
+
+def annotate(**attrs: Any) -> None:
+    """Добавляет атрибуты корневому span-у (например, причину отказа middleware)."""
+    current = _current.get()
+    if current is not None:
+        current.trace.root.set(**attrs)
+
+
+def handoff(name: str = "executor.wait") -> Callable[[], ContextManager[Any]]:
+    """
+    Передача трассы в другую задачу (воркер OrderedUpdateExecutor).
+
+    Возвращает фабрику контекст-менеджера: внутри него восстановлены текущий
+    span и ctx логов, время между handoff() и входом пишется span-ом ``name``.
+    Трасса не экспортируется, пока переданная работа не завершится.
+    """
+    parent = _current.get()
+    if parent is None:
+        return nullcontext
+    trace = parent.trace
+    trace.hold()
+    wait = trace.new_span(name, parent, {})
+
+    @contextmanager
+    def resume() -> Iterator[Span]:
+        if wait is not None:
+            _close(wait, None)
+        try:
+            with _activate(parent):
+                yield parent
+        finally:
+            trace.release()
+
+    return resume
+
+
+_F = TypeVar("_F", bound=Callable[..., Awaitable[Any]])
+
+
+def traced(name: str | None = None) -> Callable[[_F], _F]:
+    """Декоратор: span вокруг async-функции (по умолчанию — её __qualname__)."""
+
+    def decorator(func: _F) -> _F:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -4,7 +4,7 @@ from loguru import logger
 from bot.db.migrator import MigrationRunner
 
 
-async def init_db(db_path: str) -> None:
+async def init_db(db_path: str, db: aiosqlite.Connection | None = None) -> None:
     """
     Инициализирует базу данных и применяет все pending-миграции.
 
@@ -12,24 +12,34 @@ async def init_db(db_path: str) -> None:
       1. PRAGMA journal_mode = WAL  (concurrent reads)
       2. PRAGMA foreign_keys = ON   (referential integrity)
       3. MigrationRunner.run_pending() — создаёт таблицы и накатывает схему
+
+    Если передано соединение db, миграции идут через него (бот не открывает
+    второе соединение при старте) и оно остаётся открытым.
     """
     try:
-        async with aiosqlite.connect(db_path) as db:
-            db.row_factory = aiosqlite.Row
-            await db.execute("PRAGMA journal_mode = WAL")
-            await db.execute("PRAGMA foreign_keys = ON")
-
-            runner = MigrationRunner(db_path)
-            applied = await runner.run_pending(db)
-
-            if applied == 0:
-                logger.info("[STARTUP] База данных актуальна | path={}", db_path)
-            else:
-                logger.info(
-                    "[STARTUP] База данных обновлена | path={} migrations={}",
-                    db_path, applied,
-                )
+        if db is not None:
+            await _init(db_path, db)
+            return
+        async with aiosqlite.connect(db_path) as conn:
+            conn.row_factory = aiosqlite.Row
+            await _init(db_path, conn)
 
     except Exception as exc:
         logger.error("Ошибка при инициализации базы данных: {}", exc)
         raise
+
+
+async def _init(db_path: str, db: aiosqlite.Connection) -> None:
+    await db.execute("PRAGMA journal_mode = WAL")
+    await db.execute("PRAGMA foreign_keys = ON")
+
+    runner = MigrationRunner(db_path)
+    applied = await runner.run_pending(db)
+
+    if applied == 0:
+        logger.info("[STARTUP] База данных актуальна | path={}", db_path)
+    else:
+        logger.info(
+            "[STARTUP] База данных обновлена | path={} migrations={}",
+            db_path, applied,
+        )
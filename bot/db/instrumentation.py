@@ -0,0 +1,306 @@
+"""
+Инструментирование SQL-запросов.
+
+InstrumentedConnection оборачивает долгоживущее aiosqlite-соединение бота:
+каждый execute/executemany/commit замеряется и попадает в QueryStats под
+нормализованным текстом (литералы → ``?``, пробелы схлопнуты). Строки
+считаются при fetch*, время fetch добавляется к длительности запроса.
+
+Запросы дольше DB_SLOW_QUERY_MS пишутся в лог, а при DB_EXPLAIN_SLOW к ним
+прикладывается EXPLAIN QUERY PLAN. Топ медленных запросов — команда
+администратора /slowq.
+
+Так инструментируются и repository, и inline-запросы в middleware/хендлерах:
+все они получают соединение из data["db"]. Каждый запрос — span ``db <SQL>``
+текущей трассы (bot.core.tracing) и наблюдение в метрике
+andreyvpn_db_query_duration_seconds{query="<тип оператора>"}.
+"""
+from __future__ import annotations
+
+import re
+import time
+from typing import Any, Iterable, cast
+
+import aiosqlite
+from loguru import logger
+
+from bot.core import metrics, tracing
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+# Метка query метрики — первое слово оператора; прочие (PRAGMA, DDL) — OTHER
+_STATEMENT_LABELS = frozenset(_EXPLAINABLE + ("BEGIN", "COMMIT", "ROLLBACK"))
+
+MAX_SQL_LENGTH = 500
+
+
+def statement_label(sql: str) -> str:
+    """Нормализованный ``select * from t`` → ``SELECT``: ограниченный набор меток."""
+    verb = sql.split(" ", 1)[0].upper()
+    return verb if verb in _STATEMENT_LABELS else "OTHER"
+
+
+def normalize_sql(sql: str) -> str:
+    """``SELECT * FROM t WHERE id IN (1, 2)`` → ``SELECT * FROM t WHERE id IN (?...)``."""
+    text = _STRING.sub("?", sql)
+    text = _NUMBER.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    text = _PLACEHOLDER_LIST.sub("(?...)", text)
+    return text[:MAX_SQL_LENGTH]
+
+
+class _Statement:
+    __slots__ = ("count", "total", "max", "rows", "slow", "plan")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan: str | None = None
+
+
+class QueryStats:
+    """Счётчики по нормализованным запросам: число, суммарное и макс. время, строки."""
+
+    def __init__(self, max_statements: int = 500) -> None:
+        self._max_statements = max_statements
+        self._statements: dict[str, _Statement] = {}
+
+    def _get(self, sql: str) -> _Statement | None:
+        stats = self._statements.get(sql)
+        if stats is None:
+            if len(self._statements) >= self._max_statements:
+                return None  # динамический SQL без параметров — не раздуваем таблицу
+            stats = self._statements[sql] = _Statement()
+        return stats
+
+    def record(self, sql: str, duration: float, rows: int = 0) -> None:
+        stats = self._get(sql)
+        if stats is None:
+            return
+        stats.count += 1
+        stats.total += duration
+        stats.max = max(stats.max, duration)
+        stats.rows += rows
+
+    def add_fetch(self, sql: str, duration: float, rows: int) -> None:
+        """Время и строки, полученные fetch* после execute."""
+        stats = self._statements.get(sql)
+        if stats is None:
+            return
+        stats.total += duration
+        stats.rows += rows
+
+    def mark_slow(self, sql: str, plan: str | None = None) -> None:
+        stats = self._statements.get(sql)
+        if stats is None:
+            return
+        stats.slow += 1
+        if plan is not None:
+            stats.plan = plan
+
+    def top(self, limit: int = 10) -> list[dict]:
+        """Самые медленные запросы (по максимальной длительности) — первыми."""
+        ordered = sorted(self._statements.items(), key=lambda item: item[1].max, reverse=True)
+        return [
+            {
+                "sql": sql,
+                "count": stats.count,
+                "slow": stats.slow,
+                "rows": stats.rows,
+                "avg_ms": stats.total / stats.count * 1000 if stats.count else 0.0,
+                "max_ms": stats.max * 1000,
+                "total_ms": stats.total * 1000,
+                "plan": stats.plan,
+            }
+            for sql, stats in ordered[:limit]
+        ]
+
+    def reset(self) -> None:
+        self._statements.clear()
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor:
+    """Курсор aiosqlite, считающий полученные строки и время fetch*."""
+
+    def __init__(self, cursor: aiosqlite.Cursor, sql: str, stats: QueryStats) -> None:
+        self._cursor = cursor
+        self._sql = sql
+        self._stats = stats
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    async def fetchone(self) -> Any:
+        started = time.perf_counter()
+        row = await self._cursor.fetchone()
+        self._stats.add_fetch(self._sql, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    async def fetchmany(self, size: int | None = None) -> list[aiosqlite.Row]:
+        started = time.perf_counter()
+        rows = list(await (self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)))
+        self._stats.add_fetch(self._sql, time.perf_counter() - started, len(rows))
+        return rows
+
+    async def fetchall(self) -> list[aiosqlite.Row]:
+        started = time.perf_counter()
+        rows = list(await self._cursor.fetchall())
+        self._stats.add_fetch(self._sql, time.perf_counter() - started, len(rows))
+        return rows
+
+    def __aiter__(self) -> InstrumentedCursor:
+        return self
+
+    async def __anext__(self) -> Any:
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    async def __aenter__(self) -> InstrumentedCursor:
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self._cursor.close()
+
+
+class _CursorResult:
+    """Результат execute(): как и в aiosqlite, его можно await-ить или использовать в ``async with``."""
+
+    def __init__(self, coro: Any) -> None:
+        self._coro = coro
+        self._cursor: InstrumentedCursor | None = None
+
+    def __await__(self) -> Any:
+        return self._coro.__await__()
+
+    async def __aenter__(self) -> InstrumentedCursor:
+        self._cursor = await self._coro
+        return self._cursor
+
+    async def __aexit__(self, *exc: object) -> None:
+        if self._cursor is not None:
+            await self._cursor.close()
+
+
+class InstrumentedConnection:
+    """
+    Прокси над aiosqlite.Connection: замеряет каждый запрос.
+
+    Остальные атрибуты (row_factory, rollback, close, ...) передаются
+    исходному соединению без изменений.
+    """
+
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        *,
+        slow_ms: float = 100.0,
+        explain: bool = True,
+        stats: QueryStats | None = None,
+    ) -> None:
+        self._conn = conn
+        self._slow = slow_ms / 1000
+        self._explain = explain
+        self._stats = query_stats if stats is None else stats
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    @property
+    def connection(self) -> aiosqlite.Connection:
+        return self._conn
+
+    @property
+    def row_factory(self) -> Any:
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory: Any) -> None:
+        self._conn.row_factory = factory
+
+    async def _observe(
+        self, sql: str, raw_sql: str, duration: float, rows: int, parameters: Any = None,
+    ) -> None:
+        self._stats.record(sql, duration, rows)
+        metrics.DB_QUERY_SECONDS.labels(query=statement_label(sql)).observe(duration)
+        if duration < self._slow:
+            return
+        plan = None
+        if self._explain and raw_sql and sql.upper().startswith(_EXPLAINABLE):
+            plan = await self._explain_plan(raw_sql, parameters)
+        self._stats.mark_slow(sql, plan)
+        logger.warning(
+            "[DB] Медленный запрос | duration_ms={:.0f} rows={} sql={}{}",
+            duration * 1000, rows, sql, f" plan={plan}" if plan else "",
+        )
+
+    async def _explain_plan(self, sql: str, parameters: Any) -> str | None:
+        try:
+            cursor = await self._conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or [])
+            rows = await cursor.fetchall()
+            await cursor.close()
+        except Exception as exc:  # план — вспомогательная информация
+            logger.debug("[DB] EXPLAIN QUERY PLAN не выполнен | error={}", exc)
+            return None
+        return "; ".join(str(row[-1]) for row in rows)
+
+    async def _execute(self, sql: str, parameters: Iterable[Any] | None) -> InstrumentedCursor:
+        normalized = normalize_sql(sql)
+        started = time.perf_counter()
+        with tracing.span(f"db {normalized}"):
+            cursor = await self._conn.execute(sql, parameters)
+        duration = time.perf_counter() - started
+        # SELECT: строки досчитываются при fetch*; для DML — число изменённых строк
+        await self._observe(normalized, sql, duration, max(cursor.rowcount, 0), parameters)
+        return InstrumentedCursor(cursor, normalized, self._stats)
+
+    def execute(self, sql: str, parameters: Iterable[Any] | None = None) -> _CursorResult:
+        return _CursorResult(self._execute(sql, parameters))
+
+    async def executemany(self, sql: str, parameters: Iterable[Iterable[Any]]) -> aiosqlite.Cursor:
+        normalized = normalize_sql(sql)
+        started = time.perf_counter()
+        with tracing.span(f"db {normalized}"):
+            cursor = await self._conn.executemany(sql, parameters)
+        # parameters уже прочитаны — EXPLAIN для executemany не строится
+        await self._observe(normalized, "", time.perf_counter() - started, max(cursor.rowcount, 0))
+        return cursor
+
+    async def execute_fetchall(self, sql: str, parameters: Iterable[Any] | None = None) -> list[aiosqlite.Row]:
+        normalized = normalize_sql(sql)
+        started = time.perf_counter()
+        with tracing.span(f"db {normalized}"):
+            rows = list(await self._conn.execute_fetchall(sql, parameters))
+        await self._observe(normalized, sql, time.perf_counter() - started, len(rows), parameters)
+        return rows
+
+    async def commit(self) -> None:
+        started = time.perf_counter()
+        with tracing.span("db COMMIT"):
+            await self._conn.commit()
+        await self._observe("COMMIT", "", time.perf_counter() - started, 0)
+
+
+def instrument(
+    conn: aiosqlite.Connection,
+    *,
+    slow_ms: float = 100.0,
+    explain: bool = True,
+    stats: QueryStats | None = None,
+) -> aiosqlite.Connection:
+    """InstrumentedConnection для кода, типизированного aiosqlite.Connection.
+
+    Прокси не наследует aiosqlite.Connection (это поток-владелец sqlite3),
+    но повторяет его интерфейс: repository и хендлеры принимают его как есть.
+    """
+    return cast(aiosqlite.Connection, InstrumentedConnection(conn, slow_ms=slow_ms, explain=explain, stats=stats))
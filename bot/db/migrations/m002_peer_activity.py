@@ -0,0 +1,27 @@
+"""
+Активность пиров для сборщика неактивных пиров (bot/services/idle_peers.py).
+
+last_handshake_at — последнее известное рукопожатие (unix time): на
+интерфейсе оно сбрасывается при рестарте контейнера AWG, поэтому хранится в БД.
+detached_at — когда пир снят с интерфейса за неактивностью (NULL — подключён).
+"""
+import aiosqlite
+
+MIGRATION_ID = 2
+DESCRIPTION = "vpn_profiles: last_handshake_at, detached_at"
+
+
+async def up(db: aiosqlite.Connection) -> None:
+    await db.execute("ALTER TABLE vpn_profiles ADD COLUMN last_handshake_at INTEGER")
+    await db.execute("ALTER TABLE vpn_profiles ADD COLUMN detached_at INTEGER")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vpn_profiles_detached_at
+        ON vpn_profiles (detached_at)
+    """)
+
+
+async def down(db: aiosqlite.Connection) -> None:
+    # DROP COLUMN — SQLite 3.35+
+    await db.execute("DROP INDEX IF EXISTS idx_vpn_profiles_detached_at")
+    await db.execute("ALTER TABLE vpn_profiles DROP COLUMN detached_at")
+    await db.execute("ALTER TABLE vpn_profiles DROP COLUMN last_handshake_at")
@@ -0,0 +1,50 @@
+"""
+Узлы VPN (bot/services/nodes.py): таблица vpn_nodes и привязка профиля к узлу.
+
+Узел 1 («default») — текущий сервер: его NULL-поля берутся из настроек
+(WG_INTERFACE, WG_CONTAINER_NAME, SERVER_ENDPOINT, SERVER_PUB_KEY,
+VPN_IP_RANGE), существующие профили остаются на нём. У каждого узла свой пул
+адресов, поэтому уникальность ipv4_address — в пределах узла.
+"""
+import aiosqlite
+
+MIGRATION_ID = 3
+DESCRIPTION = "vpn_nodes, vpn_profiles.node_id, ipv4 unique per node"
+
+
+async def up(db: aiosqlite.Connection) -> None:
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS vpn_nodes (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            name       TEXT    NOT NULL UNIQUE,
+            interface  TEXT,
+            container  TEXT,
+            ssh_host   TEXT,
+            endpoint   TEXT,
+            public_key TEXT,
+            ip_range   TEXT,
+            max_peers  INTEGER NOT NULL DEFAULT 0,
+            enabled    BOOLEAN NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.execute("INSERT OR IGNORE INTO vpn_nodes (id, name) VALUES (1, 'default')")
+    await db.execute("ALTER TABLE vpn_profiles ADD COLUMN node_id INTEGER NOT NULL DEFAULT 1")
+    await db.execute("DROP INDEX IF EXISTS idx_vpn_profiles_ipv4_unique")
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vpn_profiles_node_ipv4_unique
+        ON vpn_profiles (node_id, ipv4_address)
+        WHERE ipv4_address IS NOT NULL AND ipv4_address <> ''
+    """)
+
+
+async def down(db: aiosqlite.Connection) -> None:
+    # Откат возможен, пока адреса не повторяются между узлами
+    await db.execute("DROP INDEX IF EXISTS idx_vpn_profiles_node_ipv4_unique")
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vpn_profiles_ipv4_unique
+        ON vpn_profiles (ipv4_address)
+        WHERE ipv4_address IS NOT NULL AND ipv4_address <> ''
+    """)
+    await db.execute("ALTER TABLE vpn_profiles DROP COLUMN node_id")
+    await db.execute("DROP TABLE IF EXISTS vpn_nodes")
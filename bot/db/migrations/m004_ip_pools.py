@@ -0,0 +1,42 @@
+"""
+Дополнительные пулы адресов узлов (bot/services/nodes.py): таблица ip_pools
+и привязка профиля к пулу.
+
+Основной пул узла — по-прежнему vpn_nodes.ip_range (для узла по умолчанию —
+VPN_IP_RANGE); его профили остаются с pool_id = NULL, перенумеровывать никого
+не нужно. Пул может жить на своём интерфейсе — тогда у него свои endpoint и
+ключ сервера; NULL-поля берутся у узла. CIDR уникален в пределах узла.
+"""
+import aiosqlite
+
+MIGRATION_ID = 4
+DESCRIPTION = "ip_pools, vpn_profiles.pool_id"
+
+
+async def up(db: aiosqlite.Connection) -> None:
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS ip_pools (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            node_id    INTEGER NOT NULL REFERENCES vpn_nodes(id),
+            cidr       TEXT    NOT NULL,
+            interface  TEXT,
+            endpoint   TEXT,
+            public_key TEXT,
+            priority   INTEGER NOT NULL DEFAULT 100,
+            enabled    BOOLEAN NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (node_id, cidr)
+        )
+    """)
+    await db.execute("ALTER TABLE vpn_profiles ADD COLUMN pool_id INTEGER")
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vpn_profiles_node_pool
+        ON vpn_profiles (node_id, pool_id)
+    """)
+
+
+async def down(db: aiosqlite.Connection) -> None:
+    # Откат возможен, пока в дополнительных пулах нет профилей
+    await db.execute("DROP INDEX IF EXISTS idx_vpn_profiles_node_pool")
+    await db.execute("ALTER TABLE vpn_profiles DROP COLUMN pool_id")
+    await db.execute("DROP TABLE IF EXISTS ip_pools")
@@ -0,0 +1,28 @@
+"""
+Dual-stack: IPv6-адрес профиля и IPv6-префикс узла.
+
+vpn_profiles.ipv6_address — NULL у профилей, выданных до включения IPv6 (им
+адрес назначается при следующем скачивании конфига); уникален в пределах
+узла, как и IPv4. vpn_nodes.ipv6_range: NULL — из VPN_IPV6_RANGE (так задан
+узел по умолчанию), пустая строка — узел без IPv6.
+"""
+import aiosqlite
+
+MIGRATION_ID = 5
+DESCRIPTION = "vpn_profiles.ipv6_address unique per node, vpn_nodes.ipv6_range"
+
+
+async def up(db: aiosqlite.Connection) -> None:
+    await db.execute("ALTER TABLE vpn_profiles ADD COLUMN ipv6_address TEXT")
+    await db.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_vpn_profiles_node_ipv6_unique
+        ON vpn_profiles (node_id, ipv6_address)
+        WHERE ipv6_address IS NOT NULL
+    """)
+    await db.execute("ALTER TABLE vpn_nodes ADD COLUMN ipv6_range TEXT")
+
+
+async def down(db: aiosqlite.Connection) -> None:
+    await db.execute("ALTER TABLE vpn_nodes DROP COLUMN ipv6_range")
+    await db.execute("DROP INDEX IF EXISTS idx_vpn_profiles_node_ipv6_unique")
+    await db.execute("ALTER TABLE vpn_profiles DROP COLUMN ipv6_address")
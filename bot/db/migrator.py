@@ -15,6 +15,7 @@
 from __future__ import annotations
 
 import importlib
+import re
 import shutil
 from datetime import datetime
 from pathlib import Path
@@ -29,6 +30,9 @@ if TYPE_CHECKING:
 
 _MIGRATIONS_PKG = "bot.db.migrations"
 _MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Номер в имени файла (m001_initial.py → 1) обязан совпадать с MIGRATION_ID:
+# по нему отбираются файлы, которые вообще нужно импортировать
+_FILE_ID = re.compile(r"^m(\d+)")
 
 
 class Migration:
@@ -68,16 +72,29 @@ class MigrationRunner:
         # PRAGMA нельзя параметризовать — используем f-string (только int!)
         await db.execute(f"PRAGMA user_version = {int(version)}")
 
-    def _discover(self) -> list[Migration]:
-        """Находит все файлы миграций, сортирует по MIGRATION_ID."""
+    def _discover(self, after: int = 0) -> list[Migration]:
+        """
+        Находит файлы миграций с номером больше after, сортирует по MIGRATION_ID.
+
+        Импортируются только эти файлы: при актуальной схеме run_pending
+        не загружает ни одного модуля миграций.
+        """
         modules: list[Migration] = []
         for path in sorted(_MIGRATIONS_DIR.glob("m[0-9]*.py")):
+            file_id = int(_FILE_ID.match(path.stem).group(1))  # type: ignore[union-attr]
+            if file_id <= after:
+                continue
             module_name = f"{_MIGRATIONS_PKG}.{path.stem}"
             try:
                 module = importlib.import_module(module_name)
                 if not hasattr(module, "MIGRATION_ID"):
                     logger.warning("Пропущен {}: нет MIGRATION_ID", path.name)
                     continue
+                if module.MIGRATION_ID != file_id:
+                    raise ValueError(
+                        f"{path.name}: MIGRATION_ID={module.MIGRATION_ID} "
+                        f"не совпадает с номером в имени файла"
+                    )
                 if not hasattr(module, "up") or not hasattr(module, "down"):
                     raise AttributeError(
                         f"{path.name}: обязательны функции up() и down()"
@@ -93,9 +110,7 @@ class MigrationRunner:
         self, db: aiosqlite.Connection
     ) -> tuple[int, list[Migration]]:
         current = await self._get_version(db)
-        all_migrations = self._discover()
-        pending = [m for m in all_migrations if m.migration_id > current]
-        return current, pending
+        return current, self._discover(after=current)
 
     def _backup(self) -> Path | None:
         """Создаёт резервную копию БД рядом с оригиналом."""
@@ -189,7 +204,7 @@ class MigrationRunner:
             )
             return 0
 
-        all_migrations = self._discover()
+        all_migrations = self._discover(after=target_version)
         to_rollback = [
             m for m in reversed(all_migrations)
             if target_version < m.migration_id <= current
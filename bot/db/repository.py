@@ -1,10 +1,29 @@
 """
 Слой доступа к данным. Все SQL-запросы сосредоточены здесь.
+
+Функции, которые коммитят сами, пишут под write_lock соединения
+(bot/db/transaction.py); помеченные «Caller commits» вызываются внутри
+transaction().
 """
 from __future__ import annotations
 
 import aiosqlite
 
+from bot.db.transaction import write_lock
+
+
+async def _one(cursor: aiosqlite.Cursor) -> aiosqlite.Row:
+    """The single row of an aggregate query (COUNT/SUM always yields one)."""
+    row = await cursor.fetchone()
+    assert row is not None
+    return row
+
+
+def _lastrowid(cursor: aiosqlite.Cursor) -> int:
+    """Id of the row just inserted through cursor."""
+    assert cursor.lastrowid is not None
+    return cursor.lastrowid
+
 
 # ── Users ─────────────────────────────────────────────────────────────────────
 
@@ -24,25 +43,27 @@ async def create_user(
     is_admin: bool = False,
     is_approved: bool = False,
 ) -> None:
-    await db.execute(
-        "INSERT OR IGNORE INTO users (telegram_id, username, full_name, is_admin, is_approved) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (telegram_id, username, full_name, int(is_admin), int(is_approved)),
-    )
-    await db.commit()
+    async with write_lock(db):
+        await db.execute(
+            "INSERT OR IGNORE INTO users (telegram_id, username, full_name, is_admin, is_approved) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (telegram_id, username, full_name, int(is_admin), int(is_approved)),
+        )
+        await db.commit()
 
 
 async def set_user_approved(db: aiosqlite.Connection, telegram_id: int, approved: bool) -> None:
-    await db.execute(
-        "UPDATE users SET is_approved = ? WHERE telegram_id = ?",
-        (int(approved), telegram_id),
-    )
-    await db.commit()
+    async with write_lock(db):
+        await db.execute(
+            "UPDATE users SET is_approved = ? WHERE telegram_id = ?",
+            (int(approved), telegram_id),
+        )
+        await db.commit()
 
 
 async def get_users_page(db: aiosqlite.Connection, page: int, page_size: int) -> tuple[list, int]:
     cursor = await db.execute("SELECT COUNT(*) as cnt FROM users")
-    total = (await cursor.fetchone())["cnt"]
+    total = (await _one(cursor))["cnt"]
     cursor = await db.execute(
         "SELECT telegram_id, full_name, username, is_approved FROM users "
         "ORDER BY registered_at DESC LIMIT ? OFFSET ?",
@@ -66,7 +87,7 @@ async def get_user_detail(db: aiosqlite.Connection, telegram_id: int) -> tuple[s
     cursor = await db.execute(
         "SELECT id, name, ipv4_address FROM vpn_profiles WHERE user_id = ?", (telegram_id,)
     )
-    profiles = await cursor.fetchall()
+    profiles = list(await cursor.fetchall())
 
     status = "✅ Одобрен" if user["is_approved"] else "❌ Заблокирован / Ожидает"
     reg_date = user["registered_at"][:10] if user["registered_at"] else "—"
@@ -92,10 +113,11 @@ async def get_user_detail(db: aiosqlite.Connection, telegram_id: int) -> tuple[s
 # ── Approvals ─────────────────────────────────────────────────────────────────
 
 async def create_approval(db: aiosqlite.Connection, user_id: int) -> None:
-    await db.execute(
-        "INSERT INTO approvals (user_id, status) VALUES (?, 'pending')", (user_id,)
-    )
-    await db.commit()
+    async with write_lock(db):
+        await db.execute(
+            "INSERT INTO approvals (user_id, status) VALUES (?, 'pending')", (user_id,)
+        )
+        await db.commit()
 
 
 async def get_pending_approvals(
@@ -104,7 +126,7 @@ async def get_pending_approvals(
     cursor = await db.execute(
         "SELECT COUNT(*) as cnt FROM approvals WHERE status = 'pending'"
     )
-    total = (await cursor.fetchone())["cnt"]
+    total = (await _one(cursor))["cnt"]
     cursor = await db.execute(
         """SELECT a.user_id, u.full_name, u.username
            FROM approvals a
@@ -118,14 +140,22 @@ async def get_pending_approvals(
     return rows, total
 
 
+async def count_pending_approvals(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute(
+        "SELECT COUNT(*) as cnt FROM approvals WHERE status = 'pending'"
+    )
+    return int((await _one(cursor))["cnt"])
+
+
 async def set_approval_status(
     db: aiosqlite.Connection, user_id: int, status: str, admin_id: int
 ) -> None:
-    await db.execute(
-        "UPDATE approvals SET status = ?, admin_id = ? WHERE user_id = ? AND status = 'pending'",
-        (status, admin_id, user_id),
-    )
-    await db.commit()
+    async with write_lock(db):
+        await db.execute(
+            "UPDATE approvals SET status = ?, admin_id = ? WHERE user_id = ? AND status = 'pending'",
+            (status, admin_id, user_id),
+        )
+        await db.commit()
 
 
 # ── VPN Profiles ──────────────────────────────────────────────────────────────
@@ -134,12 +164,13 @@ async def count_user_profiles(db: aiosqlite.Connection, user_id: int) -> int:
     cursor = await db.execute(
         "SELECT COUNT(*) as cnt FROM vpn_profiles WHERE user_id = ?", (user_id,)
     )
-    return (await cursor.fetchone())["cnt"]
+    return int((await _one(cursor))["cnt"])
 
 
 async def get_profiles(db: aiosqlite.Connection, user_id: int) -> list:
     cursor = await db.execute(
-        "SELECT id, name, ipv4_address FROM vpn_profiles WHERE user_id = ? ORDER BY created_at",
+        "SELECT id, name, ipv4_address, public_key, detached_at FROM vpn_profiles "
+        "WHERE user_id = ? ORDER BY created_at",
         (user_id,),
     )
     return [dict(r) for r in await cursor.fetchall()]
@@ -153,16 +184,66 @@ async def get_profile_owner(db: aiosqlite.Connection, profile_id: int) -> int |
     return row["user_id"] if row else None
 
 
+async def get_profile_placement(db: aiosqlite.Connection, profile_id: int) -> aiosqlite.Row | None:
+    """Node and address pool of the profile (pool_id NULL — the node's primary pool)."""
+    cursor = await db.execute(
+        "SELECT node_id, pool_id FROM vpn_profiles WHERE id = ?", (profile_id,)
+    )
+    return await cursor.fetchone()
+
+
 async def get_profile_for_config(
     db: aiosqlite.Connection, profile_id: int
 ) -> aiosqlite.Row | None:
     cursor = await db.execute(
-        "SELECT name, private_key, ipv4_address FROM vpn_profiles WHERE id = ?",
+        "SELECT name, private_key, ipv4_address, ipv6_address, public_key, detached_at, node_id, pool_id "
+        "FROM vpn_profiles WHERE id = ?",
         (profile_id,),
     )
     return await cursor.fetchone()
 
 
+async def get_profiles_for_export(
+    db: aiosqlite.Connection, after_id: int, limit: int, node_id: int | None = None
+) -> list[aiosqlite.Row]:
+    """Next page of profiles for the config export (keyset by id — no OFFSET scans)."""
+    query = (
+        "SELECT p.id, p.user_id, u.username, p.name, p.private_key, p.ipv4_address, p.ipv6_address, "
+        "p.node_id, p.pool_id FROM vpn_profiles p LEFT JOIN users u ON u.telegram_id = p.user_id "
+        "WHERE p.id > ?"
+    )
+    params: tuple = (after_id,)
+    if node_id is not None:
+        query += " AND p.node_id = ?"
+        params += (node_id,)
+    cursor = await db.execute(query + " ORDER BY p.id LIMIT ?", params + (limit,))
+    return list(await cursor.fetchall())
+
+
+async def get_private_keys_after(
+    db: aiosqlite.Connection, after_id: int, limit: int
+) -> list[aiosqlite.Row]:
+    """Next page of encrypted private keys (keyset by id) — key rotation."""
+    cursor = await db.execute(
+        "SELECT id, private_key FROM vpn_profiles WHERE id > ? ORDER BY id LIMIT ?",
+        (after_id, limit),
+    )
+    return list(await cursor.fetchall())
+
+
+async def update_private_keys(db: aiosqlite.Connection, updates: list[tuple[int, str, str]]) -> int:
+    """Re-encrypted keys: updates — (profile_id, old token, new token).
+
+    A row changed since it was read is left alone. Caller commits.
+    """
+    before = db.total_changes
+    await db.executemany(
+        "UPDATE vpn_profiles SET private_key = ? WHERE id = ? AND private_key = ?",
+        [(new, profile_id, old) for profile_id, old, new in updates],
+    )
+    return db.total_changes - before
+
+
 async def insert_vpn_profile(
     db: aiosqlite.Connection,
     user_id: int,
@@ -170,17 +251,24 @@ async def insert_vpn_profile(
     encrypted_key: str,
     public_key: str,
     ipv4: str,
-) -> None:
-    await db.execute(
-        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) "
-        "VALUES (?, ?, ?, ?, ?)",
-        (user_id, name, encrypted_key, public_key, ipv4),
+    node_id: int = 1,
+    pool_id: int | None = None,
+    ipv6: str | None = None,
+) -> int:
+    """Caller commits; returns the new profile id."""
+    cursor = await db.execute(
+        "INSERT INTO vpn_profiles "
+        "(user_id, name, private_key, public_key, ipv4_address, ipv6_address, node_id, pool_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, name, encrypted_key, public_key, ipv4, ipv6, node_id, pool_id),
     )
+    return _lastrowid(cursor)
 
 
 async def delete_vpn_profile(db: aiosqlite.Connection, profile_id: int) -> None:
-    await db.execute("DELETE FROM vpn_profiles WHERE id = ?", (profile_id,))
-    await db.commit()
+    async with write_lock(db):
+        await db.execute("DELETE FROM vpn_profiles WHERE id = ?", (profile_id,))
+        await db.commit()
 
 
 async def get_profile_public_key(db: aiosqlite.Connection, profile_id: int) -> str | None:
@@ -199,15 +287,247 @@ async def get_monthly_usage_rows(
         "FROM vpn_profiles WHERE user_id = ?",
         (user_id,),
     )
-    return await cursor.fetchall()
+    return list(await cursor.fetchall())
+
+
+async def get_all_active_profiles(
+    db: aiosqlite.Connection, node_id: int | None = None
+) -> list[aiosqlite.Row]:
+    """Profiles that belong on the interface (not detached as idle) — peer recovery and reconciliation."""
+    query = (
+        "SELECT public_key, ipv4_address, ipv6_address, node_id, pool_id "
+        "FROM vpn_profiles WHERE detached_at IS NULL"
+    )
+    if node_id is None:
+        cursor = await db.execute(query)
+    else:
+        cursor = await db.execute(query + " AND node_id = ?", (node_id,))
+    return list(await cursor.fetchall())
+
+
+# ── VPN nodes ──────────────────────────────────────────────────────────────────
+
+async def get_vpn_nodes(db: aiosqlite.Connection) -> list[aiosqlite.Row]:
+    cursor = await db.execute(
+        "SELECT id, name, interface, container, ssh_host, endpoint, public_key, ip_range, "
+        "ipv6_range, max_peers, enabled FROM vpn_nodes ORDER BY id"
+    )
+    return list(await cursor.fetchall())
+
+
+async def insert_vpn_node(
+    db: aiosqlite.Connection,
+    name: str,
+    *,
+    interface: str,
+    container: str,
+    ssh_host: str,
+    endpoint: str,
+    public_key: str,
+    ip_range: str,
+    ipv6_range: str = "",
+    max_peers: int = 0,
+) -> int:
+    async with write_lock(db):
+        cursor = await db.execute(
+            "INSERT INTO vpn_nodes "
+            "(name, interface, container, ssh_host, endpoint, public_key, ip_range, ipv6_range, max_peers) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, interface, container, ssh_host, endpoint, public_key, ip_range, ipv6_range, max_peers),
+        )
+        await db.commit()
+    return _lastrowid(cursor)
+
+
+async def set_vpn_node_enabled(db: aiosqlite.Connection, name: str, enabled: bool) -> bool:
+    """Включает/выключает приём новых профилей узлом; False — узла с таким именем нет."""
+    async with write_lock(db):
+        cursor = await db.execute(
+            "UPDATE vpn_nodes SET enabled = ? WHERE name = ?", (int(enabled), name)
+        )
+        await db.commit()
+    return cursor.rowcount > 0
+
+
+async def get_node_profile_counts(db: aiosqlite.Connection) -> dict[int, int]:
+    cursor = await db.execute(
+        "SELECT node_id, COUNT(*) AS cnt FROM vpn_profiles GROUP BY node_id"
+    )
+    return {row["node_id"]: row["cnt"] for row in await cursor.fetchall()}
+
+
+# ── Address pools ──────────────────────────────────────────────────────────────
+
+async def get_ip_pools(db: aiosqlite.Connection) -> list[aiosqlite.Row]:
+    cursor = await db.execute(
+        "SELECT id, node_id, cidr, interface, endpoint, public_key, priority, enabled "
+        "FROM ip_pools ORDER BY node_id, priority, id"
+    )
+    return list(await cursor.fetchall())
+
+
+async def insert_ip_pool(
+    db: aiosqlite.Connection,
+    node_id: int,
+    cidr: str,
+    *,
+    interface: str | None = None,
+    endpoint: str | None = None,
+    public_key: str | None = None,
+    priority: int = 100,
+) -> int:
+    async with write_lock(db):
+        cursor = await db.execute(
+            "INSERT INTO ip_pools (node_id, cidr, interface, endpoint, public_key, priority) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (node_id, cidr, interface, endpoint, public_key, priority),
+        )
+        await db.commit()
+    return _lastrowid(cursor)
+
+
+async def set_ip_pool_enabled(db: aiosqlite.Connection, pool_id: int, enabled: bool) -> bool:
+    """Включает/выключает выдачу адресов из пула; False — пула нет."""
+    async with write_lock(db):
+        cursor = await db.execute(
+            "UPDATE ip_pools SET enabled = ? WHERE id = ?", (int(enabled), pool_id)
+        )
+        await db.commit()
+    return cursor.rowcount > 0
+
+
+async def get_pool_profile_counts(db: aiosqlite.Connection) -> dict[tuple[int, int | None], int]:
+    """(node_id, pool_id) → profiles; pool_id None — the node's primary pool."""
+    cursor = await db.execute(
+        "SELECT node_id, pool_id, COUNT(*) AS cnt FROM vpn_profiles GROUP BY node_id, pool_id"
+    )
+    return {(row["node_id"], row["pool_id"]): row["cnt"] for row in await cursor.fetchall()}
 
 
-async def get_all_active_profiles(db: aiosqlite.Connection) -> list[aiosqlite.Row]:
-    """All profiles with public_key and ipv4 — used for peer recovery on startup."""
+async def get_pool_addresses(db: aiosqlite.Connection, node_id: int, pool_id: int | None) -> list[str]:
     cursor = await db.execute(
-        "SELECT public_key, ipv4_address FROM vpn_profiles"
+        "SELECT ipv4_address FROM vpn_profiles "
+        "WHERE node_id = ? AND pool_id IS ? AND ipv4_address IS NOT NULL",
+        (node_id, pool_id),
+    )
+    return [row["ipv4_address"] for row in await cursor.fetchall()]
+
+
+async def get_node_ipv6_addresses(db: aiosqlite.Connection, node_id: int) -> list[str]:
+    cursor = await db.execute(
+        "SELECT ipv6_address FROM vpn_profiles WHERE node_id = ? AND ipv6_address IS NOT NULL",
+        (node_id,),
+    )
+    return [row["ipv6_address"] for row in await cursor.fetchall()]
+
+
+async def set_profile_ipv6(db: aiosqlite.Connection, profile_id: int, ipv6: str | None) -> None:
+    """Caller commits (assigned inside the allocating transaction; None releases it)."""
+    await db.execute("UPDATE vpn_profiles SET ipv6_address = ? WHERE id = ?", (ipv6, profile_id))
+
+
+async def get_pool_profiles(
+    db: aiosqlite.Connection, node_id: int, pool_id: int | None, limit: int
+) -> list[aiosqlite.Row]:
+    """Next batch of profiles to move out of a pool (oldest first)."""
+    cursor = await db.execute(
+        "SELECT id, user_id, public_key, ipv4_address, ipv6_address, detached_at FROM vpn_profiles "
+        "WHERE node_id = ? AND pool_id IS ? ORDER BY id LIMIT ?",
+        (node_id, pool_id, limit),
+    )
+    return list(await cursor.fetchall())
+
+
+async def move_profiles_to_pool(
+    db: aiosqlite.Connection, pool_id: int | None, moves: list[tuple[int, str]]
+) -> None:
+    """Re-addresses profiles into a pool: moves — (profile_id, new ipv4). Caller commits."""
+    await db.executemany(
+        "UPDATE vpn_profiles SET pool_id = ?, ipv4_address = ? WHERE id = ?",
+        [(pool_id, ipv4, profile_id) for profile_id, ipv4 in moves],
+    )
+
+
+# ── Peer activity ──────────────────────────────────────────────────────────────
+
+async def record_handshakes(db: aiosqlite.Connection, handshakes: dict[str, int]) -> None:
+    """Сохраняет последние рукопожатия (public_key → unix time), только если они новее."""
+    async with write_lock(db):
+        await db.executemany(
+            # public_key <> '' — условие частичного уникального индекса m001: без него SCAN
+            "UPDATE vpn_profiles SET last_handshake_at = ? WHERE public_key = ? AND public_key <> '' "
+            "AND (last_handshake_at IS NULL OR last_handshake_at < ?)",
+            [(at, public_key, at) for public_key, at in handshakes.items()],
+        )
+        await db.commit()
+
+
+async def get_idle_profiles(db: aiosqlite.Connection, cutoff: int, limit: int) -> list[aiosqlite.Row]:
+    """До limit подключённых профилей без рукопожатия после cutoff (без рукопожатий — по дате создания)."""
+    cursor = await db.execute(
+        "SELECT id, public_key, node_id, pool_id FROM vpn_profiles WHERE detached_at IS NULL "
+        "AND COALESCE(last_handshake_at, CAST(strftime('%s', created_at) AS INTEGER)) < ? "
+        "ORDER BY id LIMIT ?",
+        (cutoff, limit),
+    )
+    return list(await cursor.fetchall())
+
+
+async def mark_detached(
+    db: aiosqlite.Connection, profile_ids: list[int], detached_at: int, cutoff: int,
+) -> list[int]:
+    """Помечает профили снятыми за неактивностью; возвращает id помеченных.
+
+    Условие get_idle_profiles проверяется заново: профиль, подключённый
+    обратно или активный после выборки, не трогается.
+    """
+    marked = []
+    async with write_lock(db):
+        for profile_id in profile_ids:
+            cursor = await db.execute(
+                "UPDATE vpn_profiles SET detached_at = ? WHERE id = ? AND detached_at IS NULL "
+                "AND COALESCE(last_handshake_at, CAST(strftime('%s', created_at) AS INTEGER)) < ?",
+                (detached_at, profile_id, cutoff),
+            )
+            if cursor.rowcount:
+                marked.append(profile_id)
+        await db.commit()
+    return marked
+
+
+async def mark_attached(db: aiosqlite.Connection, profile_id: int, now: int) -> None:
+    """Снимает отметку detached_at; активность — с момента подключения (чтобы не снять сразу снова)."""
+    async with write_lock(db):
+        await db.execute(
+            "UPDATE vpn_profiles SET detached_at = NULL, "
+            "last_handshake_at = MAX(COALESCE(last_handshake_at, 0), ?) WHERE id = ?",
+            (now, profile_id),
+        )
+        await db.commit()
+
+
+async def get_peer_pool_stats(db: aiosqlite.Connection) -> aiosqlite.Row:
+    cursor = await db.execute(
+        "SELECT COUNT(*) AS total, COUNT(detached_at) AS detached FROM vpn_profiles"
+    )
+    return await _one(cursor)
+
+
+# ── Configs (key-value) ────────────────────────────────────────────────────────
+
+async def get_config_value(db: aiosqlite.Connection, key: str) -> str | None:
+    cursor = await db.execute("SELECT value FROM configs WHERE key = ?", (key,))
+    row = await cursor.fetchone()
+    return row["value"] if row else None
+
+
+async def set_config_value(db: aiosqlite.Connection, key: str, value: str) -> None:
+    """Caller commits (checkpoints are written inside the batch transaction)."""
+    await db.execute(
+        "INSERT INTO configs (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
     )
-    return await cursor.fetchall()
 
 
 # ── Statistics ─────────────────────────────────────────────────────────────────
@@ -223,6 +543,6 @@ async def get_global_stats(db: aiosqlite.Connection) -> aiosqlite.Row:
             (SELECT COUNT(*) FROM users WHERE DATE(registered_at) >= DATE('now', '-7 days')) AS new_week
         """
     )
-    return await cursor.fetchone()
+    return await _one(cursor)
 
 
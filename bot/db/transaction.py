@@ -0,0 +1,50 @@
+"""
+Запись через общее соединение бота.
+
+Хендлеры (OrderedUpdateExecutor) и фоновые задачи работают одновременно через
+одно aiosqlite-соединение, а транзакция у SQLite-соединения одна: запись,
+выполненная, пока другая корутина держит BEGIN, попадает в чужую транзакцию
+(и откатывается вместе с ней), её commit фиксирует чужие незавершённые
+изменения, а второй BEGIN падает с «cannot start a transaction within a
+transaction». Поэтому любая запись идёт под write_lock соединения:
+
+  transaction(db)  — BEGIN IMMEDIATE … COMMIT (ROLLBACK при ошибке)
+  write_lock(db)   — одиночная запись с commit (функции repository)
+
+Блокировка не реентерабельна: внутри transaction() вызываются только
+функции repository, которые не коммитят сами («Caller commits»). wg/awg-команды
+под блокировкой не выполняются — она держится миллисекунды.
+"""
+from __future__ import annotations
+
+import asyncio
+import weakref
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import aiosqlite
+
+_locks: weakref.WeakKeyDictionary[Any, asyncio.Lock] = weakref.WeakKeyDictionary()
+
+
+def write_lock(db: aiosqlite.Connection) -> asyncio.Lock:
+    """Блокировка записи соединения (общая для InstrumentedConnection и исходного)."""
+    conn = getattr(db, "connection", db)
+    lock = _locks.get(conn)
+    if lock is None:
+        lock = _locks[conn] = asyncio.Lock()
+    return lock
+
+
+@asynccontextmanager
+async def transaction(db: aiosqlite.Connection) -> AsyncIterator[None]:
+    """Короткая транзакция записи: BEGIN IMMEDIATE под write_lock, COMMIT или ROLLBACK."""
+    async with write_lock(db):
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
@@ -1,5 +1,5 @@
 from aiogram import Router
-from bot.handlers.admin import menu, approvals, users, stats, version
+from bot.handlers.admin import menu, approvals, users, stats, version, diagnostics, peers, nodes, pools, export
 
 
 def setup_admin_handlers() -> Router:
@@ -9,4 +9,9 @@ def setup_admin_handlers() -> Router:
     router.include_router(users.router)
     router.include_router(stats.router)
     router.include_router(version.router)
+    router.include_router(diagnostics.router)
+    router.include_router(peers.router)
+    router.include_router(nodes.router)
+    router.include_router(pools.router)
+    router.include_router(export.router)
     return router
@@ -9,6 +9,7 @@ from bot.keyboards.admin import BTN_APPROVALS
 from bot.keyboards.user import get_user_keyboard
 from bot.core.logging import audit
 from bot.db import repository
+from bot.middlewares.access_middleware import approval_cache
 
 router = Router()
 
@@ -103,13 +104,14 @@ async def handle_approve(callback: CallbackQuery, callback_data: ApprovalAction,
 
     await repository.set_user_approved(db, user_id, True)
     await repository.set_approval_status(db, user_id, "approved", admin_id)
+    await approval_cache.invalidate(user_id)
 
     logger.info("[ACCESS] Пользователь одобрен | user_id={} by_admin={}", user_id, admin_id)
     audit("APPROVED", user_id=user_id, by_admin=admin_id)
 
     # Очищаем pending VPN requests для этого пользователя
-    from bot.handlers.user.profiles import _pending_vpn_requests
-    _pending_vpn_requests.pop(user_id, None)
+    from bot.handlers.user.profiles import clear_pending_vpn_request
+    await clear_pending_vpn_request(user_id)
 
     await callback.answer("✅ Пользователь одобрен!")
     await callback.message.edit_text(callback.message.text + "\n\n✅ <b>Одобрено.</b>")
@@ -136,8 +138,8 @@ async def handle_reject(callback: CallbackQuery, callback_data: ApprovalAction,
     audit("REJECTED", user_id=user_id, by_admin=admin_id)
 
     # Очищаем pending VPN requests для этого пользователя
-    from bot.handlers.user.profiles import _pending_vpn_requests
-    _pending_vpn_requests.pop(user_id, None)
+    from bot.handlers.user.profiles import clear_pending_vpn_request
+    await clear_pending_vpn_request(user_id)
 
     await callback.answer("❌ Заявка отклонена.")
     await callback.message.edit_text(callback.message.text + "\n\n❌ <b>Отклонено.</b>")
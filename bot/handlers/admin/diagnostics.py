@@ -0,0 +1,170 @@
+"""
+Диагностические команды администратора: производительность обработки апдейтов,
+фазы старта, медленные SQL-запросы и сэмплирующий профайлер.
+"""
+import asyncio
+import html
+
+from aiogram import Bot, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from loguru import logger
+
+from bot.core import profiler
+from bot.core.config import settings
+from bot.core.executor import OrderedUpdateExecutor
+from bot.core.loop_monitor import LoopLagMonitor
+from bot.core.startup import StartupReport
+from bot.db.instrumentation import query_stats
+from bot.filters.admin import AdminFilter
+
+router = Router()
+
+TOP_HANDLERS = 10
+TOP_QUERIES = 8
+MAX_SQL_CHARS = 200
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_TOP_FRAMES = 10
+MAX_FRAME_CHARS = 80
+
+# Ссылки на фоновые задачи отчёта, чтобы их не собрал GC
+_reports: set[asyncio.Task] = set()
+
+
+@router.message(Command("perf"), AdminFilter())
+async def cmd_perf(
+    message: Message,
+    update_executor: OrderedUpdateExecutor | None = None,
+    loop_monitor: LoopLagMonitor | None = None,
+) -> None:
+    lag_text = ""
+    if loop_monitor is not None:
+        lag = loop_monitor.stats()
+        lag_text = (
+            f"Лаг event loop: p50 {lag['p50_ms']:.1f} · p95 {lag['p95_ms']:.1f} · "
+            f"макс. {lag['max_ms']:.0f} мс, превышений порога: <b>{lag['stalls']}</b>\n"
+        )
+
+    if update_executor is None:
+        await message.answer("⚙️ Пул воркеров отключён (UPDATE_WORKERS=0).\n" + lag_text)
+        return
+
+    stats = update_executor.stats()
+    text = (
+        f"⚙️ <b>Обработка апдейтов</b>\n\n"
+        f"Воркеры: <b>{stats['busy']}/{stats['workers']}</b> заняты\n"
+        f"Очередь: <b>{stats['queue_depth']}</b> / {stats['max_pending']}\n"
+        f"Активных пользователей: <b>{stats['active_keys']}</b>\n"
+        f"Обработано: <b>{stats['processed']}</b>, ошибок: <b>{stats['failed']}</b>\n"
+        f"Макс. ожидание в очереди: <b>{stats['max_wait_ms']:.0f} мс</b>\n"
+        f"{lag_text}"
+    )
+
+    rows = update_executor.handler_latency.snapshot()[:TOP_HANDLERS]
+    if rows:
+        text += "\n<b>Хендлеры</b> (кол-во · средн. · макс.):\n"
+        for r in rows:
+            text += (
+                f"• <code>{html.escape(r['name'])}</code> — "
+                f"{r['count']} · {r['avg_ms']:.0f} мс · {r['max_ms']:.0f} мс\n"
+            )
+    await message.answer(text)
+
+
+@router.message(Command("startup"), AdminFilter())
+async def cmd_startup(message: Message, startup: StartupReport | None = None) -> None:
+    if startup is None:
+        await message.answer("🚀 Отчёт о старте недоступен.")
+        return
+    await message.answer(startup.render())
+
+
+@router.message(Command("slowq"), AdminFilter())
+async def cmd_slow_queries(message: Message) -> None:
+    rows = query_stats.top(TOP_QUERIES)
+    if not rows:
+        await message.answer("🗄 SQL-запросов пока не было.")
+        return
+
+    text = (
+        f"🗄 <b>Самые медленные SQL-запросы</b>\n"
+        f"Порог лога: {settings.db_slow_query_ms} мс\n"
+        f"(кол-во · средн. · макс. · строк · медленных)\n"
+    )
+    for r in rows:
+        sql = r["sql"] if len(r["sql"]) <= MAX_SQL_CHARS else r["sql"][:MAX_SQL_CHARS] + "…"
+        text += (
+            f"\n<code>{html.escape(sql)}</code>\n"
+            f"{r['count']} · {r['avg_ms']:.1f} мс · {r['max_ms']:.1f} мс · "
+            f"{r['rows']} · {r['slow']}\n"
+        )
+        if r["plan"]:
+            text += f"📋 <i>{html.escape(r['plan'])}</i>\n"
+    await message.answer(text)
+
+
+def _short(label: str) -> str:
+    return label if len(label) <= MAX_FRAME_CHARS else "…" + label[-MAX_FRAME_CHARS:]
+
+
+def format_profile(result: profiler.ProfileResult, files: tuple[str, ...]) -> str:
+    lag = result.lag_stats()
+    samples = result.samples or 1
+    text = (
+        f"🔬 <b>Профиль за {result.duration:.0f} с</b>\n\n"
+        f"Сэмплов: <b>{result.samples}</b>, занят: <b>{result.busy_samples / samples:.0%}</b>\n"
+        f"Лаг цикла: p50 {lag['p50_ms']:.1f} · p95 {lag['p95_ms']:.1f} · "
+        f"макс. {lag['max_ms']:.1f} мс\n"
+    )
+    frames = result.top_frames(PROFILE_TOP_FRAMES)
+    if frames:
+        text += "\n<b>CPU</b> (своё · всего, % сэмплов):\n"
+        for label, own, total in frames:
+            text += (
+                f"• <code>{html.escape(_short(label))}</code> — "
+                f"{own / samples:.0%} · {total / samples:.0%}\n"
+            )
+    coroutines = result.top_coroutines(PROFILE_TOP_FRAMES)
+    if coroutines:
+        text += "\n<b>Корутины</b> (время в await, с):\n"
+        for label, seconds in coroutines:
+            text += f"• <code>{html.escape(_short(label))}</code> — {seconds:.1f}\n"
+    text += "\n📁 " + ", ".join(f"<code>{html.escape(f)}</code>" for f in files)
+    return text
+
+
+async def _finish_profile(bot: Bot, chat_id: int, task: "asyncio.Task[profiler.ProfileResult]") -> None:
+    try:
+        result = await task
+        paths = await asyncio.to_thread(result.write, settings.log_path)
+        logger.info("[PROFILE] Профиль записан | files={}", ", ".join(map(str, paths)))
+        await bot.send_message(chat_id, format_profile(result, tuple(str(p) for p in paths)))
+    except Exception as e:
+        logger.opt(exception=e).error("[PROFILE] Ошибка профилирования")
+        await bot.send_message(chat_id, f"❌ Профилирование не удалось: {html.escape(str(e))}")
+
+
+@router.message(Command("profile"), AdminFilter())
+async def cmd_profile(message: Message, command: CommandObject, bot: Bot) -> None:
+    try:
+        seconds = float(command.args) if command.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await message.answer("Использование: /profile [секунд]")
+        return
+    if seconds <= 0:
+        await message.answer("Использование: /profile [секунд]")
+        return
+    seconds = min(seconds, profiler.MAX_DURATION)
+
+    try:
+        task = profiler.start(seconds)
+    except RuntimeError:
+        await message.answer("⏳ Профиль уже снимается, дождитесь результата.")
+        return
+
+    logger.info("[PROFILE] Старт | seconds={} by_admin={}", seconds, message.from_user.id)
+    # Хендлер не ждёт профиль — иначе он занял бы воркер на всё время сбора
+    report = asyncio.create_task(_finish_profile(bot, message.chat.id, task), name="profile-report")
+    _reports.add(report)
+    report.add_done_callback(_reports.discard)
+    await message.answer(f"🔬 Профилирую {seconds:.0f} с… Результат придёт сообщением.")
@@ -0,0 +1,89 @@
+"""
+Выгрузка конфигов всех профилей: /export [qr] [wg|amnezia] [узел] — ZIP-архивы
+документами в чат администратора (bot/services/config_export.py).
+"""
+import asyncio
+import html
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+from aiogram import Bot, Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import FSInputFile, Message
+from loguru import logger
+
+from bot.core.logging import audit
+from bot.filters.admin import AdminFilter
+from bot.services import config_export
+from bot.services.config_template import FORMAT_AWG, FORMAT_EXTENSIONS
+from bot.services.vpn_service import VPNService
+
+router = Router()
+
+USAGE = (
+    "Использование: <code>/export [qr] [wg|amnezia] [узел]</code>\n"
+    "Конфиги всех профилей (или профилей узла) ZIP-архивом; qr — добавить QR-коды PNG."
+)
+
+# Ссылки на фоновые задачи выгрузки, чтобы их не собрал GC
+_exports: set[asyncio.Task] = set()
+
+
+def parse_args(args: list[str]) -> dict:
+    """Аргументы /export → параметры export_configs; ValueError с текстом для администратора."""
+    options: dict = {"fmt": FORMAT_AWG, "qr": False, "node_id": None}
+    nodes = {node.name: node for node in VPNService.nodes()}
+    for arg in args:
+        if arg.lower() == "qr":
+            options["qr"] = True
+        elif arg.lower() in FORMAT_EXTENSIONS:
+            options["fmt"] = arg.lower()
+        elif arg in nodes:
+            options["node_id"] = nodes[arg].id
+        else:
+            raise ValueError(f"Неизвестный аргумент или узел: {arg}")
+    return options
+
+
+async def _run_export(bot: Bot, chat_id: int, admin_id: int | None, db: aiosqlite.Connection, options: dict) -> None:
+    try:
+        with tempfile.TemporaryDirectory(prefix="andreyvpn-export-") as tmp:
+            report = await config_export.export_configs(db, Path(tmp), **options)
+            total = len(report.parts)
+            for number, path in enumerate(report.parts, 1):
+                caption = f"Часть {number}/{total}" if total > 1 else None
+                await bot.send_document(chat_id, FSInputFile(path), caption=caption)
+            audit(
+                "CONFIGS_EXPORTED", profiles=report.profiles, parts=total,
+                format=report.format, qr=options["qr"], node_id=options["node_id"], by_admin=admin_id,
+            )
+            if not report.profiles and not report.failed:
+                await bot.send_message(chat_id, "📦 Профилей для выгрузки нет.")
+                return
+            await bot.send_message(chat_id, report.render())
+    except Exception as e:
+        logger.opt(exception=e).error("[EXPORT] Ошибка выгрузки конфигов")
+        await bot.send_message(chat_id, f"❌ Выгрузка не удалась: {html.escape(str(e))}")
+
+
+@router.message(Command("export"), AdminFilter())
+async def cmd_export(message: Message, command: CommandObject, bot: Bot, db: aiosqlite.Connection) -> None:
+    try:
+        options = parse_args((command.args or "").split())
+    except ValueError as exc:
+        await message.answer(f"⚠️ {html.escape(str(exc))}\n\n{USAGE}")
+        return
+    if config_export.running():
+        await message.answer("⏳ Выгрузка уже идёт, дождитесь архива.")
+        return
+
+    admin_id = message.from_user.id if message.from_user else None
+    logger.info("[EXPORT] Старт | options={} by_admin={}", options, admin_id)
+    # Хендлер не ждёт выгрузку — иначе он занял бы воркер на всё время сборки архива
+    task = asyncio.create_task(
+        _run_export(bot, message.chat.id, admin_id, db, options), name="config-export",
+    )
+    _exports.add(task)
+    task.add_done_callback(_exports.discard)
+    await message.answer("📦 Собираю архив конфигов… Файлы придут сообщениями.")
@@ -0,0 +1,117 @@
+"""
+Узлы VPN: /nodes — список с загрузкой и состоянием,
+/nodes add — новый узел, /nodes on|off — приём новых профилей.
+"""
+import asyncio
+import html
+import ipaddress
+
+import aiosqlite
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from bot.core.config import settings
+from bot.db import repository
+from bot.filters.admin import AdminFilter
+from bot.services.vpn_service import VPNService
+
+router = Router()
+
+USAGE = (
+    "Использование:\n"
+    "<code>/nodes</code> — список узлов\n"
+    "<code>/nodes add &lt;имя&gt; &lt;host:port&gt; &lt;public_key&gt; &lt;CIDR&gt; "
+    "[interface=awg0] [container=amnezia-awg] [ssh=user@host] [max=N] [ipv6=fd42:9::/64]</code>\n"
+    "<code>/nodes on|off &lt;имя&gt;</code> — принимать ли новые профили"
+)
+ADD_OPTIONS = {"interface", "container", "ssh", "max", "ipv6"}
+
+
+async def render_nodes(db: aiosqlite.Connection) -> str:
+    loads = await VPNService.node_loads(db)
+    statuses = await asyncio.gather(*(VPNService.get_server_status(load.node) for load in loads))
+    lines = ["🌐 <b>Узлы VPN</b>\n"]
+    for load, status in zip(loads, statuses, strict=True):
+        node = load.node
+        icon = "🟢" if status["status"] == "online" else "🔴"
+        state = "" if node.enabled else " · ⏸ новые профили не принимает"
+        lines.append(
+            f"{icon} <b>{html.escape(node.name)}</b> — <code>{html.escape(node.endpoint or '—')}</code>{state}\n"
+            f"   {html.escape(VPNService.runtime(node).describe())}, "
+            f"<code>{html.escape(node.interface)}</code> {html.escape(node.ip_range)}"
+            f"{' ' + html.escape(node.ipv6_range) if node.ipv6_range else ''}\n"
+            f"   Профилей: <b>{load.profiles}/{node.capacity}</b> ({load.utilization:.0%}), "
+            f"на интерфейсе: {status.get('active_peers_count', 0)}, "
+            f"онлайн: {status.get('online_peers_count', 0)}, "
+            f"трафик: {VPNService.format_bytes(load.traffic)}"
+        )
+    return "\n".join(lines)
+
+
+def parse_add(args: list[str]) -> dict:
+    """Аргументы /nodes add → поля insert_vpn_node; ValueError с текстом для администратора."""
+    if len(args) < 4:
+        raise ValueError("Нужны имя, endpoint, публичный ключ и CIDR.")
+    name, endpoint, public_key, ip_range = args[:4]
+    options = {}
+    for item in args[4:]:
+        key, sep, value = item.partition("=")
+        if not sep or key not in ADD_OPTIONS:
+            raise ValueError(f"Неизвестный параметр: {item}")
+        options[key] = value
+    if ":" not in endpoint:
+        raise ValueError("Endpoint должен быть в виде host:port.")
+    try:
+        ipaddress.IPv4Network(ip_range, strict=False)
+    except ValueError as exc:
+        raise ValueError(f"Некорректный CIDR: {exc}") from exc
+    if options.get("ipv6"):
+        try:
+            ipaddress.IPv6Network(options["ipv6"], strict=False)
+        except ValueError as exc:
+            raise ValueError(f"Некорректный IPv6-префикс: {exc}") from exc
+    try:
+        max_peers = int(options.get("max", 0))
+    except ValueError as exc:
+        raise ValueError("max должен быть числом.") from exc
+    return {
+        "name": name,
+        "endpoint": endpoint,
+        "public_key": public_key,
+        "ip_range": ip_range,
+        "ipv6_range": options.get("ipv6", ""),
+        "interface": options.get("interface", settings.wg_interface),
+        "container": options.get("container", ""),
+        "ssh_host": options.get("ssh", ""),
+        "max_peers": max_peers,
+    }
+
+
+@router.message(Command("nodes"), AdminFilter())
+async def cmd_nodes(message: Message, command: CommandObject, db: aiosqlite.Connection) -> None:
+    args = (command.args or "").split()
+    action = args[0].lower() if args else ""
+
+    if action == "add":
+        try:
+            fields = parse_add(args[1:])
+        except ValueError as exc:
+            await message.answer(f"⚠️ {html.escape(str(exc))}\n\n{USAGE}")
+            return
+        try:
+            await repository.insert_vpn_node(db, fields.pop("name"), **fields)
+        except aiosqlite.IntegrityError:
+            await message.answer("⚠️ Узел с таким именем уже есть.")
+            return
+        await VPNService.load_nodes(db)
+    elif action in ("on", "off") and len(args) == 2:
+        if not await repository.set_vpn_node_enabled(db, args[1], action == "on"):
+            await message.answer("⚠️ Узел не найден.")
+            return
+        await VPNService.load_nodes(db)
+    elif action:
+        await message.answer(USAGE)
+        return
+
+    await message.answer(await render_nodes(db))
@@ -0,0 +1,53 @@
+"""
+Пиры интерфейса: /reconcile — сверка с БД (план или применение),
+/idle — неактивные пиры и занятость пула адресов.
+"""
+import html
+
+import aiosqlite
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from bot.filters.admin import AdminFilter
+from bot.services.idle_peers import IdlePeerCollector
+from bot.services.reconciler import PeerReconciler
+
+router = Router()
+
+
+@router.message(Command("reconcile"), AdminFilter())
+async def cmd_reconcile(
+    message: Message,
+    command: CommandObject,
+    db: aiosqlite.Connection,
+    reconciler: PeerReconciler | None = None,
+) -> None:
+    if reconciler is None:
+        reconciler = PeerReconciler()
+    apply = (command.args or "").strip().lower() == "apply"
+    for node, result in await reconciler.run_all(db, dry_run=not apply):
+        if result is None:
+            await message.answer(
+                f"🔄 Не удалось прочитать пиры интерфейса узла {html.escape(node.label)} — сверка невозможна."
+            )
+            continue
+        await message.answer(result.render())
+
+
+@router.message(Command("idle"), AdminFilter())
+async def cmd_idle(
+    message: Message,
+    command: CommandObject,
+    db: aiosqlite.Connection,
+    idle_collector: IdlePeerCollector | None = None,
+) -> None:
+    if idle_collector is None:
+        await message.answer("💤 Сборщик неактивных пиров выключен (WG_IDLE_DETACH_DAYS=0).")
+        return
+    run = (command.args or "").strip().lower() == "run"
+    report = await idle_collector.run(db, dry_run=not run)
+    if report is None:
+        await message.answer("💤 Не удалось прочитать пиры интерфейса.")
+        return
+    await message.answer(report.render())
@@ -0,0 +1,143 @@
+"""
+Пулы адресов узлов: /pools — список с занятостью, /pools add — новый пул,
+/pools on|off — выдача адресов из пула, /pools migrate — перенос профилей.
+"""
+import html
+import ipaddress
+
+import aiosqlite
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from bot.db import repository
+from bot.filters.admin import AdminFilter
+from bot.services.nodes import IPPool, VPNNode
+from bot.services.pool_migration import migrate_pool
+from bot.services.vpn_service import VPNService
+
+router = Router()
+
+USAGE = (
+    "Использование:\n"
+    "<code>/pools</code> — пулы узлов\n"
+    "<code>/pools add &lt;узел&gt; &lt;CIDR&gt; [priority=100] [interface=awg1] "
+    "[endpoint=host:port] [key=public_key]</code>\n"
+    "<code>/pools on|off &lt;узел&gt; &lt;CIDR&gt;</code> — выдавать ли адреса из пула\n"
+    "<code>/pools migrate &lt;узел&gt; &lt;из CIDR&gt; &lt;в CIDR&gt; [N]</code> — перенести профили"
+)
+ADD_OPTIONS = {"priority", "interface", "endpoint", "key"}
+
+
+async def render_pools(db: aiosqlite.Connection) -> str:
+    counts = await repository.get_pool_profile_counts(db)
+    lines = ["🧮 <b>Пулы адресов</b>"]
+    for node in VPNService.nodes():
+        lines.append(f"\n<b>{html.escape(node.name)}</b>")
+        for pool in sorted(node.all_pools, key=lambda pool: pool.order):
+            used = counts.get((node.id, pool.id), 0)
+            share = f" ({used / pool.size:.0%})" if pool.size else ""
+            kind = "основной" if pool.id is None else f"приоритет {pool.priority}"
+            state = "" if pool.enabled else " · ⏸ адреса не выдаются"
+            lines.append(
+                f"  • <code>{html.escape(pool.cidr)}</code> · {html.escape(pool.interface)} · {kind}"
+                f" — {used}/{pool.size}{share}{state}"
+            )
+    return "\n".join(lines)
+
+
+def parse_add(node: VPNNode, args: list[str]) -> dict:
+    """Аргументы /pools add после имени узла → поля insert_ip_pool; ValueError с текстом для администратора."""
+    if not args:
+        raise ValueError("Нужен CIDR пула.")
+    try:
+        network = ipaddress.IPv4Network(args[0], strict=False)
+    except ValueError as exc:
+        raise ValueError(f"Некорректный CIDR: {exc}") from exc
+    options = {}
+    for item in args[1:]:
+        key, sep, value = item.partition("=")
+        if not sep or key not in ADD_OPTIONS:
+            raise ValueError(f"Неизвестный параметр: {item}")
+        options[key] = value
+
+    for pool in node.all_pools:
+        if network.overlaps(ipaddress.ip_network(pool.cidr, strict=False)):
+            raise ValueError(f"Пересекается с пулом {pool.cidr} узла {node.name}.")
+    interface = options.get("interface")
+    if interface and interface != node.interface and not ("endpoint" in options and "key" in options):
+        raise ValueError("У пула на своём интерфейсе нужны endpoint= и key= этого интерфейса.")
+    if "endpoint" in options and ":" not in options["endpoint"]:
+        raise ValueError("Endpoint должен быть в виде host:port.")
+    try:
+        priority = int(options.get("priority", 100))
+    except ValueError as exc:
+        raise ValueError("priority должен быть числом.") from exc
+    return {
+        "cidr": str(network),
+        "interface": interface,
+        "endpoint": options.get("endpoint"),
+        "public_key": options.get("key"),
+        "priority": priority,
+    }
+
+
+def find_node(name: str) -> VPNNode | None:
+    return next((node for node in VPNService.nodes() if node.name == name), None)
+
+
+def find_pool(node: VPNNode, cidr: str) -> IPPool | None:
+    """Пул узла по CIDR; None — такого пула нет или CIDR некорректен."""
+    try:
+        return node.pool_by_cidr(cidr)
+    except ValueError:
+        return None
+
+
+@router.message(Command("pools"), AdminFilter())
+async def cmd_pools(message: Message, command: CommandObject, db: aiosqlite.Connection) -> None:
+    args = (command.args or "").split()
+    action = args[0].lower() if args else ""
+    node = find_node(args[1]) if len(args) > 1 else None
+    if action in ("add", "on", "off", "migrate") and node is None:
+        await message.answer(f"⚠️ Узел не найден.\n\n{USAGE}")
+        return
+
+    if action == "add":
+        assert node is not None
+        try:
+            fields = parse_add(node, args[2:])
+        except ValueError as exc:
+            await message.answer(f"⚠️ {html.escape(str(exc))}\n\n{USAGE}")
+            return
+        await repository.insert_ip_pool(db, node.id, fields.pop("cidr"), **fields)
+        await VPNService.load_nodes(db)
+    elif action in ("on", "off") and len(args) == 3:
+        assert node is not None
+        pool = find_pool(node, args[2])
+        if pool is None or pool.id is None:
+            await message.answer("⚠️ Пул не найден (основной пул выключается вместе с узлом: /nodes off).")
+            return
+        await repository.set_ip_pool_enabled(db, pool.id, action == "on")
+        await VPNService.load_nodes(db)
+    elif action == "migrate" and len(args) in (4, 5):
+        assert node is not None
+        source, target = find_pool(node, args[2]), find_pool(node, args[3])
+        if source is None or target is None or source == target:
+            await message.answer("⚠️ Нужны два разных пула этого узла.")
+            return
+        if len(args) == 5 and not args[4].isdigit():
+            await message.answer(USAGE)
+            return
+        report = await migrate_pool(
+            db, node, source, target,
+            limit=int(args[4]) if len(args) == 5 else None,
+            by_admin=message.from_user.id if message.from_user else None,
+        )
+        await message.answer(report.render())
+        return
+    elif action:
+        await message.answer(USAGE)
+        return
+
+    await message.answer(await render_pools(db))
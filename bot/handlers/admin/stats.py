@@ -1,7 +1,10 @@
+import html
+
 from aiogram import Router, F
 from aiogram.types import Message
 import aiosqlite
 
+from bot.core.config import settings
 from bot.filters.admin import AdminFilter
 from bot.keyboards.admin import BTN_STATS, BTN_SERVER
 from bot.services.vpn_service import VPNService
@@ -9,6 +12,8 @@ from bot.db import repository
 
 router = Router()
 
+TOP_COMMANDS = 5
+
 
 @router.message(F.text == BTN_STATS, AdminFilter())
 async def handle_stats(message: Message, db: aiosqlite.Connection):
@@ -35,9 +40,28 @@ async def handle_server(message: Message):
     icon = icons.get(status_data["status"], "⚠️")
     label = labels.get(status_data["status"], f"Ошибка: {status_data.get('message', '—')}")
 
-    await message.answer(
+    text = (
         f"🖥️ <b>Статус сервера</b>\n\n"
         f"Состояние: {icon} {label}\n"
         f"Интерфейс: <code>{status_data.get('interface', '—')}</code>\n"
         f"Активных пиров: <b>{status_data.get('active_peers_count', 0)}</b>"
     )
+    if "online_peers_count" in status_data:
+        text += (
+            f"\nОнлайн сейчас: <b>{status_data['online_peers_count']}</b> "
+            f"(рукопожатие за {settings.wg_online_window // 60} мин)"
+        )
+
+    rows = VPNService.command_stats.snapshot()[:TOP_COMMANDS]
+    if rows:
+        text += "\n\n⏱ <b>Команды WG</b> (p50 · p95 · макс.):\n"
+        for r in rows:
+            text += (
+                f"• <code>{html.escape(r['command'])}</code> ×{r['count']} — "
+                f"{r['p50_ms']:.0f} · {r['p95_ms']:.0f} · {r['max_ms']:.0f} мс"
+            )
+            if r["timeouts"] or r["failures"]:
+                text += f" (ошибок {r['failures']}, таймаутов {r['timeouts']})"
+            text += "\n"
+
+    await message.answer(text)
@@ -16,9 +16,11 @@ from bot.filters.admin import AdminFilter
 from bot.keyboards.admin import BTN_USERS
 from bot.keyboards.user import get_user_keyboard
 from bot.services.vpn_service import VPNService
+from bot.core import tracing
 from bot.core.config import settings
 from bot.core.logging import audit
 from bot.db import repository
+from bot.middlewares.access_middleware import approval_cache
 
 router = Router()
 
@@ -150,6 +152,7 @@ async def handle_user_block(callback: CallbackQuery, callback_data: UserAction,
     user_id = callback_data.user_id
     admin_id = callback.from_user.id
     await repository.set_user_approved(db, user_id, False)
+    await approval_cache.invalidate(user_id)
 
     logger.info("[ACCESS] Пользователь заблокирован | user_id={} by_admin={}", user_id, admin_id)
     audit("BLOCKED", user_id=user_id, by_admin=admin_id)
@@ -172,6 +175,7 @@ async def handle_user_unblock(callback: CallbackQuery, callback_data: UserAction
     user_id = callback_data.user_id
     admin_id = callback.from_user.id
     await repository.set_user_approved(db, user_id, True)
+    await approval_cache.invalidate(user_id)
 
     logger.info("[ACCESS] Пользователь разблокирован | user_id={} by_admin={}", user_id, admin_id)
     audit("UNBLOCKED", user_id=user_id, by_admin=admin_id)
@@ -217,8 +221,8 @@ async def handle_vpn_reject(callback: CallbackQuery, callback_data: IssueVPN, bo
     await callback.message.edit_text(callback.message.text + "\n\n❌ <b>Отклонено.</b>")
 
     # Очищаем pending VPN requests для этого пользователя
-    from bot.handlers.user.profiles import _pending_vpn_requests
-    _pending_vpn_requests.pop(user_id, None)
+    from bot.handlers.user.profiles import clear_pending_vpn_request
+    await clear_pending_vpn_request(user_id)
 
     try:
         await bot.send_message(user_id, "❌ Ваш запрос на VPN профиль был отклонён.")
@@ -226,6 +230,7 @@ async def handle_vpn_reject(callback: CallbackQuery, callback_data: IssueVPN, bo
         logger.warning("[VPN] Не удалось уведомить пользователя об отказе | user_id={} error={}", user_id, e)
 
 
+@tracing.traced()
 async def _issue_vpn_to_user(callback: CallbackQuery, user_id: int, db: aiosqlite.Connection, bot: Bot):
     admin_id = callback.from_user.id
     try:
@@ -243,8 +248,8 @@ async def _issue_vpn_to_user(callback: CallbackQuery, user_id: int, db: aiosqlit
         audit("VPN_ISSUED", user_id=user_id, profile=profile_name, ip=result["ipv4"], by_admin=admin_id)
 
         # Очищаем pending VPN requests для этого пользователя
-        from bot.handlers.user.profiles import _pending_vpn_requests
-        _pending_vpn_requests.pop(user_id, None)
+        from bot.handlers.user.profiles import clear_pending_vpn_request
+        await clear_pending_vpn_request(user_id)
 
         qr_bytes = VPNService.generate_qr_code(result["config"])
         qr_file = BufferedInputFile(qr_bytes, filename=f"{profile_name}.png")
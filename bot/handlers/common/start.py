@@ -14,6 +14,7 @@ from bot.core.logging import audit
 from bot.db import repository
 from bot.keyboards.user import get_user_keyboard
 from bot.keyboards.admin import get_admin_keyboard
+from bot.middlewares.access_middleware import approval_cache
 
 router = Router()
 
@@ -67,7 +68,9 @@ async def cmd_start(message: Message, db: aiosqlite.Connection, state: FSMContex
             await message.answer("⏳ Ваша заявка всё ещё рассматривается. Ожидайте.")
         return
 
-    # Новый пользователь — капча
+    # Новый пользователь — капча. Записи в users нет (в том числе если её
+    # удалили) — закэшированный статус одобрения больше не действителен
+    await approval_cache.invalidate(user_id)
     a = random.randint(1, 20)
     b = random.randint(1, 20)
     await state.update_data(captcha_answer=a + b)
@@ -1,5 +1,4 @@
 import html
-import time
 
 from aiogram import Router, F, Bot
 from aiogram.types import (
@@ -14,22 +13,37 @@ from loguru import logger
 import aiosqlite
 
 from bot.keyboards.user import BTN_PROFILES
+from bot.services.config_template import FORMAT_AMNEZIA, FORMAT_AWG, FORMAT_WG, extra_formats
 from bot.services.vpn_service import VPNService
 from bot.core.config import settings
 from bot.core.logging import audit
+from bot.core.state_store import get_state_store
 from bot.db import repository
 from bot.handlers.admin.users import get_issue_vpn_keyboard
 
 router = Router()
 
-# Rate limiting: предотвращаем многократный спам запросами VPN
-_pending_vpn_requests: dict[int, float] = {}
+# Rate limiting: предотвращаем многократный спам запросами VPN.
+# Отметка о запросе — TTL-ключ в StateStore (общий для реплик при Redis).
 PENDING_REQUEST_TTL = 86400  # 24 часа
 
 
+def pending_request_key(user_id: int) -> str:
+    return f"vpn_request:{user_id}"
+
+
+async def clear_pending_vpn_request(user_id: int) -> None:
+    """Снимает отметку о запросе профиля — пользователь может запросить снова."""
+    await get_state_store().unlock(pending_request_key(user_id))
+
+
 class ProfileAction(CallbackData, prefix="prof"):
     action: str  # conf, qr, delete, confirm_delete, cancel_delete, request
     profile_id: int
+    fmt: str = ""  # для conf: формат конфига (пусто — AmneziaWG .conf)
+
+
+FORMAT_BUTTONS = {FORMAT_WG: "📥 WireGuard", FORMAT_AMNEZIA: "📦 AmneziaVPN"}
 
 
 def profiles_keyboard(profiles: list) -> InlineKeyboardMarkup:
@@ -44,6 +58,15 @@ def profiles_keyboard(profiles: list) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="📱 QR", callback_data=ProfileAction(action="qr", profile_id=pid).pack()),
             InlineKeyboardButton(text="🗑️ Удалить", callback_data=ProfileAction(action="delete", profile_id=pid).pack()),
         ])
+        formats = extra_formats()
+        if formats:
+            buttons.append([
+                InlineKeyboardButton(
+                    text=FORMAT_BUTTONS[fmt],
+                    callback_data=ProfileAction(action="conf", profile_id=pid, fmt=fmt).pack(),
+                )
+                for fmt in formats
+            ])
     buttons.append([
         InlineKeyboardButton(
             text="➕ Запросить новый профиль",
@@ -84,10 +107,22 @@ async def handle_profiles(message: Message, db: aiosqlite.Connection):
         await message.answer("У вас пока нет VPN профилей.", reply_markup=keyboard)
         return
 
-    await message.answer(
-        f"🔑 <b>Ваши VPN профили</b> ({len(profiles)} шт.):",
-        reply_markup=profiles_keyboard(profiles),
-    )
+    text = f"🔑 <b>Ваши VPN профили</b> ({len(profiles)} шт.):"
+    # «Последний раз в сети» — из общего снимка дампа, не отдельный дамп на просмотр
+    snapshot = await VPNService.peer_snapshot()
+    window = settings.wg_online_window
+    for p in profiles:
+        if p["detached_at"] is not None:
+            text += f"\n⏸ {html.escape(p['name'])} — отключён за неактивностью"
+        elif snapshot is not None:
+            seen = VPNService.format_last_seen(
+                snapshot.last_handshake(p["public_key"]), snapshot.taken_at, window,
+            )
+            icon = "🟢" if snapshot.is_online(p["public_key"], window) else "⚪"
+            text += f"\n{icon} {html.escape(p['name'])} — {seen}"
+    if any(p["detached_at"] is not None for p in profiles):
+        text += "\n\nПрофиль ⏸ включится снова, когда вы скачаете его .conf или QR."
+    await message.answer(text, reply_markup=profiles_keyboard(profiles))
 
 
 @router.callback_query(ProfileAction.filter(F.action == "conf"))
@@ -100,13 +135,18 @@ async def handle_download_conf(callback: CallbackQuery, callback_data: ProfileAc
         await callback.answer("Профиль не найден.", show_alert=True)
         return
 
+    fmt = callback_data.fmt or FORMAT_AWG
+    if fmt != FORMAT_AWG and fmt not in extra_formats():
+        await callback.answer("Этот формат конфига недоступен.", show_alert=True)
+        return
+
     await callback.answer("Генерирую конфиг...")
-    result = await VPNService.get_profile_config(db, profile_id)
+    result = await VPNService.get_profile_config(db, profile_id, fmt)
     if not result:
         await bot.send_message(user_id, "❌ Не удалось получить конфиг профиля. Обратитесь к администратору.")
         return
 
-    conf_file = BufferedInputFile(result["config"].encode(), filename=f"{result['name']}.conf")
+    conf_file = BufferedInputFile(result["config"].encode(), filename=f"{result['name']}{result['extension']}")
     await bot.send_document(
         user_id,
         document=conf_file,
@@ -199,17 +239,14 @@ async def handle_vpn_request(callback: CallbackQuery, bot: Bot, db: aiosqlite.Co
     user = callback.from_user
 
     user_id = user.id
-    now = time.time()
-    last_request = _pending_vpn_requests.get(user_id)
-    if last_request is not None and now - last_request < PENDING_REQUEST_TTL:
+    if not await get_state_store().try_lock(pending_request_key(user_id), PENDING_REQUEST_TTL):
         await callback.answer("⏳ Запрос уже отправлен, ожидайте ответа администратора.", show_alert=True)
         return
-    _pending_vpn_requests[user_id] = now
 
     # check profile limit
     profile_count = await repository.count_user_profiles(db, user_id)
     if profile_count >= settings.max_profiles_per_user:
-        _pending_vpn_requests.pop(user_id, None)  # сбрасываем TTL — запрос не отправлен
+        await clear_pending_vpn_request(user_id)  # сбрасываем TTL — запрос не отправлен
         await callback.answer(
             f"❌ Достигнут лимит профилей ({settings.max_profiles_per_user} шт.). "
             "Удалите один из существующих профилей.",
@@ -1,36 +1,95 @@
+"""
+Middleware контроля доступа.
+
+Порядок проверок — от дешёвых к дорогим, чтобы отказ стоил как можно меньше:
+  1. администратор, /start и /cancel          — без обращений к хранилищам
+  2. кэш статуса одобрения (approval_cache)   — StateStore (память или Redis)
+  3. FSM-состояние капчи                      — только для неодобренных
+  4. запрос is_approved в БД                  — только при промахе кэша
+"""
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware, types
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, Update
 
+from bot.core import metrics, tracing
 from bot.core.config import settings
+from bot.core.state_store import StateStore, get_state_store
 import aiosqlite
 
 
+class ApprovalCache:
+    """
+    Кэш статуса одобрения пользователей с TTL в разделяемом StateStore.
+
+    Хранит и положительные, и отрицательные результаты («бан-кэш»). Записи
+    лежат в get_state_store() — при REDIS_URL это Redis, и сброс на одной
+    реплике сразу виден остальным. Код, меняющий is_approved или удаляющий
+    пользователя, обязан вызвать ``invalidate(user_id)``.
+    """
+
+    def __init__(self, ttl: float = 60.0, store: StateStore | None = None) -> None:
+        self.ttl = ttl
+        self._store = store
+
+    @property
+    def store(self) -> StateStore:
+        # Хранилище выбирается на старте (set_state_store) — берём его при обращении
+        return self._store if self._store is not None else get_state_store()
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"approval:{user_id}"
+
+    async def get(self, user_id: int) -> bool | None:
+        """True/False — закэшированный статус, None — промах или истёк TTL."""
+        value = await self.store.get_value(self._key(user_id))
+        return None if value is None else value == "1"
+
+    async def set(self, user_id: int, approved: bool) -> None:
+        await self.store.set_value(self._key(user_id), "1" if approved else "0", self.ttl)
+
+    async def invalidate(self, user_id: int) -> None:
+        await self.store.unlock(self._key(user_id))
+
+
+approval_cache = ApprovalCache()
+
+
 class AccessControlMiddleware(BaseMiddleware):
+    def __init__(self, cache: ApprovalCache | None = None) -> None:
+        self._cache = cache if cache is not None else approval_cache
+
     async def __call__(
         self,
         handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: types.TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
+        # На dp.update приходит Update — проверяем вложенное событие
+        inner = event.event if isinstance(event, Update) else event
+
         # Пропускаем только сообщения и коллбэки
-        if not isinstance(event, (Message, CallbackQuery)):
+        if not isinstance(inner, (Message, CallbackQuery)):
             return await handler(event, data)
 
-        if event.from_user is None:
+        if inner.from_user is None:
             return await handler(event, data)
-        user_id = event.from_user.id
+        user_id = inner.from_user.id
 
         # Администратор всегда имеет доступ
         if user_id == settings.admin_id:
             return await handler(event, data)
 
         # Пропускаем /start и /cancel (регистрация и выход из FSM)
-        if isinstance(event, Message) and event.text:
-            if event.text.startswith(("/start", "/cancel")):
+        if isinstance(inner, Message) and inner.text:
+            if inner.text.startswith(("/start", "/cancel")):
                 return await handler(event, data)
 
+        approved = await self._cache.get(user_id)
+        if approved:
+            return await handler(event, data)
+
         # Пропускаем, если пользователь в процессе прохождения капчи
         state = data.get("state")
         if state:
@@ -39,24 +98,29 @@ class AccessControlMiddleware(BaseMiddleware):
             if current_state == CaptchaStates.waiting_for_answer.state:
                 return await handler(event, data)
 
-        # Проверяем одобрение в базе данных
-        db: aiosqlite.Connection = data.get("db")
-        if not db:
-            # DbMiddleware не отработал — пропускаем (не должно происходить)
-            return await handler(event, data)
+        if approved is None:
+            # Проверяем одобрение в базе данных
+            db: aiosqlite.Connection = data.get("db")
+            if not db:
+                # DbMiddleware не отработал — пропускаем (не должно происходить)
+                return await handler(event, data)
 
-        cursor = await db.execute(
-            "SELECT is_approved FROM users WHERE telegram_id = ?", (user_id,)
-        )
-        row = await cursor.fetchone()
+            cursor = await db.execute(
+                "SELECT is_approved FROM users WHERE telegram_id = ?", (user_id,)
+            )
+            row = await cursor.fetchone()
+            approved = bool(row and row["is_approved"])
+            await self._cache.set(user_id, approved)
 
-        if row and row["is_approved"]:
-            return await handler(event, data)
+            if approved:
+                return await handler(event, data)
 
         # Пользователь не одобрен или не зарегистрирован
-        if isinstance(event, Message):
-            await event.answer("🚫 Доступ ограничен. Ожидайте одобрения администратором.")
-        elif isinstance(event, CallbackQuery):
-            await event.answer("🚫 Доступ ограничен.", show_alert=True)
+        metrics.MIDDLEWARE_REJECTIONS.labels(middleware="access", reason="not_approved").inc()
+        tracing.annotate(rejected="access")
+        if isinstance(inner, Message):
+            await inner.answer("🚫 Доступ ограничен. Ожидайте одобрения администратором.")
+        elif isinstance(inner, CallbackQuery):
+            await inner.answer("🚫 Доступ ограничен.", show_alert=True)
 
         return
@@ -0,0 +1,58 @@
+"""
+Middleware для конкурентной обработки апдейтов через OrderedUpdateExecutor.
+
+Регистрируется как outer-middleware на dp.update при polling с
+handle_as_tasks=False: ставит дальнейшую обработку апдейта в очередь
+пользователя и сразу возвращает управление polling-циклу. Апдейты одного
+пользователя выполняются строго по порядку, разных — параллельно.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.middlewares.error import ErrorsMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.core import tracing
+from bot.core.executor import OrderedUpdateExecutor
+
+
+class OrderedExecutionMiddleware(BaseMiddleware):
+    """Передаёт обработку апдейта в пул воркеров с per-user упорядочиванием."""
+
+    def __init__(self, executor: OrderedUpdateExecutor) -> None:
+        self._executor = executor
+        self._errors: ErrorsMiddleware | None = None
+
+    @staticmethod
+    def _order_key(event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            return ("user", user.id)
+        chat = data.get("event_chat")
+        if chat is not None:
+            return ("chat", chat.id)
+        # Без пользователя и чата порядок не важен — каждый апдейт сам по себе
+        return ("update", event.update_id if isinstance(event, Update) else id(event))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # ErrorsMiddleware диспетчера к моменту выполнения задачи уже вернул
+        # управление, поэтому ошибки хендлеров прокидываем в errors-роутеры сами.
+        if self._errors is None and "dispatcher" in data:
+            self._errors = ErrorsMiddleware(data["dispatcher"])
+        errors = self._errors
+        # Воркер — другая задача: переносим туда трассу апдейта и ctx логов
+        resume = tracing.handoff()
+
+        async def job() -> Any:
+            with resume():
+                if errors is None:
+                    return await handler(event, data)
+                return await errors(handler, event, data)
+
+        await self._executor.submit(self._order_key(event, data), job)
+        return None
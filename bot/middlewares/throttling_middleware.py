@@ -1,46 +1,97 @@
 """
-Middleware для защиты от флуда.
+Middleware для защиты от флуда на основе token bucket.
 
-Апдейты, пришедшие раньше чем через rate_limit секунд после предыдущего
-от того же пользователя, молча отбрасываются.
-Счётчик хранится в LRU-кэше (maxsize=10_000), чтобы не было утечки памяти.
+У каждого пользователя есть «ведро» ёмкостью burst токенов, которое
+пополняется со скоростью rate токенов в секунду. Каждое действие стоит
+определённое число токенов (см. DEFAULT_ACTION_COSTS): навигация по меню
+дешёвая, запрос профиля и генерация конфига — дорогие. Если токенов не
+хватает, апдейт отбрасывается (опционально с коротким уведомлением).
+
+Вёдра хранятся в StateStore: в памяти процесса или в Redis, если бот
+запущен в несколько реплик.
+
+В отличие от фиксированного интервала, burst позволяет пользователю сделать
+несколько быстрых нажатий подряд (двойной тап по inline-кнопке), но не даёт
+долго флудить.
 """
 
-import time
-from collections import OrderedDict
+from collections.abc import Mapping
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+from loguru import logger
 
+from bot.core import metrics, tracing
+from bot.core.state_store import MemoryStateStore, StateStore
+from bot.keyboards.admin import BTN_APPROVALS, BTN_USERS
+from bot.keyboards.user import BTN_HELP
 
-class _LRUCache:
-    """Простой LRU-кэш с ограничением по размеру."""
+# Стоимость действий в токенах. Ключ — префикс callback_data вида
+# "prefix:action", команда ("/start") или текст кнопки reply-клавиатуры.
+DEFAULT_ACTION_COSTS: dict[str, float] = {
+    # Дорогие: subprocess wg, шифрование, рендер QR, уведомление админа
+    "prof:request": 3.0,
+    "prof:conf": 2.0,
+    "prof:qr": 2.0,
+    "prof:confirm_delete": 2.0,
+    "ivpn:approve": 2.0,
+    "usr:issue_vpn": 2.0,
+    # Дешёвые: навигация
+    "noop": 0.25,
+    "prof:delete": 0.5,
+    "prof:cancel_delete": 0.5,
+    "usr:page": 0.5,
+    "appr:page": 0.5,
+    "/menu": 0.5,
+    BTN_HELP: 0.5,
+    BTN_USERS: 0.5,
+    BTN_APPROVALS: 0.5,
+}
 
-    def __init__(self, maxsize: int) -> None:
-        self._maxsize = maxsize
-        self._cache: OrderedDict[int, float] = OrderedDict()
+THROTTLED_TEXT = "⏳ Слишком много запросов. Подождите пару секунд."
 
-    def get(self, key: int, default: float = 0.0) -> float:
-        if key in self._cache:
-            self._cache.move_to_end(key)
-            return self._cache[key]
-        return default
 
-    def set(self, key: int, value: float) -> None:
-        if key in self._cache:
-            self._cache.move_to_end(key)
-        self._cache[key] = value
-        if len(self._cache) > self._maxsize:
-            self._cache.popitem(last=False)
+def action_key(event: TelegramObject) -> str | None:
+    """Ключ действия для таблицы стоимостей: "prefix:action", "/cmd" или текст кнопки."""
+    inner = event.event if isinstance(event, Update) else event
+    if isinstance(inner, CallbackQuery):
+        data = inner.data or ""
+        return ":".join(data.split(":", 2)[:2])
+    if isinstance(inner, Message):
+        text = inner.text or ""
+        if text.startswith("/"):
+            return text.split(maxsplit=1)[0].split("@", 1)[0]
+        return text
+    return None
 
 
 class ThrottlingMiddleware(BaseMiddleware):
-    """Ограничивает частоту обработки апдейтов от одного пользователя."""
+    """Ограничивает частоту обработки апдейтов от одного пользователя (token bucket)."""
 
-    def __init__(self, rate_limit: float = 0.7, maxsize: int = 10_000) -> None:
-        self.rate_limit = rate_limit
-        self._last_time: _LRUCache = _LRUCache(maxsize=maxsize)
+    def __init__(
+        self,
+        rate: float = 1.5,
+        burst: float = 5.0,
+        costs: Mapping[str, float] | None = None,
+        default_cost: float = 1.0,
+        notify: bool = False,
+        store: StateStore | None = None,
+    ) -> None:
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive")
+        self.rate = rate
+        self.burst = burst
+        self.costs = dict(DEFAULT_ACTION_COSTS if costs is None else costs)
+        self.default_cost = default_cost
+        self.notify = notify
+        self.store = store if store is not None else MemoryStateStore()
+
+    def cost_of(self, event: TelegramObject) -> float:
+        key = action_key(event)
+        if key is None:
+            return self.default_cost
+        return self.costs.get(key, self.default_cost)
 
     async def __call__(
         self,
@@ -50,9 +101,31 @@ class ThrottlingMiddleware(BaseMiddleware):
     ) -> Any:
         user = data.get("event_from_user")
         if user:
-            now = time.monotonic()
-            last = self._last_time.get(user.id)
-            if now - last < self.rate_limit:
+            try:
+                allowed = await self.store.consume(
+                    str(user.id), self.cost_of(event), self.rate, self.burst,
+                )
+            except Exception as e:
+                # Недоступность хранилища не должна блокировать бота
+                logger.warning("[THROTTLE] State store недоступен, пропускаем | error={}", e)
+                allowed = True
+            if not allowed:
+                metrics.MIDDLEWARE_REJECTIONS.labels(middleware="throttling", reason="rate_limited").inc()
+                tracing.annotate(rejected="throttling")
+                if self.notify:
+                    await self._notify(event, user.id)
                 return None
-            self._last_time.set(user.id, now)
         return await handler(event, data)
+
+    async def _notify(self, event: TelegramObject, user_id: int) -> None:
+        inner = event.event if isinstance(event, Update) else event
+        try:
+            if isinstance(inner, CallbackQuery):
+                # Ответ на callback нужен в любом случае — иначе у кнопки крутятся часики
+                await inner.answer(THROTTLED_TEXT)
+            elif isinstance(inner, Message):
+                # На сообщения отвечаем один раз за эпизод, чтобы не усиливать флуд
+                if await self.store.try_lock(f"throttled:{user_id}", self.burst / self.rate):
+                    await inner.answer(THROTTLED_TEXT)
+        except Exception as e:
+            logger.debug("[THROTTLE] Не удалось уведомить пользователя | user_id={} error={}", user_id, e)
@@ -0,0 +1,94 @@
+"""
+Inner-middleware для замера времени выполнения хендлеров.
+
+Регистрируется на dp.message / dp.callback_query — inner-middleware
+родительского роутера применяется ко всем вложенным роутерам, а в data
+уже есть выбранный хендлер (data["handler"]).
+
+Длительность пишется в гистограмму Prometheus по роутеру (модуль
+bot/handlers/<router>) и, если передан, в LatencyTracker по хендлеру (/perf).
+Вызов хендлера оборачивается span-ом ``handler <имя>`` текущей трассы.
+Выполняющиеся хендлеры видны в ``running_handlers`` — их имена монитор лага
+event loop прикладывает к алерту.
+"""
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.core import metrics, tracing
+from bot.core.executor import LatencyTracker
+
+
+class RunningHandlers:
+    """Хендлеры, выполняющиеся прямо сейчас (имя и время старта)."""
+
+    def __init__(self) -> None:
+        self._ids = itertools.count()
+        self._running: Dict[int, tuple[str, float]] = {}
+
+    def enter(self, name: str) -> int:
+        token = next(self._ids)
+        self._running[token] = (name, time.perf_counter())
+        return token
+
+    def exit(self, token: int) -> None:
+        self._running.pop(token, None)
+
+    def names(self) -> list[str]:
+        """Имена с длительностью, самые долгие — первыми: ``user.status.handle_status (1.2s)``."""
+        now = time.perf_counter()
+        ordered = sorted(self._running.values(), key=lambda item: item[1])
+        return [f"{name} ({now - started:.1f}s)" for name, started in ordered]
+
+
+running_handlers = RunningHandlers()
+
+
+def _callback(data: Dict[str, Any]) -> Any:
+    return getattr(data.get("handler"), "callback", None)
+
+
+def router_name(data: Dict[str, Any]) -> str:
+    """Роутер хендлера — модуль без префикса bot.handlers: ``user.profiles``."""
+    callback = _callback(data)
+    if callback is None:
+        return "unknown"
+    module = getattr(callback, "__module__", "") or ""
+    return module.removeprefix("bot.handlers.")
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    """Имя хендлера вида ``user.profiles.handle_vpn_request``."""
+    callback = _callback(data)
+    if callback is None:
+        return "unknown"
+    return f"{router_name(data)}.{callback.__name__}"
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Записывает длительность каждого хендлера в метрики и LatencyTracker."""
+
+    def __init__(self, tracker: LatencyTracker | None = None) -> None:
+        self._tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = handler_name(data)
+        token = running_handlers.enter(name)
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"handler {name}"):
+                return await handler(event, data)
+        finally:
+            running_handlers.exit(token)
+            elapsed = time.perf_counter() - started
+            metrics.HANDLER_SECONDS.labels(router=router_name(data)).observe(elapsed)
+            if self._tracker is not None:
+                self._tracker.observe(name, elapsed)
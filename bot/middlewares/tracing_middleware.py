@@ -0,0 +1,32 @@
+"""
+Outer-middleware трассировки: корневой span ``update`` на каждый апдейт.
+
+Регистрируется на dp.update первым, чтобы в трассу попали все остальные
+middleware. Идентификатор трассы попадает в extra[ctx] всех логов апдейта.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.core import tracing
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает трассу апдейта (bot.core.tracing.start_trace)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        attrs: Dict[str, Any] = {}
+        if isinstance(event, Update):
+            attrs["update_id"] = event.update_id
+            attrs["type"] = event.event_type
+        user = data.get("event_from_user")
+        if user is not None:
+            attrs["user_id"] = user.id
+        with tracing.start_trace("update", **attrs):
+            return await handler(event, data)
@@ -0,0 +1,215 @@
+"""
+Выгрузка конфигов всех профилей администратору (/export) — ZIP-архивами.
+
+Профили читаются страницами по EXPORT_CHUNK_SIZE (keyset по id, без OFFSET),
+расшифровка ключей и рендер конфигов (и QR) — в пуле из EXPORT_WORKERS
+потоков; записи сразу уходят в ZIP на диске. В памяти одновременно только
+одна страница, поэтому память не зависит от числа профилей.
+
+Архив режется на части не больше EXPORT_PART_MB (лимит Bot API на документ —
+50 МБ): перед записью профиля считается размер части вместе с будущим
+central directory, конфиг и QR одного профиля всегда попадают в одну часть.
+
+Архив содержит приватные ключи клиентов: файлы пишутся во временный каталог
+вызывающего и отправляются только в чат администратора.
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+import re
+import time
+import zipfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import aiosqlite
+from loguru import logger
+
+from bot.core.config import settings
+from bot.db import repository
+from bot.services.config_template import FORMAT_AWG, ConfigTemplate
+from bot.services.vpn_service import VPNService
+
+EXPORT_CHUNK_SIZE = 200
+MAX_FAILED_SHOWN = 20
+
+# Размеры служебных записей ZIP без zip64: локальный заголовок, запись
+# central directory, конец архива; запас на заголовки блоков deflate
+_LOCAL_HEADER = 30
+_CENTRAL_HEADER = 46
+_END_RECORD = 22
+_DEFLATE_SLACK = 64
+
+_SAFE_NAME_RE = re.compile(r"[^\w.-]+")
+
+# Одна выгрузка за раз: каждая держит пул потоков и файлы частей
+_lock = asyncio.Lock()
+
+
+def running() -> bool:
+    return _lock.locked()
+
+
+def _safe(name: str) -> str:
+    return _SAFE_NAME_RE.sub("_", name).strip("._") or "profile"
+
+
+@dataclass(frozen=True, slots=True)
+class ExportJob:
+    """Всё, что нужно потоку пула для одного профиля (без обращений к БД и кэшам)."""
+    profile_id: int
+    path: str  # путь в архиве без расширения
+    encrypted_key: str
+    ipv4: str
+    ipv6: str | None
+    template: ConfigTemplate
+
+
+@dataclass(slots=True)
+class ExportReport:
+    format: str
+    profiles: int = 0
+    failed: list[int] = field(default_factory=list)  # id профилей, ключ которых не расшифровался
+    parts: list[Path] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return sum(path.stat().st_size for path in self.parts)
+
+    def render(self) -> str:
+        lines = [
+            f"📦 <b>Выгрузка конфигов</b> · {html.escape(self.format)}\n",
+            f"Профилей: <b>{self.profiles}</b>, архивов: <b>{len(self.parts)}</b>, "
+            f"{self.size / 2**20:.1f} МБ за {self.seconds:.1f} с",
+        ]
+        if self.failed:
+            shown = ", ".join(map(str, self.failed[:MAX_FAILED_SHOWN]))
+            more = f" и ещё {len(self.failed) - MAX_FAILED_SHOWN}" if len(self.failed) > MAX_FAILED_SHOWN else ""
+            lines.append(f"\n⚠️ Не расшифрован ключ ({len(self.failed)}): {shown}{more}")
+        return "\n".join(lines)
+
+
+class ZipParts:
+    """ZIP-архив на диске, разбитый на части не больше part_bytes."""
+
+    def __init__(self, directory: Path, stem: str, part_bytes: int) -> None:
+        self.directory = directory
+        self.stem = stem
+        self.part_bytes = part_bytes
+        self.paths: list[Path] = []
+        self._zip: zipfile.ZipFile | None = None
+        self._central = _END_RECORD  # будущий central directory текущей части
+
+    def _rotate(self) -> zipfile.ZipFile:
+        self.close()
+        path = self.directory / f"{self.stem}-{len(self.paths) + 1}.zip"
+        self.paths.append(path)
+        self._zip = zipfile.ZipFile(path, "w")
+        self._central = _END_RECORD
+        return self._zip
+
+    def _size(self, zf: zipfile.ZipFile) -> int:
+        """Записано в текущую часть (без central directory)."""
+        assert zf.fp is not None  # часть открыта на запись
+        return zf.fp.tell()
+
+    def write_profile(self, entries: list[tuple[str, bytes, int]]) -> None:
+        """Записи одного профиля (имя, данные, compress_type) — целиком в одну часть."""
+        local = sum(_LOCAL_HEADER + len(name.encode()) + len(data) + _DEFLATE_SLACK for name, data, _ in entries)
+        central = sum(_CENTRAL_HEADER + len(name.encode()) for name, _, _ in entries)
+        zf = self._zip
+        # Пустая часть принимает профиль в любом случае — иначе он не поместится никуда
+        if zf is None or (
+            zf.infolist() and self._size(zf) + self._central + local + central > self.part_bytes
+        ):
+            zf = self._rotate()
+        for name, data, compress_type in entries:
+            zf.writestr(name, data, compress_type=compress_type)
+        self._central += central
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+
+def _render(job: ExportJob, qr: bool) -> list[tuple[str, bytes, int]] | None:
+    """Поток пула: расшифровка ключа и рендер; None — ключ не расшифровался."""
+    try:
+        private_key = VPNService.decrypt_data(job.encrypted_key)
+    except (ValueError, RuntimeError):
+        return None
+    config = job.template.render(private_key, job.ipv4, job.ipv6)
+    entries = [(job.path + job.template.extension, config, zipfile.ZIP_DEFLATED)]
+    if qr and job.template.extension == ".conf":
+        # PNG уже сжат — без deflate
+        entries.append((job.path + ".png", VPNService.generate_qr_code(config.decode("utf-8")), zipfile.ZIP_STORED))
+    return entries
+
+
+def _write_chunk(pool: Executor, parts: ZipParts, jobs: list[ExportJob], qr: bool, report: ExportReport) -> None:
+    """Поток: рендер страницы в пуле (map сохраняет порядок) и запись в архив."""
+    for job, entries in zip(jobs, pool.map(_render, jobs, [qr] * len(jobs)), strict=True):
+        if entries is None:
+            report.failed.append(job.profile_id)
+            continue
+        parts.write_profile(entries)
+        report.profiles += 1
+
+
+def _job(row: aiosqlite.Row, fmt: str) -> ExportJob:
+    user = f"{row['user_id']}_{row['username']}" if row["username"] else str(row["user_id"])
+    node = VPNService.target(row["node_id"], row["pool_id"])
+    return ExportJob(
+        row["id"],
+        f"{_safe(user)}/{row['id']}_{_safe(row['name'] or '')}",
+        row["private_key"] or "",
+        row["ipv4_address"],
+        row["ipv6_address"],
+        VPNService.config_template(node, fmt),
+    )
+
+
+async def export_configs(
+    db: aiosqlite.Connection,
+    directory: Path,
+    *,
+    fmt: str = FORMAT_AWG,
+    qr: bool = False,
+    node_id: int | None = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    workers: int | None = None,
+    part_bytes: int | None = None,
+) -> ExportReport:
+    """Пишет конфиги профилей (узла node_id или всех) в ZIP-части в directory.
+
+    Профилям без IPv6 на узле с IPv6 адрес здесь не выдаётся — выгрузка
+    ничего не меняет в БД и на интерфейсах.
+    """
+    async with _lock:
+        started = time.monotonic()
+        report = ExportReport(fmt)
+        parts = ZipParts(
+            directory, f"configs-{time.strftime('%Y%m%d-%H%M%S')}",
+            part_bytes or settings.export_part_mb * 2**20,
+        )
+        after_id = 0
+        try:
+            with ThreadPoolExecutor(workers or settings.export_workers, thread_name_prefix="export") as pool:
+                while rows := await repository.get_profiles_for_export(db, after_id, chunk_size, node_id):
+                    after_id = rows[-1]["id"]
+                    # Шаблоны — в потоке event loop: кэш VPNService не потокобезопасен
+                    jobs = [_job(row, fmt) for row in rows]
+                    await asyncio.to_thread(_write_chunk, pool, parts, jobs, qr, report)
+        finally:
+            await asyncio.to_thread(parts.close)
+        report.parts = parts.paths
+        report.seconds = time.monotonic() - started
+        logger.info(
+            "[EXPORT] Конфиги выгружены | profiles={} failed={} parts={} format={} qr={} seconds={:.1f}",
+            report.profiles, len(report.failed), len(report.parts), fmt, qr, report.seconds,
+        )
+        return report
@@ -0,0 +1,156 @@
+"""
+Шаблоны клиентских конфигов: статическая часть собирается один раз.
+
+Всё, что не зависит от профиля — DNS, параметры обфускации AmneziaWG,
+ключ и endpoint сервера — компилируется в неизменяемые куски bytes вокруг
+слотов (приватный ключ, адрес, AllowedIPs); рендер профиля — один
+b"".join без обращений к settings и условий по S3/S4/I1. Шаблон зависит
+только от формата и узла (вида узла для пула), VPNService кэширует их до
+reset_cache()/load_nodes().
+
+Форматы:
+  awg      — конфиг AmneziaWG (.conf), как раньше
+  wg       — стандартный WireGuard без параметров обфускации (.conf): для
+             клиентов без AmneziaWG, работает только с сервером без обфускации
+  amnezia  — JSON AmneziaVPN (.json): контейнер amnezia-awg с last_config
+
+Значения слотов — base64-ключ и IP-адреса: экранирование им не нужно ни
+в .conf, ни внутри вложенного JSON, поэтому они вставляются как есть.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+
+from bot.core.config import settings
+from bot.services.nodes import VPNNode
+
+FORMAT_AWG = "awg"
+FORMAT_WG = "wg"
+FORMAT_AMNEZIA = "amnezia"
+FORMAT_EXTENSIONS = {FORMAT_AWG: ".conf", FORMAT_WG: ".conf", FORMAT_AMNEZIA: ".json"}
+
+# Слоты в порядке значений ConfigTemplate.render
+SLOTS = ("private_key", "ipv4", "address", "allowed_ips")
+_SLOT_RE = re.compile(rb"@@(" + b"|".join(slot.encode() for slot in SLOTS) + rb")@@")
+
+
+def _mark(slot: str) -> str:
+    return f"@@{slot}@@"
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigTemplate:
+    format: str
+    parts: tuple[bytes, ...]  # статические куски, на один больше, чем слотов
+    slots: tuple[int, ...]    # индекс значения (SLOTS) между parts[i] и parts[i + 1]
+
+    @classmethod
+    def compile(cls, text: str, fmt: str) -> ConfigTemplate:
+        """Текст с метками @@slot@@ → куски bytes и индексы слотов."""
+        pieces = _SLOT_RE.split(text.encode("utf-8"))
+        return cls(
+            fmt,
+            tuple(pieces[0::2]),
+            tuple(SLOTS.index(name.decode()) for name in pieces[1::2]),
+        )
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_EXTENSIONS[self.format]
+
+    def render(self, private_key: str, ipv4: str, ipv6: str | None = None) -> bytes:
+        if ipv6:
+            address = f"{ipv4}/32, {ipv6}/128".encode()
+            allowed_ips = b"0.0.0.0/0, ::/0"
+        else:
+            address = f"{ipv4}/32".encode()
+            allowed_ips = b"0.0.0.0/0"
+        values = (private_key.encode(), ipv4.encode(), address, allowed_ips)
+        chunks = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:], strict=True):
+            chunks.append(values[slot])
+            chunks.append(part)
+        return b"".join(chunks)
+
+
+def _obfuscation() -> list[tuple[str, int]]:
+    """Параметры AmneziaWG в порядке конфига; S3/S4/I1 — только ненулевые."""
+    params = [
+        ("Jc", settings.jc), ("Jmin", settings.jmin), ("Jmax", settings.jmax),
+        ("S1", settings.s1), ("S2", settings.s2),
+    ]
+    params += [(name, value) for name, value in (("S3", settings.s3), ("S4", settings.s4), ("I1", settings.i1)) if value]
+    params += [("H1", settings.h1), ("H2", settings.h2), ("H3", settings.h3), ("H4", settings.h4)]
+    return params
+
+
+def _conf_text(node: VPNNode, obfuscation: bool) -> str:
+    lines = [
+        "[Interface]",
+        f"PrivateKey = {_mark('private_key')}",
+        f"Address = {_mark('address')}",
+        f"DNS = {settings.dns_servers}",
+    ]
+    if obfuscation:
+        lines.extend(f"{name} = {value}" for name, value in _obfuscation())
+    lines.extend([
+        "",
+        "[Peer]",
+        f"PublicKey = {node.public_key}",
+        f"Endpoint = {node.endpoint}",
+        f"AllowedIPs = {_mark('allowed_ips')}",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def _amnezia_text(node: VPNNode) -> str:
+    host, _, port = node.endpoint.rpartition(":")
+    params = {name: str(value) for name, value in _obfuscation()}
+    last_config = {
+        **params,
+        "client_ip": _mark("ipv4"),
+        "client_priv_key": _mark("private_key"),
+        "config": _conf_text(node, obfuscation=True),
+        "hostName": host,
+        "port": int(port) if port.isdigit() else port,
+        "server_pub_key": node.public_key,
+    }
+    dns = [server.strip() for server in settings.dns_servers.split(",") if server.strip()]
+    document = {
+        "containers": [{
+            "awg": {
+                **params,
+                "last_config": json.dumps(last_config, indent=4, ensure_ascii=False),
+                "port": port,
+                "transport_proto": "udp",
+            },
+            "container": "amnezia-awg",
+        }],
+        "defaultContainer": "amnezia-awg",
+        "description": node.name,
+        "dns1": dns[0] if dns else "",
+        "dns2": dns[1] if len(dns) > 1 else "",
+        "hostName": host,
+    }
+    return json.dumps(document, indent=4, ensure_ascii=False) + "\n"
+
+
+def extra_formats() -> tuple[str, ...]:
+    """Дополнительные форматы из CONFIG_FORMATS (неизвестные и повторы отбрасываются)."""
+    names = (name.strip().lower() for name in settings.config_formats.split(","))
+    return tuple(dict.fromkeys(name for name in names if name in FORMAT_EXTENSIONS and name != FORMAT_AWG))
+
+
+def compile_template(node: VPNNode, fmt: str = FORMAT_AWG) -> ConfigTemplate:
+    """Шаблон конфига узла в формате fmt; ValueError — неизвестный формат."""
+    if fmt == FORMAT_AWG:
+        text = _conf_text(node, obfuscation=True)
+    elif fmt == FORMAT_WG:
+        text = _conf_text(node, obfuscation=False)
+    elif fmt == FORMAT_AMNEZIA:
+        text = _amnezia_text(node)
+    else:
+        raise ValueError(f"Unknown config format: {fmt!r}")
+    return ConfigTemplate.compile(text, fmt)
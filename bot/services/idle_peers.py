@@ -0,0 +1,171 @@
+"""
+Сборщик неактивных пиров: интерфейс не копит пиры, которыми давно не пользуются.
+
+Пир без рукопожатия дольше idle_after снимается с интерфейса (``awg set …
+peer … remove``), строка в vpn_profiles остаётся с отметкой detached_at:
+сверка пиров и восстановление при старте такие профили не добавляют. При
+следующей выдаче конфига или QR профиль подключается обратно
+(VPNService.ensure_attached) — ключ и адрес те же, перенастраивать клиент
+не нужно.
+
+Последние рукопожатия сохраняются в БД (last_handshake_at) на каждом
+проходе: на интерфейсе они обнуляются при рестарте контейнера AWG, и без
+этого после рестарта неактивными выглядели бы все пиры. Профиль без
+рукопожатий считается по дате создания. Дампы и снятие — по всем узлам VPN,
+каждый пир снимается со своего узла и интерфейса своего пула; профили
+интерфейса, дамп которого в этом проходе не получен, не снимаются.
+
+Отметка и снятие выполняются под VPNService.peer_lock интерфейса пира (как
+ensure_attached), а UPDATE заново проверяет неактивность: снимаются только
+пиры, строки которых действительно помечены.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+
+import aiosqlite
+from loguru import logger
+
+from bot.core import metrics
+from bot.db import repository
+from bot.services.vpn_service import VPNService
+
+# Не больше стольких пиров за один проход — остальные в следующий
+MAX_PER_RUN = 500
+
+
+@dataclass(slots=True)
+class IdleReport:
+    dry_run: bool
+    idle: int            # неактивных подключённых профилей найдено
+    detached: int        # снято в этом проходе
+    failed: int          # не удалось снять (уберёт сверка пиров)
+    on_interface: int
+    profiles: int
+    detached_total: int
+    pool_size: int
+
+    def render(self) -> str:
+        pool = f"{self.profiles}/{self.pool_size}"
+        if self.pool_size:
+            pool += f" ({self.profiles / self.pool_size:.0%})"
+        lines = [
+            "💤 <b>Неактивные пиры</b>\n",
+            f"На интерфейсе: <b>{self.on_interface}</b>",
+            f"Снято за неактивностью: <b>{self.detached_total}</b>",
+            f"Адресов занято: <b>{pool}</b>",
+        ]
+        if self.dry_run:
+            lines.append(f"\nК снятию: <b>{self.idle}</b>")
+            if self.idle:
+                lines.append("Снять: <code>/idle run</code>")
+        else:
+            lines.append(f"\nСнято сейчас: <b>{self.detached}</b>, ошибок: <b>{self.failed}</b>")
+        return "\n".join(lines)
+
+
+class IdlePeerCollector:
+    """Проход по требованию (run) и периодически (start/stop)."""
+
+    def __init__(self, idle_after: float, max_per_run: int = MAX_PER_RUN) -> None:
+        self.idle_after = idle_after
+        self.max_per_run = max_per_run
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+
+    async def run(self, db: aiosqlite.Connection, dry_run: bool = False) -> IdleReport | None:
+        """None — не прочитан ни один интерфейс (ничего не снимаем вслепую)."""
+        async with self._lock:
+            taken_at = time.time()
+            targets = VPNService.targets()
+            dumps = await asyncio.gather(*(VPNService.dump_peers(node) for node in targets))
+            # Только интерфейсы, прочитанные в этом проходе: у пиров остальных
+            # last_handshake_at в БД устарел, и живой пир выглядел бы неактивным
+            live = {
+                (node.id, node.interface): {peer.public_key: peer for peer in peers}
+                for node, peers in zip(targets, dumps, strict=True) if peers is not None
+            }
+            if not live:
+                return None
+            handshakes = {
+                key: peer.latest_handshake
+                for peers in live.values() for key, peer in peers.items() if peer.latest_handshake
+            }
+            if handshakes:
+                await repository.record_handshakes(db, handshakes)
+
+            cutoff = int(taken_at - self.idle_after)
+            idle = await repository.get_idle_profiles(db, cutoff, self.max_per_run)
+            detached = removed = failed = 0
+            if idle and not dry_run:
+                by_target: dict[tuple[int, int | None], list[aiosqlite.Row]] = {}
+                for row in idle:
+                    by_target.setdefault((row["node_id"], row["pool_id"]), []).append(row)
+                for (node_id, pool_id), rows in by_target.items():
+                    target = VPNService.target(node_id, pool_id)
+                    peers = live.get((target.id, target.interface))
+                    if peers is None:
+                        logger.warning(
+                            "[IDLE] Интерфейс не прочитан — пиры не снимаются | node={} profiles={}",
+                            target.label, len(rows),
+                        )
+                        continue
+                    # Под peer_lock интерфейса: ensure_attached не вернёт пир между отметкой и снятием
+                    async with VPNService.peer_lock(target):
+                        # Сначала БД: если снять с интерфейса не выйдет, пир уберёт сверка
+                        marked = set(await repository.mark_detached(
+                            db, [row["id"] for row in rows], int(taken_at), cutoff,
+                        ))
+                        keys = [
+                            row["public_key"] for row in rows
+                            if row["id"] in marked and row["public_key"] in peers
+                        ]
+                        if keys:
+                            node_removed, node_failed = await VPNService.apply_peer_changes({}, keys, node=target)
+                            removed += node_removed
+                            failed += node_failed
+                    detached += len(marked)
+                detached -= failed
+                metrics.PEERS_DETACHED.inc(detached)
+                logger.info(
+                    "[IDLE] Сняты неактивные пиры | detached={} removed={} failed={} idle_days={:.0f}",
+                    detached, removed, failed, self.idle_after / 86400,
+                )
+
+            pool = await repository.get_peer_pool_stats(db)
+            report = IdleReport(
+                dry_run=dry_run,
+                idle=len(idle),
+                detached=detached,
+                failed=failed,
+                on_interface=sum(len(peers) for peers in live.values()) - removed,
+                profiles=pool["total"],
+                detached_total=pool["detached"],
+                pool_size=sum(node.pool_size for node in VPNService.nodes()),
+            )
+        metrics.DETACHED_PEERS.set(report.detached_total)
+        if report.pool_size:
+            metrics.ADDRESS_POOL_USAGE.set(report.profiles / report.pool_size)
+        return report
+
+    # ── Периодический запуск ─────────────────────────────────────────────────
+
+    def start(self, db: aiosqlite.Connection, interval: float) -> None:
+        if self._task is None and interval > 0:
+            self._task = asyncio.create_task(self._loop(db, interval), name="idle-peer-collector")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self, db: aiosqlite.Connection, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run(db)
+            except Exception as e:
+                logger.warning("[IDLE] Проход не удался | error={}", e)
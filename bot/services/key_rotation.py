@@ -0,0 +1,183 @@
+"""
+Ротация ключа шифрования приватных ключей без простоя.
+
+ENCRYPTION_KEY принимает несколько Fernet-ключей через запятую: первый —
+текущий, им шифруются новые профили; остальные — прежние, ими только
+расшифровываются старые токены (MultiFernet в VPNService._get_fernet).
+Порядок смены ключа:
+
+1. ENCRYPTION_KEY=<новый>,<старый> и рестарт бота — всё работает сразу.
+2. Фоновое перешифрование (KeyRotator) проходит vpn_profiles пачками по
+   KEY_ROTATION_BATCH с паузой KEY_ROTATION_PAUSE: токены старых ключей
+   переписываются текущим (MultiFernet.rotate, время токена сохраняется).
+   Пачка — короткая транзакция (bot.db.transaction) вместе с чекпоинтом в
+   configs, поэтому после рестарта проход продолжается с места остановки;
+   пачка, упавшая на занятой БД, повторяется с паузой.
+3. Когда в логе «перешифрование завершено» и failed=0 — старый ключ можно
+   убрать из ENCRYPTION_KEY.
+
+Чекпоинт привязан к отпечатку текущего ключа: новая ротация начинает проход
+заново. Токен, который не расшифровывается ни одним ключом, пропускается и
+считается в failed — такой профиль не выдаст конфиг и с прежним ключом.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from dataclasses import asdict, dataclass, replace
+
+import aiosqlite
+from loguru import logger
+
+from bot.core.config import settings
+from bot.core.logging import audit
+from bot.db import repository
+from bot.db.transaction import transaction
+from bot.services.vpn_service import VPNService
+
+CHECKPOINT_KEY = "key_rotation"
+# Прогресс в лог — каждые столько пачек
+LOG_EVERY_BATCHES = 50
+# Повторы пачки при занятой БД: пауза удваивается до BATCH_RETRY_DELAY_MAX
+BATCH_ATTEMPTS = 10
+BATCH_RETRY_DELAY = 0.5
+BATCH_RETRY_DELAY_MAX = 30.0
+
+
+@dataclass(slots=True)
+class KeyRotationReport:
+    key_id: str          # отпечаток текущего ключа
+    last_id: int = 0     # последний обработанный id профиля
+    rotated: int = 0
+    failed: int = 0
+    batches: int = 0
+    done: bool = False
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def load(cls, value: str | None, key_id: str) -> KeyRotationReport:
+        """Чекпоинт из configs; для другого ключа (или без чекпоинта) — проход с начала."""
+        try:
+            data = json.loads(value) if value else {}
+        except ValueError:
+            data = {}
+        if data.get("key_id") != key_id:
+            return cls(key_id)
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+def _reencrypt(rows: list[aiosqlite.Row]) -> tuple[list[tuple[int, str, str]], list[int]]:
+    """Поток: (profile_id, старый токен, новый) для токенов старых ключей и id нерасшифрованных."""
+    updates, failed = [], []
+    for row in rows:
+        token = row["private_key"]
+        if not token:
+            continue
+        try:
+            new = VPNService.reencrypt_data(token)
+        except ValueError:
+            failed.append(row["id"])
+            continue
+        if new is not None:
+            updates.append((row["id"], token, new))
+    return updates, failed
+
+
+class KeyRotator:
+    """Проход по требованию (run) и фоновый проход до конца (start/stop)."""
+
+    def __init__(self, batch_size: int | None = None, pause: float | None = None) -> None:
+        self.batch_size = batch_size or settings.key_rotation_batch
+        self.pause = settings.key_rotation_pause if pause is None else pause
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+
+    async def run(self, db: aiosqlite.Connection) -> KeyRotationReport:
+        async with self._lock:
+            key_id = VPNService.encryption_key_id()
+            report = KeyRotationReport.load(await repository.get_config_value(db, CHECKPOINT_KEY), key_id)
+            if report.done:
+                return report
+            logger.info(
+                "[KEYS] Перешифрование приватных ключей | key={} keys={} from_id={}",
+                key_id, VPNService.encryption_key_count(), report.last_id,
+            )
+            while not report.done:
+                rows = await repository.get_private_keys_after(db, report.last_id, self.batch_size)
+                # Расшифровка пачки — вне event loop
+                updates, failed = await asyncio.to_thread(_reencrypt, rows) if rows else ([], [])
+                report = await self._commit_batch(db, report, rows, updates, len(failed))
+                if failed:
+                    logger.warning("[KEYS] Токен не расшифрован ни одним ключом | profile_ids={}", failed)
+                if report.batches % LOG_EVERY_BATCHES == 0 and rows:
+                    logger.info(
+                        "[KEYS] Прогресс | last_id={} rotated={} failed={}",
+                        report.last_id, report.rotated, report.failed,
+                    )
+                if rows and self.pause:
+                    await asyncio.sleep(self.pause)
+
+        logger.info(
+            "[KEYS] Перешифрование завершено | key={} rotated={} failed={}{}",
+            key_id, report.rotated, report.failed,
+            " — старые ключи можно убрать из ENCRYPTION_KEY" if not report.failed else "",
+        )
+        audit("KEYS_ROTATED", key=key_id, rotated=report.rotated, failed=report.failed)
+        return report
+
+    @staticmethod
+    async def _commit_batch(
+        db: aiosqlite.Connection, report: KeyRotationReport, rows: list[aiosqlite.Row],
+        updates: list[tuple[int, str, str]], failed: int,
+    ) -> KeyRotationReport:
+        """Пачка и чекпоинт одной транзакцией; отчёт меняется только после commit.
+
+        Занятая БД (OperationalError — например, запись другого процесса)
+        не прерывает проход: пачка повторяется с паузой до BATCH_RETRY_DELAY_MAX.
+        """
+        attempt = 1
+        while True:
+            try:
+                async with transaction(db):
+                    rotated = await repository.update_private_keys(db, updates) if updates else 0
+                    committed = replace(
+                        report,
+                        last_id=rows[-1]["id"] if rows else report.last_id,
+                        batches=report.batches + 1 if rows else report.batches,
+                        done=not rows,
+                        rotated=report.rotated + rotated,
+                        failed=report.failed + failed,
+                    )
+                    await repository.set_config_value(db, CHECKPOINT_KEY, committed.to_json())
+                return committed
+            except aiosqlite.OperationalError as e:
+                if attempt == BATCH_ATTEMPTS:
+                    raise
+                delay = min(BATCH_RETRY_DELAY * 2 ** (attempt - 1), BATCH_RETRY_DELAY_MAX)
+                logger.warning(
+                    "[KEYS] Пачка не записана, повтор через {:.1f} с | from_id={} attempt={} error={}",
+                    delay, report.last_id, attempt, e,
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    # ── Фоновый запуск ──────────────────────────────────────────────────────
+
+    def start(self, db: aiosqlite.Connection) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_logged(db), name="key-rotation")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run_logged(self, db: aiosqlite.Connection) -> None:
+        try:
+            await self.run(db)
+        except Exception as e:
+            # Чекпоинт последней пачки сохранён — следующий старт продолжит с него
+            logger.opt(exception=e).error("[KEYS] Перешифрование прервано")
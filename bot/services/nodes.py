@@ -0,0 +1,311 @@
+"""
+Узлы VPN: несколько серверов AmneziaWG за одним ботом.
+
+Узел — строка таблицы vpn_nodes: интерфейс, способ вызова awg (локально,
+``docker exec``, ``ssh <host>`` или их сочетание — см. WGRuntime), endpoint и
+публичный ключ сервера для клиентских конфигов, пул адресов и лимит пиров.
+Профиль привязан к узлу (vpn_profiles.node_id); адреса уникальны в пределах
+узла.
+
+Пулы адресов (IPPool): основной — ip_range узла, дополнительные — строки
+ip_pools со своим CIDR и, при необходимости, своим интерфейсом (тогда и своими
+endpoint и ключом сервера). Адрес выдаётся из первого включённого пула с
+местом в порядке priority; профиль помнит пул (vpn_profiles.pool_id, NULL —
+основной). Команды к пиру профиля выполняются на «виде» узла для его пула
+(VPNNode.for_pool) — тот же узел и транспорт, интерфейс и ключ пула.
+
+Dual-stack: если у узла задан IPv6-префикс (ipv6_range, для узла по
+умолчанию — VPN_IPV6_RANGE), профиль получает ещё и IPv6-адрес (next_ipv6),
+allowed-ips пира — оба адреса (peer_allowed_ips).
+
+Узел 1 («default») создаётся миграцией и берёт незаданные (NULL) поля из
+настроек — WG_INTERFACE, WG_CONTAINER_NAME, SERVER_ENDPOINT, SERVER_PUB_KEY,
+VPN_IP_RANGE: установка с одним сервером работает как раньше, без записей в БД.
+
+Новый профиль получает наименее загруженный включённый узел (choose_node):
+доля занятых адресов и, с весом NODE_TRAFFIC_WEIGHT, доля трафика узла по
+последнему дампу.
+
+Команды узла выполняет NodeExecutor: по умолчанию — VPNService._run
+(subprocess с argv из WGRuntime узла); тесты и альтернативные транспорты
+подставляют свой через VPNService.set_executor().
+"""
+from __future__ import annotations
+
+import ipaddress
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, replace
+from typing import Any, Protocol
+
+import aiosqlite
+from loguru import logger
+
+from bot.core.config import settings
+from bot.services.wg_command import CommandResult
+
+DEFAULT_NODE_ID = 1
+DEFAULT_NODE_NAME = "default"
+
+
+def address_pool_size(ip_range: str) -> int:
+    """Адресов для профилей в CIDR пула (без сети, broadcast и шлюза)."""
+    network = ipaddress.ip_network(ip_range, strict=False)
+    return max(network.num_addresses - 3, 0)
+
+
+def free_addresses(ip_range: str, used: Iterable[str], limit: int = 1) -> list[str]:
+    """До limit свободных адресов пула по возрастанию (первый хост — шлюз).
+
+    Занятость — bytearray по смещениям в сети, поиск свободного — bytes.find:
+    без обхода network.hosts() и объекта IPv4Address на каждый хост, так что
+    /16 с десятками тысяч профилей разбирается за миллисекунды.
+    """
+    network = ipaddress.IPv4Network(ip_range, strict=False)
+    base, size = int(network.network_address), network.num_addresses
+    taken = bytearray(size)
+    # Сеть, шлюз и broadcast не выдаются
+    for offset in (0, 1, size - 1):
+        if 0 <= offset < size:
+            taken[offset] = 1
+    for raw in used:
+        try:
+            offset = int(ipaddress.IPv4Address(raw)) - base
+        except ipaddress.AddressValueError:
+            logger.warning("Skipping invalid IPv4 entry in DB: {!r}", raw)
+            continue
+        if 0 <= offset < size:
+            taken[offset] = 1
+
+    found: list[str] = []
+    offset = taken.find(0)
+    while offset >= 0 and len(found) < limit:
+        found.append(str(ipaddress.IPv4Address(base + offset)))
+        offset = taken.find(0, offset + 1)
+    return found
+
+
+def next_ipv6(ip_range: str, used: Iterable[str]) -> str | None:
+    """Свободный адрес IPv6-префикса (первый хост — шлюз); None — префикс исчерпан.
+
+    Хосты /64 не перебрать, поэтому работа — только со смещениями занятых
+    адресов: обычно выдаётся следующий за наибольшим (O(k) по числу
+    профилей), и лишь когда префикс занят до конца — первый пропуск среди
+    отсортированных смещений.
+    """
+    network = ipaddress.IPv6Network(ip_range, strict=False)
+    base, size = int(network.network_address), network.num_addresses
+    offsets: set[int] = set()
+    for raw in used:
+        try:
+            offset = int(ipaddress.IPv6Address(raw)) - base
+        except ipaddress.AddressValueError:
+            logger.warning("Skipping invalid IPv6 entry in DB: {!r}", raw)
+            continue
+        if 0 < offset < size:
+            offsets.add(offset)
+
+    # Смещение 0 — anycast-адрес подсети, 1 — адрес интерфейса сервера
+    candidate = max(offsets, default=1) + 1
+    if candidate >= size:
+        candidate = 2
+        for offset in sorted(offsets):
+            if offset > candidate:
+                break
+            if offset == candidate:
+                candidate += 1
+    return str(ipaddress.IPv6Address(base + candidate)) if candidate < size else None
+
+
+def peer_allowed_ips(ipv4: str, ipv6: str | None = None) -> str:
+    """allowed-ips пира профиля: ``10.0.0.2/32`` или ``10.0.0.2/32,fd00::2/128``."""
+    return f"{ipv4}/32,{ipv6}/128" if ipv6 else f"{ipv4}/32"
+
+
+@dataclass(frozen=True, slots=True)
+class IPPool:
+    id: int | None      # None — основной пул узла (ip_range)
+    node_id: int
+    cidr: str
+    interface: str
+    endpoint: str
+    public_key: str
+    priority: int = 0   # меньше — раньше; основной пул — 0, новые по умолчанию — 100
+    enabled: bool = True
+
+    @classmethod
+    def primary(cls, node: VPNNode) -> IPPool:
+        return cls(None, node.id, node.ip_range, node.interface, node.endpoint, node.public_key)
+
+    @classmethod
+    def from_row(cls, row: aiosqlite.Row, node: VPNNode) -> IPPool:
+        """NULL-поля берутся у узла (пул на интерфейсе узла)."""
+        def value(column: str, default: str) -> str:
+            return default if row[column] is None else row[column]
+
+        return cls(
+            row["id"], node.id, row["cidr"],
+            value("interface", node.interface),
+            value("endpoint", node.endpoint),
+            value("public_key", node.public_key),
+            row["priority"],
+            bool(row["enabled"]),
+        )
+
+    @property
+    def size(self) -> int:
+        return address_pool_size(self.cidr)
+
+    @property
+    def order(self) -> tuple[int, int]:
+        return self.priority, self.id or 0
+
+
+class NodeExecutor(Protocol):
+    """Выполняет готовый argv команды узла (как VPNService._run)."""
+
+    def __call__(
+        self,
+        args: list[str],
+        *,
+        input: bytes | None = None,
+        parse: Callable[[Any], Awaitable[Any]] | None = None,
+    ) -> Awaitable[CommandResult]: ...
+
+
+@dataclass(frozen=True, slots=True)
+class VPNNode:
+    id: int
+    name: str
+    interface: str
+    container: str
+    ssh_host: str
+    endpoint: str
+    public_key: str
+    ip_range: str
+    max_peers: int = 0  # 0 — ограничен только пулами адресов
+    enabled: bool = True
+    pools: tuple[IPPool, ...] = ()  # все пулы узла; пусто — только основной (ip_range)
+    ipv6_range: str = ""  # IPv6-префикс клиентов; пусто — только IPv4
+
+    @classmethod
+    def from_settings(cls) -> VPNNode:
+        """Узел по умолчанию целиком из настроек (до загрузки vpn_nodes)."""
+        return cls(
+            DEFAULT_NODE_ID, DEFAULT_NODE_NAME,
+            settings.wg_interface, settings.wg_container_name, "",
+            settings.server_endpoint, settings.server_pub_key, settings.vpn_ip_range,
+            ipv6_range=settings.vpn_ipv6_range,
+        )
+
+    @classmethod
+    def from_row(cls, row: aiosqlite.Row) -> VPNNode:
+        """NULL-поля берутся из настроек (так задан узел по умолчанию)."""
+        def value(column: str, default: str) -> str:
+            return default if row[column] is None else row[column]
+
+        return cls(
+            row["id"], row["name"],
+            value("interface", settings.wg_interface),
+            value("container", settings.wg_container_name),
+            value("ssh_host", ""),
+            value("endpoint", settings.server_endpoint),
+            value("public_key", settings.server_pub_key),
+            value("ip_range", settings.vpn_ip_range),
+            row["max_peers"] or 0,
+            bool(row["enabled"]),
+            ipv6_range=value("ipv6_range", settings.vpn_ipv6_range),
+        )
+
+    def with_pools(self, extra: Iterable[IPPool]) -> VPNNode:
+        """Узел с дополнительными пулами (основной — из ip_range — первым)."""
+        return replace(self, pools=(IPPool.primary(self), *extra))
+
+    @property
+    def all_pools(self) -> tuple[IPPool, ...]:
+        return self.pools or (IPPool.primary(self),)
+
+    def pool(self, pool_id: int | None) -> IPPool:
+        for pool in self.all_pools:
+            if pool.id == pool_id:
+                return pool
+        raise LookupError(f"IP pool {pool_id} is not registered on node {self.name}")
+
+    def pool_by_cidr(self, cidr: str) -> IPPool | None:
+        network = ipaddress.ip_network(cidr, strict=False)
+        for pool in self.all_pools:
+            if ipaddress.ip_network(pool.cidr, strict=False) == network:
+                return pool
+        return None
+
+    def allocation_order(self) -> list[IPPool]:
+        """Включённые пулы в порядке выдачи адресов."""
+        return sorted((pool for pool in self.all_pools if pool.enabled), key=lambda pool: pool.order)
+
+    def for_pool(self, pool: IPPool) -> VPNNode:
+        """Узел, каким его видят пиры пула: интерфейс, endpoint, ключ и CIDR пула."""
+        if (pool.interface, pool.endpoint, pool.public_key, pool.cidr) == (
+            self.interface, self.endpoint, self.public_key, self.ip_range,
+        ):
+            return self
+        return replace(
+            self, interface=pool.interface, endpoint=pool.endpoint,
+            public_key=pool.public_key, ip_range=pool.cidr, pools=self.all_pools,
+        )
+
+    def for_interface(self, interface: str) -> VPNNode:
+        """Вид узла для интерфейса — по первому его пулу."""
+        return self.for_pool(next(pool for pool in self.all_pools if pool.interface == interface))
+
+    @property
+    def interfaces(self) -> list[str]:
+        return list(dict.fromkeys(pool.interface for pool in self.all_pools))
+
+    @property
+    def label(self) -> str:
+        """Имя для логов и отчётов; с интерфейсом, если их у узла несколько."""
+        return self.name if len(self.interfaces) < 2 else f"{self.name}/{self.interface}"
+
+    @property
+    def pool_size(self) -> int:
+        return sum(pool.size for pool in self.all_pools)
+
+    @property
+    def capacity(self) -> int:
+        """Сколько профилей помещается на узел: включённые пулы и max_peers."""
+        pool = sum(pool.size for pool in self.all_pools if pool.enabled)
+        return min(pool, self.max_peers) if self.max_peers else pool
+
+
+@dataclass(frozen=True, slots=True)
+class NodeLoad:
+    node: VPNNode
+    profiles: int
+    traffic: int = 0  # rx + tx пиров узла по последнему дампу
+
+    @property
+    def free(self) -> int:
+        return max(self.node.capacity - self.profiles, 0)
+
+    @property
+    def utilization(self) -> float:
+        capacity = self.node.capacity
+        return self.profiles / capacity if capacity else 1.0
+
+
+def choose_node(loads: Iterable[NodeLoad], traffic_weight: float = 0.0) -> VPNNode | None:
+    """Наименее загруженный включённый узел со свободными адресами (None — мест нет).
+
+    Оценка — занятость пула, смешанная с долей трафика узла среди кандидатов
+    с весом traffic_weight; при равенстве выигрывает узел с меньшим id.
+    """
+    candidates = [load for load in loads if load.node.enabled and load.free > 0]
+    if not candidates:
+        return None
+    weight = min(max(traffic_weight, 0.0), 1.0)
+    total_traffic = sum(load.traffic for load in candidates)
+
+    def score(load: NodeLoad) -> tuple[float, int]:
+        share = load.traffic / total_traffic if total_traffic else 0.0
+        return (1 - weight) * load.utilization + weight * share, load.node.id
+
+    return min(candidates, key=score).node
@@ -0,0 +1,134 @@
+"""
+Перенос профилей между пулами адресов узла (/pools migrate).
+
+Профили переносятся пачками по batch_size: на пачку — одна короткая
+транзакция записи (новые адреса и pool_id) и пакетное применение на
+интерфейсах (VPNService.apply_peer_changes): на том же интерфейсе меняются
+allowed-ips, на другом — пир снимается со старого и добавляется на новый.
+Сначала БД: если интерфейс не принял изменения, их доведёт сверка пиров.
+awg-команды выполняются после commit, но под VPNService.peer_lock обоих
+интерфейсов — как создание и удаление профиля.
+Снятые за неактивностью профили переносятся только в БД.
+
+Каждый перенос — запись AUDIT (профиль, старый и новый адрес, кто перенёс).
+Адрес клиента меняется (а на другом интерфейсе — и Endpoint с ключом
+сервера), поэтому пользователю нужно заново скачать конфиг.
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+
+import aiosqlite
+from loguru import logger
+
+from bot.core.logging import audit
+from bot.db import repository
+from bot.db.transaction import transaction
+from bot.services.nodes import IPPool, VPNNode, free_addresses, peer_allowed_ips
+from bot.services.vpn_service import VPNService
+
+MIGRATION_BATCH_SIZE = 100
+
+# Один перенос за раз: пачки двух переносов не должны делить адреса пула
+_lock = asyncio.Lock()
+
+
+@dataclass(slots=True)
+class PoolMigrationReport:
+    node: str
+    source: str
+    target: str
+    moved: int = 0
+    failed: int = 0      # не применено на интерфейсе (доведёт сверка пиров)
+    batches: int = 0
+    remaining: int = 0   # профилей осталось в исходном пуле
+    target_full: bool = False
+
+    def render(self) -> str:
+        lines = [
+            f"🔀 <b>Перенос профилей</b> · {html.escape(self.node)}\n",
+            f"<code>{html.escape(self.source)}</code> → <code>{html.escape(self.target)}</code>",
+            f"Перенесено: <b>{self.moved}</b> ({self.batches} пачек), ошибок на интерфейсе: <b>{self.failed}</b>",
+            f"Осталось в исходном пуле: <b>{self.remaining}</b>",
+        ]
+        if self.target_full:
+            lines.append("\n⚠️ В целевом пуле закончились адреса")
+        if self.moved:
+            lines.append("\nПеренесённым пользователям нужно заново скачать конфиг.")
+        return "\n".join(lines)
+
+
+async def migrate_pool(
+    db: aiosqlite.Connection,
+    node: VPNNode,
+    source: IPPool,
+    target: IPPool,
+    *,
+    limit: int | None = None,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    by_admin: int | None = None,
+) -> PoolMigrationReport:
+    """Переносит до limit профилей (None — все) из пула source в пул target узла."""
+    if source.id == target.id:
+        raise ValueError("Source and target pools are the same")
+    report = PoolMigrationReport(node.name, source.cidr, target.cidr)
+    source_view, target_view = node.for_pool(source), node.for_pool(target)
+    # Порядок блокировок один для всех переносов; общий интерфейс — одна блокировка
+    views = sorted(
+        {view.interface: view for view in (source_view, target_view)}.values(),
+        key=lambda view: view.interface,
+    )
+
+    async with _lock:
+        while limit is None or report.moved < limit:
+            size = batch_size if limit is None else min(batch_size, limit - report.moved)
+            # Под peer_lock обоих интерфейсов: сверка не увидит пачку между БД и интерфейсами
+            async with AsyncExitStack() as locks:
+                for view in views:
+                    await locks.enter_async_context(VPNService.peer_lock(view))
+                async with transaction(db):
+                    rows = await repository.get_pool_profiles(db, node.id, source.id, size)
+                    used = await repository.get_pool_addresses(db, node.id, target.id) if rows else []
+                    addresses = free_addresses(target.cidr, used, len(rows))
+                    rows = rows[:len(addresses)]
+                    if rows:
+                        await repository.move_profiles_to_pool(
+                            db, target.id,
+                            [(row["id"], ipv4) for row, ipv4 in zip(rows, addresses, strict=True)],
+                        )
+                if not rows:
+                    break
+
+                upsert = {
+                    row["public_key"]: peer_allowed_ips(ipv4, row["ipv6_address"])
+                    for row, ipv4 in zip(rows, addresses, strict=True) if row["detached_at"] is None
+                }
+                if upsert and source_view.interface != target_view.interface:
+                    _, failed = await VPNService.apply_peer_changes({}, list(upsert), node=source_view)
+                    report.failed += failed
+                if upsert:
+                    _, failed = await VPNService.apply_peer_changes(upsert, [], node=target_view)
+                    report.failed += failed
+
+            for row, ipv4 in zip(rows, addresses, strict=True):
+                audit(
+                    "POOL_MIGRATED", user_id=row["user_id"], profile_id=row["id"], node=node.name,
+                    from_ip=row["ipv4_address"], to_ip=ipv4, by_admin=by_admin,
+                )
+            report.moved += len(rows)
+            report.batches += 1
+            logger.info(
+                "[POOLS] Пачка перенесена | node={} {} → {} moved={} total={}",
+                node.name, source.cidr, target.cidr, len(rows), report.moved,
+            )
+            if len(rows) < size:
+                break
+
+    counts = await repository.get_pool_profile_counts(db)
+    report.remaining = counts.get((node.id, source.id), 0)
+    # Остановились не по limit, а профили в исходном пуле остались — кончились адреса
+    report.target_full = report.remaining > 0 and (limit is None or report.moved < limit)
+    return report
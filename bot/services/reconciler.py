@@ -0,0 +1,214 @@
+"""
+Сверка пиров интерфейса с БД (vpn_profiles ⇄ ``awg show dump``).
+
+Желаемое состояние — профили в БД (public_key → ipv4/32 и ipv6/128), фактическое —
+один дамп интерфейса. Разница считается по словарям с ключом public_key:
+  add     — профиль есть в БД, пира нет на интерфейсе
+  update  — пир есть, но allowed-ips не совпадают с БД
+  remove  — пир есть на интерфейсе, профиля нет (устаревший пир)
+Применяется только разница — пакетными ``awg set`` и одним ``awg-quick save``
+(VPNService.apply_peer_changes). Каждый интерфейс каждого узла VPN
+сверяется отдельно — с профилями своих пулов (run_all обходит все).
+
+Защита от массового удаления: если план удаляет больше max_remove_ratio
+пиров интерфейса (например, бот запущен с пустой или чужой БД), удаления
+пропускаются, добавления и обновления применяются, а в лог и администратору
+уходит предупреждение. План без применения показывает /reconcile.
+
+План и его применение выполняются под VPNService.peer_lock интерфейса — той
+же блокировкой, что создание и удаление профиля на нём: иначе пир профиля,
+вставка которого ещё не закоммичена, попал бы в remove, а пир удаляемого —
+в add. Профили на других интерфейсах сверку не ждут.
+"""
+from __future__ import annotations
+
+import asyncio
+import html
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import aiosqlite
+from loguru import logger
+
+from bot.core import metrics
+from bot.db import repository
+from bot.services.nodes import VPNNode, peer_allowed_ips
+from bot.services.vpn_service import VPNService
+from bot.services.wg_dump import normalize_allowed_ips
+
+# Сколько ключей каждого вида показывать в отчёте
+REPORT_KEYS = 5
+
+Alert = Callable[["ReconcileResult"], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class ReconcilePlan:
+    add: dict[str, str] = field(default_factory=dict)
+    update: dict[str, str] = field(default_factory=dict)
+    remove: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    live: int = 0
+
+    @property
+    def changes(self) -> int:
+        return len(self.add) + len(self.update) + len(self.remove)
+
+    def removal_blocked(self, max_ratio: float) -> bool:
+        """Удалений больше max_ratio пиров интерфейса (0 < max_ratio < 1)."""
+        if not self.remove or max_ratio >= 1:
+            return False
+        return len(self.remove) > max(self.live * max_ratio, 1)
+
+
+def diff(desired: dict[str, str], live: dict[str, str]) -> ReconcilePlan:
+    """План изменений: desired и live — public_key → нормализованные allowed-ips."""
+    plan = ReconcilePlan(live=len(live))
+    for key, allowed_ips in desired.items():
+        current = live.get(key)
+        if current is None:
+            plan.add[key] = allowed_ips
+        elif current != allowed_ips:
+            plan.update[key] = allowed_ips
+        else:
+            plan.unchanged += 1
+    plan.remove = [key for key in live if key not in desired]
+    return plan
+
+
+@dataclass(slots=True)
+class ReconcileResult:
+    plan: ReconcilePlan
+    dry_run: bool
+    applied: int = 0
+    failed: int = 0
+    removals_blocked: bool = False
+    duration: float = 0.0
+    node: str = ""  # узел (и интерфейс) — только когда интерфейсов несколько
+
+    def summary(self) -> str:
+        plan = self.plan
+        text = f"{self.node}: " if self.node else ""
+        text += (
+            f"+{len(plan.add)} ~{len(plan.update)} -{len(plan.remove)} "
+            f"={plan.unchanged} (live {plan.live})"
+        )
+        if not self.dry_run:
+            text += f", applied {self.applied}, failed {self.failed}"
+        if self.removals_blocked:
+            text += ", removals blocked"
+        return text
+
+    def render(self) -> str:
+        plan = self.plan
+        title = "План сверки пиров" if self.dry_run else "Сверка пиров"
+        if self.node:
+            title += f" · {html.escape(self.node)}"
+        lines = [
+            f"🔄 <b>{title}</b> ({self.duration * 1000:.0f} мс)\n",
+            f"На интерфейсе: <b>{plan.live}</b>, совпадает с БД: <b>{plan.unchanged}</b>",
+            f"➕ Добавить: <b>{len(plan.add)}</b>",
+            f"✏️ Обновить allowed-ips: <b>{len(plan.update)}</b>",
+            f"➖ Удалить устаревших: <b>{len(plan.remove)}</b>",
+        ]
+        for label, keys in (("+", list(plan.add)), ("~", list(plan.update)), ("-", plan.remove)):
+            for key in keys[:REPORT_KEYS]:
+                lines.append(f"  {label} <code>{html.escape(key[:12])}…</code>")
+            if len(keys) > REPORT_KEYS:
+                lines.append(f"  {label} … ещё {len(keys) - REPORT_KEYS}")
+        if self.removals_blocked:
+            lines.append("\n⚠️ Удаления пропущены: затронуто слишком много пиров интерфейса")
+        if not self.dry_run:
+            lines.append(f"\nПрименено: <b>{self.applied}</b>, ошибок: <b>{self.failed}</b>")
+        elif plan.changes:
+            lines.append("\nПрименить: <code>/reconcile apply</code>")
+        return "\n".join(lines)
+
+
+class PeerReconciler:
+    """Сверка по требованию (run) и периодически (start/stop)."""
+
+    def __init__(self, max_remove_ratio: float = 0.5, alert: Alert | None = None) -> None:
+        self.max_remove_ratio = max_remove_ratio
+        self._alert = alert
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+        self.last: ReconcileResult | None = None
+
+    async def plan(self, db: aiosqlite.Connection, node: VPNNode | None = None) -> ReconcilePlan | None:
+        """План интерфейса узла по одному его дампу; None — интерфейс не прочитан."""
+        node = node or VPNService.node()
+        live = await VPNService.get_interface_peers(node)
+        if live is None:
+            return None
+        interfaces = {pool.id: pool.interface for pool in node.all_pools}
+        desired = {
+            row["public_key"]: normalize_allowed_ips(peer_allowed_ips(row["ipv4_address"], row["ipv6_address"]))
+            for row in await repository.get_all_active_profiles(db, node.id)
+            if interfaces.get(row["pool_id"]) == node.interface
+        }
+        return diff(desired, live)
+
+    async def run_all(
+        self, db: aiosqlite.Connection, dry_run: bool = False,
+    ) -> list[tuple[VPNNode, ReconcileResult | None]]:
+        """Сверка всех интерфейсов всех узлов по очереди."""
+        return [(node, await self.run(db, dry_run, node)) for node in VPNService.targets()]
+
+    async def run(
+        self, db: aiosqlite.Connection, dry_run: bool = False, node: VPNNode | None = None,
+    ) -> ReconcileResult | None:
+        node = node or VPNService.node()
+        async with self._lock, VPNService.peer_lock(node):
+            started = time.perf_counter()
+            plan = await self.plan(db, node)
+            if plan is None:
+                return None
+            result = ReconcileResult(plan, dry_run, node=node.label if len(VPNService.targets()) > 1 else "")
+            result.removals_blocked = plan.removal_blocked(self.max_remove_ratio)
+            if not dry_run and plan.changes:
+                remove = [] if result.removals_blocked else plan.remove
+                result.applied, result.failed = await VPNService.apply_peer_changes(
+                    {**plan.add, **plan.update}, remove, node=node,
+                )
+                metrics.PEER_RECONCILE_CHANGES.labels(action="add").inc(len(plan.add))
+                metrics.PEER_RECONCILE_CHANGES.labels(action="update").inc(len(plan.update))
+                metrics.PEER_RECONCILE_CHANGES.labels(action="remove").inc(len(remove))
+            result.duration = time.perf_counter() - started
+            if not dry_run:
+                self.last = result
+
+        if plan.changes or result.removals_blocked:
+            logger.info("[RECONCILE] {} | {}", "dry-run" if dry_run else "apply", result.summary())
+        if result.removals_blocked:
+            logger.warning(
+                "[RECONCILE] Удаление {} из {} пиров интерфейса пропущено (порог {:.0%}) | node={}",
+                len(plan.remove), plan.live, self.max_remove_ratio, node.label,
+            )
+            if not dry_run and self._alert is not None:
+                try:
+                    await self._alert(result)
+                except Exception as e:
+                    logger.warning("[RECONCILE] Не удалось отправить алерт | error={}", e)
+        return result
+
+    # ── Периодический запуск ─────────────────────────────────────────────────
+
+    def start(self, db: aiosqlite.Connection, interval: float) -> None:
+        if self._task is None and interval > 0:
+            self._task = asyncio.create_task(self._loop(db, interval), name="peer-reconciler")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self, db: aiosqlite.Connection, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_all(db)
+            except Exception as e:
+                logger.warning("[RECONCILE] Сверка не удалась | error={}", e)
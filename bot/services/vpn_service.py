@@ -1,17 +1,53 @@
 import asyncio
-import ipaddress
+import hashlib
+import math
+import os
 import shutil
+import signal
+import time
 from io import BytesIO
-from typing import Any
+from collections.abc import Awaitable, Callable, Sequence
+from typing import TYPE_CHECKING, Any, cast
 
 import aiosqlite
-import segno
-from cryptography.fernet import Fernet, InvalidToken
 from loguru import logger
 
+from bot.core import metrics, tracing
 from bot.core.config import settings
 from bot.core.logging import log_wg_command, log_wg_result
 from bot.db import repository
+from bot.db.transaction import transaction
+from bot.services.config_template import FORMAT_AWG, ConfigTemplate, compile_template
+from bot.services.nodes import (
+    DEFAULT_NODE_ID,
+    IPPool,
+    NodeExecutor,
+    NodeLoad,
+    VPNNode,
+    choose_node,
+    free_addresses,
+    next_ipv6,
+    peer_allowed_ips,
+)
+from bot.services.wg_command import (
+    CircuitBreaker,
+    CommandResult,
+    CommandStats,
+    WGRuntime,
+    WGUnavailableError,
+    command_label,
+    command_timeout,
+)
+from bot.services.wg_dump import PeerRecord, PeerSnapshot, read_dump
+
+if TYPE_CHECKING:
+    # segno и cryptography импортируются при первом использовании: они нужны
+    # только при выдаче конфига и работе с ключами, а не на каждом старте
+    from cryptography.fernet import Fernet, MultiFernet
+
+
+# Пиров в одном ``awg set`` при пакетном применении (ограничение длины argv)
+PEER_BATCH_SIZE = 200
 
 
 class VPNService:
@@ -20,17 +56,79 @@ class VPNService:
 
     Все методы, требующие доступа к БД, принимают db: aiosqlite.Connection —
     соединение управляется снаружи (через DbMiddleware или lifecycle hooks).
+
+    Методы работы с пирами принимают node (bot/services/nodes.py); None —
+    узел по умолчанию. Для пиров дополнительного пула на своём интерфейсе
+    передаётся вид узла для пула (VPNService.target).
     """
 
-    _fernet: Fernet | None = None
+    # Ключи ENCRYPTION_KEY: расшифровка любым, шифрование первым (текущим);
+    # _key_id — отпечаток текущего ключа для чекпоинта перешифрования
+    _fernet: "MultiFernet | None" = None
+    _primary_fernet: "Fernet | None" = None
+    _key_id: str = ""
+    _key_count: int = 0
     _FERNET_PREFIX = "gAAAAA"
 
+    # Скользящая статистика wg-команд (экран «🖥️ Сервер»)
+    command_stats = CommandStats()
+    _semaphore: asyncio.Semaphore | None = None
+    # Circuit breaker и окружение команд — свои у каждого узла: недоступность
+    # одного узла не останавливает вызовы к остальным
+    _breakers: dict[int, CircuitBreaker] = {}
+    _runtimes: dict[int, WGRuntime] = {}
+    # Узлы из vpn_nodes; None — не загружены, единственный узел из настроек
+    _nodes: dict[int, VPNNode] | None = None
+    _executors: dict[int, NodeExecutor] = {}
+    # Последние успешные дампы по интерфейсам узлов — ключ (node_id, interface),
+    # их объединение (public_key уникален между узлами) и момент последней
+    # попытки по интерфейсу (monotonic)
+    _node_snapshots: dict[tuple[int, str], PeerSnapshot] = {}
+    _snapshot: PeerSnapshot | None = None
+    _snapshot_checked: dict[tuple[int, str], float] = {}
+    _snapshot_lock: asyncio.Lock | None = None
+    # Изменения пиров — по интерфейсу узла (node_id, interface), см. peer_lock
+    _peer_locks: dict[tuple[int, str], asyncio.Lock] = {}
+    # Скомпилированные шаблоны конфигов: (формат, узел, endpoint, ключ) → шаблон
+    _templates: dict[tuple[str, str, str, str], ConfigTemplate] = {}
+
     @classmethod
     def reset_cache(cls) -> None:
         cls._fernet = None
+        cls._primary_fernet = None
+        cls._key_id = ""
+        cls._key_count = 0
+        cls._semaphore = None
+        cls._breakers = {}
+        cls._runtimes = {}
+        cls._nodes = None
+        cls._executors = {}
+        cls._node_snapshots = {}
+        cls._snapshot = None
+        cls._snapshot_checked = {}
+        cls._snapshot_lock = None
+        cls._peer_locks = {}
+        cls._templates = {}
+
+    @classmethod
+    def peer_lock(cls, node: VPNNode | None = None) -> asyncio.Lock:
+        """Блокировка изменений пиров интерфейса узла: профиль, возврат пира, сверка.
+
+        Без неё сверка снимает пир профиля, который ещё не закоммичен, или
+        возвращает пир удаляемого профиля. Своя у каждого интерфейса: сверка
+        одного узла не задерживает создание профилей на остальных. Не
+        реентерабельна; берётся до write_lock/transaction, не наоборот.
+        """
+        node = node or cls.node()
+        key = (node.id, node.interface)
+        lock = cls._peer_locks.get(key)
+        if lock is None:
+            lock = cls._peer_locks[key] = asyncio.Lock()
+        return lock
 
     @classmethod
-    def _get_fernet(cls) -> Fernet:
+    def _get_fernet(cls) -> "MultiFernet":
+        """Ключи ENCRYPTION_KEY через запятую, первый — текущий (ротация без простоя)."""
         if cls._fernet is not None:
             return cls._fernet
 
@@ -39,16 +137,34 @@ class VPNService:
             raise RuntimeError("ENCRYPTION_KEY is required for private key encryption.")
 
         key_value = raw_key if isinstance(raw_key, str) else raw_key.get_secret_value()
-        if not key_value:
+        keys = [key.strip() for key in key_value.split(",") if key.strip()]
+        if not keys:
             raise RuntimeError("ENCRYPTION_KEY is empty.")
 
+        from cryptography.fernet import Fernet, MultiFernet
+
         try:
-            cls._fernet = Fernet(key_value.encode("utf-8"))
+            fernets = [Fernet(key.encode("utf-8")) for key in keys]
         except (TypeError, ValueError) as exc:
             raise RuntimeError("ENCRYPTION_KEY must be a valid Fernet key.") from exc
 
+        cls._primary_fernet = fernets[0]
+        cls._key_id = hashlib.sha256(keys[0].encode("utf-8")).hexdigest()[:16]
+        cls._key_count = len(keys)
+        cls._fernet = MultiFernet(fernets)
         return cls._fernet
 
+    @classmethod
+    def encryption_key_id(cls) -> str:
+        """Отпечаток текущего ключа (не сам ключ) — для логов и чекпоинта key_rotation."""
+        cls._get_fernet()
+        return cls._key_id
+
+    @classmethod
+    def encryption_key_count(cls) -> int:
+        cls._get_fernet()
+        return cls._key_count
+
     @classmethod
     def encrypt_data(cls, data: str) -> str:
         if not data:
@@ -60,6 +176,8 @@ class VPNService:
     def decrypt_data(cls, encrypted_data: str) -> str:
         if not encrypted_data:
             raise ValueError("Encrypted private key is empty.")
+        from cryptography.fernet import InvalidToken
+
         try:
             payload = cls._get_fernet().decrypt(encrypted_data.encode("utf-8"))
         except InvalidToken as exc:
@@ -68,260 +186,564 @@ class VPNService:
             ) from exc
         return payload.decode("utf-8")
 
+    @classmethod
+    def reencrypt_data(cls, encrypted_data: str) -> str | None:
+        """Токен, зашифрованный старым ключом, → токен текущего ключа; None — уже текущий."""
+        from cryptography.fernet import InvalidToken
+
+        fernet = cls._get_fernet()
+        primary = cls._primary_fernet
+        assert primary is not None  # задаётся в _get_fernet вместе с MultiFernet
+        token = encrypted_data.encode("utf-8")
+        try:
+            # Чужой ключ отсекается проверкой HMAC — без расшифровки
+            primary.decrypt(token)
+            return None
+        except InvalidToken:
+            pass
+        try:
+            return fernet.rotate(token).decode("utf-8")
+        except InvalidToken as exc:
+            raise ValueError("Encrypted private key matches none of ENCRYPTION_KEY keys.") from exc
+
     @classmethod
     def looks_like_fernet_token(cls, value: str) -> bool:
         return value.startswith(cls._FERNET_PREFIX)
 
-    @staticmethod
-    def _resolve_wg_binary() -> str:
+    # ── Узлы ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    async def load_nodes(cls, db: aiosqlite.Connection) -> list[VPNNode]:
+        """Загружает узлы из vpn_nodes с их пулами (на старте и после /nodes, /pools)."""
+        pool_rows: dict[int, list[aiosqlite.Row]] = {}
+        for row in await repository.get_ip_pools(db):
+            pool_rows.setdefault(row["node_id"], []).append(row)
+        nodes = []
+        for row in await repository.get_vpn_nodes(db):
+            node = VPNNode.from_row(row)
+            if node.id in pool_rows:
+                node = node.with_pools(IPPool.from_row(pool, node) for pool in pool_rows[node.id])
+            nodes.append(node)
+        cls._nodes = {node.id: node for node in nodes} or None
+        cls._runtimes = {}  # контейнер или ssh-хост узла могли измениться
+        cls._templates = {}
+        return cls.nodes()
+
+    @classmethod
+    def nodes(cls, enabled_only: bool = False) -> list[VPNNode]:
+        """Все узлы; enabled_only — только принимающие новые профили."""
+        nodes = list(cls._nodes.values()) if cls._nodes else [VPNNode.from_settings()]
+        return [node for node in nodes if node.enabled] if enabled_only else nodes
+
+    @classmethod
+    def node(cls, node_id: int | None = None) -> VPNNode:
+        """Узел по id (None — по умолчанию). До load_nodes — единственный узел из настроек."""
+        if cls._nodes is None:
+            return VPNNode.from_settings()
+        node = cls._nodes.get(DEFAULT_NODE_ID if node_id is None else node_id)
+        if node is None:
+            raise LookupError(f"VPN node {node_id} is not registered")
+        return node
+
+    @classmethod
+    def target(cls, node_id: int | None = None, pool_id: int | None = None) -> VPNNode:
+        """Вид узла для пула профиля — на нём выполняются команды к его пиру."""
+        node = cls.node(node_id)
+        return node.for_pool(node.pool(pool_id))
+
+    @classmethod
+    def targets(cls) -> list[VPNNode]:
+        """Все интерфейсы всех узлов (по виду узла на интерфейс) — для дампов и сверки."""
+        return [node.for_interface(interface) for node in cls.nodes() for interface in node.interfaces]
+
+    @classmethod
+    def set_executor(cls, node_id: int, executor: NodeExecutor | None) -> None:
+        """Свой транспорт команд узла (тесты, нестандартный доступ); None — снова subprocess."""
+        if executor is None:
+            cls._executors.pop(node_id, None)
+        else:
+            cls._executors[node_id] = executor
+
+    @classmethod
+    async def node_loads(cls, db: aiosqlite.Connection) -> list[NodeLoad]:
+        """Загрузка узлов: профилей на узле и трафик его пиров по последним дампам."""
+        counts = await repository.get_pool_profile_counts(db)
+        loads = []
+        for node in cls.nodes():
+            profiles = 0
+            for pool in node.all_pools:
+                used = counts.get((node.id, pool.id), 0)
+                profiles += used
+                if pool.size:
+                    metrics.IP_POOL_USAGE.labels(node=node.name, pool=pool.cidr).set(used / pool.size)
+            traffic = sum(
+                peer.total
+                for (node_id, _), snapshot in cls._node_snapshots.items() if node_id == node.id
+                for peer in snapshot.peers.values()
+            )
+            loads.append(NodeLoad(node, profiles, traffic))
+            metrics.NODE_PROFILES.labels(node=node.name).set(profiles)
+        return loads
+
+    @classmethod
+    async def place(cls, db: aiosqlite.Connection) -> VPNNode:
+        """Узел для нового профиля: наименее загруженный включённый со свободными местами.
+
+        Единственный узел проверяется так же — заполненный пул или max_peers
+        не обходятся.
+        """
+        if not cls.nodes(enabled_only=True):
+            raise ValueError("No enabled VPN nodes to place a profile on")
+        node = choose_node(await cls.node_loads(db), settings.node_traffic_weight)
+        if node is None:
+            raise ValueError("No available IP addresses on any VPN node")
+        return node
+
+    # ── Окружение и запуск команд ────────────────────────────────────────────
+
+    @classmethod
+    def runtime(cls, node: VPNNode | None = None) -> WGRuntime:
+        """Окружение wg/awg узла: разрешается при первом вызове (или на старте) и кэшируется."""
+        node = node or cls.node()
+        runtime = cls._runtimes.get(node.id)
+        if runtime is None:
+            runtime = cls._runtimes[node.id] = WGRuntime.probe(node.container, shutil.which, node.ssh_host)
+            logger.info("[WG] Окружение команд | node={} {}", node.name, runtime.describe())
+        return runtime
+
+    @classmethod
+    def reprobe_runtime(cls, node: VPNNode | None = None) -> WGRuntime:
+        """Заново разрешает окружение (бинарник переустановлен, контейнер AWG перезапущен)."""
+        cls._runtimes.pop((node or cls.node()).id, None)
+        return cls.runtime(node)
+
+    @classmethod
+    def _resolve_wg_binary(cls, node: VPNNode | None = None) -> str:
         """Находит бинарник awg или wg.
 
         В Docker-режиме (WG_CONTAINER_NAME задан) бинарник находится внутри
         целевого контейнера — локальный поиск не нужен, возвращаем bare-имя.
+        Не найденный бинарник ищется заново при следующем вызове.
         """
-        if settings.wg_container_name.strip():
-            return "awg"
-        awg_binary = shutil.which("awg")
-        if awg_binary:
-            return awg_binary
-        wg_binary = shutil.which("wg")
-        if wg_binary:
-            return wg_binary
-        raise RuntimeError("Utilities 'awg' or 'wg' are not installed or not in PATH.")
+        binary = cls.runtime(node).wg or cls.reprobe_runtime(node).wg
+        if binary is None:
+            raise RuntimeError("Utilities 'awg' or 'wg' are not installed or not in PATH.")
+        return binary
 
-    @staticmethod
-    def _resolve_wg_quick_binary() -> str:
+    @classmethod
+    def _resolve_wg_quick_binary(cls, node: VPNNode | None = None) -> str:
         """Находит бинарник awg-quick или wg-quick для сохранения конфигурации."""
-        if settings.wg_container_name.strip():
-            return "awg-quick"
-        for name in ("awg-quick", "wg-quick"):
-            path = shutil.which(name)
-            if path:
-                return path
-        raise RuntimeError("Utilities 'awg-quick' or 'wg-quick' are not installed or not in PATH.")
+        binary = cls.runtime(node).wg_quick or cls.reprobe_runtime(node).wg_quick
+        if binary is None:
+            raise RuntimeError("Utilities 'awg-quick' or 'wg-quick' are not installed or not in PATH.")
+        return binary
 
     @classmethod
-    def _build_command(cls, *args: str, interactive: bool = False) -> list[str]:
-        """Строит команду для выполнения.
+    def _build_command(cls, *args: str, interactive: bool = False, node: VPNNode | None = None) -> list[str]:
+        """Строит команду для выполнения на узле.
 
-        Если WG_CONTAINER_NAME задан — оборачивает в docker exec.
-        Флаг ``interactive=True`` добавляет ``-i`` для команд, читающих stdin
-        (например, ``awg pubkey``).
+        Если у узла задан контейнер — оборачивает в docker exec, ssh-хост —
+        в ssh. Флаг ``interactive=True`` добавляет ``-i`` для команд, читающих
+        stdin (например, ``awg pubkey``).
         """
-        cmd = list(args)
-        container = settings.wg_container_name.strip()
-        if container:
-            docker_cmd = ["docker", "exec"]
-            if interactive:
-                docker_cmd.append("-i")
-            return docker_cmd + [container] + cmd
-        return cmd
+        return cls.runtime(node).command(*args, interactive=interactive)
 
     @classmethod
-    async def generate_keys(cls) -> tuple[str, str]:
-        binary = cls._resolve_wg_binary()
+    def _limits(cls, node_id: int = DEFAULT_NODE_ID) -> tuple[asyncio.Semaphore, CircuitBreaker]:
+        """Общий семафор на число процессов и circuit breaker узла (создаются лениво)."""
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(max(settings.wg_max_concurrent, 1))
+        breaker = cls._breakers.get(node_id)
+        if breaker is None:
+            breaker = cls._breakers[node_id] = CircuitBreaker(
+                settings.wg_breaker_threshold, settings.wg_breaker_reset,
+            )
+        return cls._semaphore, breaker
 
-        genkey_cmd = cls._build_command(binary, "genkey")
-        log_wg_command(genkey_cmd)
-        process_genkey = await asyncio.create_subprocess_exec(
-            *genkey_cmd,
+    @classmethod
+    async def _execute(
+        cls,
+        node: VPNNode,
+        args: list[str],
+        *,
+        input: bytes | None = None,
+        parse: Callable[[asyncio.StreamReader], Awaitable[Any]] | None = None,
+    ) -> CommandResult:
+        """Команда узла через его транспорт: свой executor или _run."""
+        executor = cls._executors.get(node.id)
+        if executor is not None:
+            return await executor(args, input=input, parse=parse)
+        return await cls._run(args, input=input, parse=parse, node_id=node.id)
+
+    @staticmethod
+    def _kill(process: asyncio.subprocess.Process) -> None:
+        """Убивает группу процессов команды (docker exec вместе с потомками)."""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except OSError:
+            process.kill()
+
+    @classmethod
+    async def _spawn(
+        cls,
+        args: list[str],
+        input: bytes | None,
+        timeout: float,
+        parse: Callable[[asyncio.StreamReader], Awaitable[Any]] | None = None,
+    ) -> tuple[int | None, bytes, bytes, Any]:
+        """Один запуск команды. returncode None — таймаут (процесс убит).
+
+        С parse stdout не буферизуется: parse читает его построчно, пока
+        идёт процесс, и его результат возвращается четвёртым элементом.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,  # своя группа процессов — для killpg
         )
-        genkey_stdout, genkey_stderr = await process_genkey.communicate()
-        if process_genkey.returncode != 0:
-            error = genkey_stderr.decode("utf-8", errors="replace").strip()
-            raise RuntimeError(f"Failed to generate private key: {error}")
+        parsed = None
+        try:
+            if parse is None:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input=input), timeout)
+            else:
+                assert process.stdout is not None and process.stderr is not None
+                parsed, stderr, _ = await asyncio.wait_for(
+                    asyncio.gather(parse(process.stdout), process.stderr.read(), process.wait()),
+                    timeout,
+                )
+                stdout = b""
+        except asyncio.TimeoutError:
+            return None, b"", b"", None
+        finally:
+            # Таймаут, отмена хендлера или ошибка parse — не оставляем висящий
+            # docker exec и дожидаемся его, чтобы не копить зомби-процессы
+            if process.returncode is None:
+                cls._kill(process)
+                await process.wait()
+        return process.returncode, stdout or b"", stderr or b"", parsed
+
+    @classmethod
+    async def _run(
+        cls,
+        args: list[str],
+        *,
+        input: bytes | None = None,
+        timeout: float | None = None,
+        retries: int | None = None,
+        parse: Callable[[asyncio.StreamReader], Awaitable[Any]] | None = None,
+        node_id: int = DEFAULT_NODE_ID,
+    ) -> CommandResult:
+        """Единая точка запуска wg/awg/docker-команд.
+
+        Замеряет длительность, объём stdout, таймауты и повторы; пишет
+        результат в метрики и ``command_stats``, медленные команды (дольше
+        WG_SLOW_COMMAND_MS) — в лог. Повтор выполняется только по таймауту:
+        все команды бота идемпотентны (show, set peer, save, genkey).
+
+        Таймаут берётся из COMMAND_TIMEOUTS по подкоманде; одновременно
+        работает не больше WG_MAX_CONCURRENT процессов. Если circuit breaker
+        разомкнут (AWG недоступен), сразу бросает WGUnavailableError.
+        OSError (нет docker/бинарника) пробрасывается вызывающему.
+        parse — потоковый разбор stdout (см. _spawn), итог в ``result.parsed``.
+        node_id — узел команды: у каждого узла свой circuit breaker.
+        """
+        label = command_label(args)
+        if timeout is None:
+            timeout = command_timeout(label, settings.wg_command_timeout)
+        retries = settings.wg_command_retries if retries is None else retries
+        semaphore, breaker = cls._limits(node_id)
+        if not breaker.allow():
+            raise WGUnavailableError(
+                f"WireGuard is unavailable, retry in {breaker.retry_after():.0f}s",
+            )
+        log_wg_command(args)
+
+        attempts = 0
+        try:
+            with tracing.span(f"wg {label}") as span:
+                async with semaphore:
+                    started = time.perf_counter()
+                    while True:
+                        attempts += 1
+                        returncode, stdout, stderr, parsed = await cls._spawn(args, input, timeout, parse)
+                        if returncode is None and attempts <= retries:
+                            logger.warning("[WG] Таймаут, повтор | command={} attempt={}", label, attempts)
+                            continue
+                        break
+                if span is not None:
+                    span.set(returncode=returncode, attempts=attempts)
+        except OSError as exc:
+            breaker.record_failure()
+            if isinstance(exc, FileNotFoundError):
+                cls._runtimes.pop(node_id, None)  # бинарник или docker пропал — разрешить заново
+            raise
+        except BaseException:
+            # Отмена или ошибка parse — результата нет, пробный вызов не засчитан
+            breaker.release_probe()
+            raise
+
+        duration = time.perf_counter() - started
+        if returncode is None:
+            result = CommandResult(
+                label, None, b"", f"timed out after {timeout:g}s", duration, attempts, timed_out=True,
+            )
+        else:
+            result = CommandResult(
+                label, returncode, stdout,
+                stderr.decode("utf-8", errors="replace").strip(), duration, attempts, parsed=parsed,
+            )
+
+        if result.unavailable:
+            breaker.record_failure()
+            cls._runtimes.pop(node_id, None)  # AWG перезапускается — окружение разрешится заново
+            if breaker.state != "closed":
+                logger.error("[WG] AWG недоступен, вызовы приостановлены | command={} error={}", label, result.stderr)
+        else:
+            breaker.record_success()
 
-        private_key = genkey_stdout.decode("utf-8", errors="replace").strip()
+        cls.command_stats.record(result)
+        metrics.WG_COMMAND_SECONDS.labels(command=label).observe(result.duration)
+        log_wg_result(-1 if result.returncode is None else result.returncode, result.stderr)
+        duration_ms = result.duration * 1000
+        if duration_ms >= settings.wg_slow_command_ms or result.timed_out:
+            logger.warning(
+                "[WG] Медленная команда | command={} duration_ms={:.0f} attempts={} "
+                "timed_out={} returncode={} stdout_bytes={}",
+                label, duration_ms, result.attempts, result.timed_out,
+                result.returncode, len(result.stdout),
+            )
+        return result
+
+    @classmethod
+    async def generate_keys(cls) -> tuple[str, str]:
+        # Ключи не привязаны к узлу — генерируются утилитой узла по умолчанию
+        node = cls.node()
+        binary = cls._resolve_wg_binary(node)
+
+        genkey = await cls._execute(node, cls._build_command(binary, "genkey", node=node))
+        if not genkey.ok:
+            raise RuntimeError(f"Failed to generate private key: {genkey.stderr}")
+
+        private_key = genkey.text.strip()
         if not private_key:
             raise RuntimeError("Generated private key is empty.")
 
-        pubkey_cmd = cls._build_command(binary, "pubkey", interactive=True)
-        log_wg_command(pubkey_cmd)
-        process_pubkey = await asyncio.create_subprocess_exec(
-            *pubkey_cmd,
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        pubkey_stdout, pubkey_stderr = await process_pubkey.communicate(
+        pubkey = await cls._execute(
+            node,
+            cls._build_command(binary, "pubkey", interactive=True, node=node),
             input=private_key.encode("utf-8"),
         )
-        if process_pubkey.returncode != 0:
-            error = pubkey_stderr.decode("utf-8", errors="replace").strip()
-            raise RuntimeError(f"Failed to generate public key: {error}")
+        if not pubkey.ok:
+            raise RuntimeError(f"Failed to generate public key: {pubkey.stderr}")
 
-        public_key = pubkey_stdout.decode("utf-8", errors="replace").strip()
+        public_key = pubkey.text.strip()
         if not public_key:
             raise RuntimeError("Generated public key is empty.")
 
         return private_key, public_key
 
     @classmethod
-    async def get_next_ipv4(cls, db: aiosqlite.Connection) -> str:
-        network = ipaddress.IPv4Network(settings.vpn_ip_range, strict=False)
-        host_count = max(network.num_addresses - 2, 0)
-        if host_count < 2:
+    async def allocate_address(cls, db: aiosqlite.Connection, node: VPNNode | None = None) -> tuple[IPPool, str]:
+        """Пул и первый свободный адрес: включённые пулы узла по priority.
+
+        Заполненный пул отсекается по числу профилей в нём, без чтения
+        адресов; в выбранном пуле читаются только его адреса.
+        """
+        node = node or cls.node()
+        pools = node.allocation_order()
+        if not any(pool.size for pool in pools):
             raise ValueError(
                 "VPN_IP_RANGE is too small. Use CIDR that contains at least two usable hosts.",
             )
-
-        used_ips: set[ipaddress.IPv4Address] = set()
-        async with db.execute(
-            "SELECT ipv4_address FROM vpn_profiles WHERE ipv4_address IS NOT NULL",
-        ) as cursor:
-            async for (raw_ip,) in cursor:
-                try:
-                    parsed_ip = ipaddress.IPv4Address(raw_ip)
-                except ipaddress.AddressValueError:
-                    logger.warning(f"Skipping invalid IPv4 entry in DB: {raw_ip!r}")
-                    continue
-                if parsed_ip in network:
-                    used_ips.add(parsed_ip)
-
-        host_iterator = iter(network.hosts())
-        next(host_iterator, None)  # резервируем первый адрес для шлюза
-
-        for ip in host_iterator:
-            if ip not in used_ips:
-                return str(ip)
+        counts = await repository.get_pool_profile_counts(db)
+        for pool in pools:
+            if counts.get((node.id, pool.id), 0) >= pool.size:
+                continue
+            used = await repository.get_pool_addresses(db, node.id, pool.id)
+            for ipv4 in free_addresses(pool.cidr, used):
+                return pool, ipv4
 
         raise ValueError("No available IP addresses in the configured range")
 
     @classmethod
+    async def get_next_ipv4(cls, db: aiosqlite.Connection, node: VPNNode | None = None) -> str:
+        """Первый свободный адрес узла (адреса уникальны в пределах узла)."""
+        return (await cls.allocate_address(db, node))[1]
+
+    @classmethod
+    async def allocate_ipv6(cls, db: aiosqlite.Connection, node: VPNNode | None = None) -> str | None:
+        """Свободный IPv6-адрес узла; None — у узла нет IPv6-префикса."""
+        node = node or cls.node()
+        if not node.ipv6_range:
+            return None
+        ipv6 = next_ipv6(node.ipv6_range, await repository.get_node_ipv6_addresses(db, node.id))
+        if ipv6 is None:
+            raise ValueError("No available IPv6 addresses in the configured prefix")
+        return ipv6
+
+    @classmethod
+    @tracing.traced("VPNService.create_profile")
     async def create_profile(
         cls, db: aiosqlite.Connection, user_id: int, name: str
     ) -> dict:
-        """Атомарное создание профиля. Принимает db — не открывает своё соединение."""
-        await db.execute("BEGIN IMMEDIATE")
-        try:
-            private_key, public_key = await cls.generate_keys()
-            ipv4 = await cls.get_next_ipv4(db)
-            encrypted_key = cls.encrypt_data(private_key)
+        """Создание профиля. Принимает db — не открывает своё соединение.
 
-            synced = await cls.sync_peer_with_server(public_key, ipv4)
-            if not synced:
-                raise RuntimeError(
-                    "Не удалось синхронизировать peer с WireGuard. "
-                    "Профиль не создан — проверьте доступность WireGuard сервера."
+        Ключи генерируются до записи. Узел (VPNService.place — по согласованному
+        числу профилей) и адрес выбираются, а профиль вставляется одной короткой
+        транзакцией: одновременные создания не получат один адрес. Пир
+        добавляется на интерфейс после commit под peer_lock интерфейса — awg
+        не выполняется под блокировкой записи, а сверка не застанет пир,
+        профиля которого ещё нет в БД; не удалось добавить пир — профиль
+        удаляется.
+        """
+        private_key, public_key = await cls.generate_keys()
+        encrypted_key = cls.encrypt_data(private_key)
+        try:
+            async with transaction(db):
+                node = await cls.place(db)
+                pool, ipv4 = await cls.allocate_address(db, node)
+                ipv6 = await cls.allocate_ipv6(db, node)
+                node = node.for_pool(pool)
+                profile_id = await repository.insert_vpn_profile(
+                    db, user_id, name, encrypted_key, public_key, ipv4, node.id, pool.id, ipv6,
                 )
-
-            await repository.insert_vpn_profile(db, user_id, name, encrypted_key, public_key, ipv4)
-            await db.commit()
-
-            return {
-                "name": name,
-                "ipv4": ipv4,
-                "config": cls.generate_config_content(private_key, ipv4),
-            }
         except aiosqlite.IntegrityError as exc:
-            await db.rollback()
             raise RuntimeError(
                 "Failed to create profile due to DB integrity violation. "
                 "Check duplicate public_key/ipv4.",
             ) from exc
-        except Exception:
-            await db.rollback()
-            raise
+
+        async with cls.peer_lock(node):
+            synced = False
+            try:
+                synced = await cls.sync_peer_with_server(public_key, ipv4, node=node, ipv6=ipv6)
+            finally:
+                if not synced:
+                    # Профиль без пира на интерфейсе не оставляем
+                    await repository.delete_vpn_profile(db, profile_id)
+        if not synced:
+            raise RuntimeError(
+                "Не удалось синхронизировать peer с WireGuard. "
+                "Профиль не создан — проверьте доступность WireGuard сервера."
+            )
+        if len(cls.targets()) > 1:
+            logger.info("[VPN] Профиль размещён на узле | node={} ipv4={}", node.label, ipv4)
+
+        return {
+            "name": name,
+            "ipv4": ipv4,
+            "ipv6": ipv6,
+            "config": cls.generate_config_content(private_key, ipv4, node, ipv6),
+        }
 
     @classmethod
-    async def sync_peer_with_server(cls, public_key: str, ipv4: str) -> bool:
+    async def sync_peer_with_server(
+        cls, public_key: str, ipv4: str, node: VPNNode | None = None, ipv6: str | None = None,
+    ) -> bool:
+        node = node or cls.node()
         try:
-            binary = cls._resolve_wg_binary()
+            binary = cls._resolve_wg_binary(node)
         except RuntimeError as exc:
             logger.error(str(exc))
             return False
 
         args = cls._build_command(
-            binary, "set", settings.wg_interface, "peer", public_key,
-            "allowed-ips", f"{ipv4}/32"
+            binary, "set", node.interface, "peer", public_key,
+            "allowed-ips", peer_allowed_ips(ipv4, ipv6), node=node,
         )
-        log_wg_command(args)
         try:
-            process = await asyncio.create_subprocess_exec(
-                *args,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            _, stderr = await process.communicate()
-            err = stderr.decode("utf-8", errors="replace").strip()
-            log_wg_result(process.returncode, err)
-            if process.returncode != 0:
-                logger.error(f"Sync error: {err}")
-                return False
-            # Persist to config file so peers survive container restart
-            saved = await cls.save_interface_config()
-            if not saved:
-                logger.warning("[WG] Peer synced to runtime but config save failed")
-            return True
+            result = await cls._execute(node, args)
         except OSError as exc:
             logger.error(f"Sync error: {exc}")
             return False
+        if not result.ok:
+            logger.error(f"Sync error: {result.stderr}")
+            return False
+        # Persist to config file so peers survive container restart
+        saved = await cls.save_interface_config(node)
+        if not saved:
+            logger.warning("[WG] Peer synced to runtime but config save failed")
+        return True
 
     @classmethod
-    async def save_interface_config(cls) -> bool:
+    async def save_interface_config(cls, node: VPNNode | None = None) -> bool:
         """Сохраняет текущее runtime-состояние WG интерфейса на диск через awg-quick save."""
+        node = node or cls.node()
         try:
-            binary_quick = cls._resolve_wg_quick_binary()
+            binary_quick = cls._resolve_wg_quick_binary(node)
         except RuntimeError as exc:
             logger.error(str(exc))
             return False
-        args = cls._build_command(binary_quick, "save", settings.wg_interface)
-        log_wg_command(args)
+        args = cls._build_command(binary_quick, "save", node.interface, node=node)
         try:
-            process = await asyncio.create_subprocess_exec(
-                *args, stderr=asyncio.subprocess.PIPE,
-            )
-            _, stderr = await process.communicate()
-            err = stderr.decode("utf-8", errors="replace").strip()
-            log_wg_result(process.returncode, err)
-            if process.returncode != 0:
-                logger.error("[WG] Failed to save interface config: {}", err)
-                return False
-            return True
+            result = await cls._execute(node, args)
         except OSError as exc:
             logger.error("[WG] Failed to save interface config: {}", exc)
             return False
+        if not result.ok:
+            logger.error("[WG] Failed to save interface config: {}", result.stderr)
+            return False
+        return True
+
+    @classmethod
+    def config_template(cls, node: VPNNode | None = None, fmt: str = FORMAT_AWG) -> ConfigTemplate:
+        """Шаблон конфига узла (вида узла для пула): компилируется при первом вызове или на старте."""
+        node = node or cls.node()
+        key = (fmt, node.name, node.endpoint, node.public_key)
+        template = cls._templates.get(key)
+        if template is None:
+            template = cls._templates[key] = compile_template(node, fmt)
+        return template
+
+    @classmethod
+    def compile_templates(cls, formats: tuple[str, ...] = (FORMAT_AWG,)) -> int:
+        """Компилирует шаблоны всех интерфейсов всех узлов заранее (фаза старта); сколько шаблонов."""
+        for node in cls.targets():
+            for fmt in formats:
+                cls.config_template(node, fmt)
+        return len(cls._templates)
 
     @classmethod
-    def generate_config_content(cls, private_key: str, ipv4: str) -> str:
-        lines = [
-            "[Interface]",
-            f"PrivateKey = {private_key}",
-            f"Address = {ipv4}/32",
-            f"DNS = {settings.dns_servers}",
-            f"Jc = {settings.jc}",
-            f"Jmin = {settings.jmin}",
-            f"Jmax = {settings.jmax}",
-            f"S1 = {settings.s1}",
-            f"S2 = {settings.s2}",
-        ]
-        if settings.s3:
-            lines.append(f"S3 = {settings.s3}")
-        if settings.s4:
-            lines.append(f"S4 = {settings.s4}")
-        if settings.i1:
-            lines.append(f"I1 = {settings.i1}")
-        lines.extend([
-            f"H1 = {settings.h1}",
-            f"H2 = {settings.h2}",
-            f"H3 = {settings.h3}",
-            f"H4 = {settings.h4}",
-            "",
-            "[Peer]",
-            f"PublicKey = {settings.server_pub_key}",
-            f"Endpoint = {settings.server_endpoint}",
-            "AllowedIPs = 0.0.0.0/0",
-        ])
-        return "\n".join(lines) + "\n"
+    def render_config(
+        cls, private_key: str, ipv4: str, node: VPNNode | None = None, ipv6: str | None = None,
+        fmt: str = FORMAT_AWG,
+    ) -> bytes:
+        """Конфиг профиля в формате fmt — подстановка ключа и адресов в готовый шаблон."""
+        return cls.config_template(node, fmt).render(private_key, ipv4, ipv6)
+
+    @classmethod
+    def generate_config_content(
+        cls, private_key: str, ipv4: str, node: VPNNode | None = None, ipv6: str | None = None,
+    ) -> str:
+        return cls.render_config(private_key, ipv4, node, ipv6).decode("utf-8")
 
     @staticmethod
     def generate_qr_code(config: str) -> bytes:
+        import segno
+
         qr_code = segno.make(config)
         buffer = BytesIO()
         qr_code.save(buffer, kind="png", scale=5)
         return buffer.getvalue()
 
+    @staticmethod
+    def format_last_seen(handshake: int, now: float, window: float) -> str:
+        """«онлайн» / «N мин/ч/дн назад» / «не подключался» по времени рукопожатия."""
+        if not handshake:
+            return "не подключался"
+        ago = max(now - handshake, 0)
+        if ago <= window:
+            return "онлайн"
+        if ago < 3600:
+            return f"{int(ago // 60)} мин назад"
+        if ago < 86400:
+            return f"{int(ago // 3600)} ч назад"
+        return f"{int(ago // 86400)} дн назад"
+
     @staticmethod
     def format_bytes(value: int) -> str:
         units = ["B", "KB", "MB", "GB", "TB"]
@@ -335,10 +757,74 @@ class VPNService:
         return "0 B"
 
     @classmethod
-    async def get_server_status(cls) -> dict[str, Any]:
-        interface = settings.wg_interface
+    async def _dump(cls, node: VPNNode | None = None) -> CommandResult:
+        """``awg show <interface> dump`` узла с потоковым разбором: пиры в ``result.parsed``.
+
+        RuntimeError (нет бинарника) и OSError пробрасываются вызывающему.
+        """
+        node = node or cls.node()
+        binary = cls._resolve_wg_binary(node)
+        result = await cls._execute(
+            node, cls._build_command(binary, "show", node.interface, "dump", node=node), parse=read_dump,
+        )
+        cls._snapshot_checked[node.id, node.interface] = time.monotonic()
+        if result.ok:
+            cls._node_snapshots[node.id, node.interface] = PeerSnapshot.from_records(result.parsed)
+            cls._snapshot = PeerSnapshot.merge(cls._node_snapshots.values())
+            metrics.ACTIVE_PEERS.set(len(cls._snapshot.peers))
+            metrics.ONLINE_PEERS.set(cls._snapshot.online_count(settings.wg_online_window))
+        return result
+
+    @classmethod
+    async def peer_snapshot(cls, max_age: float | None = None) -> PeerSnapshot | None:
+        """Снимок пиров всех узлов, не старше max_age (по умолч. WG_SNAPSHOT_TTL).
+
+        Любой дамп (статус сервера, сверка, статистика) обновляет снимок своего
+        интерфейса, так что просмотры обычно обходятся без subprocess.
+        Конкурентные вызовы ждут одни и те же дампы; интерфейс с неудачным
+        дампом опрашивается снова не раньше чем через max_age.
+        """
+        max_age = settings.wg_snapshot_ttl if max_age is None else max_age
+
+        def stale() -> list[VPNNode]:
+            now = time.monotonic()
+            return [
+                node for node in cls.targets()
+                if now - cls._snapshot_checked.get((node.id, node.interface), -math.inf) >= max_age
+            ]
+
+        if not stale():
+            return cls._snapshot
+        if cls._snapshot_lock is None:
+            cls._snapshot_lock = asyncio.Lock()
+        async with cls._snapshot_lock:
+            nodes = stale()
+            await asyncio.gather(*(cls.dump_peers(node) for node in nodes))
+            checked = time.monotonic()
+            for node in nodes:
+                cls._snapshot_checked[node.id, node.interface] = checked
+        return cls._snapshot
+
+    @classmethod
+    async def dump_peers(cls, node: VPNNode | None = None) -> list[PeerRecord] | None:
+        """Пиры интерфейса узла; None — дамп не получен (это не то же, что пустой интерфейс)."""
         try:
-            binary = cls._resolve_wg_binary()
+            result = await cls._dump(node)
+        except (RuntimeError, OSError) as exc:
+            logger.warning("[WG] Не удалось прочитать пиры интерфейса: {}", exc)
+            return None
+        if not result.ok:
+            logger.warning("[WG] Не удалось прочитать пиры интерфейса: {}", result.stderr)
+            return None
+        # _dump разбирает stdout через read_dump
+        return cast(list[PeerRecord], result.parsed)
+
+    @classmethod
+    async def get_server_status(cls, node: VPNNode | None = None) -> dict[str, Any]:
+        node = node or cls.node()
+        interface = node.interface
+        try:
+            result = await cls._dump(node)
         except RuntimeError as exc:
             return {
                 "status": "error",
@@ -346,17 +832,16 @@ class VPNService:
                 "active_peers_count": 0,
                 "message": str(exc),
             }
+        except OSError as exc:
+            return {
+                "status": "offline",
+                "interface": interface,
+                "active_peers_count": 0,
+                "message": str(exc),
+            }
 
-        args = cls._build_command(binary, "show", interface, "dump")
-        process = await asyncio.create_subprocess_exec(
-            *args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await process.communicate()
-
-        if process.returncode != 0:
-            message = stderr.decode("utf-8", errors="replace").strip() or "interface is unavailable"
+        if not result.ok:
+            message = result.stderr or "interface is unavailable"
             return {
                 "status": "offline",
                 "interface": interface,
@@ -364,26 +849,39 @@ class VPNService:
                 "message": message,
             }
 
-        lines = [line for line in stdout.decode("utf-8", errors="replace").splitlines() if line]
-        active_peers_count = max(len(lines) - 1, 0)
+        snapshot = cls._node_snapshots[node.id, node.interface]
         return {
             "status": "online",
             "interface": interface,
-            "active_peers_count": active_peers_count,
+            "active_peers_count": len(result.parsed),
+            "online_peers_count": snapshot.online_count(settings.wg_online_window),
         }
 
+    @classmethod
+    async def get_server_public_key(cls, node: VPNNode | None = None) -> str | None:
+        """Публичный ключ интерфейса по ``awg show <interface> public-key`` (None при ошибке)."""
+        node = node or cls.node()
+        try:
+            binary = cls._resolve_wg_binary(node)
+            result = await cls._execute(
+                node, cls._build_command(binary, "show", node.interface, "public-key", node=node),
+            )
+        except (RuntimeError, OSError):
+            return None
+        return result.text.strip() if result.ok else None
+
     @classmethod
     async def get_monthly_usage(cls, db: aiosqlite.Connection, user_id: int) -> list[dict]:
-        all_stats = await cls.get_all_peers_stats()
+        """Трафик профилей пользователя за месяц — из общего снимка дампа (WG_SNAPSHOT_TTL)."""
+        snapshot = await cls.peer_snapshot()
+        peers = snapshot.peers if snapshot is not None else {}
         rows = await repository.get_monthly_usage_rows(db, user_id)
         results: list[dict] = []
         for row in rows:
-            pub_key = row["public_key"]
             offset = row["monthly_offset_bytes"] or 0
-            stats = all_stats.get(pub_key, {"total": 0, "rx": 0, "tx": 0})
-            monthly_total = (
-                stats["total"] - offset if stats["total"] >= offset else stats["total"]
-            )
+            peer = peers.get(row["public_key"])
+            total = peer.total if peer is not None else 0
+            monthly_total = total - offset if total >= offset else total
             results.append({
                 "id": row["id"],
                 "name": row["name"],
@@ -393,31 +891,25 @@ class VPNService:
         return results
 
     @classmethod
-    async def remove_peer_from_server(cls, public_key: str) -> bool:
+    async def remove_peer_from_server(cls, public_key: str, node: VPNNode | None = None) -> bool:
+        node = node or cls.node()
         try:
-            binary = cls._resolve_wg_binary()
+            binary = cls._resolve_wg_binary(node)
         except RuntimeError as exc:
             logger.error(str(exc))
             return False
 
-        args = cls._build_command(binary, "set", settings.wg_interface, "peer", public_key, "remove")
-        log_wg_command(args)
+        args = cls._build_command(binary, "set", node.interface, "peer", public_key, "remove", node=node)
         try:
-            process = await asyncio.create_subprocess_exec(
-                *args,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            _, stderr = await process.communicate()
-            err = stderr.decode("utf-8", errors="replace").strip()
-            log_wg_result(process.returncode, err)
-            if process.returncode != 0:
-                logger.error(f"Failed to remove peer: {err}")
-                return False
-            await cls.save_interface_config()
-            return True
+            result = await cls._execute(node, args)
         except OSError as exc:
             logger.error(f"Failed to remove peer: {exc}")
             return False
+        if not result.ok:
+            logger.error(f"Failed to remove peer: {result.stderr}")
+            return False
+        await cls.save_interface_config(node)
+        return True
 
     @classmethod
     async def delete_profile(cls, db: aiosqlite.Connection, profile_id: int) -> bool:
@@ -426,19 +918,24 @@ class VPNService:
         if not public_key:
             return False
 
-        removed = await cls.remove_peer_from_server(public_key)
-        if not removed:
-            logger.error(
-                "[VPN] Не удалось удалить peer с WireGuard сервера | public_key={}...",
-                public_key[:8],
-            )
-            return False
-        await repository.delete_vpn_profile(db, profile_id)
+        placement = await repository.get_profile_placement(db, profile_id)
+        node = cls.target(placement["node_id"], placement["pool_id"]) if placement else cls.node()
+        async with cls.peer_lock(node):
+            removed = await cls.remove_peer_from_server(public_key, node)
+            if not removed:
+                logger.error(
+                    "[VPN] Не удалось удалить peer с WireGuard сервера | public_key={}... node={}",
+                    public_key[:8], node.label,
+                )
+                return False
+            await repository.delete_vpn_profile(db, profile_id)
         return True
 
     @classmethod
-    async def get_profile_config(cls, db: aiosqlite.Connection, profile_id: int) -> dict | None:
-        """Восстанавливает конфиг профиля. Принимает db — не открывает своё соединение."""
+    async def get_profile_config(
+        cls, db: aiosqlite.Connection, profile_id: int, fmt: str = FORMAT_AWG,
+    ) -> dict | None:
+        """Восстанавливает конфиг профиля в формате fmt. Принимает db — не открывает своё соединение."""
         row = await repository.get_profile_for_config(db, profile_id)
         if not row:
             return None
@@ -449,81 +946,165 @@ class VPNService:
         except (ValueError, RuntimeError) as exc:
             logger.error("[VPN] Не удалось расшифровать приватный ключ профиля | profile_id={} error={}", profile_id, exc)
             return None
-        config = cls.generate_config_content(private_key, ipv4)
-        return {"name": name, "config": config, "ipv4": ipv4}
+        node = cls.target(row["node_id"], row["pool_id"])
+        ipv6 = row["ipv6_address"]
+        if ipv6 is None and node.ipv6_range:
+            ipv6 = await cls.assign_ipv6(db, profile_id, row["public_key"], ipv4, node, row["detached_at"] is None)
+        if row["detached_at"] is not None:
+            await cls.ensure_attached(db, profile_id, row["public_key"], ipv4, node, ipv6)
+        template = cls.config_template(node, fmt)
+        config = template.render(private_key, ipv4, ipv6).decode("utf-8")
+        return {"name": name, "config": config, "ipv4": ipv4, "ipv6": ipv6, "extension": template.extension}
 
     @classmethod
-    async def recover_all_peers(cls, db: aiosqlite.Connection) -> tuple[int, int]:
-        """Восстанавливает все пиры из БД на WG-сервер при старте.
+    async def assign_ipv6(
+        cls, db: aiosqlite.Connection, profile_id: int, public_key: str, ipv4: str,
+        node: VPNNode, attached: bool = True,
+    ) -> str | None:
+        """IPv6-адрес профилю, выданному до включения IPv6 на узле (при скачивании конфига).
 
-        Возвращает (success_count, fail_count). Вызывает ``save_interface_config``
-        один раз в конце, а не после каждого peer.
+        Адрес выделяется и сохраняется короткой транзакцией, затем пир
+        синхронизируется (снятый за неактивностью — без синхронизации); не
+        принял адрес — он освобождается, конфиг остаётся IPv4. awg не
+        выполняется под блокировкой записи, всё вместе — под peer_lock интерфейса.
         """
-        profiles = await repository.get_all_active_profiles(db)
-        if not profiles:
-            return (0, 0)
+        async with cls.peer_lock(node):
+            async with transaction(db):
+                ipv6 = await cls.allocate_ipv6(db, node)
+                if ipv6 is not None:
+                    await repository.set_profile_ipv6(db, profile_id, ipv6)
+            if ipv6 is None:
+                return None
+            synced = not attached
+            try:
+                if attached:
+                    synced = await cls.sync_peer_with_server(public_key, ipv4, node, ipv6)
+            finally:
+                if not synced:
+                    async with transaction(db):
+                        await repository.set_profile_ipv6(db, profile_id, None)
+            if not synced:
+                return None
+        logger.info("[VPN] Профилю назначен IPv6 | profile_id={} ipv6={}", profile_id, ipv6)
+        return ipv6
 
-        try:
-            binary = cls._resolve_wg_binary()
-        except RuntimeError as exc:
-            logger.error("[RECOVERY] {}", exc)
-            return (0, len(profiles))
+    @classmethod
+    async def ensure_attached(
+        cls, db: aiosqlite.Connection, profile_id: int, public_key: str, ipv4: str,
+        node: VPNNode | None = None, ipv6: str | None = None,
+    ) -> bool:
+        """Возвращает на интерфейс пир, снятый сборщиком неактивных пиров."""
+        async with cls.peer_lock(node):
+            if not await cls.sync_peer_with_server(public_key, ipv4, node=node, ipv6=ipv6):
+                logger.warning("[IDLE] Не удалось вернуть пир на интерфейс | profile_id={}", profile_id)
+                return False
+            await repository.mark_attached(db, profile_id, int(time.time()))
+        logger.info("[IDLE] Пир возвращён на интерфейс | profile_id={}", profile_id)
+        return True
+
+    @classmethod
+    async def recover_all_peers(
+        cls, db: aiosqlite.Connection, node: VPNNode | None = None,
+    ) -> tuple[int, int]:
+        """Восстанавливает пиры из БД на их узлы при старте (node — только на этот узел).
 
+        Возвращает (success_count, fail_count). Пиры интерфейса применяются
+        пакетными ``awg set`` (apply_peer_changes) с одним ``awg-quick save``
+        в конце. Вид узла для интерфейса (VPNService.targets) ограничивает
+        восстановление им.
+        """
+        only = (node.id, node.interface) if node else None
+        by_target: dict[tuple[int, str], tuple[VPNNode, list[aiosqlite.Row]]] = {}
         success, failed = 0, 0
-        for p in profiles:
-            args = cls._build_command(
-                binary, "set", settings.wg_interface,
-                "peer", p["public_key"], "allowed-ips", f"{p['ipv4_address']}/32",
-            )
+        for row in await repository.get_all_active_profiles(db, node.id if node else None):
             try:
-                proc = await asyncio.create_subprocess_exec(
-                    *args, stderr=asyncio.subprocess.PIPE,
-                )
-                _, stderr = await proc.communicate()
-                if proc.returncode == 0:
-                    success += 1
-                else:
-                    logger.warning(
-                        "[RECOVERY] peer {}...: {}",
-                        p["public_key"][:8],
-                        stderr.decode(errors="replace").strip(),
-                    )
-                    failed += 1
-            except OSError as exc:
-                logger.warning("[RECOVERY] peer {}...: {}", p["public_key"][:8], exc)
+                target = cls.target(row["node_id"], row["pool_id"])
+            except LookupError as exc:
+                logger.error("[RECOVERY] {}", exc)
                 failed += 1
+                continue
+            if only is None or (target.id, target.interface) == only:
+                by_target.setdefault((target.id, target.interface), (target, []))[1].append(row)
 
-        if success > 0:
-            await cls.save_interface_config()
+        for node, profiles in by_target.values():
+            upsert = {
+                p["public_key"]: peer_allowed_ips(p["ipv4_address"], p["ipv6_address"]) for p in profiles
+            }
+            synced, node_failed = await cls.apply_peer_changes(upsert, [], node=node)
+            success += synced
+            failed += node_failed
 
         return (success, failed)
 
     @classmethod
-    async def get_all_peers_stats(cls) -> dict[str, dict[str, int]]:
-        try:
-            binary = cls._resolve_wg_binary()
-        except RuntimeError:
-            return {}
+    async def get_interface_peers(cls, node: VPNNode | None = None) -> dict[str, str] | None:
+        """Пиры интерфейса узла по одному дампу: public_key → нормализованные allowed-ips."""
+        peers = await cls.dump_peers(node)
+        if peers is None:
+            return None
+        return {peer.public_key: peer.allowed_ips for peer in peers}
+
+    @classmethod
+    async def apply_peer_changes(
+        cls, upsert: dict[str, str], remove: list[str], batch_size: int = PEER_BATCH_SIZE,
+        node: VPNNode | None = None,
+    ) -> tuple[int, int]:
+        """Пакетно применяет изменения пиров узла: (применено, ошибок).
 
-        args = cls._build_command(binary, "show", settings.wg_interface, "dump")
+        Несколько ``peer ...`` в одном ``awg set`` — один процесс на batch_size
+        пиров; если пакет не прошёл, его пиры повторяются по одному, чтобы
+        ошибка одного ключа не блокировала остальные. ``awg-quick save`` —
+        один раз в конце.
+        """
+        clauses = [
+            ("peer", key, "allowed-ips", allowed_ips) for key, allowed_ips in upsert.items()
+        ] + [("peer", key, "remove") for key in remove]
+        if not clauses:
+            return 0, 0
+        node = node or cls.node()
         try:
-            process = await asyncio.create_subprocess_exec(
-                *args,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            stdout, _ = await process.communicate()
-            if process.returncode != 0:
-                return {}
-
-            stats: dict[str, dict[str, int]] = {}
-            lines = stdout.decode("utf-8", errors="replace").strip().split("\n")
-            for line in lines[1:]:
-                parts = line.split("\t")
-                if len(parts) >= 8:
-                    rx = int(parts[6])
-                    tx = int(parts[7])
-                    stats[parts[0]] = {"rx": rx, "tx": tx, "total": rx + tx}
-            return stats
-        except (OSError, ValueError):
-            return {}
+            binary = cls._resolve_wg_binary(node)
+        except RuntimeError as exc:
+            logger.error("[WG] {}", exc)
+            return 0, len(clauses)
+
+        async def set_peers(batch: Sequence[tuple[str, ...]]) -> bool:
+            args = [arg for clause in batch for arg in clause]
+            try:
+                result = await cls._execute(
+                    node, cls._build_command(binary, "set", node.interface, *args, node=node),
+                )
+            except OSError as exc:
+                logger.warning("[WG] Пакет из {} пиров не применён: {}", len(batch), exc)
+                return False
+            if not result.ok:
+                logger.warning("[WG] Пакет из {} пиров не применён: {}", len(batch), result.stderr)
+            return result.ok
+
+        applied, failed = 0, 0
+        for start in range(0, len(clauses), batch_size):
+            batch = clauses[start:start + batch_size]
+            if await set_peers(batch):
+                applied += len(batch)
+                continue
+            if len(batch) == 1:
+                failed += 1
+                continue
+            for clause in batch:
+                if await set_peers([clause]):
+                    applied += 1
+                else:
+                    failed += 1
+
+        if applied:
+            await cls.save_interface_config(node)
+        return applied, failed
+
+    @classmethod
+    async def get_all_peers_stats(cls) -> dict[str, dict[str, int]]:
+        """Трафик пиров всех узлов (узел, дамп которого не получен, пропускается)."""
+        stats: dict[str, dict[str, int]] = {}
+        for peers in await asyncio.gather(*(cls.dump_peers(node) for node in cls.targets())):
+            for p in peers or ():
+                stats[p.public_key] = {"rx": p.rx, "tx": p.tx, "total": p.total}
+        return stats
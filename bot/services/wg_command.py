@@ -0,0 +1,276 @@
+"""
+Результаты, статистика и защита вызовов wg/awg/docker.
+
+Все subprocess-вызовы VPNService идут через VPNService._run(), который
+возвращает CommandResult и записывает его в CommandStats — скользящее окно
+длительностей по каждой команде. Перцентили показываются на экране
+администратора «🖥️ Сервер».
+
+Окружение вызовов — WGRuntime: пути awg/awg-quick и префикс argv (docker exec,
+ssh до удалённого узла) разрешаются один раз на узел и переиспользуются всеми
+командами.
+
+Защита от зависаний:
+  COMMAND_TIMEOUTS — таймаут по подкоманде (genkey, set, save, ...)
+  CircuitBreaker   — после серии отказов (таймауты, контейнер AWG не запущен)
+                     вызовы сразу завершаются WGUnavailableError, не порождая
+                     новых процессов, пока не пройдёт reset_timeout
+"""
+from __future__ import annotations
+
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+# Таймауты (с) по подкоманде wg/awg. WG_COMMAND_TIMEOUT — верхняя граница
+# и значение для неизвестных команд.
+COMMAND_TIMEOUTS: dict[str, float] = {
+    "genkey": 5.0,
+    "pubkey": 5.0,
+    "show": 10.0,
+    "set": 10.0,
+    "save": 20.0,
+}
+
+# Признаки того, что контейнер AWG (или docker) недоступен, а не ошибка команды
+UNAVAILABLE_MARKERS = (
+    "No such container",
+    "is not running",
+    "is restarting",
+    "Cannot connect to the Docker daemon",
+)
+
+
+class WGUnavailableError(ConnectionError):
+    """WireGuard/контейнер AWG недоступен — circuit breaker разомкнут."""
+
+
+# Опции ssh со значением (``-o BatchMode=yes``) — для разбора метки команды
+_SSH_VALUE_OPTIONS = frozenset({"-o", "-p", "-i", "-l", "-F", "-J"})
+
+
+def command_label(args: list[str]) -> str:
+    """Метка команды: ``awg set``, ``awg-quick save`` (без ssh, docker exec и аргументов)."""
+    cmd = list(args)
+    if cmd[:1] == ["ssh"]:
+        index = 1
+        while index < len(cmd) and cmd[index].startswith("-"):
+            index += 2 if cmd[index] in _SSH_VALUE_OPTIONS else 1
+        cmd = cmd[index + 1:]  # без хоста
+    if cmd[:2] == ["docker", "exec"]:
+        cmd = [a for a in cmd[2:] if a != "-i"][1:]
+    if not cmd:
+        return "unknown"
+    binary = cmd[0].rsplit("/", 1)[-1]
+    return f"{binary} {cmd[1]}" if len(cmd) > 1 else binary
+
+
+def command_timeout(label: str, limit: float) -> float:
+    """Таймаут команды по её метке (``awg set`` → COMMAND_TIMEOUTS["set"]), не больше limit."""
+    subcommand = label.rsplit(" ", 1)[-1]
+    return min(COMMAND_TIMEOUTS.get(subcommand, limit), limit)
+
+
+@dataclass(frozen=True, slots=True)
+class WGRuntime:
+    """
+    Разрешённое окружение wg/awg: бинарники, режим и готовый префикс argv.
+
+    В Docker-режиме (container задан) бинарники находятся внутри контейнера —
+    используются bare-имена, префикс ``docker exec [-i] <container>``. В прямом
+    режиме пути ищутся через which; None — бинарник не найден. Для удалённого
+    узла (ssh_host задан) перед всем этим добавляется ``ssh <host>``: искать
+    бинарники локально бессмысленно, используются bare-имена.
+    """
+
+    container: str
+    wg: str | None
+    wg_quick: str | None
+    prefix: tuple[str, ...] = ()
+    interactive_prefix: tuple[str, ...] = ()
+    ssh_host: str = ""
+
+    @property
+    def mode(self) -> str:
+        mode = "docker" if self.container else "direct"
+        return f"ssh+{mode}" if self.ssh_host else mode
+
+    @classmethod
+    def probe(cls, container: str, which: Callable[[str], str | None], ssh_host: str = "") -> WGRuntime:
+        container, ssh_host = container.strip(), ssh_host.strip()
+        # BatchMode: без запроса пароля — иначе команда висит до таймаута
+        ssh = ("ssh", "-o", "BatchMode=yes", ssh_host) if ssh_host else ()
+        if container:
+            return cls(
+                container, "awg", "awg-quick",
+                prefix=(*ssh, "docker", "exec", container),
+                interactive_prefix=(*ssh, "docker", "exec", "-i", container),
+                ssh_host=ssh_host,
+            )
+        if ssh_host:
+            return cls("", "awg", "awg-quick", prefix=ssh, interactive_prefix=ssh, ssh_host=ssh_host)
+        return cls(
+            "",
+            which("awg") or which("wg"),
+            which("awg-quick") or which("wg-quick"),
+        )
+
+    def command(self, *args: str, interactive: bool = False) -> list[str]:
+        """argv команды с префиксом режима (``-i`` — для команд, читающих stdin)."""
+        return [*(self.interactive_prefix if interactive else self.prefix), *args]
+
+    def describe(self) -> str:
+        via = f"ssh {self.ssh_host} " if self.ssh_host else ""
+        if self.container:
+            return f"{via}docker exec {self.container}"
+        if self.ssh_host:
+            return f"ssh {self.ssh_host}"
+        return f"direct wg={self.wg or '-'} wg_quick={self.wg_quick or '-'}"
+
+
+@dataclass(slots=True)
+class CommandResult:
+    """Итог выполнения команды (с учётом повторов)."""
+
+    command: str
+    returncode: int | None
+    stdout: bytes
+    stderr: str
+    duration: float
+    attempts: int = 1
+    timed_out: bool = False
+    parsed: Any = None  # результат потокового разбора stdout (stdout тогда пуст)
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def text(self) -> str:
+        return self.stdout.decode("utf-8", errors="replace")
+
+    @property
+    def unavailable(self) -> bool:
+        """Отказ инфраструктуры (таймаут, контейнер остановлен), а не ошибка самой команды."""
+        if self.timed_out:
+            return True
+        return self.returncode != 0 and any(m in self.stderr for m in UNAVAILABLE_MARKERS)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для вызовов wg/docker.
+
+    closed    — вызовы идут как обычно, считаются подряд идущие отказы
+    open      — после ``threshold`` отказов: allow() == False ``reset_timeout`` секунд
+    half-open — по истечении таймаута пропускается один пробный вызов;
+                успех замыкает цепь, отказ снова размыкает
+    """
+
+    def __init__(self, threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._opened_at is not None or self._failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Пробный вызов отменён, не дав результата — следующий вызов снова станет пробным."""
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+
+class _Window:
+    __slots__ = ("durations", "count", "failures", "timeouts", "retries", "stdout_bytes")
+
+    def __init__(self, size: int) -> None:
+        self.durations: deque[float] = deque(maxlen=size)
+        self.count = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.stdout_bytes = 0
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class CommandStats:
+    """Скользящие перцентили длительности и счётчики по командам."""
+
+    def __init__(self, window: int = 256) -> None:
+        self._window = window
+        self._commands: dict[str, _Window] = {}
+
+    def record(self, result: CommandResult) -> None:
+        stats = self._commands.get(result.command)
+        if stats is None:
+            stats = self._commands[result.command] = _Window(self._window)
+        stats.durations.append(result.duration)
+        stats.count += 1
+        stats.retries += result.attempts - 1
+        stats.stdout_bytes += len(result.stdout)
+        if result.timed_out:
+            stats.timeouts += 1
+        if not result.ok:
+            stats.failures += 1
+
+    def snapshot(self) -> list[dict]:
+        """Статистика по командам, самые частые — первыми."""
+        rows = []
+        for command, stats in sorted(self._commands.items(), key=lambda item: item[1].count, reverse=True):
+            ordered = sorted(stats.durations)
+            rows.append({
+                "command": command,
+                "count": stats.count,
+                "failures": stats.failures,
+                "timeouts": stats.timeouts,
+                "retries": stats.retries,
+                "stdout_bytes": stats.stdout_bytes,
+                "p50_ms": _percentile(ordered, 0.50) * 1000,
+                "p95_ms": _percentile(ordered, 0.95) * 1000,
+                "p99_ms": _percentile(ordered, 0.99) * 1000,
+                "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+            })
+        return rows
+
+    def reset(self) -> None:
+        self._commands.clear()
@@ -0,0 +1,135 @@
+"""
+Потоковый разбор ``awg show <interface> dump``.
+
+Формат: первая строка — интерфейс (private-key, public-key, listen-port,
+fwmark), далее по строке на пир, поля через табуляцию:
+  public-key  preshared-key  endpoint  allowed-ips  latest-handshake
+  transfer-rx  transfer-tx  persistent-keepalive
+
+read_dump() читает stdout процесса по мере поступления и сразу превращает строку в
+PeerRecord (NamedTuple — кортеж без __dict__): весь вывод не собирается в
+одну строку, не режется в список строк и не превращается в dict на пир.
+PeerSnapshot — последний дамп с моментом снятия: по нему считаются пиры
+онлайн (рукопожатие не старше окна) и «последний раз в сети» без нового
+дампа на каждый просмотр.
+
+Некорректные строки пропускаются — частично прочитанный дамп лучше, чем
+исключение посреди чтения stdout.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import NamedTuple
+
+_NONE = "(none)"
+
+
+class PeerRecord(NamedTuple):
+    public_key: str
+    endpoint: str | None      # None — пир ещё не подключался
+    allowed_ips: str          # нормализованные: отсортированы, "" вместо (none)
+    latest_handshake: int     # unix time, 0 — рукопожатия не было
+    rx: int
+    tx: int
+
+    @property
+    def total(self) -> int:
+        return self.rx + self.tx
+
+
+def normalize_allowed_ips(value: str) -> str:
+    """allowed-ips в сравнимом виде: ``10.0.0.3/32,10.0.0.2/32`` → отсортированные, без ``(none)``."""
+    if value in ("", _NONE):
+        return ""
+    if "," not in value:
+        return value
+    return ",".join(sorted(part.strip() for part in value.split(",")))
+
+
+def parse_peer_line(line: str | bytes) -> PeerRecord | None:
+    """Строка пира → PeerRecord; None — строка не похожа на пир."""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    parts = line.split("\t", 7)
+    if len(parts) < 7:
+        return None
+    try:
+        handshake, rx, tx = int(parts[4]), int(parts[5]), int(parts[6])
+    except ValueError:
+        return None
+    endpoint = parts[2]
+    return PeerRecord(
+        parts[0], None if endpoint == _NONE else endpoint,
+        normalize_allowed_ips(parts[3]), handshake, rx, tx,
+    )
+
+
+def parse_dump(lines: Iterable[str | bytes]) -> Iterator[PeerRecord]:
+    """Пиры из строк дампа (первая строка — интерфейс, пропускается)."""
+    iterator = iter(lines)
+    next(iterator, None)
+    for line in iterator:
+        record = parse_peer_line(line)
+        if record is not None:
+            yield record
+
+
+async def read_dump(stream: asyncio.StreamReader, chunk_size: int = 64 * 1024) -> list[PeerRecord]:
+    """Читает дамп из stdout процесса кусками до EOF, разбирая готовые строки сразу.
+
+    Кусками, а не readline(): на десятках тысяч пиров await на строку
+    дороже самого разбора. В памяти — только хвост недочитанной строки.
+    """
+    peers: list[PeerRecord] = []
+    tail = b""
+    header = True
+    while chunk := await stream.read(chunk_size):
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        if header and lines:
+            header = False
+            del lines[0]
+        for line in lines:
+            record = parse_peer_line(line)
+            if record is not None:
+                peers.append(record)
+    if tail and not header:
+        record = parse_peer_line(tail)
+        if record is not None:
+            peers.append(record)
+    return peers
+
+
+@dataclass(slots=True)
+class PeerSnapshot:
+    peers: dict[str, PeerRecord]
+    taken_at: float  # unix time снятия дампа
+
+    @classmethod
+    def from_records(cls, records: Iterable[PeerRecord], taken_at: float | None = None) -> PeerSnapshot:
+        return cls({r.public_key: r for r in records}, time.time() if taken_at is None else taken_at)
+
+    @classmethod
+    def merge(cls, snapshots: Iterable[PeerSnapshot]) -> PeerSnapshot:
+        """Один снимок по нескольким узлам; момент снятия — самого старого из них."""
+        snapshots = list(snapshots)
+        peers: dict[str, PeerRecord] = {}
+        for snapshot in snapshots:
+            peers.update(snapshot.peers)
+        return cls(peers, min((s.taken_at for s in snapshots), default=time.time()))
+
+    def is_online(self, public_key: str, window: float) -> bool:
+        peer = self.peers.get(public_key)
+        return peer is not None and peer.latest_handshake > 0 and self.taken_at - peer.latest_handshake <= window
+
+    def online_count(self, window: float) -> int:
+        since = self.taken_at - window
+        return sum(1 for peer in self.peers.values() if peer.latest_handshake and peer.latest_handshake >= since)
+
+    def last_handshake(self, public_key: str) -> int:
+        """Unix time последнего рукопожатия; 0 — не было или пира нет на интерфейсе."""
+        peer = self.peers.get(public_key)
+        return peer.latest_handshake if peer is not None else 0
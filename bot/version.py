@@ -3,4 +3,4 @@
 __version__ = "1.2.1"
 
 # Должен совпадать с наибольшим MIGRATION_ID в bot/db/migrations/
-__schema_version__ = 1
+__schema_version__ = 5
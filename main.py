@@ -1,8 +1,11 @@
 import asyncio
+import functools
 import ipaddress
 import os
 import re
 import sys
+import time
+from collections.abc import Awaitable, Callable
 
 import aiosqlite
 from aiogram import Bot, Dispatcher
@@ -11,13 +14,25 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.memory import MemoryStorage
 from loguru import logger
 
+from bot.core import metrics, tracing
 from bot.core.config import settings
-from bot.core.logging import setup_logging
+from bot.core.executor import OrderedUpdateExecutor
+from bot.core.loop_monitor import LoopLagMonitor
+from bot.core.startup import StartupPhase, StartupReport
+from bot.core.state_store import create_state_store, get_state_store, set_state_store
+from bot.core.logging import complete_logging, setup_logging
 from bot.db.engine import init_db
+from bot.db.instrumentation import instrument
 from bot.middlewares.db_middleware import DbMiddleware
 from bot.middlewares.access_middleware import AccessControlMiddleware
 from bot.middlewares.throttling_middleware import ThrottlingMiddleware
+from bot.middlewares.ordering_middleware import OrderedExecutionMiddleware
+from bot.middlewares.timing_middleware import HandlerTimingMiddleware, running_handlers
+from bot.middlewares.tracing_middleware import TracingMiddleware
 from bot.handlers import setup_handlers
+from bot.services.idle_peers import IdlePeerCollector
+from bot.services.key_rotation import KeyRotator
+from bot.services.reconciler import PeerReconciler, ReconcileResult
 
 
 def main() -> None:
@@ -42,6 +57,13 @@ def main() -> None:
     if not settings.encryption_key:
         logger.critical("[STARTUP] ENCRYPTION_KEY не задан — приватные ключи WireGuard не будут зашифрованы")
         sys.exit(1)
+    from bot.services.vpn_service import VPNService
+
+    try:
+        encryption_keys = VPNService.encryption_key_count()
+    except RuntimeError as e:
+        logger.critical("[STARTUP] Некорректный ENCRYPTION_KEY: {}", e)
+        sys.exit(1)
 
     # Валидация конфигурации WireGuard при старте
     try:
@@ -51,6 +73,13 @@ def main() -> None:
     except ValueError as e:
         logger.critical("[STARTUP] Некорректный VPN_IP_RANGE='{}': {}", settings.vpn_ip_range, e)
         sys.exit(1)
+    if settings.vpn_ipv6_range:
+        try:
+            if ipaddress.IPv6Network(settings.vpn_ipv6_range, strict=False).num_addresses < 4:
+                raise ValueError("слишком маленький префикс")
+        except ValueError as e:
+            logger.critical("[STARTUP] Некорректный VPN_IPV6_RANGE='{}': {}", settings.vpn_ipv6_range, e)
+            sys.exit(1)
 
     pub_key = settings.server_pub_key.strip()
     if not pub_key:
@@ -80,67 +109,117 @@ def main() -> None:
             "Для production задайте REDIS_URL в .env"
         )
 
+    # Антифлуд и дедупликация запросов: Redis при REDIS_URL, иначе память процесса
+    set_state_store(create_state_store(settings.redis_url))
+
     bot = Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
     dp = Dispatcher(storage=storage)
 
+    # Пул воркеров: апдейты разных пользователей параллельно, одного — по порядку
+    executor: OrderedUpdateExecutor | None = None
+    if settings.update_workers > 0:
+        executor = OrderedUpdateExecutor(
+            workers=settings.update_workers,
+            max_pending=settings.update_queue_size,
+        )
+        dp["update_executor"] = executor
+
+    startup = StartupReport()
+    # CPU-время процесса до этой точки — почти целиком импорт модулей
+    startup.record("imports", time.process_time())
+    dp["startup"] = startup
+
     # ── Lifecycle hooks ────────────────────────────────────────────────────────
+    # Блокирующие фазы — только то, без чего нельзя принимать апдейты (БД,
+    # middleware). Восстановление пиров и проверка ключа идут в фоне после
+    # старта polling; отчёт о фазах — в лог, администратору и в /startup.
     async def on_startup() -> None:
-        # Инициализация БД
-        try:
-            await init_db(settings.db_path)
-            logger.info("[STARTUP] База данных инициализирована | path={}", settings.db_path)
-        except Exception as e:
-            logger.critical("[STARTUP] Не удалось инициализировать базу данных: {}", e)
-            sys.exit(1)
+        # Инициализация БД: миграции идут через то же долгоживущее соединение
+        with startup.phase("db"):
+            try:
+                conn = await aiosqlite.connect(settings.db_path)
+                conn.row_factory = aiosqlite.Row
+                await init_db(settings.db_path, conn)
+                logger.info("[STARTUP] База данных инициализирована | path={}", settings.db_path)
+            except Exception as e:
+                logger.critical("[STARTUP] Не удалось инициализировать базу данных: {}", e)
+                sys.exit(1)
 
-        # Открываем долгоживущее соединение
-        db = await aiosqlite.connect(settings.db_path)
-        db.row_factory = aiosqlite.Row
-        await db.execute("PRAGMA foreign_keys = ON")
-        await db.execute("PRAGMA journal_mode = WAL")
+        # Все запросы через соединение бота замеряются (/slowq)
+        db = instrument(
+            conn,
+            slow_ms=settings.db_slow_query_ms,
+            explain=settings.db_explain_slow,
+        )
         dp["db"] = db
 
-        # Восстановление пиров из БД
-        from bot.services.vpn_service import VPNService
-        try:
-            ok, fail = await VPNService.recover_all_peers(db)
-            if ok or fail:
-                logger.info("[STARTUP] Peer recovery: {} synced, {} failed", ok, fail)
-        except Exception as e:
-            logger.warning("[STARTUP] Peer recovery skipped: {}", e)
-
-        # Проверка SERVER_PUB_KEY на соответствие серверу
-        try:
-            status = await VPNService.get_server_status()
-            if status["status"] == "online":
-                binary = VPNService._resolve_wg_binary()
-                args = VPNService._build_command(binary, "show", settings.wg_interface, "public-key")
-                proc = await asyncio.create_subprocess_exec(
-                    *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        # Регистрируем middlewares с готовым соединением.
+        # Порядок важен: трасса апдейта открывается первой; затем дешёвые in-memory
+        # проверки (throttling), постановка в пул воркеров, и только потом
+        # проверки с обращением к БД/FSM.
+        with startup.phase("middlewares"):
+            if settings.trace_sample_rate > 0 or settings.trace_slow_ms > 0:
+                tracing.configure(
+                    tracing.JsonlTraceExporter(settings.trace_path),
+                    sample_rate=settings.trace_sample_rate,
+                    slow_ms=settings.trace_slow_ms,
                 )
-                stdout, _ = await proc.communicate()
-                if proc.returncode == 0:
-                    actual_key = stdout.decode().strip()
-                    if actual_key != settings.server_pub_key.strip():
-                        logger.warning(
-                            "[STARTUP] SERVER_PUB_KEY MISMATCH! .env={:.8}... actual={:.8}... "
-                            "— clients will fail to connect!",
-                            settings.server_pub_key, actual_key,
-                        )
-                    else:
-                        logger.info("[STARTUP] SERVER_PUB_KEY verified OK")
-        except Exception:
-            logger.debug("[STARTUP] Could not verify server public key")
-
-        # Регистрируем middlewares с готовым соединением
-        dp.update.outer_middleware(DbMiddleware(db))
-        dp.update.outer_middleware(AccessControlMiddleware())
-        dp.update.outer_middleware(ThrottlingMiddleware(rate_limit=0.7))
-
-        dp.include_router(setup_handlers())
+            dp.update.outer_middleware(TracingMiddleware())
+            dp.update.outer_middleware(ThrottlingMiddleware(
+                rate=settings.throttle_rate,
+                burst=settings.throttle_burst,
+                notify=settings.throttle_notify,
+                store=get_state_store(),
+            ))
+            if executor is not None:
+                executor.start()
+                dp.update.outer_middleware(OrderedExecutionMiddleware(executor))
+            timing = HandlerTimingMiddleware(executor.handler_latency if executor is not None else None)
+            dp.message.middleware(timing)
+            dp.callback_query.middleware(timing)
+            dp.update.outer_middleware(DbMiddleware(db))
+            dp.update.outer_middleware(AccessControlMiddleware())
+
+            dp.include_router(setup_handlers())
+
+        with startup.phase("monitoring"):
+            # Проба лага event loop: гистограмма + алерт администратору
+            loop_monitor = LoopLagMonitor(
+                interval=settings.loop_lag_interval,
+                threshold=settings.loop_lag_threshold_ms / 1000,
+                cooldown=settings.loop_lag_alert_cooldown,
+                alert=_loop_lag_alert(bot),
+                running=running_handlers.names,
+            )
+            loop_monitor.start()
+            dp["loop_monitor"] = loop_monitor
+
+            # Метрики Prometheus
+            if settings.metrics_port:
+                metrics.REGISTRY.add_collector(_pending_approvals_collector(db))
+                metrics.REGISTRY.add_collector(_active_peers_collector())
+                metrics_server = metrics.MetricsServer(settings.metrics_host, settings.metrics_port)
+                try:
+                    await metrics_server.start()
+                    dp["metrics_server"] = metrics_server
+                except OSError as e:
+                    logger.error("[STARTUP] Не удалось запустить эндпоинт метрик | port={} error={}", settings.metrics_port, e)
+
+        with startup.phase("wg_runtime") as phase:
+            # Узлы VPN, пути awg/awg-quick и префикс docker exec/ssh — один раз на всё время работы
+            from bot.services.vpn_service import VPNService
+
+            nodes = await VPNService.load_nodes(db)
+            phase.detail = "; ".join(f"{node.name}: {VPNService.runtime(node).describe()}" for node in nodes)
+            # Статическая часть клиентских конфигов — шаблоны на все интерфейсы и форматы
+            from bot.services.config_template import FORMAT_AWG, extra_formats
+
+            templates = VPNService.compile_templates((FORMAT_AWG, *extra_formats()))
+            phase.detail += f"; config templates: {templates}"
+
         logger.info(
             "[STARTUP] Бот запущен | admin_id={} interface={} container={}",
             settings.admin_id,
@@ -148,23 +227,182 @@ def main() -> None:
             settings.wg_container_name or "direct",
         )
 
+        # Фоновые фазы: polling стартует сразу после on_startup
+        startup.on_ready(_startup_notify(bot))
+        startup.mark_accepting()
+        reconciler = PeerReconciler(settings.wg_reconcile_max_remove, alert=_reconcile_alert(bot))
+        dp["reconciler"] = reconciler
+        # Периодическая сверка запускается из _recover_peers, когда восстановление завершено
+        startup.background("peer_recovery", functools.partial(_recover_peers, db, reconciler))
+        if settings.wg_idle_detach_days > 0:
+            idle_collector = IdlePeerCollector(settings.wg_idle_detach_days * 86400)
+            dp["idle_collector"] = idle_collector
+            idle_collector.start(db, settings.wg_idle_check_interval)
+        if encryption_keys > 1:
+            # Несколько ключей — идёт ротация: токены старых ключей перешифровываются текущим
+            key_rotator = KeyRotator()
+            dp["key_rotator"] = key_rotator
+            key_rotator.start(db)
+        startup.background("server_key", _verify_server_key)
+        await startup.finish()
+
     async def on_shutdown() -> None:
+        await startup.cancel()
+        reconciler: PeerReconciler | None = dp.get("reconciler")
+        if reconciler:
+            await reconciler.stop()
+        idle_collector: IdlePeerCollector | None = dp.get("idle_collector")
+        if idle_collector:
+            await idle_collector.stop()
+        key_rotator: KeyRotator | None = dp.get("key_rotator")
+        if key_rotator:
+            await key_rotator.stop()
+        loop_monitor: LoopLagMonitor | None = dp.get("loop_monitor")
+        if loop_monitor:
+            await loop_monitor.stop()
+        if executor is not None:
+            await executor.stop()
+        metrics_server: metrics.MetricsServer | None = dp.get("metrics_server")
+        if metrics_server:
+            await metrics_server.stop()
         db: aiosqlite.Connection | None = dp.get("db")
         if db:
             await db.close()
             logger.info("[SHUTDOWN] Соединение с БД закрыто")
+        await get_state_store().close()
+        await asyncio.to_thread(tracing.shutdown)
         logger.info("[SHUTDOWN] Бот остановлен")
+        await complete_logging()
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
-    # run_polling — синхронная обёртка с правильным lifecycle management
+    # run_polling — синхронная обёртка с правильным lifecycle management.
+    # С пулом воркеров polling подаёт апдейты последовательно (handle_as_tasks=False),
+    # а параллелизм обеспечивает OrderedExecutionMiddleware.
     dp.run_polling(
         bot,
         allowed_updates=["message", "callback_query"],
         drop_pending_updates=True,
+        handle_as_tasks=executor is None,
     )
 
 
+def _pending_approvals_collector(db: aiosqlite.Connection) -> metrics.Collector:
+    """Gauge заявок на одобрение: один COUNT(*) на запрос /metrics."""
+    from bot.db import repository
+
+    async def collect() -> None:
+        metrics.PENDING_APPROVALS.set(await repository.count_pending_approvals(db))
+
+    return collect
+
+
+async def _recover_peers(
+    db: aiosqlite.Connection, reconciler: PeerReconciler, phase: StartupPhase,
+) -> None:
+    """Сверка пиров интерфейса с БД на каждом узле (после рестарта контейнера AWG).
+
+    Периодическая сверка стартует только после восстановления (даже неудачного):
+    иначе она шла бы параллельно с recover_all_peers по тем же интерфейсам.
+    """
+    from bot.services.vpn_service import VPNService
+
+    details = []
+    try:
+        for node, result in await reconciler.run_all(db):
+            if result is not None:
+                details.append(result.summary())
+                continue
+            # Дамп интерфейса не прочитан — прежнее поведение: добавить все пиры узла из БД
+            ok, fail = await VPNService.recover_all_peers(db, node)
+            details.append(f"{node.label}: {ok} synced, {fail} failed")
+            if ok or fail:
+                logger.info("[STARTUP] Peer recovery | node={} synced={} failed={}", node.label, ok, fail)
+    finally:
+        reconciler.start(db, settings.wg_reconcile_interval)
+    phase.detail = "; ".join(details)
+
+
+async def _verify_server_key(phase: StartupPhase) -> None:
+    """Проверка публичного ключа каждого интерфейса узлов (SERVER_PUB_KEY для узла по умолчанию)."""
+    from bot.services.vpn_service import VPNService
+
+    nodes = VPNService.targets()
+    details = []
+    for node in nodes:
+        prefix = f"{node.label}: " if len(nodes) > 1 else ""
+        status = await VPNService.get_server_status(node)
+        if status["status"] != "online":
+            details.append(f"{prefix}server offline, skipped")
+            continue
+        actual_key = await VPNService.get_server_public_key(node)
+        if actual_key is None:
+            details.append(f"{prefix}key unavailable")
+            logger.debug("[STARTUP] Could not verify server public key | node={}", node.label)
+        elif actual_key != node.public_key.strip():
+            details.append(f"{prefix}MISMATCH")
+            logger.warning(
+                "[STARTUP] SERVER_PUB_KEY MISMATCH! node={} configured={:.8}... actual={:.8}... "
+                "— clients will fail to connect!",
+                node.label, node.public_key, actual_key,
+            )
+        else:
+            details.append(f"{prefix}OK")
+            logger.info("[STARTUP] SERVER_PUB_KEY verified OK | node={}", node.label)
+    phase.detail = "; ".join(details)
+
+
+def _startup_notify(bot: Bot) -> Callable[[StartupReport], Awaitable[None]]:
+    """Отчёт о фазах старта в чат администратора."""
+
+    async def notify(report: StartupReport) -> None:
+        await bot.send_message(settings.admin_id, report.render())
+
+    return notify
+
+
+def _loop_lag_alert(bot: Bot) -> Callable[[float, list[str], int], Awaitable[None]]:
+    """Алерт о лаге event loop в чат администратора."""
+    import html
+
+    async def alert(lag: float, handlers: list[str], suppressed: int) -> None:
+        text = f"🐢 <b>Event loop был занят {lag * 1000:.0f} мс</b>\n"
+        if handlers:
+            text += "\nВыполнялись:\n" + "".join(f"• <code>{html.escape(h)}</code>\n" for h in handlers)
+        if suppressed:
+            text += f"\nЕщё превышений с прошлого алерта: {suppressed}"
+        await bot.send_message(settings.admin_id, text)
+
+    return alert
+
+
+def _reconcile_alert(bot: Bot) -> Callable[[ReconcileResult], Awaitable[None]]:
+    """Сверка пропустила массовое удаление пиров — нужна проверка администратора."""
+    async def alert(result: ReconcileResult) -> None:
+        await bot.send_message(settings.admin_id, result.render())
+
+    return alert
+
+
+def _active_peers_collector(min_interval: float = 30.0) -> metrics.Collector:
+    """
+    Gauge активных пиров всех узлов. ``awg show dump`` — subprocess (docker exec,
+    ssh), поэтому опрашиваем не чаще min_interval; любой дамп обновляет gauge и сам.
+    """
+    from bot.services.vpn_service import VPNService
+    last_run = 0.0
+
+    async def collect() -> None:
+        nonlocal last_run
+        now = asyncio.get_running_loop().time()
+        if now - last_run < min_interval:
+            return
+        last_run = now
+        await VPNService.peer_snapshot(max_age=min_interval)
+
+    return collect
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк генерации клиентских конфигов (по умолч. 100k профилей).
+
+Сравнивает прежнюю сборку (список строк из settings на каждый профиль →
+"\\n".join) с рендером скомпилированного шаблона (bot/services/config_template.py:
+подстановка ключа и адресов между готовыми кусками bytes). Проверяет, что
+результат побайтно совпадает.
+
+Запуск:
+    ADMIN_ID=1 BOT_TOKEN=x python scripts/bench_config_template.py [N]
+"""
+import base64
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.core.config import settings  # noqa: E402
+from bot.services.config_template import compile_template  # noqa: E402
+from bot.services.nodes import VPNNode  # noqa: E402
+
+
+def legacy(private_key: str, ipv4: str, node: VPNNode) -> str:
+    lines = [
+        "[Interface]",
+        f"PrivateKey = {private_key}",
+        f"Address = {ipv4}/32",
+        f"DNS = {settings.dns_servers}",
+        f"Jc = {settings.jc}",
+        f"Jmin = {settings.jmin}",
+        f"Jmax = {settings.jmax}",
+        f"S1 = {settings.s1}",
+        f"S2 = {settings.s2}",
+    ]
+    if settings.s3:
+        lines.append(f"S3 = {settings.s3}")
+    if settings.s4:
+        lines.append(f"S4 = {settings.s4}")
+    if settings.i1:
+        lines.append(f"I1 = {settings.i1}")
+    lines.extend([
+        f"H1 = {settings.h1}",
+        f"H2 = {settings.h2}",
+        f"H3 = {settings.h3}",
+        f"H4 = {settings.h4}",
+        "",
+        "[Peer]",
+        f"PublicKey = {node.public_key}",
+        f"Endpoint = {node.endpoint}",
+        "AllowedIPs = 0.0.0.0/0",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def measure(name: str, profiles: list[tuple[str, str]], render) -> None:
+    started = time.perf_counter()
+    for private_key, ipv4 in profiles:
+        render(private_key, ipv4)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {elapsed * 1000:8.1f} ms  {len(profiles) / elapsed:10.0f} configs/s")
+
+
+def main(count: int) -> None:
+    node = VPNNode.from_settings()
+    profiles = [
+        (base64.b64encode(i.to_bytes(32, "big")).decode(), f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}")
+        for i in range(count)
+    ]
+    template = compile_template(node)
+    for private_key, ipv4 in profiles[:1000]:
+        assert template.render(private_key, ipv4) == legacy(private_key, ipv4, node).encode()
+
+    print(f"profiles: {count}")
+    measure("legacy", profiles, lambda key, ip: legacy(key, ip, node).encode())
+    measure("template", profiles, template.render)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
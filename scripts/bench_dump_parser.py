@@ -0,0 +1,79 @@
+"""
+Бенчмарк разбора ``awg show dump`` на синтетическом интерфейсе (по умолч. 50k пиров).
+
+Сравнивает прежний разбор (весь stdout → str → список строк → dict на пир)
+с потоковым read_dump (строка из StreamReader → PeerRecord): время и пик
+выделенной памяти (tracemalloc) поверх самих байтов дампа.
+
+Запуск:
+    python scripts/bench_dump_parser.py [N]
+"""
+import asyncio
+import base64
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.services.wg_dump import read_dump  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def make_dump(peers: int) -> bytes:
+    lines = ["cHJpdmF0ZQ==\tcHVibGlj\t51820\toff"]
+    for i in range(peers):
+        key = base64.b64encode(i.to_bytes(32, "big")).decode()
+        endpoint = f"203.0.113.{i % 250}:{40000 + i % 20000}" if i % 3 else "(none)"
+        lines.append(
+            f"{key}\t(none)\t{endpoint}\t10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/32"
+            f"\t{1700000000 + i if i % 3 else 0}\t{i * 1024}\t{i * 4096}\toff"
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def legacy(stdout: bytes) -> dict[str, dict[str, int]]:
+    stats: dict[str, dict[str, int]] = {}
+    for line in stdout.decode("utf-8", errors="replace").strip().split("\n")[1:]:
+        parts = line.split("\t")
+        if len(parts) >= 8:
+            rx, tx = int(parts[5]), int(parts[6])
+            stats[parts[0]] = {"rx": rx, "tx": tx, "total": rx + tx}
+    return stats
+
+
+async def streaming(data: bytes) -> int:
+    reader = asyncio.StreamReader()
+
+    async def feed() -> None:
+        # Как pipe: данные приходят кусками по 64 КБ
+        for start in range(0, len(data), CHUNK):
+            reader.feed_data(data[start:start + CHUNK])
+            await asyncio.sleep(0)
+        reader.feed_eof()
+
+    peers, _ = await asyncio.gather(read_dump(reader), feed())
+    return len(peers)
+
+
+def measure(name: str, run) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} peers={count:<7} {elapsed * 1000:8.1f} ms  peak={peak / 2**20:7.1f} MiB")
+
+
+def main(peers: int) -> None:
+    data = make_dump(peers)
+    print(f"dump: {peers} peers, {len(data) / 2**20:.1f} MiB")
+    measure("legacy", lambda: len(legacy(data)))
+    measure("streaming", lambda: asyncio.run(streaming(data)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,91 @@
+"""
+Бенчмарк латентности хендлеров во время ротации логов.
+
+Имитирует хендлеры, пишущие несколько строк в bot.log/audit.log, при
+боевом пороге ротации 10 МБ (каждая ротация — переименование + gzip-сжатие
+всего файла). Сравнивает три режима:
+  sync    — обычные файловые sink-и: сжатие в потоке event loop
+  enqueue — enqueue=True в loguru (pickle + multiprocessing-очередь)
+  writer  — LogWriter из bot.core.logging (поток-писатель, queue.Queue)
+
+Запуск:
+    python scripts/bench_logging_rotation.py [N]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger  # noqa: E402
+
+from bot.core.logging import AUDIT_LEVEL_NAME, LogWriter  # noqa: E402
+
+PAYLOAD = "x" * 2000
+
+
+FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {message}"
+# Как в проде (setup_logging): ротация 10 МБ + gzip
+FILE_OPTIONS = {"rotation": "10 MB", "compression": "gz", "encoding": "utf-8"}
+
+
+def add_sinks(log_dir: str, mode: str) -> LogWriter | None:
+    logger.remove()
+    writer = LogWriter() if mode == "writer" else None
+    for name, level in (("bot.log", "INFO"), ("audit.log", AUDIT_LEVEL_NAME)):
+        path = os.path.join(log_dir, name)
+        if writer is not None:
+            logger.add(writer.add_file(name, path, **FILE_OPTIONS), level=level, format=FORMAT)
+        else:
+            logger.add(path, level=level, format=FORMAT, enqueue=mode == "enqueue", **FILE_OPTIONS)
+    if writer is not None:
+        writer.start()
+    return writer
+
+
+async def handler(i: int) -> float:
+    """Возвращает время (мс), которое хендлер провёл в вызовах logger-а."""
+    t0 = time.perf_counter()
+    logger.info("[BENCH] Запрос | user_id={} payload={}", i, PAYLOAD)
+    logger.debug("[BENCH] Отладка | user_id={}", i)
+    logger.log(AUDIT_LEVEL_NAME, "BENCH_EVENT | user_id={} | payload={}", i, PAYLOAD)
+    spent = (time.perf_counter() - t0) * 1000
+    await asyncio.sleep(0.0005)  # I/O хендлера: сеть, БД
+    return spent
+
+
+async def run(n: int, mode: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = add_sinks(tmp, mode)
+        latencies: list[float] = []
+        started = time.perf_counter()
+        for i in range(n):
+            latencies.append(await handler(i))
+        elapsed = time.perf_counter() - started
+        await logger.complete()
+        if writer is not None:
+            writer.stop()
+        rotated = sum(1 for f in os.listdir(tmp) if f.endswith(".gz"))
+        logger.remove()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    slow = sum(1 for ms in latencies if ms > 1.0)
+    print(
+        f"  {mode:<8} p50={statistics.median(latencies):.3f} ms  "
+        f"p99={p99:.3f} ms  max={latencies[-1]:.2f} ms  >1ms={slow}  "
+        f"total={elapsed * 1000:.0f} ms  rotations={rotated}"
+    )
+
+
+async def main(n: int) -> None:
+    print(f"{n} хендлеров, ротация каждые {FILE_OPTIONS['rotation']}:")
+    for mode in ("sync", "enqueue", "writer"):
+        await run(n, mode)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
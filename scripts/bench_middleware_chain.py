@@ -0,0 +1,117 @@
+"""
+Бенчмарк пропускной способности цепочки middleware (апдейтов/сек).
+
+Сравнивает прежний порядок (Db → Access → Throttling, без кэша одобрения)
+с текущим (Throttling → Db → Access с approval_cache) на двух сценариях:
+  flood  — один пользователь шлёт N апдейтов подряд
+  normal — N разных одобренных пользователей, по одному апдейту
+
+Запуск:
+    python scripts/bench_middleware_chain.py [N]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from functools import partial
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "1234567890:bench")
+os.environ.setdefault("ADMIN_ID", "1")
+
+import aiosqlite  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import Chat, Message, Update, User  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from bot.core.state_store import MemoryStateStore  # noqa: E402
+from bot.db.engine import init_db  # noqa: E402
+from bot.middlewares.access_middleware import AccessControlMiddleware, ApprovalCache  # noqa: E402
+from bot.middlewares.db_middleware import DbMiddleware  # noqa: E402
+from bot.middlewares.throttling_middleware import ThrottlingMiddleware  # noqa: E402
+
+FLOOD_USER = 10_000
+
+
+def build_chain(middlewares, final):
+    handler = final
+    for middleware in reversed(middlewares):
+        handler = partial(middleware, handler)
+    return handler
+
+
+def make_update(update_id: int, user_id: int) -> tuple[Update, User]:
+    user = User(id=user_id, is_bot=False, first_name="Bench")
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=user,
+        text="🔑 Мои профили",
+    )
+    return Update(update_id=update_id, message=message), user
+
+
+async def run(name, middlewares, updates, storage) -> None:
+    passed = 0
+
+    async def final(event, data):
+        nonlocal passed
+        passed += 1
+
+    chain = build_chain(middlewares, final)
+    started = time.perf_counter()
+    for update, user in updates:
+        state = FSMContext(storage, StorageKey(bot_id=1, chat_id=user.id, user_id=user.id))
+        await chain(update, {"event_from_user": user, "state": state})
+    elapsed = time.perf_counter() - started
+    print(
+        f"  {name:<8} {len(updates) / elapsed:>10.0f} upd/s  "
+        f"(passed {passed}/{len(updates)}, {elapsed * 1000:.1f} ms)"
+    )
+
+
+async def main(n: int) -> None:
+    logger.remove()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        await init_db(db_path)
+        async with aiosqlite.connect(db_path) as db:
+            db.row_factory = aiosqlite.Row
+            await db.executemany(
+                "INSERT INTO users (telegram_id, is_approved) VALUES (?, 1)",
+                [(uid,) for uid in range(1, n + 1)] + [(FLOOD_USER,)],
+            )
+            await db.commit()
+
+            flood = [make_update(i, FLOOD_USER) for i in range(n)]
+            normal = [make_update(i, i + 1) for i in range(n)]
+            storage = MemoryStorage()
+
+            def legacy():
+                return [
+                    DbMiddleware(db),
+                    AccessControlMiddleware(cache=ApprovalCache(ttl=0)),
+                    ThrottlingMiddleware(),
+                ]
+
+            def current():
+                return [
+                    ThrottlingMiddleware(),
+                    DbMiddleware(db),
+                    AccessControlMiddleware(cache=ApprovalCache(store=MemoryStateStore())),
+                ]
+
+            for label, factory in (("legacy", legacy), ("current", current)):
+                print(f"{label}:")
+                await run("flood", factory(), flood, storage)
+                await run("normal", factory(), normal, storage)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,53 @@
+"""
+Преобразует трассы бота (TRACE_PATH, JSON-строки) в folded stacks.
+
+Каждая строка вывода — путь span-ов от корня и собственное время span-а
+в микросекундах (без дочерних): формат flamegraph.pl, speedscope, inferno.
+
+Запуск:
+    python scripts/trace_to_folded.py logs/traces.jsonl > traces.folded
+    flamegraph.pl traces.folded > traces.svg
+"""
+import json
+import sys
+from collections import Counter
+from collections.abc import Iterable
+
+
+def _frame(name: str) -> str:
+    return name.replace(";", ",").replace("\n", " ")
+
+
+def fold(traces: Iterable[dict]) -> Counter[str]:
+    stacks: Counter[str] = Counter()
+    for trace in traces:
+        spans = {s["id"]: s for s in trace["spans"]}
+        child_time: Counter[int] = Counter()
+        for s in spans.values():
+            if s["parent"] is not None:
+                child_time[s["parent"]] += s["duration_ms"]
+        for s in spans.values():
+            path = []
+            node: dict | None = s
+            while node is not None:
+                path.append(_frame(node["name"]))
+                node = spans.get(node["parent"]) if node["parent"] is not None else None
+            # Параллельные дочерние span-ы могут перекрываться — не уходим в минус
+            self_us = max(0.0, s["duration_ms"] - child_time[s["id"]]) * 1000
+            if self_us:
+                stacks[";".join(reversed(path))] += round(self_us)
+    return stacks
+
+
+def main(path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        traces = (json.loads(line) for line in f if line.strip())
+        for stack, value in sorted(fold(traces).items()):
+            print(f"{stack} {value}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    main(sys.argv[1])
@@ -17,6 +17,8 @@ from pydantic import SecretStr
 
 from bot.core.config import settings
 from bot.db.engine import init_db
+from bot.core.state_store import MemoryStateStore, set_state_store
+from bot.db.instrumentation import query_stats
 from bot.services.vpn_service import VPNService
 
 
@@ -28,8 +30,24 @@ def fernet_key() -> str:
 @pytest.fixture(autouse=True)
 def reset_vpn_service_cache() -> Iterator[None]:
     VPNService.reset_cache()
+    VPNService.command_stats.reset()
     yield
     VPNService.reset_cache()
+    VPNService.command_stats.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_query_stats() -> Iterator[None]:
+    query_stats.reset()
+    yield
+    query_stats.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_state_store() -> Iterator[None]:
+    set_state_store(MemoryStateStore())
+    yield
+    set_state_store(MemoryStateStore())
 
 
 @pytest.fixture
@@ -216,3 +216,38 @@ async def test_server_status_offline(prepared_db, db_connection, admin_id):
     text = message.answer.call_args[0][0]
     assert "🔴" in text, "При статусе offline должна быть иконка 🔴"
     assert "Остановлен" in text, "Должно быть слово 'Остановлен'"
+
+
+async def test_server_status_shows_wg_command_percentiles(prepared_db, db_connection, admin_id):
+    """handle_server показывает перцентили wg-команд из VPNService.command_stats."""
+    from bot.handlers.admin.stats import handle_server
+    from bot.services.vpn_service import VPNService
+    from bot.services.wg_command import CommandResult
+
+    for ms in (10, 20, 30):
+        VPNService.command_stats.record(CommandResult("awg show", 0, b"x", "", ms / 1000))
+    VPNService.command_stats.record(
+        CommandResult("awg set", None, b"", "timeout", 5.0, attempts=2, timed_out=True),
+    )
+
+    message = make_message(user_id=admin_id)
+    online_status = {"status": "online", "interface": "awg0", "active_peers_count": 3}
+    with patch("bot.handlers.admin.stats.VPNService.get_server_status", return_value=online_status):
+        await handle_server(message)
+
+    text = message.answer.call_args[0][0]
+    assert "<code>awg show</code> ×3 — 20 · 30 · 30 мс" in text
+    assert "таймаутов 1" in text
+
+
+async def test_server_status_shows_online_count(prepared_db, db_connection, admin_id):
+    """handle_server показывает число пиров онлайн из того же дампа."""
+    from bot.handlers.admin.stats import handle_server
+
+    status = {"status": "online", "interface": "awg0", "active_peers_count": 5, "online_peers_count": 2}
+    message = make_message(user_id=admin_id)
+
+    with patch("bot.handlers.admin.stats.VPNService.get_server_status", return_value=status):
+        await handle_server(message)
+
+    assert "Онлайн сейчас: <b>2</b>" in message.answer.call_args[0][0]
@@ -184,12 +184,11 @@ async def test_cannot_show_qr_for_other_users_profile(prepared_db, db_connection
 
 async def test_vpn_request_notifies_admin(prepared_db, db_connection, admin_id):
     """handle_vpn_request отправляет уведомление администратору."""
-    from bot.handlers.user.profiles import handle_vpn_request, _pending_vpn_requests
+    from bot.handlers.user.profiles import handle_vpn_request
 
     user_id = 3011
     await create_approved_user(db_connection, user_id, username="requester", full_name="Requester")
 
-    _pending_vpn_requests.clear()
     callback = make_callback(user_id=user_id)
     bot = make_bot()
 
@@ -202,14 +201,15 @@ async def test_vpn_request_notifies_admin(prepared_db, db_connection, admin_id):
 
 async def test_vpn_request_blocked_within_ttl(prepared_db, db_connection, admin_id):
     """Повторный запрос в течение 24ч блокируется."""
-    from bot.handlers.user.profiles import handle_vpn_request, _pending_vpn_requests
+    from bot.handlers.user.profiles import handle_vpn_request
 
     user_id = 3020
     await create_approved_user(db_connection, user_id, username="ttl_user", full_name="TTL User")
 
-    _pending_vpn_requests.clear()
-    import time
-    _pending_vpn_requests[user_id] = time.time()  # уже есть свежий запрос
+    from bot.core.state_store import get_state_store
+    from bot.handlers.user.profiles import pending_request_key, PENDING_REQUEST_TTL
+    # уже есть свежий запрос
+    await get_state_store().try_lock(pending_request_key(user_id), PENDING_REQUEST_TTL)
 
     callback = make_callback(user_id=user_id)
     bot = make_bot()
@@ -224,14 +224,15 @@ async def test_vpn_request_blocked_within_ttl(prepared_db, db_connection, admin_
 
 async def test_vpn_request_allowed_after_ttl_expired(prepared_db, db_connection, admin_id):
     """Запрос разрешён если предыдущий старше 24ч."""
-    from bot.handlers.user.profiles import handle_vpn_request, _pending_vpn_requests, PENDING_REQUEST_TTL
+    from bot.handlers.user.profiles import handle_vpn_request, pending_request_key
+    from bot.core.state_store import get_state_store
 
     user_id = 3021
     await create_approved_user(db_connection, user_id, username="expired_user", full_name="Expired User")
 
-    _pending_vpn_requests.clear()
-    import time
-    _pending_vpn_requests[user_id] = time.time() - PENDING_REQUEST_TTL - 1  # истёк
+    import asyncio
+    await get_state_store().try_lock(pending_request_key(user_id), ttl=0.01)
+    await asyncio.sleep(0.02)  # истёк
 
     callback = make_callback(user_id=user_id)
     bot = make_bot()
@@ -244,7 +245,7 @@ async def test_vpn_request_allowed_after_ttl_expired(prepared_db, db_connection,
 
 async def test_vpn_request_blocked_at_profile_limit(prepared_db, db_connection, admin_id, test_settings, monkeypatch):
     """Запрос блокируется если пользователь достиг лимита профилей."""
-    from bot.handlers.user.profiles import handle_vpn_request, _pending_vpn_requests
+    from bot.handlers.user.profiles import handle_vpn_request
     from bot.core.config import settings
 
     user_id = 3022
@@ -260,7 +261,6 @@ async def test_vpn_request_blocked_at_profile_limit(prepared_db, db_connection,
         )
     await db_connection.commit()
 
-    _pending_vpn_requests.clear()
     callback = make_callback(user_id=user_id)
     bot = make_bot()
 
@@ -271,4 +271,42 @@ async def test_vpn_request_blocked_at_profile_limit(prepared_db, db_connection,
     assert "лимит" in callback.answer.call_args[0][0]
 
     # TTL запись должна быть сброшена — пользователь может попробовать снова после удаления профиля
-    assert user_id not in _pending_vpn_requests
+    from bot.core.state_store import get_state_store
+    from bot.handlers.user.profiles import pending_request_key
+    assert not await get_state_store().exists(pending_request_key(user_id))
+
+
+async def test_profiles_show_last_seen_from_snapshot(prepared_db, db_connection, admin_id):
+    """handle_profiles показывает «онлайн» / «N ч назад» по снимку дампа, без дампа на каждый просмотр."""
+    import time
+
+    from bot.handlers.user.profiles import handle_profiles
+    from bot.services.vpn_service import VPNService
+    from bot.services.wg_dump import PeerRecord, PeerSnapshot
+
+    user_id = 3010
+    await create_approved_user(db_connection, user_id)
+    await create_profile(db_connection, user_id, name="Phone", ip="10.0.0.2", public_key="pk_phone")
+    await create_profile(db_connection, user_id, name="Laptop", ip="10.0.0.3", public_key="pk_laptop")
+    await create_profile(db_connection, user_id, name="Tablet", ip="10.0.0.4", public_key="pk_tablet")
+
+    now = time.time()
+    snapshot = PeerSnapshot.from_records([
+        PeerRecord("pk_phone", "198.51.100.1:1", "10.0.0.2/32", int(now) - 30, 0, 0),
+        PeerRecord("pk_laptop", None, "10.0.0.3/32", int(now) - 2 * 3600, 0, 0),
+    ], taken_at=now)
+
+    async def dump_peers(node=None):
+        VPNService._snapshot = snapshot
+        return list(snapshot.peers.values())
+
+    with patch.object(VPNService, "dump_peers", side_effect=dump_peers) as mock_dump:
+        for _ in range(3):
+            message = make_message(user_id=user_id)
+            await handle_profiles(message, db_connection)
+
+    assert mock_dump.call_count == 1
+    answer = message.answer.call_args[0][0]
+    assert "🟢 Phone — онлайн" in answer
+    assert "⚪ Laptop — 2 ч назад" in answer
+    assert "⚪ Tablet — не подключался" in answer
@@ -0,0 +1,62 @@
+"""
+Бюджет времени импорта (холодный старт).
+
+Запускает отдельный интерпретатор с ``-X importtime`` и проверяет, что
+тяжёлые необязательные модули не грузятся при импорте сервисов, а модули
+бота укладываются в бюджет. На медленной машине бюджет можно увеличить
+переменной IMPORT_BUDGET_SCALE (например, 2).
+"""
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Сервисный слой без aiogram — время импорта aiogram от нас не зависит
+TARGET_MODULES = ("bot.services.vpn_service", "bot.db.engine", "bot.db.instrumentation")
+
+# Загружаются только при первом использовании (QR, шифрование ключей)
+LAZY_MODULES = ("segno", "cryptography")
+
+# Бюджеты, мс: собственное время модулей bot.* и полное время импорта TARGET
+BOT_SELF_BUDGET_MS = 150
+TOTAL_BUDGET_MS = 600
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _importtime() -> dict[str, tuple[int, int]]:
+    """{модуль: (self_us, cumulative_us)} для одного запуска интерпретатора."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(TARGET_MODULES)],
+        cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+def test_import_time_budget() -> None:
+    scale = float(os.environ.get("IMPORT_BUDGET_SCALE", "1"))
+    # Первый запуск может компилировать .pyc — берём лучший из двух
+    runs = [_importtime() for _ in range(2)]
+
+    for modules in runs:
+        loaded = [m for m in modules if m.split(".")[0] in LAZY_MODULES]
+        assert not loaded, f"тяжёлые модули импортируются при старте: {loaded}"
+
+    bot_self_ms = min(
+        sum(self_us for name, (self_us, _) in modules.items() if name.startswith("bot.")) / 1000
+        for modules in runs
+    )
+    total_ms = min(
+        sum(cumulative for name, (_, cumulative) in modules.items() if name in TARGET_MODULES) / 1000
+        for modules in runs
+    )
+    assert bot_self_ms <= BOT_SELF_BUDGET_MS * scale, f"модули bot.*: {bot_self_ms:.0f} мс"
+    assert total_ms <= TOTAL_BUDGET_MS * scale, f"импорт сервисного слоя: {total_ms:.0f} мс"
@@ -231,8 +231,8 @@ async def test_recover_all_peers_syncs_profiles(
     ok, fail = await VPNService.recover_all_peers(db_connection)
     assert ok == 2
     assert fail == 0
-    # 2 awg set calls + 1 awg-quick save = 3 subprocess calls
-    assert mock_create.await_count == 3
+    # 1 batched awg set + 1 awg-quick save = 2 subprocess calls
+    assert mock_create.await_count == 2
 
 
 @pytest.mark.asyncio
@@ -161,3 +161,94 @@ async def test_access_passes_approved_user(
     result = await middleware(handler, msg, data)
     assert result == "ok"
     handler.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_access_unwraps_update_event(
+    db_connection: aiosqlite.Connection,
+    mock_message: Any,
+) -> None:
+    """На dp.update приходит Update — проверка идёт по вложенному сообщению."""
+    from aiogram.types import Update
+
+    middleware = AccessControlMiddleware()
+    handler = AsyncMock()
+    msg = mock_message(42005, "hello")
+    update = MagicMock(spec=Update)
+    update.event = msg
+    data: dict[str, Any] = {"db": db_connection, "state": None}
+
+    result = await middleware(handler, update, data)
+    assert result is None
+    handler.assert_not_awaited()
+    msg.answer.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_access_cached_approval_skips_db_and_fsm(mock_message: Any) -> None:
+    """Закэшированный одобренный пользователь не трогает ни БД, ни FSM."""
+    from bot.middlewares.access_middleware import ApprovalCache
+
+    cache = ApprovalCache()
+    await cache.set(42006, True)
+    middleware = AccessControlMiddleware(cache=cache)
+    handler = AsyncMock(return_value="ok")
+    db = MagicMock(spec=aiosqlite.Connection)
+    state = AsyncMock()
+    data: dict[str, Any] = {"db": db, "state": state}
+
+    result = await middleware(handler, mock_message(42006, "hello"), data)
+    assert result == "ok"
+    db.execute.assert_not_called()
+    state.get_state.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_access_caches_db_result_and_invalidates(
+    db_connection: aiosqlite.Connection,
+    mock_message: Any,
+) -> None:
+    """Результат из БД кэшируется; после invalidate статус перечитывается."""
+    from bot.db import repository
+    from bot.middlewares.access_middleware import ApprovalCache
+
+    user_id = 42007
+    await repository.create_user(db_connection, user_id, "u", "U")
+    cache = ApprovalCache()
+    middleware = AccessControlMiddleware(cache=cache)
+    handler = AsyncMock(return_value="ok")
+    data: dict[str, Any] = {"db": db_connection, "state": None}
+
+    assert await middleware(handler, mock_message(user_id, "hi"), data) is None
+    assert await cache.get(user_id) is False
+
+    await repository.set_user_approved(db_connection, user_id, True)
+    # Пока кэш не сброшен — отказ без обращения к БД
+    assert await middleware(handler, mock_message(user_id, "hi"), data) is None
+
+    await cache.invalidate(user_id)
+    assert await middleware(handler, mock_message(user_id, "hi"), data) == "ok"
+    assert await cache.get(user_id) is True
+
+
+@pytest.mark.asyncio
+async def test_approval_cache_ttl_expiry() -> None:
+    from bot.middlewares.access_middleware import ApprovalCache
+
+    cache = ApprovalCache(ttl=0)
+    await cache.set(1, True)
+    assert await cache.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_approval_cache_shared_between_replicas() -> None:
+    """Кэш лежит в StateStore: сброс на одной реплике виден другой."""
+    from bot.core.state_store import MemoryStateStore
+    from bot.middlewares.access_middleware import ApprovalCache
+
+    store = MemoryStateStore()
+    replica_a, replica_b = ApprovalCache(store=store), ApprovalCache(store=store)
+    await replica_a.set(1, True)
+    assert await replica_b.get(1) is True
+    await replica_b.invalidate(1)
+    assert await replica_a.get(1) is None
@@ -151,7 +151,7 @@ async def test_create_profile_is_atomic_and_encrypts_keys(
         key_counter += 1
         return (f"private_{key_counter}", f"public_{key_counter}")
 
-    async def fake_sync(_cls: type[VPNService], _public_key: str, _ipv4: str) -> bool:
+    async def fake_sync(_cls: type[VPNService], _public_key: str, _ipv4: str, node=None, ipv6=None) -> bool:
         return True
 
     monkeypatch.setattr(VPNService, "generate_keys", classmethod(fake_generate_keys))
@@ -209,7 +209,7 @@ async def test_create_profile_raises_when_sync_fails(
     async def fake_generate_keys(_cls):
         return ("private_key_test", "public_key_test")
 
-    async def fake_sync_fail(_cls, _pk, _ip):
+    async def fake_sync_fail(_cls, _pk, _ip, node=None, ipv6=None):
         return False
 
     monkeypatch.setattr(VPNService, "generate_keys", classmethod(fake_generate_keys))
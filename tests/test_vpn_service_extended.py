@@ -1,3 +1,4 @@
+import asyncio
 from pathlib import Path
 from unittest.mock import AsyncMock
 
@@ -7,6 +8,7 @@ import pytest
 import bot.services.vpn_service as vpn_service_module
 from bot.core.config import settings
 from bot.services.vpn_service import VPNService
+from bot.services.wg_dump import PeerRecord, PeerSnapshot
 
 
 # ============================================================================
@@ -139,16 +141,20 @@ async def test_peers_stats_parses_dump(
     """Correctly parses wg show dump output."""
     monkeypatch.setattr(vpn_service_module.shutil, "which", lambda _binary: "/usr/bin/wg")
 
-    # wg show dump format: pubkey preshared endpoint allowed_ips latest_handshake rx tx keepalive
-    # Code reads parts[6]=rx, parts[7]=tx so we need at least 8 tab-separated fields
-    # with numeric values at indices 6 and 7.
+    # wg show <interface> dump: строка интерфейса, затем пиры —
+    # pubkey preshared endpoint allowed_ips latest_handshake rx tx keepalive
     dump_output = (
-        "private_key\tpublic_key\tlisten_port\tfwmark\n"
-        "peer_pub_1\tpreshared\tendpoint\tallowed_ips\tlatest_handshake\thandshake_time\t1000\t2000\tpersistent\n"
-        "peer_pub_2\tpreshared\tendpoint\tallowed_ips\tlatest_handshake\thandshake_time\t3000\t4000\tpersistent\n"
+        "private_key\tpublic_key\tlisten_port\toff\n"
+        "peer_pub_1\t(none)\t1.2.3.4:5\t10.0.0.2/32\t1700000000\t1000\t2000\toff\n"
+        "peer_pub_2\t(none)\t(none)\t10.0.0.3/32\t0\t3000\t4000\t25\n"
     )
+    stdout = asyncio.StreamReader()
+    stdout.feed_data(dump_output.encode())
+    stdout.feed_eof()
+    stderr = asyncio.StreamReader()
+    stderr.feed_eof()
     mock_process = AsyncMock()
-    mock_process.communicate.return_value = (dump_output.encode(), b"")
+    mock_process.stdout, mock_process.stderr = stdout, stderr
     mock_process.returncode = 0
     monkeypatch.setattr(
         vpn_service_module.asyncio, "create_subprocess_exec", AsyncMock(return_value=mock_process)
@@ -192,11 +198,8 @@ async def test_monthly_usage_offset(
     )
     await db_connection.commit()
 
-    monkeypatch.setattr(
-        VPNService,
-        "get_all_peers_stats",
-        AsyncMock(return_value={"test_pub_key": {"rx": 500, "tx": 1000, "total": 1500}}),
-    )
+    snapshot = PeerSnapshot.from_records([PeerRecord("test_pub_key", None, "", 0, 500, 1000)])
+    monkeypatch.setattr(VPNService, "peer_snapshot", AsyncMock(return_value=snapshot))
 
     result = await VPNService.get_monthly_usage(db_connection, user_id)
     assert len(result) == 1
@@ -218,11 +221,8 @@ async def test_monthly_usage_offset_exceeds(
     )
     await db_connection.commit()
 
-    monkeypatch.setattr(
-        VPNService,
-        "get_all_peers_stats",
-        AsyncMock(return_value={"test_pub_key_2": {"rx": 500, "tx": 1000, "total": 1500}}),
-    )
+    snapshot = PeerSnapshot.from_records([PeerRecord("test_pub_key_2", None, "", 0, 500, 1000)])
+    monkeypatch.setattr(VPNService, "peer_snapshot", AsyncMock(return_value=snapshot))
 
     result = await VPNService.get_monthly_usage(db_connection, user_id)
     assert len(result) == 1
@@ -0,0 +1,89 @@
+"""Тесты выгрузки конфигов: страницы профилей, ZIP-части по размеру, QR, битые ключи."""
+import zipfile
+
+import pytest
+
+from bot.core.config import settings
+from bot.services import config_export
+from bot.services.config_export import ZipParts, export_configs
+from bot.services.vpn_service import VPNService
+
+
+@pytest.fixture
+async def profiles(db_connection, test_settings) -> list[int]:
+    """Пять профилей двух пользователей; у третьего ключ не расшифровывается."""
+    await db_connection.execute("INSERT INTO users (telegram_id, username) VALUES (1, 'alice'), (2, NULL)")
+    rows = []
+    for i in range(5):
+        key = "garbage" if i == 2 else VPNService.encrypt_data(f"priv{i}")
+        rows.append((1 + i % 2, f"phone {i}", key, f"pub{i}", f"10.0.0.{i + 2}"))
+    await db_connection.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    await db_connection.commit()
+    return [1, 2, 3, 4, 5]
+
+
+async def test_export_pages_into_one_archive(db_connection, profiles, tmp_path):
+    report = await export_configs(db_connection, tmp_path, chunk_size=2, workers=2)
+
+    assert (report.profiles, report.failed) == (4, [3])
+    [part] = report.parts
+    with zipfile.ZipFile(part) as archive:
+        assert archive.namelist() == [
+            "1_alice/1_phone_0.conf", "2/2_phone_1.conf", "2/4_phone_3.conf", "1_alice/5_phone_4.conf",
+        ]
+        config = archive.read("2/4_phone_3.conf")
+    assert config == VPNService.render_config("priv3", "10.0.0.5")
+    assert "3" in report.render()
+
+
+async def test_export_with_qr_and_node_filter(db_connection, profiles, tmp_path):
+    report = await export_configs(db_connection, tmp_path, qr=True, node_id=1)
+
+    with zipfile.ZipFile(report.parts[0]) as archive:
+        names = archive.namelist()
+        png = archive.getinfo("1_alice/1_phone_0.png")
+        assert archive.read(png).startswith(b"\x89PNG")
+    assert png.compress_type == zipfile.ZIP_STORED
+    assert len(names) == 8
+
+    assert (await export_configs(db_connection, tmp_path, node_id=99)).parts == []
+
+
+async def test_export_splits_parts_by_size(db_connection, profiles, tmp_path):
+    report = await export_configs(db_connection, tmp_path, part_bytes=900)
+
+    assert len(report.parts) > 1
+    names = []
+    for part in report.parts:
+        assert part.stat().st_size <= 900
+        with zipfile.ZipFile(part) as archive:
+            assert archive.testzip() is None
+            names += archive.namelist()
+    assert len(names) == 4
+
+
+def test_zip_parts_keep_profile_entries_together(tmp_path):
+    parts = ZipParts(tmp_path, "t", part_bytes=600)
+    parts.write_profile([("a.conf", b"x" * 100, zipfile.ZIP_STORED), ("a.png", b"y" * 100, zipfile.ZIP_STORED)])
+    parts.write_profile([("b.conf", b"x" * 100, zipfile.ZIP_STORED), ("b.png", b"y" * 100, zipfile.ZIP_STORED)])
+    # Больше лимита целиком — всё равно пишется в свою (пустую) часть
+    parts.write_profile([("c.conf", b"z" * 1000, zipfile.ZIP_STORED)])
+    parts.close()
+
+    contents = [zipfile.ZipFile(path).namelist() for path in parts.paths]
+    assert contents == [["a.conf", "a.png"], ["b.conf", "b.png"], ["c.conf"]]
+
+
+async def test_export_command_args(db_connection, test_settings, monkeypatch: pytest.MonkeyPatch):
+    from bot.handlers.admin.export import parse_args
+
+    await VPNService.load_nodes(db_connection)
+    assert parse_args(["QR", "amnezia", "default"]) == {"fmt": "amnezia", "qr": True, "node_id": 1}
+    assert parse_args([]) == {"fmt": "awg", "qr": False, "node_id": None}
+    with pytest.raises(ValueError):
+        parse_args(["edge"])
+    assert settings.export_part_mb * 2**20 < 50 * 2**20
+    assert not config_export.running()
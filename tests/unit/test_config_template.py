@@ -0,0 +1,99 @@
+"""Тесты шаблонов конфигов: побайтно тот же .conf, форматы wg/amnezia, кэш шаблонов."""
+import json
+
+import pytest
+
+from bot.core.config import settings
+from bot.db import repository
+from bot.services.config_template import (
+    FORMAT_AMNEZIA,
+    FORMAT_AWG,
+    FORMAT_WG,
+    compile_template,
+    extra_formats,
+)
+from bot.services.nodes import VPNNode
+from bot.services.vpn_service import VPNService
+
+
+@pytest.fixture
+def node(test_settings) -> VPNNode:
+    return VPNNode.from_settings()
+
+
+def expected_conf(private_key: str, ipv4: str, node: VPNNode) -> str:
+    lines = [
+        "[Interface]",
+        f"PrivateKey = {private_key}",
+        f"Address = {ipv4}/32",
+        f"DNS = {settings.dns_servers}",
+        f"Jc = {settings.jc}", f"Jmin = {settings.jmin}", f"Jmax = {settings.jmax}",
+        f"S1 = {settings.s1}", f"S2 = {settings.s2}",
+    ]
+    lines += [f"{name} = {value}" for name, value in (("S3", settings.s3), ("S4", settings.s4), ("I1", settings.i1)) if value]
+    lines += [
+        f"H1 = {settings.h1}", f"H2 = {settings.h2}", f"H3 = {settings.h3}", f"H4 = {settings.h4}",
+        "",
+        "[Peer]",
+        f"PublicKey = {node.public_key}",
+        f"Endpoint = {node.endpoint}",
+        "AllowedIPs = 0.0.0.0/0",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.mark.parametrize("s3", [0, 42])
+def test_awg_render_matches_legacy_config(node, monkeypatch: pytest.MonkeyPatch, s3):
+    monkeypatch.setattr(settings, "s3", s3, raising=False)
+    template = compile_template(node, FORMAT_AWG)
+    rendered = template.render("cHJpdg==", "10.0.0.7")
+    assert rendered == expected_conf("cHJpdg==", "10.0.0.7", node).encode()
+    assert template.extension == ".conf"
+
+
+def test_dual_stack_and_wg_format(node):
+    awg = compile_template(node, FORMAT_AWG).render("k", "10.0.0.7", "fd42::7").decode()
+    assert "Address = 10.0.0.7/32, fd42::7/128\n" in awg
+    assert awg.endswith("AllowedIPs = 0.0.0.0/0, ::/0\n")
+
+    wg = compile_template(node, FORMAT_WG).render("k", "10.0.0.7").decode()
+    assert "Jc =" not in wg and "H1 =" not in wg
+    assert wg.startswith("[Interface]\nPrivateKey = k\nAddress = 10.0.0.7/32\n")
+
+
+def test_amnezia_json(node):
+    template = compile_template(node, FORMAT_AMNEZIA)
+    document = json.loads(template.render("cHJpdg==", "10.0.0.7", "fd42::7"))
+
+    assert template.extension == ".json"
+    [container] = document["containers"]
+    assert container["container"] == document["defaultContainer"] == "amnezia-awg"
+    last_config = json.loads(container["awg"]["last_config"])
+    assert last_config["client_ip"] == "10.0.0.7"
+    assert last_config["client_priv_key"] == "cHJpdg=="
+    assert last_config["server_pub_key"] == node.public_key
+    assert "Address = 10.0.0.7/32, fd42::7/128" in last_config["config"]
+
+
+def test_unknown_format_and_extra_formats(node, monkeypatch: pytest.MonkeyPatch):
+    with pytest.raises(ValueError):
+        compile_template(node, "ovpn")
+    monkeypatch.setattr(settings, "config_formats", " Amnezia, ovpn, awg, wg, amnezia", raising=False)
+    assert extra_formats() == (FORMAT_AMNEZIA, FORMAT_WG)
+
+
+async def test_templates_cached_per_interface_until_reload(db_connection, test_settings):
+    await repository.insert_ip_pool(
+        db_connection, 1, "10.1.0.0/24", interface="awg1",
+        endpoint="198.51.100.10:51821", public_key="awg1_pub",
+    )
+    node = (await VPNService.load_nodes(db_connection))[0]
+
+    assert VPNService.compile_templates((FORMAT_AWG, FORMAT_WG)) == 4
+    template = VPNService.config_template(node)
+    assert VPNService.config_template(node) is template
+    view = node.for_interface("awg1")
+    assert b"PublicKey = awg1_pub" in VPNService.render_config("k", "10.1.0.2", view)
+
+    await VPNService.load_nodes(db_connection)
+    assert VPNService.config_template(node) is not template
@@ -54,3 +54,14 @@ async def test_init_db_sets_schema_version(tmp_path: Path) -> None:
         row = await cursor.fetchone()
         version = row[0] if row else 0
     assert version >= 1
+
+
+@pytest.mark.asyncio
+async def test_init_db_uses_given_connection(tmp_path: Path) -> None:
+    db_path = str(tmp_path / "shared.db")
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        await init_db(db_path, db)
+        # Соединение остаётся открытым и видит схему
+        cursor = await db.execute("SELECT name FROM sqlite_master WHERE name = 'users'")
+        assert await cursor.fetchone() is not None
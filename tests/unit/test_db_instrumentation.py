@@ -0,0 +1,118 @@
+"""Тесты инструментирования SQL-запросов (InstrumentedConnection, QueryStats)."""
+from unittest.mock import AsyncMock
+
+import aiosqlite
+import pytest
+
+from bot.db import repository
+from bot.db.instrumentation import InstrumentedConnection, QueryStats, instrument, normalize_sql
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM users WHERE id = 42 AND name = 'x''y'") == (
+        "SELECT * FROM users WHERE id = ? AND name = ?"
+    )
+    assert normalize_sql("DELETE FROM t WHERE id IN (?, ?, ?)") == "DELETE FROM t WHERE id IN (?...)"
+    assert normalize_sql("SELECT * FROM m001_table") == "SELECT * FROM m001_table"
+
+
+def test_query_stats_top_is_ordered_by_max():
+    stats = QueryStats()
+    stats.record("SELECT a", 0.001, 1)
+    stats.record("SELECT b", 0.050, 0)
+    stats.add_fetch("SELECT b", 0.010, 3)
+    stats.record("SELECT b", 0.002, 0)
+
+    top = stats.top()
+    assert [r["sql"] for r in top] == ["SELECT b", "SELECT a"]
+    assert top[0]["count"] == 2
+    assert top[0]["rows"] == 3
+    assert top[0]["max_ms"] == pytest.approx(50)
+    assert top[0]["avg_ms"] == pytest.approx(31)
+
+
+def test_query_stats_is_bounded():
+    stats = QueryStats(max_statements=2)
+    for sql in ("a", "b", "c"):
+        stats.record(sql, 0.001)
+    assert {r["sql"] for r in stats.top()} == {"a", "b"}
+
+
+@pytest.mark.asyncio
+async def test_repository_queries_are_recorded(db_connection: aiosqlite.Connection) -> None:
+    stats = QueryStats()
+    db = instrument(db_connection, slow_ms=10_000, stats=stats)
+
+    await repository.create_user(db, 1, "u1", "User 1")
+    await repository.create_user(db, 2, "u2", "User 2")
+    rows, total = await repository.get_users_page(db, 0, 10)
+
+    assert total == 2 and len(rows) == 2
+    by_sql = {r["sql"]: r for r in stats.top(50)}
+    insert = next(r for sql, r in by_sql.items() if sql.startswith("INSERT OR IGNORE INTO users"))
+    assert insert["count"] == 2
+    assert insert["rows"] == 2
+    page = next(r for sql, r in by_sql.items() if "ORDER BY registered_at" in sql)
+    assert page["rows"] == 2
+    assert by_sql["COMMIT"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_async_with_and_iteration(db_connection: aiosqlite.Connection) -> None:
+    stats = QueryStats()
+    db = InstrumentedConnection(db_connection, slow_ms=10_000, stats=stats)
+    await db.executemany(
+        "INSERT INTO users (telegram_id, username) VALUES (?, ?)", [(1, "a"), (2, "b"), (3, "c")],
+    )
+
+    async with db.execute("SELECT telegram_id FROM users ORDER BY telegram_id") as cursor:
+        ids = [row["telegram_id"] async for row in cursor]
+
+    assert ids == [1, 2, 3]
+    (select,) = [r for r in stats.top() if r["sql"].startswith("SELECT")]
+    assert select["rows"] == 3
+
+
+@pytest.mark.asyncio
+async def test_slow_query_gets_plan_and_log(db_connection: aiosqlite.Connection) -> None:
+    from loguru import logger
+
+    stats = QueryStats()
+    db = InstrumentedConnection(db_connection, slow_ms=0, explain=True, stats=stats)
+    messages: list[str] = []
+    sink_id = logger.add(lambda m: messages.append(m.record["message"]), level="WARNING")
+    try:
+        cursor = await db.execute("SELECT * FROM users WHERE telegram_id = ?", (5,))
+        assert await cursor.fetchone() is None
+    finally:
+        logger.remove(sink_id)
+
+    (row,) = stats.top()
+    assert row["slow"] == 1
+    assert row["plan"] and "users" in row["plan"]
+    assert any(m.startswith("[DB] Медленный запрос") for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_proxy_passes_through(db_connection: aiosqlite.Connection) -> None:
+    db = InstrumentedConnection(db_connection, stats=QueryStats())
+    assert db.row_factory is aiosqlite.Row
+    assert db.connection is db_connection
+    assert db.in_transaction is False
+
+
+@pytest.mark.asyncio
+async def test_cmd_slow_queries_renders_table() -> None:
+    from bot.db.instrumentation import query_stats
+    from bot.handlers.admin.diagnostics import cmd_slow_queries
+
+    query_stats.record("SELECT * FROM users WHERE telegram_id = ?", 0.250, 1)
+    query_stats.mark_slow("SELECT * FROM users WHERE telegram_id = ?", "SEARCH users USING INDEX")
+    message = AsyncMock()
+
+    await cmd_slow_queries(message)
+
+    text = message.answer.await_args.args[0]
+    assert "<code>SELECT * FROM users WHERE telegram_id = ?</code>" in text
+    assert "250.0 мс" in text
+    assert "SEARCH users USING INDEX" in text
@@ -0,0 +1,44 @@
+"""Тесты записи через общее соединение: write_lock и transaction()."""
+import asyncio
+
+import aiosqlite
+import pytest
+
+from bot.db import repository
+from bot.db.instrumentation import instrument
+from bot.db.transaction import transaction, write_lock
+
+
+@pytest.mark.asyncio
+async def test_write_waits_for_open_transaction(db_connection: aiosqlite.Connection) -> None:
+    """Запись другой корутины не попадает в чужую транзакцию и не откатывается с ней."""
+    inside = asyncio.Event()
+
+    async def failing_transaction() -> None:
+        async with transaction(db_connection):
+            await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+            inside.set()
+            await asyncio.sleep(0.01)  # create_user ждёт блокировку
+            raise RuntimeError("boom")
+
+    task = asyncio.create_task(failing_transaction())
+    await inside.wait()
+    await repository.create_user(db_connection, 2, "u2", "User 2")
+    with pytest.raises(RuntimeError):
+        await task
+
+    assert await repository.get_user(db_connection, 1) is None
+    assert await repository.get_user(db_connection, 2) is not None
+
+
+@pytest.mark.asyncio
+async def test_transaction_commits(db_connection: aiosqlite.Connection) -> None:
+    async with transaction(db_connection):
+        await db_connection.execute("INSERT INTO users (telegram_id) VALUES (3)")
+    assert not db_connection.in_transaction
+    assert await repository.get_user(db_connection, 3) is not None
+
+
+@pytest.mark.asyncio
+async def test_instrumented_connection_shares_lock(db_connection: aiosqlite.Connection) -> None:
+    assert write_lock(instrument(db_connection)) is write_lock(db_connection)
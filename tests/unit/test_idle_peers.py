@@ -0,0 +1,186 @@
+"""Тесты сборщика неактивных пиров (bot.services.idle_peers)."""
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from bot.db import repository
+from bot.services.idle_peers import IdlePeerCollector
+from bot.services.nodes import address_pool_size
+from bot.services.reconciler import PeerReconciler
+from bot.services.vpn_service import VPNService
+from bot.services.wg_dump import PeerRecord
+
+DAY = 86400
+
+
+async def add_profile(db, key: str, ipv4: str, created_days_ago: int = 60) -> int:
+    await db.execute("INSERT OR IGNORE INTO users (telegram_id) VALUES (1)")
+    cursor = await db.execute(
+        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address, created_at) "
+        "VALUES (1, ?, ?, ?, ?, datetime('now', ?))",
+        (key, VPNService.encrypt_data("k"), key, ipv4, f"-{created_days_ago} days"),
+    )
+    await db.commit()
+    return int(cursor.lastrowid)
+
+
+def dump(*peers: tuple[str, int]) -> list[PeerRecord]:
+    return [PeerRecord(key, None, "", handshake, 0, 0) for key, handshake in peers]
+
+
+@pytest.fixture
+def now() -> float:
+    return time.time()
+
+
+async def test_detaches_idle_peers_and_keeps_rows(db_connection, now):
+    await add_profile(db_connection, "active", "10.0.0.2")
+    idle_id = await add_profile(db_connection, "idle", "10.0.0.3")
+    await add_profile(db_connection, "fresh", "10.0.0.4", created_days_ago=1)
+    peers = dump(("active", int(now) - 60), ("idle", 0), ("fresh", 0))
+
+    with patch.object(VPNService, "dump_peers", AsyncMock(return_value=peers)), \
+         patch.object(VPNService, "apply_peer_changes", AsyncMock(return_value=(1, 0))) as apply:
+        report = await IdlePeerCollector(30 * DAY).run(db_connection)
+
+    apply.assert_awaited_once_with({}, ["idle"], node=VPNService.node(1))
+    assert report is not None and (report.idle, report.detached) == (1, 1)
+    assert report.on_interface == 2
+    assert report.profiles == 3 and report.detached_total == 1
+
+    cursor = await db_connection.execute("SELECT detached_at FROM vpn_profiles WHERE id = ?", (idle_id,))
+    assert int(now) <= (await cursor.fetchone())["detached_at"] <= time.time()
+    # Сверка больше не считает снятый пир нужным на интерфейсе
+    active = {row["public_key"] for row in await repository.get_all_active_profiles(db_connection)}
+    assert active == {"active", "fresh"}
+
+
+async def test_unread_node_is_not_detached(db_connection):
+    """Дамп узла не получен — его профили не снимаются: рукопожатия в БД устарели."""
+    await repository.insert_vpn_node(
+        db_connection, "edge", interface="awg1", container="", ssh_host="root@edge",
+        endpoint="203.0.113.5:51820", public_key="edge_pub", ip_range="10.0.0.0/29",
+    )
+    await VPNService.load_nodes(db_connection)
+    await add_profile(db_connection, "idle", "10.0.0.3")
+    edge_id = await add_profile(db_connection, "edge", "10.0.0.4")
+    await db_connection.execute("UPDATE vpn_profiles SET node_id = 2 WHERE id = ?", (edge_id,))
+    await db_connection.commit()
+
+    async def dump_peers(node):
+        return dump(("idle", 0)) if node.id == 1 else None  # edge недоступен
+
+    with patch.object(VPNService, "dump_peers", AsyncMock(side_effect=dump_peers)), \
+         patch.object(VPNService, "apply_peer_changes", AsyncMock(return_value=(1, 0))) as apply:
+        report = await IdlePeerCollector(30 * DAY).run(db_connection)
+
+    apply.assert_awaited_once_with({}, ["idle"], node=VPNService.node(1))
+    assert report is not None and (report.idle, report.detached) == (2, 1)
+    active = {row["public_key"] for row in await repository.get_all_active_profiles(db_connection)}
+    assert active == {"edge"}
+
+
+async def test_record_handshakes_uses_public_key_index(db_connection, monkeypatch: pytest.MonkeyPatch):
+    """UPDATE по public_key идёт по частичному индексу m001, а не сканом таблицы на каждый пир."""
+    statements: list[str] = []
+    executemany = db_connection.executemany
+
+    async def spy(sql, parameters):
+        statements.append(sql)
+        return await executemany(sql, parameters)
+
+    monkeypatch.setattr(db_connection, "executemany", spy)
+    await repository.record_handshakes(db_connection, {"phone": 1})
+
+    [sql] = statements
+    cursor = await db_connection.execute(f"EXPLAIN QUERY PLAN {sql}", (1, "phone", 1))
+    plan = " ".join(row[-1] for row in await cursor.fetchall())
+    assert "USING INDEX idx_vpn_profiles_public_key_unique" in plan
+
+
+async def test_handshakes_survive_interface_restart(db_connection, now):
+    """После рестарта AWG рукопожатия на интерфейсе нулевые — решает сохранённое в БД."""
+    await add_profile(db_connection, "phone", "10.0.0.2")
+    collector = IdlePeerCollector(30 * DAY)
+
+    before = dump(("phone", int(now) - 5 * DAY))
+    after_restart = dump(("phone", 0))
+    with patch.object(VPNService, "apply_peer_changes", AsyncMock(return_value=(0, 0))) as apply:
+        with patch.object(VPNService, "dump_peers", AsyncMock(return_value=before)):
+            await collector.run(db_connection)
+        with patch.object(VPNService, "dump_peers", AsyncMock(return_value=after_restart)):
+            report = await collector.run(db_connection)
+
+    assert report is not None and report.idle == 0
+    apply.assert_not_awaited()
+
+
+async def test_dry_run_changes_nothing(db_connection, now):
+    await add_profile(db_connection, "idle", "10.0.0.3")
+    peers = dump(("idle", 0))
+
+    with patch.object(VPNService, "dump_peers", AsyncMock(return_value=peers)), \
+         patch.object(VPNService, "apply_peer_changes", AsyncMock()) as apply:
+        report = await IdlePeerCollector(30 * DAY).run(db_connection, dry_run=True)
+
+    assert report is not None and report.idle == 1 and report.detached_total == 0
+    assert "/idle run" in report.render()
+    apply.assert_not_awaited()
+
+
+async def test_reattached_during_run_is_not_removed(db_connection, now, monkeypatch: pytest.MonkeyPatch):
+    """Профиль, подключённый обратно после выборки, не помечается и не снимается."""
+    profile_id = await add_profile(db_connection, "idle", "10.0.0.3")
+    peers = dump(("idle", 0))
+    select = repository.get_idle_profiles
+
+    async def select_then_attach(db, cutoff, limit):
+        rows = await select(db, cutoff, limit)
+        await repository.mark_attached(db, profile_id, int(now))  # скачан конфиг
+        return rows
+
+    monkeypatch.setattr(repository, "get_idle_profiles", select_then_attach)
+    with patch.object(VPNService, "dump_peers", AsyncMock(return_value=peers)), \
+         patch.object(VPNService, "apply_peer_changes", AsyncMock()) as apply:
+        report = await IdlePeerCollector(30 * DAY).run(db_connection)
+
+    assert report is not None and (report.idle, report.detached) == (1, 0)
+    assert report.detached_total == 0
+    apply.assert_not_awaited()
+
+
+async def test_config_download_reattaches(db_connection, now, monkeypatch: pytest.MonkeyPatch):
+    profile_id = await add_profile(db_connection, "idle", "10.0.0.3")
+    await repository.mark_detached(db_connection, [profile_id], int(now) - DAY, int(now))
+    sync = AsyncMock(return_value=True)
+    monkeypatch.setattr(VPNService, "sync_peer_with_server", sync)
+
+    config = await VPNService.get_profile_config(db_connection, profile_id)
+
+    assert config is not None
+    sync.assert_awaited_once_with("idle", "10.0.0.3", node=VPNService.node(), ipv6=None)
+    cursor = await db_connection.execute(
+        "SELECT detached_at, last_handshake_at FROM vpn_profiles WHERE id = ?", (profile_id,),
+    )
+    row = await cursor.fetchone()
+    assert row["detached_at"] is None
+    assert row["last_handshake_at"] >= int(now)  # не снимется снова на следующем проходе
+
+
+async def test_reconciler_removes_detached_peer_left_on_interface(db_connection, now):
+    """Если снять пир не удалось, его уберёт сверка: в желаемом состоянии его нет."""
+    profile_id = await add_profile(db_connection, "idle", "10.0.0.3")
+    await add_profile(db_connection, "active", "10.0.0.2")
+    await repository.mark_detached(db_connection, [profile_id], int(now), int(now))
+    live = {"idle": "10.0.0.3/32", "active": "10.0.0.2/32"}
+
+    with patch.object(VPNService, "get_interface_peers", AsyncMock(return_value=live)):
+        result = await PeerReconciler().run(db_connection, dry_run=True)
+
+    assert result is not None and result.plan.remove == ["idle"]
+
+
+def test_address_pool_size():
+    assert address_pool_size("10.0.0.0/29") == 5
+    assert address_pool_size("10.8.0.0/24") == 253
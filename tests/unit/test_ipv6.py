@@ -0,0 +1,126 @@
+"""Тесты dual-stack: выдача IPv6 без перебора хостов, конфиг и allowed-ips с обоими адресами."""
+from unittest.mock import AsyncMock
+
+import aiosqlite
+import pytest
+
+from bot.core.config import settings
+from bot.services.nodes import next_ipv6, peer_allowed_ips
+from bot.services.reconciler import PeerReconciler
+from bot.services.vpn_service import VPNService
+from bot.services.wg_dump import PeerRecord, normalize_allowed_ips
+from tests.unit.test_nodes import FakeExecutor
+
+
+@pytest.fixture
+async def awg(db_connection, monkeypatch: pytest.MonkeyPatch) -> FakeExecutor:
+    """Узел по умолчанию с префиксом fd42::/64 и фейковым awg."""
+    monkeypatch.setattr(settings, "vpn_ipv6_range", "fd42::/64", raising=False)
+    monkeypatch.setattr("bot.services.vpn_service.shutil.which", lambda name: f"/usr/bin/{name}")
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.commit()
+    executor = FakeExecutor()
+    VPNService.set_executor(1, executor)
+    return executor
+
+
+def test_next_ipv6_follows_highest_offset():
+    assert next_ipv6("fd42::/64", []) == "fd42::2"
+    assert next_ipv6("fd42::/64", ["fd42::2", "fd42::7", "bogus", "fd43::9"]) == "fd42::8"
+
+
+def test_next_ipv6_fills_gaps_when_prefix_end_reached():
+    # /125: смещения 2..7; конец занят — первый пропуск
+    assert next_ipv6("fd42::/125", ["fd42::2", "fd42::3", "fd42::5", "fd42::7"]) == "fd42::4"
+    assert next_ipv6("fd42::/125", [f"fd42::{i}" for i in range(2, 8)]) is None
+
+
+def test_next_ipv6_huge_prefix_is_instant():
+    # /48 — 2^80 хостов: выдача не зависит от размера префикса
+    assert next_ipv6("fd42:1::/48", ["fd42:1::ffff:ffff"]) == "fd42:1::1:0:0"
+
+
+def test_peer_allowed_ips():
+    assert peer_allowed_ips("10.0.0.2") == "10.0.0.2/32"
+    assert peer_allowed_ips("10.0.0.2", "fd42::2") == "10.0.0.2/32,fd42::2/128"
+
+
+async def test_create_profile_dual_stack(db_connection, awg):
+    first = await VPNService.create_profile(db_connection, 1, "phone")
+    second = await VPNService.create_profile(db_connection, 1, "laptop")
+
+    assert (first["ipv4"], first["ipv6"]) == ("10.0.0.2", "fd42::2")
+    assert second["ipv6"] == "fd42::3"
+    assert "Address = 10.0.0.2/32, fd42::2/128" in first["config"]
+    assert "AllowedIPs = 0.0.0.0/0, ::/0" in first["config"]
+    assert awg.sets()[0][-2:] == ["allowed-ips", "10.0.0.2/32,fd42::2/128"]
+    cursor = await db_connection.execute("SELECT ipv6_address FROM vpn_profiles ORDER BY id")
+    assert [row["ipv6_address"] for row in await cursor.fetchall()] == ["fd42::2", "fd42::3"]
+
+
+async def test_ipv4_only_config_unchanged(db_connection, awg, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "vpn_ipv6_range", "", raising=False)
+    profile = await VPNService.create_profile(db_connection, 1, "phone")
+    assert profile["ipv6"] is None
+    assert "Address = 10.0.0.2/32\n" in profile["config"]
+    assert "AllowedIPs = 0.0.0.0/0\n" in profile["config"]
+
+
+async def test_legacy_profile_gets_ipv6_on_config_download(db_connection, awg):
+    cursor = await db_connection.execute(
+        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) VALUES (1, 'old', ?, 'k_old', '10.0.0.2')",
+        (VPNService.encrypt_data("priv_old"),),
+    )
+    await db_connection.commit()
+
+    config = await VPNService.get_profile_config(db_connection, cursor.lastrowid)
+
+    assert config is not None and config["ipv6"] == "fd42::2"
+    assert "Address = 10.0.0.2/32, fd42::2/128" in config["config"]
+    assert awg.sets()[0][3:] == ["peer", "k_old", "allowed-ips", "10.0.0.2/32,fd42::2/128"]
+    again = await VPNService.get_profile_config(db_connection, cursor.lastrowid)
+    assert again is not None and again["ipv6"] == "fd42::2" and len(awg.sets()) == 1
+
+
+async def test_legacy_profile_keeps_ipv4_when_sync_fails(db_connection, awg, monkeypatch: pytest.MonkeyPatch):
+    """Пир не принял адрес — он освобождается, конфиг остаётся IPv4."""
+    cursor = await db_connection.execute(
+        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) VALUES (1, 'old', ?, 'k_old', '10.0.0.2')",
+        (VPNService.encrypt_data("priv_old"),),
+    )
+    await db_connection.commit()
+    monkeypatch.setattr(VPNService, "sync_peer_with_server", AsyncMock(return_value=False))
+
+    config = await VPNService.get_profile_config(db_connection, cursor.lastrowid)
+
+    assert config is not None and config["ipv6"] is None
+    assert "Address = 10.0.0.2/32\n" in config["config"]
+    cursor = await db_connection.execute("SELECT ipv6_address FROM vpn_profiles")
+    assert (await cursor.fetchone())["ipv6_address"] is None
+
+
+async def test_recover_and_reconcile_with_both_addresses(db_connection, awg):
+    await db_connection.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address, ipv6_address) VALUES (1, ?, ?, ?, ?)",
+        [("a", "k1", "10.0.0.2", "fd42::2"), ("b", "k2", "10.0.0.3", None)],
+    )
+    await db_connection.commit()
+
+    assert await VPNService.recover_all_peers(db_connection) == (2, 0)
+    [call] = awg.sets()  # один пакетный awg set
+    assert call[3:] == ["peer", "k1", "allowed-ips", "10.0.0.2/32,fd42::2/128", "peer", "k2", "allowed-ips", "10.0.0.3/32"]
+
+    awg.peers = [
+        # awg может перечислить адреса в любом порядке — дамп их нормализует
+        PeerRecord("k1", None, normalize_allowed_ips("fd42::2/128,10.0.0.2/32"), 0, 0, 0),
+        PeerRecord("k2", None, "10.0.0.3/32", 0, 0, 0),
+    ]
+    plan = await PeerReconciler().plan(db_connection)
+    assert plan is not None and plan.changes == 0 and plan.unchanged == 2
+
+
+async def test_ipv6_unique_per_node(db_connection, awg):
+    insert = "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address, ipv6_address) VALUES (1, ?, ?, ?, 'fd42::2')"
+    await db_connection.execute(insert, ("a", "k1", "10.0.0.2"))
+    with pytest.raises(aiosqlite.IntegrityError):
+        await db_connection.execute(insert, ("b", "k2", "10.0.0.3"))
@@ -0,0 +1,137 @@
+"""Тесты ротации ключа шифрования: MultiFernet, перешифрование пачками, чекпоинт в configs."""
+import json
+
+import aiosqlite
+import pytest
+from cryptography.fernet import Fernet
+from pydantic import SecretStr
+
+from bot.core.config import settings
+from bot.db import repository
+from bot.services import key_rotation
+from bot.services.key_rotation import CHECKPOINT_KEY, KeyRotator
+from bot.services.vpn_service import VPNService
+
+
+def use_keys(monkeypatch: pytest.MonkeyPatch, *keys: str) -> None:
+    monkeypatch.setattr(settings, "encryption_key", SecretStr(",".join(keys)), raising=False)
+    VPNService.reset_cache()
+
+
+@pytest.fixture
+async def old_profiles(db_connection, monkeypatch: pytest.MonkeyPatch, fernet_key: str) -> str:
+    """Пять профилей под старым ключом; ENCRYPTION_KEY — новый ключ и старый."""
+    old = Fernet(fernet_key.encode())
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) VALUES (1, ?, ?, ?, ?)",
+        [(f"p{i}", old.encrypt(f"priv{i}".encode()).decode(), f"pub{i}", f"10.0.0.{i + 2}") for i in range(5)],
+    )
+    await db_connection.commit()
+    new_key = Fernet.generate_key().decode()
+    use_keys(monkeypatch, new_key, fernet_key)
+    return new_key
+
+
+async def private_keys(db) -> list[str]:
+    cursor = await db.execute("SELECT private_key FROM vpn_profiles ORDER BY id")
+    return [row["private_key"] for row in await cursor.fetchall()]
+
+
+def test_multifernet_decrypts_any_key_encrypts_with_first(test_settings, monkeypatch, fernet_key):
+    old_token = VPNService.encrypt_data("secret")
+    new_key = Fernet.generate_key().decode()
+    use_keys(monkeypatch, new_key, fernet_key)
+
+    assert VPNService.decrypt_data(old_token) == "secret"
+    assert VPNService.encryption_key_count() == 2
+    assert Fernet(new_key.encode()).decrypt(VPNService.encrypt_data("x").encode()) == b"x"
+
+    rotated = VPNService.reencrypt_data(old_token)
+    assert rotated is not None and Fernet(new_key.encode()).decrypt(rotated.encode()) == b"secret"
+    assert VPNService.reencrypt_data(rotated) is None
+
+    use_keys(monkeypatch, new_key)
+    with pytest.raises(ValueError):
+        VPNService.reencrypt_data(old_token)
+
+
+def test_invalid_key_in_list(test_settings, monkeypatch, fernet_key):
+    use_keys(monkeypatch, fernet_key, "not-a-key")
+    with pytest.raises(RuntimeError, match="ENCRYPTION_KEY"):
+        VPNService.encryption_key_id()
+
+
+async def test_rotation_in_batches_with_checkpoint(db_connection, old_profiles, monkeypatch, fernet_key):
+    events = []
+    monkeypatch.setattr(key_rotation, "audit", lambda event, **kw: events.append((event, kw)))
+    await db_connection.execute(
+        "UPDATE vpn_profiles SET private_key = ? WHERE id = 4",
+        (Fernet(old_profiles.encode()).encrypt(b"priv3").decode(),),  # уже под новым ключом
+    )
+    await db_connection.execute("UPDATE vpn_profiles SET private_key = 'gAAAAAbroken' WHERE id = 5")
+    await db_connection.commit()
+
+    report = await KeyRotator(batch_size=2, pause=0).run(db_connection)
+
+    assert (report.rotated, report.failed, report.batches, report.done) == (3, 1, 3, True)
+    new = Fernet(old_profiles.encode())
+    assert [new.decrypt(token.encode()) for token in (await private_keys(db_connection))[:4]] == [
+        b"priv0", b"priv1", b"priv2", b"priv3",
+    ]
+    value = await repository.get_config_value(db_connection, CHECKPOINT_KEY)
+    assert value is not None
+    checkpoint = json.loads(value)
+    assert checkpoint == {
+        "key_id": VPNService.encryption_key_id(), "last_id": 5,
+        "rotated": 3, "failed": 1, "batches": 3, "done": True,
+    }
+    assert events == [("KEYS_ROTATED", {"key": checkpoint["key_id"], "rotated": 3, "failed": 1})]
+
+    # Повторный запуск с тем же ключом — ничего не читает
+    again = await KeyRotator(batch_size=2, pause=0).run(db_connection)
+    assert again.rotated == 3 and len(events) == 1
+
+
+async def test_busy_batch_is_retried(db_connection, old_profiles, monkeypatch):
+    """Пачка, упавшая на занятой БД, повторяется, а не обрывает проход."""
+    monkeypatch.setattr(key_rotation, "BATCH_RETRY_DELAY", 0)
+    save = repository.set_config_value
+    busy = [aiosqlite.OperationalError("database is locked")] * 2
+
+    async def flaky_save(db, key, value):
+        if busy:
+            raise busy.pop()
+        await save(db, key, value)
+
+    monkeypatch.setattr(repository, "set_config_value", flaky_save)
+    report = await KeyRotator(batch_size=10, pause=0).run(db_connection)
+
+    assert (report.rotated, report.failed, report.done) == (5, 0, True)
+    assert all(VPNService.reencrypt_data(token) is None for token in await private_keys(db_connection))
+
+
+async def test_rotation_resumes_from_checkpoint(db_connection, old_profiles):
+    key_id = VPNService.encryption_key_id()
+    await repository.set_config_value(
+        db_connection, CHECKPOINT_KEY, json.dumps({"key_id": key_id, "last_id": 3, "rotated": 3}),
+    )
+    await db_connection.commit()
+
+    report = await KeyRotator(batch_size=10, pause=0).run(db_connection)
+
+    assert (report.rotated, report.last_id) == (5, 5)
+    tokens = await private_keys(db_connection)
+    assert VPNService.reencrypt_data(tokens[0]) is not None  # до чекпоинта не трогали
+    assert all(VPNService.reencrypt_data(token) is None for token in tokens[3:])
+
+
+async def test_new_key_restarts_pass(db_connection, old_profiles):
+    await repository.set_config_value(
+        db_connection, CHECKPOINT_KEY, json.dumps({"key_id": "stale", "last_id": 5, "done": True}),
+    )
+    await db_connection.commit()
+
+    report = await KeyRotator(batch_size=10, pause=0).run(db_connection)
+
+    assert report.rotated == 5 and report.key_id == VPNService.encryption_key_id()
@@ -0,0 +1,50 @@
+"""Тесты для bot.core.logging: фоновые sink-и и ленивое форматирование."""
+import sys
+
+import pytest
+from loguru import logger
+
+from bot.core.logging import complete_logging, log_wg_command, log_wg_result, setup_logging
+
+
+@pytest.fixture
+def restore_logger():
+    yield
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+class _Exploding(str):
+    def __str__(self) -> str:
+        raise AssertionError("аргумент отформатирован при выключенном DEBUG")
+
+
+def test_log_wg_command_lazy_when_debug_disabled(restore_logger):
+    logger.remove()
+    logger.add(lambda _: None, level="INFO")
+    log_wg_command(["awg", "show", _Exploding()])  # не форматируется
+    log_wg_result(1, "err")
+
+
+def test_log_wg_command_formats_when_debug_enabled(restore_logger):
+    messages: list[str] = []
+    logger.remove()
+    logger.add(lambda m: messages.append(m.record["message"]), level="DEBUG")
+
+    log_wg_command(["awg", "set", "awg0", "peer", "PUB"])
+    log_wg_result(1, "  boom \n")
+
+    assert messages == [
+        "[WG] Команда: awg set awg0 peer PUB",
+        "[WG] Ошибка (returncode=1): boom",
+    ]
+
+
+async def test_enqueued_file_sinks_flushed_by_complete(tmp_path, restore_logger):
+    setup_logging(log_level="INFO", log_path=str(tmp_path), background=True)
+    logger.info("[TEST] queued message")
+    logger.log("AUDIT", "TEST_EVENT | user_id=1")
+    await complete_logging()
+
+    assert "[TEST] queued message" in (tmp_path / "bot.log").read_text(encoding="utf-8")
+    assert "TEST_EVENT | user_id=1" in (tmp_path / "audit.log").read_text(encoding="utf-8")
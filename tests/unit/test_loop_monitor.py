@@ -0,0 +1,86 @@
+"""Тесты монитора лага event loop."""
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+from bot.core import metrics
+from bot.core.loop_monitor import LoopLagMonitor
+from bot.middlewares.timing_middleware import RunningHandlers
+
+
+async def test_probe_measures_blocking_lag():
+    alert = AsyncMock()
+    monitor = LoopLagMonitor(
+        interval=0.01, threshold=0.05, alert=alert,
+        running=lambda: ["user.status.handle_status (0.1s)"],
+    )
+    monitor.start()
+    await asyncio.sleep(0.03)
+    time.sleep(0.1)  # синхронная работа в цикле
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["max_ms"] >= 80
+    assert stats["stalls"] == 1
+    assert alert.await_args is not None
+    lag, handlers, suppressed = alert.await_args.args
+    assert lag >= 0.08
+    assert handlers == ["user.status.handle_status (0.1s)"]
+    assert suppressed == 0
+
+
+async def test_alerts_are_rate_limited():
+    alert = AsyncMock()
+    monitor = LoopLagMonitor(interval=1, threshold=0.1, cooldown=60, alert=alert)
+    for _ in range(3):
+        monitor.observe(0.2)
+        await asyncio.sleep(0)
+    assert alert.await_count == 1
+    assert monitor.stats()["stalls"] == 3
+
+    assert monitor._last_alert is not None
+    monitor._last_alert -= 61
+    monitor.observe(0.3)
+    await asyncio.sleep(0)
+    assert alert.await_count == 2
+    assert alert.await_args is not None
+    assert alert.await_args.args[2] == 2  # пропущенные превышения
+
+
+async def test_below_threshold_only_feeds_histogram():
+    alert = AsyncMock()
+    monitor = LoopLagMonitor(interval=1, threshold=0.1, alert=alert)
+    before = metrics.EVENT_LOOP_LAG_SECONDS._default().count
+    monitor.observe(0.01)
+    await asyncio.sleep(0)
+    assert metrics.EVENT_LOOP_LAG_SECONDS._default().count == before + 1
+    alert.assert_not_awaited()
+    assert monitor.stats()["stalls"] == 0
+
+
+async def test_alert_failure_is_logged_not_raised():
+    monitor = LoopLagMonitor(interval=1, threshold=0.1, alert=AsyncMock(side_effect=RuntimeError("blocked")))
+    monitor.observe(0.5)
+    assert monitor._alert_task is not None
+    await asyncio.gather(monitor._alert_task)
+
+
+def test_running_handlers():
+    running = RunningHandlers()
+    first = running.enter("user.menu.a")
+    second = running.enter("admin.stats.b")
+    assert [n.split(" ")[0] for n in running.names()] == ["user.menu.a", "admin.stats.b"]
+    running.exit(first)
+    running.exit(second)
+    assert running.names() == []
+
+
+async def test_cmd_perf_shows_loop_lag():
+    from bot.handlers.admin.diagnostics import cmd_perf
+
+    monitor = LoopLagMonitor(interval=1, threshold=0)
+    monitor.observe(0.02)
+    message = AsyncMock()
+    await cmd_perf(message, None, monitor)
+    assert "Лаг event loop" in message.answer.await_args.args[0]
@@ -0,0 +1,131 @@
+"""Тесты для bot.core.metrics: реестр, формат Prometheus, эндпоинт /metrics."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from bot.core import metrics
+from bot.core.metrics import Counter, Gauge, Histogram, MetricsServer, Registry
+from bot.middlewares.throttling_middleware import ThrottlingMiddleware
+from bot.services.wg_command import command_label
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    metrics.REGISTRY.reset()
+    yield
+    metrics.REGISTRY.reset()
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    counter = registry.register(Counter("t_total", "Test counter", ["kind"]))
+    gauge = registry.register(Gauge("t_gauge", "Test gauge"))
+    counter.labels(kind="a").inc()
+    counter.labels(kind="a").inc(2)
+    gauge.set(7)
+
+    text = registry.render()
+    assert "# TYPE t_total counter" in text
+    assert 't_total{kind="a"} 3' in text
+    assert "t_gauge 7" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    hist = registry.register(Histogram("t_seconds", "Test", ["cmd"], buckets=(0.1, 1.0)))
+    child = hist.labels(cmd="x")
+    for value in (0.05, 0.5, 5.0):
+        child.observe(value)
+
+    text = registry.render()
+    assert 't_seconds_bucket{cmd="x",le="0.1"} 1' in text
+    assert 't_seconds_bucket{cmd="x",le="1"} 2' in text
+    assert 't_seconds_bucket{cmd="x",le="+Inf"} 3' in text
+    assert 't_seconds_count{cmd="x"} 3' in text
+
+
+def test_labels_validated():
+    hist = Histogram("t2_seconds", "Test", ["cmd"])
+    with pytest.raises(ValueError):
+        hist.labels(other="x")
+    with pytest.raises(ValueError):
+        hist.observe(1.0)
+
+
+def test_label_values_escaped():
+    counter = Counter("t3_total", "Test", ["text"])
+    counter.labels(text='a"b\nc').inc()
+    assert 't3_total{text="a\\"b\\nc"} 1' in list(counter.render())
+
+
+async def test_db_query_latency_by_statement(db_connection):
+    from bot.db.instrumentation import InstrumentedConnection
+
+    db = InstrumentedConnection(db_connection)
+    await db.execute("select 1")
+    await db.execute("PRAGMA user_version")
+    await db.commit()
+
+    assert metrics.DB_QUERY_SECONDS.labels(query="SELECT").count == 1
+    assert metrics.DB_QUERY_SECONDS.labels(query="OTHER").count == 1
+    assert metrics.DB_QUERY_SECONDS.labels(query="COMMIT").count == 1
+
+
+async def test_collector_errors_do_not_break_render():
+    registry = Registry()
+    gauge = registry.register(Gauge("t_peers", "Test"))
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def ok():
+        gauge.set(3)
+
+    registry.add_collector(broken)
+    registry.add_collector(ok)
+    await registry.collect()
+    assert "t_peers 3" in registry.render()
+
+
+def test_command_label_strips_docker_and_args():
+    assert command_label(["docker", "exec", "-i", "amneziawg", "awg", "pubkey"]) == "awg pubkey"
+    assert command_label(["/usr/bin/awg", "set", "awg0", "peer", "KEY"]) == "awg set"
+    assert command_label(["awg-quick", "save", "awg0"]) == "awg-quick save"
+
+
+async def test_throttling_rejection_counted():
+    middleware = ThrottlingMiddleware(rate=0.01, burst=1.0)
+    handler = AsyncMock(return_value="ok")
+    user = MagicMock()
+    user.id = 1
+    await middleware(handler, MagicMock(), {"event_from_user": user})
+    await middleware(handler, MagicMock(), {"event_from_user": user})
+
+    child = metrics.MIDDLEWARE_REJECTIONS.labels(middleware="throttling", reason="rate_limited")
+    assert child.value == 1
+
+
+async def _http_get(port: int, path: str) -> tuple[str, str]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    raw = (await reader.read()).decode()
+    writer.close()
+    head, _, body = raw.partition("\r\n\r\n")
+    return head.split("\r\n", 1)[0], body
+
+
+async def test_metrics_server_serves_registry():
+    metrics.PENDING_APPROVALS.set(5)
+    server = MetricsServer("127.0.0.1", 0)
+    await server.start()
+    try:
+        status, body = await _http_get(server.port, "/metrics")
+        assert status == "HTTP/1.0 200 OK"
+        assert "andreyvpn_pending_approvals 5" in body
+
+        status, _ = await _http_get(server.port, "/other")
+        assert status == "HTTP/1.0 404 Not Found"
+    finally:
+        await server.stop()
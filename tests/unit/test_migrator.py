@@ -1,10 +1,12 @@
 """Тесты для MigrationRunner (bot/db/migrator.py)."""
 from pathlib import Path
+from types import ModuleType
 
 import aiosqlite
 import pytest
 
 from bot.db.migrator import MigrationRunner
+from bot.version import __schema_version__
 
 
 # ── Вспомогательная функция ──────────────────────────────────────────────────
@@ -28,12 +30,12 @@ async def test_fresh_db_has_version_zero(tmp_path: Path) -> None:
 
 @pytest.mark.asyncio
 async def test_run_pending_applies_migration(tmp_path: Path) -> None:
-    """run_pending применяет m001 на пустой БД и возвращает 1."""
+    """run_pending применяет все миграции на пустой БД и возвращает их число."""
     db_path = str(tmp_path / "test.db")
     runner = MigrationRunner(db_path)
     async with aiosqlite.connect(db_path) as db:
         applied = await runner.run_pending(db)
-    assert applied == 1
+    assert applied == __schema_version__
 
 
 @pytest.mark.asyncio
@@ -44,7 +46,7 @@ async def test_run_pending_sets_user_version(tmp_path: Path) -> None:
     async with aiosqlite.connect(db_path) as db:
         await runner.run_pending(db)
         version = await get_user_version(db)
-    assert version == 1
+    assert version == __schema_version__
 
 
 @pytest.mark.asyncio
@@ -88,7 +90,7 @@ async def test_rollback_to_zero(tmp_path: Path) -> None:
             "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
         )
         tables = {row[0] for row in await cursor.fetchall()}
-    assert rolled == 1
+    assert rolled == __schema_version__
     assert version == 0
     assert "users" not in tables
 
@@ -141,3 +143,27 @@ async def test_discover_returns_sorted_migrations(tmp_path: Path) -> None:
     ids = [m.migration_id for m in migrations]
     assert ids == sorted(ids)
     assert len(ids) >= 1
+
+
+@pytest.mark.asyncio
+async def test_current_schema_imports_no_migrations(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """При актуальной схеме run_pending не импортирует модули миграций."""
+    import importlib
+
+    db_path = str(tmp_path / "test.db")
+    runner = MigrationRunner(db_path)
+    async with aiosqlite.connect(db_path) as db:
+        await runner.run_pending(db)
+        imported: list[str] = []
+        original = importlib.import_module
+
+        def tracking_import(name: str) -> ModuleType:
+            imported.append(name)
+            return original(name)
+
+        monkeypatch.setattr(importlib, "import_module", tracking_import)
+        applied = await runner.run_pending(db)
+    assert applied == 0
+    assert imported == []
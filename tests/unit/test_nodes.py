@@ -0,0 +1,201 @@
+"""Тесты узлов VPN (bot.services.nodes) и размещения профилей с фейковыми executor-ами узлов."""
+import asyncio
+import itertools
+
+import pytest
+
+from bot.db import repository
+from bot.services.nodes import NodeLoad, VPNNode, choose_node
+from bot.services.reconciler import PeerReconciler
+from bot.services.vpn_service import VPNService
+from bot.services.wg_command import CommandResult, WGRuntime, command_label
+from bot.services.wg_dump import PeerRecord
+
+
+def make_node(node_id: int, ip_range: str = "10.0.0.0/29", *, max_peers: int = 0, enabled: bool = True) -> VPNNode:
+    return VPNNode(
+        node_id, f"n{node_id}", "awg0", "", "", f"198.51.100.{node_id}:51820", f"pub{node_id}",
+        ip_range, max_peers, enabled,
+    )
+
+
+class FakeExecutor:
+    """Транспорт узла для тестов: записывает argv и отвечает как awg."""
+
+    _keys = itertools.count(1)
+
+    def __init__(self, peers: list[PeerRecord] | None = None) -> None:
+        self.calls: list[list[str]] = []
+        self.peers = peers or []
+
+    async def __call__(self, args, *, input=None, parse=None) -> CommandResult:
+        self.calls.append(list(args))
+        stdout, parsed = b"", None
+        if "genkey" in args:
+            stdout = f"priv{next(self._keys)}".encode()
+        elif "pubkey" in args:
+            stdout = input.replace(b"priv", b"pub")
+        elif "dump" in args:
+            parsed = list(self.peers)
+        return CommandResult(command_label(args), 0, stdout, "", 0.001, parsed=parsed)
+
+    def sets(self) -> list[list[str]]:
+        return [call for call in self.calls if "set" in call]
+
+
+@pytest.fixture
+async def two_nodes(db_connection, monkeypatch: pytest.MonkeyPatch) -> tuple[FakeExecutor, FakeExecutor]:
+    # Узел по умолчанию — прямой режим: бинарники ищутся локально
+    monkeypatch.setattr("bot.services.vpn_service.shutil.which", lambda name: f"/usr/bin/{name}")
+    await repository.insert_vpn_node(
+        db_connection, "edge", interface="awg1", container="", ssh_host="root@edge",
+        endpoint="203.0.113.5:51820", public_key="edge_pub", ip_range="10.0.0.0/29",
+    )
+    await VPNService.load_nodes(db_connection)
+    default, edge = FakeExecutor(), FakeExecutor()
+    VPNService.set_executor(1, default)
+    VPNService.set_executor(2, edge)
+    return default, edge
+
+
+def test_choose_node_least_utilized():
+    loads = [NodeLoad(make_node(1), 4), NodeLoad(make_node(2), 1), NodeLoad(make_node(3), 1)]
+    node = choose_node(loads)
+    assert node is not None and node.id == 2  # при равенстве — меньший id
+
+
+def test_choose_node_skips_full_and_disabled():
+    loads = [
+        NodeLoad(make_node(1, max_peers=2), 2),
+        NodeLoad(make_node(2, enabled=False), 0),
+        NodeLoad(make_node(3), 4),
+    ]
+    node = choose_node(loads)
+    assert node is not None and node.id == 3
+    assert choose_node(loads[:2]) is None
+
+
+def test_choose_node_traffic_weight():
+    loads = [NodeLoad(make_node(1), 2, traffic=900), NodeLoad(make_node(2), 2, traffic=100)]
+    by_traffic, by_peers = choose_node(loads, traffic_weight=0.5), choose_node(loads, traffic_weight=0.0)
+    assert by_traffic is not None and by_traffic.id == 2
+    assert by_peers is not None and by_peers.id == 1
+
+
+def test_ssh_runtime_and_label():
+    runtime = WGRuntime.probe("amnezia-awg", lambda _: None, ssh_host="root@edge")
+    args = runtime.command("awg", "set", "awg0", "peer", "k")
+    assert args[:4] == ["ssh", "-o", "BatchMode=yes", "root@edge"]
+    assert args[4:7] == ["docker", "exec", "amnezia-awg"]
+    assert command_label(args) == "awg set"
+    assert runtime.mode == "ssh+docker"
+
+
+async def test_default_node_comes_from_settings(db_connection, test_settings):
+    from bot.core.config import settings
+
+    nodes = await VPNService.load_nodes(db_connection)
+    assert [node.name for node in nodes] == ["default"]
+    assert nodes[0] == VPNNode.from_settings()
+    assert nodes[0].endpoint == settings.server_endpoint
+
+
+async def test_create_profile_placed_on_least_loaded_node(db_connection, two_nodes):
+    default, edge = two_nodes
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.execute(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address) VALUES (1, 'old', 'k_old', '10.0.0.2')"
+    )
+    await db_connection.commit()
+
+    profile = await VPNService.create_profile(db_connection, 1, "phone")
+
+    # Пул узла edge пуст — тот же адрес, что у профиля на узле default
+    assert profile["ipv4"] == "10.0.0.2"
+    assert "Endpoint = 203.0.113.5:51820" in profile["config"]
+    assert "PublicKey = edge_pub" in profile["config"]
+    [call] = edge.sets()
+    assert call[:7] == ["ssh", "-o", "BatchMode=yes", "root@edge", "awg", "set", "awg1"]
+    assert call[-2:] == ["allowed-ips", "10.0.0.2/32"]
+    assert ["ssh", "-o", "BatchMode=yes", "root@edge", "awg-quick", "save", "awg1"] in edge.calls
+    assert default.sets() == []
+    cursor = await db_connection.execute("SELECT node_id FROM vpn_profiles WHERE name = 'phone'")
+    assert (await cursor.fetchone())["node_id"] == 2
+
+
+async def test_single_full_node_gets_no_placement(db_connection, test_settings):
+    """Единственный узел тоже проверяется на свободные адреса и max_peers."""
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address) VALUES (1, ?, ?, ?)",
+        [(f"p{i}", f"k{i}", f"10.0.0.{i + 2}") for i in range(5)],  # /29 — пять адресов
+    )
+    await db_connection.commit()
+
+    with pytest.raises(ValueError, match="No available IP addresses on any VPN node"):
+        await VPNService.place(db_connection)
+
+
+async def test_busy_node_does_not_block_other_nodes(db_connection, two_nodes):
+    """Сверка (peer_lock) узла default не задерживает профиль, размещённый на edge."""
+    default, edge = two_nodes
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.execute(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address) VALUES (1, 'old', 'k_old', '10.0.0.2')"
+    )
+    await db_connection.commit()
+
+    async with VPNService.peer_lock(VPNService.node(1)):
+        profile = await asyncio.wait_for(VPNService.create_profile(db_connection, 1, "phone"), timeout=1)
+
+    assert "PublicKey = edge_pub" in profile["config"]
+    assert default.sets() == []
+
+
+async def test_delete_profile_removes_peer_from_its_node(db_connection, two_nodes):
+    default, edge = two_nodes
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    cursor = await db_connection.execute(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address, node_id) "
+        "VALUES (1, 'p', 'k_edge', '10.0.0.2', 2)"
+    )
+    await db_connection.commit()
+
+    assert await VPNService.delete_profile(db_connection, cursor.lastrowid)
+    assert edge.sets()[0][-3:] == ["peer", "k_edge", "remove"]
+    assert default.calls == []
+
+
+async def test_reconcile_each_node_against_its_profiles(db_connection, two_nodes):
+    default, edge = two_nodes
+    default.peers = [PeerRecord("k1", None, "10.0.0.2/32", 0, 0, 0)]
+    edge.peers = [PeerRecord("stale", None, "10.0.0.5/32", 0, 0, 0)]
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address, node_id) VALUES (1, ?, ?, ?, ?)",
+        [("a", "k1", "10.0.0.2", 1), ("b", "k2", "10.0.0.2", 2)],
+    )
+    await db_connection.commit()
+
+    results = {}
+    for node, result in await PeerReconciler(max_remove_ratio=1.0).run_all(db_connection):
+        assert result is not None
+        results[node.name] = result
+
+    assert results["default"].plan.changes == 0
+    assert results["edge"].plan.add == {"k2": "10.0.0.2/32"}
+    assert results["edge"].plan.remove == ["stale"]
+    assert default.sets() == []
+    assert edge.sets()[0][5:] == ["set", "awg1", "peer", "k2", "allowed-ips", "10.0.0.2/32", "peer", "stale", "remove"]
+
+
+def test_parse_add_options_and_validation():
+    from bot.handlers.admin.nodes import parse_add
+
+    fields = parse_add(["edge", "203.0.113.5:51820", "edge_pub", "10.9.0.0/24", "ssh=root@edge", "max=100"])
+    assert fields["ssh_host"] == "root@edge" and fields["max_peers"] == 100
+    assert fields["interface"] == "awg0" and fields["container"] == ""
+    with pytest.raises(ValueError):
+        parse_add(["edge", "203.0.113.5", "edge_pub", "10.9.0.0/24"])
+    with pytest.raises(ValueError):
+        parse_add(["edge", "203.0.113.5:51820", "edge_pub", "10.9.0.0/24", "port=1"])
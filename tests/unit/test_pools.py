@@ -0,0 +1,179 @@
+"""Тесты пулов адресов: выдача по priority, пул на своём интерфейсе, перенос профилей пачками."""
+import pytest
+
+from bot.db import repository
+from bot.services import pool_migration
+from bot.services.nodes import free_addresses
+from bot.services.pool_migration import migrate_pool
+from bot.services.reconciler import PeerReconciler
+from bot.services.vpn_service import VPNService
+from bot.services.wg_dump import PeerRecord
+from tests.unit.test_nodes import FakeExecutor
+
+
+@pytest.fixture
+async def awg(db_connection, monkeypatch: pytest.MonkeyPatch) -> FakeExecutor:
+    """Узел по умолчанию (основной пул 10.0.0.0/29, 5 адресов) с фейковым awg."""
+    monkeypatch.setattr("bot.services.vpn_service.shutil.which", lambda name: f"/usr/bin/{name}")
+    await db_connection.execute("INSERT INTO users (telegram_id) VALUES (1)")
+    await db_connection.commit()
+    executor = FakeExecutor()
+    VPNService.set_executor(1, executor)
+    return executor
+
+
+async def add_profiles(db, addresses: list[str], pool_id: int | None = None) -> None:
+    await db.executemany(
+        "INSERT INTO vpn_profiles (user_id, name, public_key, ipv4_address, pool_id) VALUES (1, ?, ?, ?, ?)",
+        [(f"p{ip}", f"k{ip}", ip, pool_id) for ip in addresses],
+    )
+    await db.commit()
+
+
+def test_free_addresses_skips_gateway_used_and_invalid():
+    used = ["10.0.0.2", "10.0.0.4", "garbage", "192.168.0.1"]
+    assert free_addresses("10.0.0.0/29", used, limit=3) == ["10.0.0.3", "10.0.0.5", "10.0.0.6"]
+    assert free_addresses("10.0.0.0/30", ["10.0.0.2"]) == []
+    assert free_addresses("10.0.0.0/31", []) == []
+
+
+def test_free_addresses_large_pool():
+    used = [f"10.1.{i // 256}.{i % 256}" for i in range(2, 60000)]
+    assert free_addresses("10.1.0.0/16", used) == ["10.1.234.96"]
+
+
+async def test_allocation_follows_priority_and_skips_full_and_disabled(db_connection, awg):
+    await repository.insert_ip_pool(db_connection, 1, "10.1.0.0/24", priority=50)
+    off = await repository.insert_ip_pool(db_connection, 1, "10.2.0.0/24", priority=10)
+    await repository.set_ip_pool_enabled(db_connection, off, False)
+    node = (await VPNService.load_nodes(db_connection))[0]
+
+    # Основной пул (priority 0) — первым, пока в нём есть место
+    pool, ipv4 = await VPNService.allocate_address(db_connection, node)
+    assert (pool.id, ipv4) == (None, "10.0.0.2")
+
+    await add_profiles(db_connection, ["10.0.0.2", "10.0.0.3", "10.0.0.4", "10.0.0.5", "10.0.0.6"])
+    pool, ipv4 = await VPNService.allocate_address(db_connection, node)
+    assert (pool.cidr, ipv4) == ("10.1.0.0/24", "10.1.0.2")
+
+
+async def test_profile_in_pool_on_own_interface(db_connection, awg):
+    await repository.insert_ip_pool(
+        db_connection, 1, "10.1.0.0/24", interface="awg1",
+        endpoint="198.51.100.10:51821", public_key="awg1_pub", priority=-1,
+    )
+    await VPNService.load_nodes(db_connection)
+
+    profile = await VPNService.create_profile(db_connection, 1, "phone")
+
+    assert profile["ipv4"] == "10.1.0.2"
+    assert "Endpoint = 198.51.100.10:51821" in profile["config"]
+    assert "PublicKey = awg1_pub" in profile["config"]
+    [call] = awg.sets()
+    assert call[:3] == ["/usr/bin/awg", "set", "awg1"]
+    cursor = await db_connection.execute("SELECT pool_id FROM vpn_profiles WHERE name = 'phone'")
+    assert (await cursor.fetchone())["pool_id"] == 1
+
+    config = await VPNService.get_profile_config(db_connection, 1)
+    assert config is not None and "PublicKey = awg1_pub" in config["config"]
+
+
+async def test_reconcile_each_interface_against_its_pools(db_connection, awg):
+    await repository.insert_ip_pool(
+        db_connection, 1, "10.1.0.0/24", interface="awg1",
+        endpoint="198.51.100.10:51821", public_key="awg1_pub",
+    )
+    await VPNService.load_nodes(db_connection)
+    await add_profiles(db_connection, ["10.0.0.2"])
+    await add_profiles(db_connection, ["10.1.0.2"], pool_id=1)
+    awg.peers = [PeerRecord("k10.0.0.2", None, "10.0.0.2/32", 0, 0, 0)]
+
+    results = {}
+    for node, result in await PeerReconciler(max_remove_ratio=1.0).run_all(db_connection):
+        assert result is not None
+        results[node.label] = result
+
+    assert set(results) == {"default/awg0", "default/awg1"}
+    assert results["default/awg0"].plan.changes == 0
+    assert results["default/awg1"].plan.add == {"k10.1.0.2": "10.1.0.2/32"}
+    assert results["default/awg1"].plan.remove == ["k10.0.0.2"]  # один фейковый дамп на оба интерфейса
+
+
+async def test_migrate_pool_in_batches(db_connection, awg, monkeypatch: pytest.MonkeyPatch):
+    events = []
+    monkeypatch.setattr(pool_migration, "audit", lambda event, **kw: events.append((event, kw)))
+    pool_id = await repository.insert_ip_pool(db_connection, 1, "10.1.0.0/24")
+    node = (await VPNService.load_nodes(db_connection))[0]
+    await add_profiles(db_connection, ["10.0.0.2", "10.0.0.3", "10.0.0.4"])
+    await db_connection.execute("UPDATE vpn_profiles SET detached_at = 1 WHERE ipv4_address = '10.0.0.4'")
+    await db_connection.commit()
+
+    report = await migrate_pool(
+        db_connection, node, node.pool(None), node.pool(pool_id), batch_size=2, by_admin=42,
+    )
+
+    assert (report.moved, report.batches, report.remaining, report.target_full) == (3, 2, 0, False)
+    cursor = await db_connection.execute("SELECT ipv4_address, pool_id FROM vpn_profiles ORDER BY id")
+    assert [tuple(row) for row in await cursor.fetchall()] == [
+        ("10.1.0.2", pool_id), ("10.1.0.3", pool_id), ("10.1.0.4", pool_id),
+    ]
+    # Тот же интерфейс — новые allowed-ips; снятый за неактивностью — только в БД
+    assert [call[3:] for call in awg.sets()] == [
+        ["peer", "k10.0.0.2", "allowed-ips", "10.1.0.2/32", "peer", "k10.0.0.3", "allowed-ips", "10.1.0.3/32"],
+    ]
+    assert [kw["to_ip"] for _, kw in events] == ["10.1.0.2", "10.1.0.3", "10.1.0.4"]
+    assert events[0] == ("POOL_MIGRATED", {
+        "user_id": 1, "profile_id": 1, "node": "default",
+        "from_ip": "10.0.0.2", "to_ip": "10.1.0.2", "by_admin": 42,
+    })
+
+
+async def test_migrate_pool_to_other_interface_respects_limit_and_capacity(db_connection, awg):
+    pool_id = await repository.insert_ip_pool(
+        db_connection, 1, "10.1.0.0/30", interface="awg1",
+        endpoint="198.51.100.10:51821", public_key="awg1_pub",
+    )
+    node = (await VPNService.load_nodes(db_connection))[0]
+    await add_profiles(db_connection, ["10.0.0.2", "10.0.0.3"])
+
+    report = await migrate_pool(db_connection, node, node.pool(None), node.pool(pool_id), limit=5)
+
+    # В /30 один адрес для профилей
+    assert (report.moved, report.remaining, report.target_full) == (1, 1, True)
+    assert [call[2:] for call in awg.sets()] == [
+        ["awg0", "peer", "k10.0.0.2", "remove"],
+        ["awg1", "peer", "k10.0.0.2", "allowed-ips", "10.1.0.2/32"],
+    ]
+
+
+def test_parse_pool_add_validation(test_settings):
+    from bot.handlers.admin.pools import parse_add
+    from bot.services.nodes import VPNNode
+
+    node = VPNNode.from_settings()
+    fields = parse_add(node, ["10.1.0.7/24", "priority=5"])
+    assert fields == {"cidr": "10.1.0.0/24", "interface": None, "endpoint": None, "public_key": None, "priority": 5}
+    with pytest.raises(ValueError, match="Пересекается"):
+        parse_add(node, ["10.0.0.0/16"])
+    with pytest.raises(ValueError, match="endpoint"):
+        parse_add(node, ["10.1.0.0/24", "interface=awg1"])
+    with pytest.raises(ValueError):
+        parse_add(node, ["10.1.0.0/24", "mtu=1280"])
+
+
+@pytest.mark.parametrize(("args", "reply"), [
+    ("on default 10.0.0.300/24", "Пул не найден"),
+    ("migrate default bogus 10.1.0.0/24", "Нужны два разных пула"),
+])
+async def test_pools_command_rejects_bad_cidr(db_connection, test_settings, args, reply):
+    """Некорректный CIDR — ответ администратору, а не исключение из хендлера."""
+    from aiogram.filters import CommandObject
+
+    from bot.handlers.admin.pools import cmd_pools
+    from tests.conftest import make_message
+
+    message = make_message(user_id=1)
+    await cmd_pools(message, CommandObject(command="pools", args=args), db_connection)
+
+    message.answer.assert_awaited_once()
+    assert reply in message.answer.await_args.args[0]
@@ -0,0 +1,87 @@
+"""Тесты сэмплирующего профайлера и команды /profile."""
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from bot.core import profiler
+from bot.core.profiler import IDLE, ProfileResult, SamplingProfiler
+
+
+def _busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def test_profile_sees_blocking_code_lag_and_coroutines():
+    async def blocker():
+        await asyncio.sleep(0.02)
+        _busy(0.1)
+
+    async def sleeper():
+        await asyncio.sleep(1)
+
+    background = [asyncio.create_task(blocker()), asyncio.create_task(sleeper())]
+    result = await SamplingProfiler(interval=0.005).run(0.3)
+    for task in background:
+        task.cancel()
+
+    assert result.samples > 0
+    assert any(label.endswith(":_busy") for label, _, _ in result.top_frames(20))
+    assert result.lag_stats()["max_ms"] >= 50
+    assert any(label.endswith("<locals>.sleeper") for label, _ in result.top_coroutines(20))
+
+
+def test_result_summary_and_files(tmp_path):
+    result = ProfileResult(duration=1.0, interval=0.01)
+    result.stacks[("main:run", "handlers:cmd", "vpn:encrypt")] += 3
+    result.stacks[("main:run", "handlers:cmd")] += 1
+    result.stacks[(IDLE,)] += 6
+    result.coroutines["handlers:cmd"] += 50
+    result.lag.extend([0.001, 0.002, 0.2])
+
+    assert result.busy_samples == 4
+    assert result.top_frames()[0] == ("vpn:encrypt", 3, 3)
+    assert ("handlers:cmd", 1, 4) in result.top_frames()
+    assert result.top_coroutines() == [("handlers:cmd", pytest.approx(0.5))]
+
+    folded, summary = result.write(tmp_path)
+    assert "main:run;handlers:cmd;vpn:encrypt 3" in folded.read_text()
+    assert "loop lag" in summary.read_text()
+
+
+async def test_only_one_profile_at_a_time():
+    task = profiler.start(0.05, interval=0.01)
+    with pytest.raises(RuntimeError):
+        profiler.start(0.05)
+    await task
+    assert not profiler.is_running()
+
+
+async def test_cmd_profile_reports_to_admin(tmp_path, monkeypatch):
+    from bot.handlers.admin import diagnostics
+
+    monkeypatch.setattr(diagnostics.settings, "log_path", str(tmp_path))
+    message = AsyncMock()
+    message.chat.id = 999
+    command = MagicMock(args="0.05")
+    bot = AsyncMock()
+
+    await diagnostics.cmd_profile(message, command, bot)
+    assert "Профилирую" in message.answer.await_args.args[0]
+    await asyncio.gather(*diagnostics._reports)
+
+    chat_id, text = bot.send_message.await_args.args
+    assert chat_id == 999
+    assert "Профиль за" in text
+    assert len(list(tmp_path.glob("profile-*.folded"))) == 1
+
+
+async def test_cmd_profile_rejects_bad_argument():
+    from bot.handlers.admin.diagnostics import cmd_profile
+
+    message = AsyncMock()
+    await cmd_profile(message, MagicMock(args="abc"), AsyncMock())
+    assert "Использование" in message.answer.await_args.args[0]
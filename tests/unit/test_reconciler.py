@@ -0,0 +1,169 @@
+"""Тесты сверки пиров интерфейса с БД (bot.services.reconciler)."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from bot.core.config import settings
+from bot.services.reconciler import PeerReconciler, diff
+from bot.services.vpn_service import VPNService
+
+DUMP_HEADER = "privkey\tpubkey\t51820\toff\n"
+
+
+def stream(data: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def make_process(returncode: int = 0, stdout: bytes = b"", stderr: bytes = b""):
+    proc = MagicMock()
+    proc.pid = 4242
+    proc.returncode = returncode
+    proc.communicate = AsyncMock(return_value=(stdout, stderr))
+    # дамп читается потоково из stdout
+    proc.stdout, proc.stderr = stream(stdout), stream(stderr)
+    proc.wait = AsyncMock(return_value=returncode)
+    return proc
+
+
+def dump(*peers: tuple[str, str]) -> bytes:
+    lines = [f"{key}\t(none)\t1.2.3.4:5\t{ips}\t0\t0\t0\toff" for key, ips in peers]
+    return (DUMP_HEADER + "\n".join(lines) + "\n").encode()
+
+
+async def add_profiles(db, *profiles: tuple[str, str]) -> None:
+    await db.execute("INSERT OR IGNORE INTO users (telegram_id) VALUES (1)")
+    for n, (key, ipv4) in enumerate(profiles):
+        await db.execute(
+            "INSERT INTO vpn_profiles (user_id, name, private_key, public_key, ipv4_address) "
+            "VALUES (1, ?, 'k', ?, ?)",
+            (f"p{n}", key, ipv4),
+        )
+    await db.commit()
+
+
+def test_diff_minimal_changes():
+    plan = diff(
+        desired={"a": "10.0.0.2/32", "b": "10.0.0.3/32", "c": "10.0.0.4/32"},
+        live={"a": "10.0.0.2/32", "b": "10.0.0.9/32", "stale": "10.0.0.7/32"},
+    )
+    assert plan.add == {"c": "10.0.0.4/32"}
+    assert plan.update == {"b": "10.0.0.3/32"}
+    assert plan.remove == ["stale"]
+    assert plan.unchanged == 1
+    assert plan.changes == 3
+
+
+def test_mass_removal_is_blocked():
+    live = {f"k{i}": f"10.0.0.{i}/32" for i in range(10)}
+    assert diff({}, live).removal_blocked(0.5)
+    assert not diff({f"k{i}": f"10.0.0.{i}/32" for i in range(6)}, live).removal_blocked(0.5)
+    assert not diff({}, live).removal_blocked(1.0)
+
+
+async def test_run_applies_diff_in_one_batch(db_connection, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+    await add_profiles(db_connection, ("a", "10.0.0.2"), ("b", "10.0.0.3"), ("c", "10.0.0.4"))
+    live = dump(("a", "10.0.0.2/32"), ("b", "10.0.0.9/32"), ("stale", "10.0.0.7/32"), ("stale2", "(none)"))
+    calls: list[list[str]] = []
+
+    async def create(*args, **kwargs):
+        calls.append(list(args))
+        return make_process(stdout=live if "dump" in args else b"")
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=create):
+        result = await PeerReconciler(max_remove_ratio=1.0).run(db_connection)
+
+    assert result is not None
+    assert (result.applied, result.failed) == (4, 0)
+    # dump + один awg set на все изменения + awg-quick save
+    assert len(calls) == 3
+    set_args = calls[1][calls[1].index("set"):]
+    assert set_args == [
+        "set", "awg0", "peer", "c", "allowed-ips", "10.0.0.4/32",
+        "peer", "b", "allowed-ips", "10.0.0.3/32",
+        "peer", "stale", "remove", "peer", "stale2", "remove",
+    ]
+    assert calls[2][-2:] == ["save", "awg0"]
+
+
+async def test_dry_run_and_noop(db_connection, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+    await add_profiles(db_connection, ("a", "10.0.0.2"))
+    create = AsyncMock(return_value=make_process(stdout=dump(("a", "10.0.0.2/32"), ("stale", "10.0.0.7/32"))))
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", create):
+        reconciler = PeerReconciler(max_remove_ratio=1.0)
+        planned = await reconciler.run(db_connection, dry_run=True)
+    assert planned is not None and planned.plan.remove == ["stale"]
+    assert create.await_count == 1  # только дамп
+    assert "/reconcile apply" in planned.render()
+    assert reconciler.last is None
+
+
+async def test_blocked_removals_still_add_and_alert(db_connection, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+    await add_profiles(db_connection, ("new", "10.0.0.5"))
+    live = dump(*[(f"old{i}", f"10.0.0.{10 + i}/32") for i in range(4)])
+    calls: list[list[str]] = []
+
+    async def create(*args, **kwargs):
+        calls.append(list(args))
+        return make_process(stdout=live if "dump" in args else b"")
+
+    alert = AsyncMock()
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=create):
+        result = await PeerReconciler(max_remove_ratio=0.5, alert=alert).run(db_connection)
+
+    assert result is not None and result.removals_blocked
+    assert result.applied == 1
+    assert not any("remove" in call for call in calls)
+    alert.assert_awaited_once_with(result)
+
+
+async def test_run_waits_for_profile_mutation(db_connection, monkeypatch: pytest.MonkeyPatch):
+    """Пир создаваемого профиля (строка ещё не закоммичена) не попадает в remove."""
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+    create = AsyncMock(return_value=make_process(stdout=dump(("new", "10.0.0.5/32"))))
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", create):
+        async with VPNService.peer_lock():
+            task = asyncio.create_task(PeerReconciler(max_remove_ratio=1.0).run(db_connection))
+            await asyncio.sleep(0)
+            assert create.await_count == 0  # сверка ждёт create_profile
+            await add_profiles(db_connection, ("new", "10.0.0.5"))
+        result = await task
+
+    assert result is not None
+    assert result.plan.remove == [] and result.plan.unchanged == 1
+
+
+async def test_unreadable_interface_returns_none(db_connection, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+    await add_profiles(db_connection, ("a", "10.0.0.2"))
+    create = AsyncMock(return_value=make_process(returncode=1, stderr=b"Unable to access interface"))
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", create):
+        assert await PeerReconciler().run(db_connection) is None
+    assert create.await_count == 1  # пустой дамп не трактуется как «удалить всё»
+
+
+async def test_failed_batch_is_retried_per_peer(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", "awg", raising=False)
+
+    async def create(*args, **kwargs):
+        if "save" in args:
+            return make_process()
+        bad = "bad" in args
+        return make_process(returncode=1 if bad else 0, stderr=b"Invalid key" if bad else b"")
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=create) as mock:
+        applied, failed = await VPNService.apply_peer_changes(
+            {"a": "10.0.0.2/32", "bad": "10.0.0.3/32", "c": "10.0.0.4/32"}, [], batch_size=3,
+        )
+    assert (applied, failed) == (2, 1)
+    # пакет + 3 по одному + save
+    assert mock.call_count == 5
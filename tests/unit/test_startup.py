@@ -0,0 +1,98 @@
+"""Тесты поэтапного старта (StartupReport)."""
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from bot.core.startup import DONE, FAILED, StartupReport
+
+
+async def test_blocking_and_background_phases():
+    report = StartupReport()
+    notify = AsyncMock()
+    report.on_ready(notify)
+    release = asyncio.Event()
+
+    with report.phase("db"):
+        pass
+    report.mark_accepting()
+
+    async def recovery(phase):
+        await release.wait()
+        phase.detail = "3 synced, 0 failed"
+
+    async def broken(phase):
+        raise RuntimeError("awg is down")
+
+    report.background("peer_recovery", recovery)
+    report.background("server_key", broken)
+    await asyncio.sleep(0.01)
+
+    # Фоновая фаза ещё идёт — бот уже принимает апдейты, но не «готов»
+    assert report.accepting_updates is not None
+    assert not report.ready
+    notify.assert_not_awaited()
+
+    release.set()
+    await report.wait()
+
+    assert report.ready
+    assert report.phases["db"].status == DONE
+    assert report.phases["peer_recovery"].detail == "3 synced, 0 failed"
+    assert report.phases["server_key"].status == FAILED
+    assert report.phases["server_key"].detail == "awg is down"
+    notify.assert_awaited_once_with(report)
+
+
+async def test_blocking_phase_failure_propagates():
+    report = StartupReport()
+    with pytest.raises(ValueError):
+        with report.phase("db"):
+            raise ValueError("locked")
+    assert report.phases["db"].status == FAILED
+
+
+async def test_finish_without_background_reports_immediately():
+    report = StartupReport()
+    notify = AsyncMock()
+    report.on_ready(notify)
+    with report.phase("db"):
+        pass
+    report.mark_accepting()
+    await report.finish()
+    await report.finish()
+    notify.assert_awaited_once()
+
+
+async def test_cancel_marks_running_phases():
+    report = StartupReport()
+    report.mark_accepting()
+    report.background("slow", lambda phase: asyncio.sleep(10))
+    await asyncio.sleep(0)
+    await report.cancel()
+    assert report.phases["slow"].detail == "cancelled"
+
+
+async def test_render_and_admin_command():
+    from bot.handlers.admin.diagnostics import cmd_startup
+
+    report = StartupReport()
+    with report.phase("db"):
+        pass
+    report.mark_accepting()
+    message = AsyncMock()
+    await cmd_startup(message, report)
+
+    text = message.answer.await_args.args[0]
+    assert "готов" in text
+    assert "✅ db (блок.)" in text
+
+
+async def test_recorded_phase_is_rendered():
+    report = StartupReport()
+    report.record("imports", 0.25)
+    report.mark_accepting()
+    await report.finish()
+
+    assert report.ready
+    assert "imports (блок.): 250 мс" in report.render(html=False)
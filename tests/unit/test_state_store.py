@@ -0,0 +1,108 @@
+"""Тесты для StateStore: MemoryStateStore и RedisStateStore (с моком клиента)."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from bot.core.state_store import (
+    MemoryStateStore,
+    RedisStateStore,
+    create_state_store,
+    get_state_store,
+    set_state_store,
+)
+
+
+async def test_memory_try_lock_is_exclusive():
+    store = MemoryStateStore()
+    assert await store.try_lock("k", ttl=10) is True
+    assert await store.try_lock("k", ttl=10) is False
+    assert await store.exists("k") is True
+
+
+async def test_memory_lock_expires():
+    store = MemoryStateStore()
+    await store.try_lock("k", ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await store.exists("k") is False
+    assert await store.try_lock("k", ttl=10) is True
+
+
+async def test_memory_unlock():
+    store = MemoryStateStore()
+    await store.try_lock("k", ttl=10)
+    await store.unlock("k")
+    assert await store.try_lock("k", ttl=10) is True
+    await store.unlock("missing")  # не падает
+
+
+async def test_memory_store_is_bounded():
+    store = MemoryStateStore(maxsize=3)
+    for i in range(10):
+        await store.try_lock(f"k{i}", ttl=60)
+    assert len(store) == 3
+    # Вытесняются самые старые
+    assert await store.exists("k9") is True
+    assert await store.exists("k0") is False
+
+
+async def test_memory_consume_token_bucket():
+    store = MemoryStateStore()
+    assert await store.consume("u", 1.0, rate=0.01, burst=2.0)
+    assert await store.consume("u", 1.0, rate=0.01, burst=2.0)
+    assert await store.consume("u", 1.0, rate=0.01, burst=2.0) is False
+    # Другой ключ — своё ведро
+    assert await store.consume("v", 1.0, rate=0.01, burst=2.0)
+
+
+def _redis_mock(set_result=True):
+    redis = MagicMock()
+    redis.set = AsyncMock(return_value=set_result)
+    redis.delete = AsyncMock()
+    redis.exists = AsyncMock(return_value=1)
+    redis.aclose = AsyncMock()
+    script = AsyncMock(return_value=1)
+    redis.register_script = MagicMock(return_value=script)
+    return redis, script
+
+
+async def test_redis_try_lock_uses_set_nx_px():
+    redis, _ = _redis_mock(set_result=True)
+    store = RedisStateStore(redis, prefix="p:")
+
+    assert await store.try_lock("vpn_request:1", ttl=1.5) is True
+    redis.set.assert_awaited_once_with("p:vpn_request:1", b"1", nx=True, px=1500)
+
+
+async def test_redis_try_lock_taken():
+    redis, _ = _redis_mock(set_result=None)
+    store = RedisStateStore(redis)
+    assert await store.try_lock("k", ttl=1) is False
+
+
+async def test_redis_unlock_and_exists_prefixed():
+    redis, _ = _redis_mock()
+    store = RedisStateStore(redis, prefix="p:")
+    await store.unlock("k")
+    assert await store.exists("k") is True
+    redis.delete.assert_awaited_once_with("p:k")
+    redis.exists.assert_awaited_once_with("p:k")
+
+
+async def test_redis_consume_runs_script():
+    redis, script = _redis_mock()
+    store = RedisStateStore(redis, prefix="p:")
+
+    assert await store.consume("42", 3.0, rate=1.5, burst=5.0) is True
+    script.assert_awaited_once_with(keys=["p:tb:42"], args=[3.0, 1.5, 5.0])
+
+    script.return_value = 0
+    assert await store.consume("42", 3.0, rate=1.5, burst=5.0) is False
+
+
+def test_create_state_store_defaults_to_memory():
+    assert isinstance(create_state_store(None), MemoryStateStore)
+
+
+def test_set_and_get_state_store():
+    store = MemoryStateStore()
+    set_state_store(store)
+    assert get_state_store() is store
@@ -1,120 +1,190 @@
-"""Тесты для ThrottlingMiddleware с LRU-кэшем."""
-import asyncio
-import time
+"""Тесты для ThrottlingMiddleware на основе token bucket."""
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from bot.middlewares.throttling_middleware import ThrottlingMiddleware, _LRUCache
-
-
-class TestLRUCache:
-    def test_get_default(self):
-        cache = _LRUCache(maxsize=10)
-        assert cache.get(1) == 0.0
-        assert cache.get(1, default=5.0) == 5.0
-
-    def test_set_and_get(self):
-        cache = _LRUCache(maxsize=10)
-        cache.set(1, 100.0)
-        assert cache.get(1) == 100.0
-
-    def test_lru_eviction(self):
-        cache = _LRUCache(maxsize=3)
-        cache.set(1, 1.0)
-        cache.set(2, 2.0)
-        cache.set(3, 3.0)
-        # Добавить 4й элемент — должен вытеснить 1й (LRU)
-        cache.set(4, 4.0)
-        assert cache.get(1) == 0.0  # вытеснен
-        assert cache.get(4) == 4.0
-
-    def test_lru_move_to_end_on_get(self):
-        cache = _LRUCache(maxsize=3)
-        cache.set(1, 1.0)
-        cache.set(2, 2.0)
-        cache.set(3, 3.0)
-        _ = cache.get(1)  # 1 теперь последний использованный
-        cache.set(4, 4.0)  # вытеснит 2 (самый старый)
-        assert cache.get(1) == 1.0  # 1 сохранился
-        assert cache.get(2) == 0.0  # 2 вытеснен
+from aiogram.types import CallbackQuery, Message
+
+from bot.core.state_store import TokenBuckets
+from bot.middlewares.throttling_middleware import ThrottlingMiddleware, action_key
+
+
+class TestTokenBuckets:
+    def test_new_key_starts_full(self):
+        buckets = TokenBuckets(rate=1.0, burst=3.0)
+        assert buckets.tokens(1, now=0.0) == 3.0
+        assert buckets.consume(1, 1.0, now=0.0) is True
+        assert buckets.tokens(1, now=0.0) == pytest.approx(2.0)
+
+    def test_burst_then_reject(self):
+        buckets = TokenBuckets(rate=1.0, burst=2.0)
+        assert buckets.consume(1, 1.0, now=0.0)
+        assert buckets.consume(1, 1.0, now=0.0)
+        assert buckets.consume(1, 1.0, now=0.0) is False
+
+    def test_lazy_refill(self):
+        buckets = TokenBuckets(rate=2.0, burst=2.0)
+        buckets.consume(1, 2.0, now=0.0)
+        assert buckets.consume(1, 1.0, now=0.1) is False
+        # 0.5 с * 2 токена/с = 1 токен
+        assert buckets.consume(1, 1.0, now=0.6) is True
+
+    def test_refill_capped_at_burst(self):
+        buckets = TokenBuckets(rate=10.0, burst=3.0)
+        buckets.consume(1, 3.0, now=0.0)
+        assert buckets.tokens(1, now=100.0) == 3.0
+
+    def test_rejected_cost_not_charged(self):
+        buckets = TokenBuckets(rate=1.0, burst=2.0)
+        buckets.consume(1, 1.5, now=0.0)
+        assert buckets.consume(1, 1.0, now=0.0) is False
+        assert buckets.tokens(1, now=0.0) == pytest.approx(0.5)
+
+    def test_full_buckets_evicted_when_capacity_reached(self):
+        buckets = TokenBuckets(rate=1000.0, burst=1.0, maxsize=2)
+        buckets.consume(1, 1.0, now=0.0)
+        buckets.consume(2, 1.0, now=0.0)
+        # Оба ведра к моменту sweep (time.monotonic) восполнены и освобождаются
+        buckets.consume(3, 1.0, now=0.0)
+        assert len(buckets) <= 2
+
+    def test_invalid_params(self):
+        with pytest.raises(ValueError):
+            TokenBuckets(rate=0, burst=1)
+
+
+def _callback(data: str):
+    cq = MagicMock(spec=CallbackQuery)
+    cq.data = data
+    cq.answer = AsyncMock()
+    return cq
+
+
+def _message(text: str):
+    msg = MagicMock(spec=Message)
+    msg.text = text
+    msg.answer = AsyncMock()
+    return msg
+
+
+def _user(user_id: int):
+    user = MagicMock()
+    user.id = user_id
+    return user
+
+
+def test_action_key():
+    assert action_key(_callback("prof:request:0")) == "prof:request"
+    assert action_key(_callback("noop")) == "noop"
+    assert action_key(_message("/start payload")) == "/start"
+    assert action_key(_message("/menu@SomeBot")) == "/menu"
+    assert action_key(_message("🔑 Мои профили")) == "🔑 Мои профили"
+    assert action_key(MagicMock()) is None
 
 
 @pytest.mark.asyncio
 async def test_throttling_allows_first_message():
-    middleware = ThrottlingMiddleware(rate_limit=1.0)
+    middleware = ThrottlingMiddleware(rate=1.0, burst=1.0)
     handler = AsyncMock(return_value="ok")
-    user = MagicMock()
-    user.id = 1
 
-    event = MagicMock()
-    data = {"event_from_user": user}
-
-    result = await middleware(handler, event, data)
+    result = await middleware(handler, MagicMock(), {"event_from_user": _user(1)})
     assert result == "ok"
     handler.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_throttling_blocks_rapid_messages():
-    middleware = ThrottlingMiddleware(rate_limit=10.0)
+async def test_throttling_allows_double_tap_within_burst():
+    """Двойной тап по inline-кнопке не отбрасывается."""
+    middleware = ThrottlingMiddleware(rate=0.1, burst=2.0)
     handler = AsyncMock(return_value="ok")
-    user = MagicMock()
-    user.id = 2
+    data = {"event_from_user": _user(2)}
+    event = _callback("usr:view:5:0")
 
-    event = MagicMock()
-    data = {"event_from_user": user}
+    assert await middleware(handler, event, data) == "ok"
+    assert await middleware(handler, event, data) == "ok"
+    assert await middleware(handler, event, data) is None
+    assert handler.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_throttling_per_action_costs():
+    middleware = ThrottlingMiddleware(
+        rate=0.01, burst=3.0, costs={"prof:request": 3.0, "noop": 0.5},
+    )
+    handler = AsyncMock(return_value="ok")
+    data = {"event_from_user": _user(3)}
 
-    # Первый запрос проходит
-    result1 = await middleware(handler, event, data)
-    assert result1 == "ok"
+    assert await middleware(handler, _callback("prof:request:0"), data) == "ok"
+    # Ведро пусто — даже дешёвая навигация ждёт пополнения
+    assert await middleware(handler, _callback("noop"), data) is None
 
-    # Второй немедленный — блокируется
-    result2 = await middleware(handler, event, data)
-    assert result2 is None
-    assert handler.call_count == 1
+    cheap = ThrottlingMiddleware(rate=0.01, burst=3.0, costs={"noop": 0.5})
+    for _ in range(6):
+        assert await cheap(handler, _callback("noop"), {"event_from_user": _user(4)}) == "ok"
 
 
 @pytest.mark.asyncio
-async def test_throttling_allows_after_cooldown():
-    middleware = ThrottlingMiddleware(rate_limit=0.05)
+async def test_throttling_different_users_independent():
+    middleware = ThrottlingMiddleware(rate=0.1, burst=1.0)
     handler = AsyncMock(return_value="ok")
-    user = MagicMock()
-    user.id = 3
-
     event = MagicMock()
-    data = {"event_from_user": user}
 
-    await middleware(handler, event, data)
-    await asyncio.sleep(0.1)
-    result = await middleware(handler, event, data)
+    assert await middleware(handler, event, {"event_from_user": _user(10)}) == "ok"
+    assert await middleware(handler, event, {"event_from_user": _user(11)}) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_throttling_no_user_passes():
+    middleware = ThrottlingMiddleware(rate=1.0, burst=1.0)
+    handler = AsyncMock(return_value="ok")
+
+    result = await middleware(handler, MagicMock(), {})
     assert result == "ok"
-    assert handler.call_count == 2
 
 
 @pytest.mark.asyncio
-async def test_throttling_different_users_independent():
-    middleware = ThrottlingMiddleware(rate_limit=10.0)
+async def test_throttling_notifies_callback_every_time():
+    middleware = ThrottlingMiddleware(rate=0.01, burst=1.0, notify=True)
     handler = AsyncMock(return_value="ok")
+    data = {"event_from_user": _user(20)}
 
-    user1 = MagicMock()
-    user1.id = 10
-    user2 = MagicMock()
-    user2.id = 11
+    await middleware(handler, _callback("usr:view:1:0"), data)
+    throttled = _callback("usr:view:1:0")
+    assert await middleware(handler, throttled, data) is None
+    throttled.answer.assert_awaited_once()
 
-    event = MagicMock()
 
-    result1 = await middleware(handler, event, {"event_from_user": user1})
-    result2 = await middleware(handler, event, {"event_from_user": user2})
-    assert result1 == "ok"
-    assert result2 == "ok"
+@pytest.mark.asyncio
+async def test_throttling_notifies_message_once():
+    middleware = ThrottlingMiddleware(rate=0.01, burst=1.0, notify=True)
+    handler = AsyncMock(return_value="ok")
+    data = {"event_from_user": _user(21)}
+
+    await middleware(handler, _message("hi"), data)
+    first, second = _message("hi"), _message("hi")
+    await middleware(handler, first, data)
+    await middleware(handler, second, data)
+
+    first.answer.assert_awaited_once()
+    second.answer.assert_not_awaited()
 
 
 @pytest.mark.asyncio
-async def test_throttling_no_user_passes():
-    middleware = ThrottlingMiddleware(rate_limit=1.0)
+async def test_throttling_fails_open_when_store_unavailable():
+    store = MagicMock()
+    store.consume = AsyncMock(side_effect=ConnectionError("redis down"))
+    middleware = ThrottlingMiddleware(store=store)
     handler = AsyncMock(return_value="ok")
-    event = MagicMock()
-    data = {}  # нет event_from_user
 
-    result = await middleware(handler, event, data)
-    assert result == "ok"
+    assert await middleware(handler, _message("hi"), {"event_from_user": _user(23)}) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_throttling_silent_by_default():
+    middleware = ThrottlingMiddleware(rate=0.01, burst=1.0)
+    handler = AsyncMock(return_value="ok")
+    data = {"event_from_user": _user(22)}
+
+    await middleware(handler, _message("hi"), data)
+    throttled = _message("hi")
+    await middleware(handler, throttled, data)
+    throttled.answer.assert_not_awaited()
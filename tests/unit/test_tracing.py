@@ -0,0 +1,170 @@
+"""Тесты трассировки апдейтов (bot.core.tracing) и её интеграции."""
+import asyncio
+import json
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+from loguru import logger
+
+from bot.core import tracing
+from bot.core.executor import OrderedUpdateExecutor
+from bot.middlewares.ordering_middleware import OrderedExecutionMiddleware
+from bot.middlewares.tracing_middleware import TracingMiddleware
+from scripts.trace_to_folded import fold
+
+
+class ListExporter:
+    def __init__(self) -> None:
+        self.traces: list[dict[str, Any]] = []
+
+    def export(self, trace: dict[str, Any]) -> None:
+        self.traces.append(trace)
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def exporter():
+    exporter = ListExporter()
+    tracing.configure(exporter, sample_rate=1.0)
+    yield exporter
+    tracing.configure(None)
+
+
+def _names(trace: dict) -> dict[str, dict]:
+    return {s["name"]: s for s in trace["spans"]}
+
+
+async def test_span_tree_and_export(exporter):
+    with tracing.start_trace("update", user_id=1):
+        with tracing.span("handler a"):
+            with tracing.span("db SELECT ?"):
+                await asyncio.sleep(0)
+        with pytest.raises(ValueError):
+            with tracing.span("wg awg set"):
+                raise ValueError
+
+    (trace,) = exporter.traces
+    spans = _names(trace)
+    assert trace["attrs"] == {"user_id": 1}
+    assert spans["handler a"]["parent"] == spans["update"]["id"]
+    assert spans["db SELECT ?"]["parent"] == spans["handler a"]["id"]
+    assert spans["wg awg set"]["error"] == "ValueError"
+    json.dumps(trace)
+
+
+def test_span_outside_trace_is_noop():
+    with tracing.span("orphan") as span:
+        assert span is None
+    assert tracing.current_trace_id() is None
+
+
+async def test_concurrent_traces_do_not_mix(exporter):
+    async def update(n: int) -> None:
+        with tracing.start_trace("update", n=n):
+            await asyncio.sleep(0.01)
+            with tracing.span(f"handler {n}"):
+                await asyncio.sleep(0)
+
+    await asyncio.gather(update(1), update(2))
+
+    assert len(exporter.traces) == 2
+    for trace in exporter.traces:
+        assert set(_names(trace)) == {"update", f"handler {trace['attrs']['n']}"}
+
+
+async def test_tail_sampling_exports_only_slow_traces():
+    exporter = ListExporter()
+    tracing.configure(exporter, sample_rate=0.0, slow_ms=20)
+    try:
+        with tracing.start_trace("fast"):
+            pass
+        with tracing.start_trace("slow"):
+            await asyncio.sleep(0.03)
+    finally:
+        tracing.configure(None)
+
+    assert [t["name"] for t in exporter.traces] == ["slow"]
+
+
+async def test_trace_id_is_bound_to_log_ctx(exporter):
+    records: list[dict] = []
+    sink_id = logger.add(lambda m: records.append(m.record["extra"]), level="INFO")
+    try:
+        with tracing.start_trace("update") as root:
+            logger.info("inside")
+    finally:
+        logger.remove(sink_id)
+
+    assert records[0]["ctx"] == root.trace.trace_id
+
+
+async def test_trace_follows_update_into_executor_worker(exporter):
+    executor = OrderedUpdateExecutor(workers=1, max_pending=10)
+    executor.start()
+    ordering = OrderedExecutionMiddleware(executor)
+    done = asyncio.Event()
+
+    async def handler(event, data):
+        with tracing.span("handler x"):
+            await asyncio.sleep(0.01)
+        done.set()
+
+    async def through_ordering(event, data):
+        return await ordering(handler, event, data)
+
+    user = MagicMock(id=42)
+    await TracingMiddleware()(through_ordering, MagicMock(), {"event_from_user": user})
+    assert exporter.traces == []  # работа ещё в очереди воркера
+
+    await asyncio.wait_for(done.wait(), 1)
+    await executor.stop()
+
+    (trace,) = exporter.traces
+    spans = _names(trace)
+    assert trace["attrs"]["user_id"] == 42
+    assert spans["executor.wait"]["parent"] == spans["update"]["id"]
+    assert spans["handler x"]["parent"] == spans["update"]["id"]
+    assert spans["update"]["duration_ms"] >= spans["handler x"]["duration_ms"]
+
+
+async def test_db_and_traced_spans(exporter, db_connection):
+    from bot.db.instrumentation import InstrumentedConnection, QueryStats
+
+    db = InstrumentedConnection(db_connection, slow_ms=10_000, stats=QueryStats())
+
+    @tracing.traced()
+    async def issue() -> None:
+        await db.execute("SELECT 1")
+
+    with tracing.start_trace("update"):
+        await issue()
+
+    spans = _names(exporter.traces[0])
+    issue_name = next(name for name in spans if name.endswith("issue"))
+    assert spans["db SELECT ?"]["parent"] == spans[issue_name]["id"]
+
+
+def test_jsonl_exporter_writes_lines(tmp_path):
+    exporter = tracing.JsonlTraceExporter(tmp_path / "traces" / "t.jsonl")
+    exporter.export({"trace_id": "a"})
+    exporter.export({"trace_id": "b"})
+    exporter.close()
+
+    lines = (tmp_path / "traces" / "t.jsonl").read_text().splitlines()
+    assert [json.loads(line)["trace_id"] for line in lines] == ["a", "b"]
+
+
+def test_fold_to_self_time():
+    trace = {"spans": [
+        {"id": 0, "parent": None, "name": "update", "duration_ms": 10.0},
+        {"id": 1, "parent": 0, "name": "handler a", "duration_ms": 6.0},
+        {"id": 2, "parent": 1, "name": "db SELECT ?; x", "duration_ms": 4.0},
+    ]}
+    assert fold([trace]) == {
+        "update": 4000,
+        "update;handler a": 2000,
+        "update;handler a;db SELECT ?, x": 4000,
+    }
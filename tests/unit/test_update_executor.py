@@ -0,0 +1,168 @@
+"""Тесты для OrderedUpdateExecutor и OrderedExecutionMiddleware."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from bot.core.executor import LatencyTracker, OrderedUpdateExecutor
+from bot.middlewares.ordering_middleware import OrderedExecutionMiddleware
+from bot.middlewares.timing_middleware import HandlerTimingMiddleware, handler_name
+
+
+async def test_same_key_runs_in_order():
+    executor = OrderedUpdateExecutor(workers=4, max_pending=100)
+    executor.start()
+    seen: list[int] = []
+
+    def make_job(i: int):
+        async def job():
+            # Более ранние задачи спят дольше — без упорядочивания порядок бы нарушился
+            await asyncio.sleep(0.01 * (5 - i))
+            seen.append(i)
+        return job
+
+    for i in range(5):
+        await executor.submit("user-1", make_job(i))
+    await executor.join()
+    await executor.stop()
+
+    assert seen == [0, 1, 2, 3, 4]
+
+
+async def test_different_keys_run_concurrently():
+    executor = OrderedUpdateExecutor(workers=2, max_pending=100)
+    executor.start()
+    slow_started = asyncio.Event()
+    release = asyncio.Event()
+    fast_done = asyncio.Event()
+
+    async def slow():
+        slow_started.set()
+        await release.wait()
+
+    async def fast():
+        fast_done.set()
+
+    await executor.submit("slow-user", slow)
+    await slow_started.wait()
+    await executor.submit("fast-user", fast)
+
+    # Быстрый пользователь не ждёт медленного
+    await asyncio.wait_for(fast_done.wait(), timeout=1)
+    release.set()
+    await executor.stop()
+
+
+async def test_worker_limit_is_respected():
+    executor = OrderedUpdateExecutor(workers=2, max_pending=100)
+    executor.start()
+    running = 0
+    peak = 0
+
+    async def job():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for i in range(10):
+        await executor.submit(i, job)
+    await executor.join()
+    await executor.stop()
+
+    assert peak == 2
+
+
+async def test_failed_job_does_not_stop_worker():
+    executor = OrderedUpdateExecutor(workers=1, max_pending=10)
+    executor.start()
+    done = []
+
+    async def boom():
+        raise RuntimeError("boom")
+
+    async def ok():
+        done.append(True)
+
+    await executor.submit("k", boom)
+    await executor.submit("k", ok)
+    await executor.join()
+    await executor.stop()
+
+    assert done == [True]
+    stats = executor.stats()
+    assert stats["failed"] == 1
+    assert stats["processed"] == 1
+
+
+async def test_queue_depth_reported():
+    executor = OrderedUpdateExecutor(workers=1, max_pending=10)
+    release = asyncio.Event()
+
+    async def blocked():
+        await release.wait()
+
+    # Воркеры ещё не запущены — всё остаётся в очереди
+    for _ in range(3):
+        await executor.submit("k", blocked)
+    assert executor.queue_depth == 3
+    assert executor.stats()["active_keys"] == 1
+
+    executor.start()
+    release.set()
+    await executor.join()
+    assert executor.queue_depth == 0
+    await executor.stop()
+
+
+def test_invalid_pool_size():
+    with pytest.raises(ValueError):
+        OrderedUpdateExecutor(workers=0)
+
+
+def test_latency_tracker_snapshot_sorted_by_total():
+    tracker = LatencyTracker()
+    tracker.observe("a", 0.010)
+    tracker.observe("b", 0.100)
+    tracker.observe("a", 0.030)
+
+    rows = tracker.snapshot()
+    assert [r["name"] for r in rows] == ["b", "a"]
+    assert rows[1]["count"] == 2
+    assert rows[1]["avg_ms"] == pytest.approx(20.0)
+    assert rows[1]["max_ms"] == pytest.approx(30.0)
+
+
+async def test_ordering_middleware_submits_and_returns():
+    executor = OrderedUpdateExecutor(workers=1, max_pending=10)
+    executor.start()
+    middleware = OrderedExecutionMiddleware(executor)
+    handler = AsyncMock(return_value="ok")
+    user = MagicMock()
+    user.id = 42
+
+    result = await middleware(handler, MagicMock(), {"event_from_user": user})
+    assert result is None
+
+    await executor.join()
+    handler.assert_awaited_once()
+    await executor.stop()
+
+
+async def test_timing_middleware_records_handler_name():
+    tracker = LatencyTracker()
+    middleware = HandlerTimingMiddleware(tracker)
+
+    async def handle_something():
+        pass
+
+    handle_something.__module__ = "bot.handlers.user.profiles"
+    handler_obj = MagicMock()
+    handler_obj.callback = handle_something
+    data = {"handler": handler_obj}
+
+    await middleware(AsyncMock(return_value="ok"), MagicMock(), data)
+
+    assert handler_name(data) == "user.profiles.handle_something"
+    assert tracker.snapshot()[0]["name"] == "user.profiles.handle_something"
@@ -43,3 +43,41 @@ def test_build_command_empty_string_is_direct(monkeypatch: pytest.MonkeyPatch):
     monkeypatch.setattr(settings, "wg_container_name", "   ", raising=False)
     cmd = VPNService._build_command("awg", "show")
     assert cmd == ["awg", "show"]
+
+
+def test_runtime_resolved_once(monkeypatch: pytest.MonkeyPatch):
+    """Бинарники ищутся один раз; reprobe_runtime разрешает окружение заново."""
+    monkeypatch.setattr(settings, "wg_container_name", "", raising=False)
+    lookups: list[str] = []
+
+    def which(name: str) -> str | None:
+        lookups.append(name)
+        return f"/usr/bin/{name}" if name.startswith("awg") else None
+
+    with patch("bot.services.vpn_service.shutil.which", side_effect=which):
+        for _ in range(3):
+            assert VPNService._resolve_wg_binary() == "/usr/bin/awg"
+            assert VPNService._resolve_wg_quick_binary() == "/usr/bin/awg-quick"
+            VPNService._build_command("/usr/bin/awg", "show")
+        assert lookups == ["awg", "awg-quick"]
+
+        VPNService.reprobe_runtime()
+        assert lookups == ["awg", "awg-quick"] * 2
+
+
+def test_runtime_missing_binary_is_reprobed(monkeypatch: pytest.MonkeyPatch):
+    """Не найденный при старте бинарник подхватывается после установки."""
+    monkeypatch.setattr(settings, "wg_container_name", "", raising=False)
+    with patch("bot.services.vpn_service.shutil.which", return_value=None):
+        with pytest.raises(RuntimeError):
+            VPNService._resolve_wg_binary()
+    with patch("bot.services.vpn_service.shutil.which", return_value="/usr/local/bin/wg"):
+        assert VPNService._resolve_wg_binary() == "/usr/local/bin/wg"
+
+
+def test_runtime_docker_prefix(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "wg_container_name", " amneziawg ", raising=False)
+    runtime = VPNService.runtime()
+    assert runtime.mode == "docker"
+    assert runtime.prefix == ("docker", "exec", "amneziawg")
+    assert runtime.interactive_prefix == ("docker", "exec", "-i", "amneziawg")
@@ -111,6 +111,11 @@ async def test_get_profile_config_returns_config(test_settings):
         "name": "TestProfile",
         "private_key": encrypted_key,
         "ipv4_address": "10.0.0.2",
+        "ipv6_address": None,
+        "public_key": "FAKE_PUBLIC_KEY==",
+        "detached_at": None,
+        "node_id": 1,
+        "pool_id": None,
     }[k])
 
     db, cursor = make_mock_db()
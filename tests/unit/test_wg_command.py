@@ -0,0 +1,277 @@
+"""Тесты для единого исполнителя wg-команд (VPNService._run) и CommandStats."""
+import asyncio
+import signal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from bot.services.wg_command import (
+    CircuitBreaker,
+    CommandResult,
+    CommandStats,
+    WGUnavailableError,
+    command_label,
+    command_timeout,
+)
+
+
+def make_process(returncode: int = 0, stdout: bytes = b"", stderr: bytes = b""):
+    proc = MagicMock()
+    proc.pid = 4242
+    proc.returncode = returncode
+    proc.communicate = AsyncMock(return_value=(stdout, stderr))
+    proc.wait = AsyncMock(return_value=-9)
+    return proc
+
+
+def make_hanging_process():
+    proc = make_process()
+    proc.returncode = None  # процесс ещё идёт — код появится после kill и wait
+
+    async def hang(input=None):
+        await asyncio.sleep(10)
+
+    async def wait():
+        proc.returncode = -9
+        return -9
+
+    proc.communicate = hang
+    proc.wait = AsyncMock(side_effect=wait)
+    return proc
+
+
+def test_command_label():
+    assert command_label(["docker", "exec", "-i", "amneziawg", "awg", "pubkey"]) == "awg pubkey"
+    assert command_label(["/usr/bin/awg", "show", "awg0", "dump"]) == "awg show"
+    assert command_label(["awg"]) == "awg"
+    assert command_label([]) == "unknown"
+
+
+def test_stats_percentiles_and_counters():
+    stats = CommandStats(window=100)
+    for ms in range(1, 101):
+        stats.record(CommandResult("awg show", 0, b"abc", "", ms / 1000))
+    stats.record(CommandResult("awg set", None, b"", "t", 1.0, attempts=2, timed_out=True))
+
+    show, set_ = stats.snapshot()
+    assert show["command"] == "awg show"
+    assert show["count"] == 100
+    assert show["stdout_bytes"] == 300
+    assert show["p50_ms"] == pytest.approx(50, abs=1)
+    assert show["p95_ms"] == pytest.approx(95, abs=1)
+    assert show["max_ms"] == pytest.approx(100)
+    assert set_["timeouts"] == 1
+    assert set_["retries"] == 1
+    assert set_["failures"] == 1
+
+
+def test_stats_window_is_rolling():
+    stats = CommandStats(window=3)
+    for ms in (1000, 1, 1, 1):
+        stats.record(CommandResult("awg show", 0, b"", "", ms / 1000))
+    (row,) = stats.snapshot()
+    assert row["count"] == 4
+    assert row["max_ms"] == pytest.approx(1)
+
+
+async def test_run_records_result(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    proc = make_process(returncode=0, stdout=b"peer-dump\n")
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", return_value=proc):
+        result = await VPNService._run(["awg", "show", "awg0", "dump"])
+
+    assert result.ok
+    assert result.text == "peer-dump\n"
+    assert result.attempts == 1
+    (row,) = VPNService.command_stats.snapshot()
+    assert row["command"] == "awg show"
+    assert row["stdout_bytes"] == len(b"peer-dump\n")
+
+
+async def test_run_passes_stdin(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    proc = make_process(stdout=b"pub\n")
+    create = AsyncMock(return_value=proc)
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", create):
+        await VPNService._run(["awg", "pubkey"], input=b"priv")
+
+    assert create.call_args.kwargs["stdin"] == asyncio.subprocess.PIPE
+    proc.communicate.assert_awaited_once_with(input=b"priv")
+
+
+async def test_run_timeout_retries_then_fails(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    procs = [make_hanging_process(), make_hanging_process()]
+    with (
+        patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=procs) as create,
+        patch("bot.services.vpn_service.os.killpg") as killpg,
+    ):
+        result = await VPNService._run(["awg", "show", "awg0", "dump"], timeout=0.01, retries=1)
+
+    assert result.timed_out
+    assert not result.ok
+    assert result.attempts == 2
+    assert create.call_args.kwargs["start_new_session"] is True
+    assert killpg.call_count == 2
+    for proc in procs:
+        proc.wait.assert_awaited_once()
+    (row,) = VPNService.command_stats.snapshot()
+    assert row["timeouts"] == 1
+    assert row["retries"] == 1
+
+
+async def test_run_retry_succeeds_after_timeout(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    procs = [make_hanging_process(), make_process(stdout=b"ok")]
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=procs):
+        result = await VPNService._run(["awg", "show"], timeout=0.01, retries=1)
+
+    assert result.ok
+    assert result.attempts == 2
+
+
+async def test_run_logs_slow_command(test_settings, monkeypatch):
+    from loguru import logger
+
+    from bot.services.vpn_service import VPNService, settings
+
+    monkeypatch.setattr(settings, "wg_slow_command_ms", 0)
+    messages: list[str] = []
+    sink_id = logger.add(lambda m: messages.append(m.record["message"]), level="WARNING")
+    try:
+        with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", return_value=make_process()):
+            await VPNService._run(["awg", "set", "awg0"])
+    finally:
+        logger.remove(sink_id)
+
+    assert any(m.startswith("[WG] Медленная команда | command=awg set") for m in messages)
+
+
+def test_command_timeout_per_subcommand():
+    assert command_timeout("awg genkey", 30) == 5.0
+    assert command_timeout("awg-quick save", 30) == 20.0
+    assert command_timeout("awg set", 3) == 3
+    assert command_timeout("docker", 30) == 30
+
+
+def test_unavailable_distinguishes_container_errors():
+    down = CommandResult("awg show", 1, b"", "Error response from daemon: No such container: amneziawg", 0.1)
+    peer = CommandResult("awg set", 1, b"", "Invalid key", 0.1)
+    assert down.unavailable
+    assert not peer.unavailable
+    assert CommandResult("awg set", None, b"", "t", 1.0, timed_out=True).unavailable
+
+
+def test_circuit_breaker_opens_and_half_opens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("bot.services.wg_command.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(30)
+
+    now[0] += 30
+    assert breaker.allow()  # пробный вызов
+    assert not breaker.allow()  # второй ждёт результата пробы
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+async def test_run_fails_fast_when_container_down(test_settings, monkeypatch):
+    from bot.services.vpn_service import VPNService, settings
+
+    monkeypatch.setattr(settings, "wg_breaker_threshold", 2)
+    down = [make_process(returncode=1, stderr=b"Error: No such container: amneziawg") for _ in range(2)]
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", side_effect=down) as create:
+        for _ in range(2):
+            assert not (await VPNService._run(["awg", "show"])).ok
+        with pytest.raises(WGUnavailableError):
+            await VPNService._run(["awg", "show"])
+
+    assert create.call_count == 2
+
+
+async def test_run_limits_concurrent_processes(test_settings, monkeypatch):
+    from bot.services.vpn_service import VPNService, settings
+
+    monkeypatch.setattr(settings, "wg_max_concurrent", 2)
+    running = peak = 0
+
+    async def create(*args, **kwargs):
+        proc = make_process()
+
+        async def communicate(input=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return b"", b""
+
+        proc.communicate = communicate
+        return proc
+
+    with patch("bot.services.vpn_service.asyncio.create_subprocess_exec", create):
+        await asyncio.gather(*(VPNService._run(["awg", "show"]) for _ in range(6)))
+
+    assert peak == 2
+
+
+async def test_run_kills_process_group_on_cancel(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    proc = make_hanging_process()
+    with (
+        patch("bot.services.vpn_service.asyncio.create_subprocess_exec", return_value=proc),
+        patch("bot.services.vpn_service.os.killpg") as killpg,
+    ):
+        task = asyncio.create_task(VPNService._run(["awg", "set", "awg0"]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    killpg.assert_called_once_with(proc.pid, signal.SIGKILL)
+    proc.wait.assert_awaited()
+
+
+async def test_run_kills_process_when_parse_fails(test_settings):
+    from bot.services.vpn_service import VPNService
+
+    proc = make_hanging_process()
+    proc.stdout = asyncio.StreamReader()
+    proc.stderr = asyncio.StreamReader()
+    proc.stderr.feed_eof()
+    killed = asyncio.Event()
+
+    async def wait():
+        await killed.wait()  # процесс завершается только после killpg
+        proc.returncode = -9
+        return -9
+
+    async def parse(stream):
+        raise ValueError("bad dump")
+
+    proc.wait = AsyncMock(side_effect=wait)
+    with (
+        patch("bot.services.vpn_service.asyncio.create_subprocess_exec", return_value=proc),
+        patch("bot.services.vpn_service.os.killpg", side_effect=lambda *_: killed.set()) as killpg,
+    ):
+        with pytest.raises(ValueError):
+            await VPNService._run(["awg", "show", "awg0", "dump"], parse=parse)
+
+    killpg.assert_called_once_with(proc.pid, signal.SIGKILL)
+    proc.wait.assert_awaited()
@@ -0,0 +1,73 @@
+"""Тесты потокового разбора awg show dump (bot.services.wg_dump)."""
+import asyncio
+
+from bot.services.wg_dump import (
+    PeerRecord,
+    PeerSnapshot,
+    normalize_allowed_ips,
+    parse_dump,
+    parse_peer_line,
+    read_dump,
+)
+
+DUMP = (
+    b"privkey\tpubkey\t51820\toff\n"
+    b"peerA\t(none)\t203.0.113.5:41000\t10.0.0.3/32,10.0.0.2/32\t1700000000\t100\t200\t25\n"
+    b"broken line\n"
+    b"peerB\t(none)\t(none)\t(none)\t0\t0\t0\toff\n"
+)
+
+
+def test_parse_peer_line():
+    record = parse_peer_line("peerA\t(none)\t203.0.113.5:41000\t10.0.0.2/32\t1700000000\t100\t200\toff\n")
+    assert record == PeerRecord("peerA", "203.0.113.5:41000", "10.0.0.2/32", 1700000000, 100, 200)
+    assert record.total == 300
+    assert parse_peer_line("peerA\t(none)\t(none)\t(none)\tnever\t0\t0\toff") is None
+    assert parse_peer_line("privkey\tpubkey\t51820\toff") is None
+
+
+def test_parse_dump_skips_interface_and_malformed_lines():
+    peers = list(parse_dump(DUMP.splitlines()))
+    assert [p.public_key for p in peers] == ["peerA", "peerB"]
+    assert peers[0].allowed_ips == "10.0.0.2/32,10.0.0.3/32"
+    assert peers[1].endpoint is None
+    assert peers[1].allowed_ips == ""
+
+
+async def test_read_dump_streams_lines():
+    reader = asyncio.StreamReader()
+
+    async def feed() -> None:
+        for line in DUMP.splitlines(keepends=True):
+            reader.feed_data(line)
+            await asyncio.sleep(0)
+        reader.feed_eof()
+
+    # Маленькие куски: строки разрываются на границах чтения
+    peers, _ = await asyncio.gather(read_dump(reader, chunk_size=7), feed())
+    assert peers == list(parse_dump(DUMP.splitlines()))
+
+
+async def test_read_dump_without_trailing_newline():
+    reader = asyncio.StreamReader()
+    reader.feed_data(DUMP.rstrip(b"\n"))
+    reader.feed_eof()
+    assert [p.public_key for p in await read_dump(reader)] == ["peerA", "peerB"]
+
+
+def test_normalize_allowed_ips():
+    assert normalize_allowed_ips("(none)") == ""
+    assert normalize_allowed_ips("10.0.0.3/32,10.0.0.2/32") == "10.0.0.2/32,10.0.0.3/32"
+
+
+def test_snapshot_online_window():
+    snapshot = PeerSnapshot.from_records([
+        PeerRecord("a", None, "", 1000, 0, 0),
+        PeerRecord("b", None, "", 800, 0, 0),
+        PeerRecord("c", None, "", 0, 0, 0),
+    ], taken_at=1100)
+    assert snapshot.online_count(180) == 1
+    assert snapshot.is_online("a", 180) and not snapshot.is_online("b", 180)
+    assert not snapshot.is_online("c", 10_000)
+    assert snapshot.last_handshake("b") == 800
+    assert snapshot.last_handshake("missing") == 0